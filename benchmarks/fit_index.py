@@ -0,0 +1,124 @@
+"""
+Benchmark for listing FIT files by time_created.
+
+Writes a folder of synthetic FIT activities, then compares the old
+get_fit_files (a full garmin_fit_sdk decode of every file) with
+fit_index.iter_fit_files on a cold and on a warm index.
+
+Usage:
+    python -m benchmarks.fit_index [--files 200] [--records 3600] [--repeat 3]
+"""
+
+import argparse
+import logging
+import os
+import struct
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.file_id_message import FileIdMessage
+from fit_tool.profile.messages.record_message import RecordMessage
+from fit_tool.profile.profile_type import FileType
+from garmin_fit_sdk import Decoder, Stream
+from garmin_fit_sdk.crc_calculator import CrcCalculator
+
+from scripts.fit_index import FIT_EPOCH_OFFSET, FitFile, iter_fit_files
+
+
+def make_fit(time_created, records):
+    start_ms = int(time_created.timestamp() * 1000)
+    builder = FitFileBuilder(auto_define=True)
+    file_id = FileIdMessage()
+    file_id.type = FileType.ACTIVITY
+    file_id.manufacturer = 1
+    file_id.time_created = start_ms
+    builder.add(file_id)
+    for second in range(records):
+        record = RecordMessage()
+        record.timestamp = start_ms + second * 1000
+        record.heart_rate = 120 + second % 40
+        record.distance = second * 2.8
+        builder.add(record)
+    return builder.build().to_bytes()
+
+
+def with_time_created(fit_bytes, old, new):
+    """``fit_bytes`` with the file_id time_created ``old`` replaced by ``new`` and the file CRC updated."""
+
+    def raw(value):
+        return struct.pack("<I", int(value.timestamp()) - FIT_EPOCH_OFFSET)
+
+    data = bytearray(fit_bytes)
+    offset = data.index(raw(old))
+    data[offset : offset + 4] = raw(new)
+    data[-2:] = struct.pack("<H", CrcCalculator.calculate_crc(data, 0, len(data) - 2))
+    return bytes(data)
+
+
+def decode_all(folder):
+    """get_fit_files before the index: a full decode of each file, name-sorted."""
+    files = []
+    for filename in sorted((name for name in os.listdir(folder) if name.lower().endswith(".fit")), reverse=True):
+        messages, _ = Decoder(Stream.from_file(os.path.join(folder, filename))).read()
+        time_created = messages["file_id_mesgs"][0]["time_created"]
+        files.append(FitFile(os.path.join(folder, filename), time_created.replace(tzinfo=timezone.utc)))
+    return files
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(files, records, repeat):
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folder = os.path.join(tmp_dir, "FIT_OUT")
+        os.mkdir(folder)
+        index_file = os.path.join(tmp_dir, "fit_index.json")
+        first = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        fit_bytes = make_fit(first, records)
+        for day in range(files):
+            # Same records in every file, only the file_id differs.
+            time_created = first + timedelta(days=day)
+            with open(os.path.join(folder, f"{time_created:%Y%m%d}.fit"), "wb") as f:
+                f.write(with_time_created(fit_bytes, first, time_created))
+        print(f"{files} files, {records} records each")
+
+        decode_time, expected = timed(lambda: decode_all(folder), 1)
+
+        def cold():
+            if os.path.exists(index_file):
+                os.remove(index_file)
+            return list(iter_fit_files(folder, index_file))
+
+        cold_time, cold_files = timed(cold, repeat)
+        warm_time, warm_files = timed(lambda: list(iter_fit_files(folder, index_file)), repeat)
+
+    print(f"{'implementation':<22} {'time (s)':>9} {'speedup':>8}")
+    for name, elapsed in (("full decode", decode_time), ("header scan (cold)", cold_time), ("index (warm)", warm_time)):
+        print(f"{name:<22} {elapsed:>9.3f} {decode_time / elapsed:>7.1f}x")
+    print(f"identical: {expected == cold_files == warm_files}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark listing FIT files by time_created")
+    parser.add_argument("--files", type=int, default=200, help="Number of FIT files")
+    parser.add_argument("--records", type=int, default=3600, help="Record messages per file")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.files, args.records, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
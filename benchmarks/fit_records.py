@@ -0,0 +1,119 @@
+"""
+Benchmark for FIT record encoding.
+
+Builds a synthetic fit_record frame (1 Hz track with position, altitude,
+heart rate with a few gaps, cadence and step length), compares the previous
+one-RecordMessage-per-point fit_tool path with fit_encoder.encode_record_messages,
+checks that both produce the same bytes, and times the file CRC.
+
+Usage:
+    python -m benchmarks.fit_records [--points 40000] [--repeat 3]
+"""
+
+import argparse
+import datetime
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.record_message import RecordMessage
+from fit_tool.utils.crc import crc16
+
+from scripts.generator.fit_encoder import encode_record_messages, fit_crc16
+
+
+def legacy_record_bytes(df):
+    """One fit_tool RecordMessage per row through FitFileBuilder(auto_define=True), as before."""
+    builder = FitFileBuilder(auto_define=True)
+    for row in df.itertuples(index=False):
+        msg = RecordMessage()
+        msg.timestamp = round(row.timestamp.timestamp() * 1000)
+        if pd.notna(row.position_lat):
+            msg.position_lat = row.position_lat
+        if pd.notna(row.position_long):
+            msg.position_long = row.position_long
+        if pd.notna(row.distance):
+            msg.distance = row.distance
+        if pd.notna(row.altitude):
+            msg.altitude = row.altitude
+        if pd.notna(row.speed):
+            msg.speed = row.speed
+        if pd.notna(row.heart_rate):
+            msg.heart_rate = int(row.heart_rate)
+        if pd.notna(row.cadence):
+            msg.cadence = int(row.cadence)
+        if pd.notna(row.power):
+            msg.power = int(row.power)
+        if pd.notna(row.step_length):
+            msg.step_length = float(row.step_length * 1000)
+        builder.add(msg)
+    return b"".join(record.to_bytes() for record in builder.records)
+
+
+def make_records(points, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 1, 7, 0, 0)
+    step = np.clip(rng.normal(2.9, 0.4, points), 0, None)
+    heading = np.cumsum(rng.normal(0, 0.05, points))
+    heart_rate = np.clip(rng.normal(150, 8, points), 60, 200).round()
+    heart_rate[rng.random(points) < 0.02] = np.nan
+    cadence = rng.integers(160, 190, points).astype("float64")
+    return pd.DataFrame(
+        {
+            "timestamp": pd.date_range(start, periods=points, freq="s"),
+            "position_lat": 39.9 + np.cumsum(np.cos(heading) * step) / 111_000,
+            "position_long": 116.4 + np.cumsum(np.sin(heading) * step) / 85_000,
+            "distance": np.cumsum(step).round(1),
+            "altitude": 50 + np.cumsum(rng.normal(0, 0.1, points)),
+            "speed": step.round(3),
+            "heart_rate": heart_rate,
+            "cadence": cadence,
+            "power": np.nan,
+            "step_length": step / (cadence / 60),
+        }
+    )
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(points, repeat):
+    logging.disable(logging.WARNING)
+    records = make_records(points)
+    print(f"{points} records")
+
+    legacy_time, legacy = timed(lambda: legacy_record_bytes(records), 1)
+    encoded_time, encoded = timed(lambda: encode_record_messages(records), repeat)
+    crc_legacy_time, crc_legacy = timed(lambda: crc16(encoded), 1)
+    crc_time, crc = timed(lambda: fit_crc16(encoded), repeat)
+
+    print(f"{'implementation':<24} {'bytes':>9} {'time (s)':>9} {'speedup':>8}")
+    print(f"{'fit_tool records':<24} {len(legacy):>9} {legacy_time:>9.3f} {1:>7.1f}x")
+    print(f"{'encode_record_messages':<24} {len(encoded):>9} {encoded_time:>9.3f} {legacy_time / encoded_time:>7.1f}x")
+    print(f"{'fit_tool crc16':<24} {len(encoded):>9} {crc_legacy_time:>9.3f} {1:>7.1f}x")
+    print(f"{'fit_crc16':<24} {len(encoded):>9} {crc_time:>9.3f} {crc_legacy_time / crc_time:>7.1f}x")
+    print(f"identical: {legacy == encoded and crc_legacy == crc}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark FIT record encoding")
+    parser.add_argument("--points", type=int, default=40_000, help="Number of records")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs for the fast paths")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.points, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Micro-benchmark for convert_streams_to_flyby_dataframe.
+
+Compares the previous list-comprehension implementation with the current
+array-backed one on synthetic 1k/10k/100k-point streams and checks that both
+produce the same rows.
+
+Usage:
+    python -m benchmarks.flyby_conversion [--sizes 1000 10000 100000] [--repeat 5]
+"""
+
+import argparse
+import copy
+import logging
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def legacy_convert_streams_to_flyby_dataframe(activity, streams):
+    """The per-point implementation kept verbatim as a baseline."""
+    time_data = streams.get("time").data
+
+    latlng_stream = streams.get("latlng")
+    if latlng_stream and latlng_stream.data:
+        latlng_data = latlng_stream.data
+        if len(time_data) != len(latlng_data):
+            min_length = min(len(time_data), len(latlng_data))
+            time_data = time_data[:min_length]
+            latlng_data = latlng_data[:min_length]
+        latlng_df = pd.DataFrame(latlng_data, columns=["lat", "lng"])
+        lats = latlng_df["lat"].round(6).tolist()
+        lngs = latlng_df["lng"].round(6).tolist()
+    else:
+        lats = [None] * len(time_data)
+        lngs = [None] * len(time_data)
+
+    flyby_data = {
+        "activity_id": [activity.id] * len(time_data),
+        "time_offset": time_data,
+        "lat": lats,
+        "lng": lngs,
+    }
+
+    def get_aligned_stream_data(stream_name):
+        stream = streams.get(stream_name)
+        if stream and stream.data:
+            data = stream.data
+            if len(data) < len(time_data):
+                data.extend([None] * (len(time_data) - len(data)))
+            elif len(data) > len(time_data):
+                data = data[: len(time_data)]
+            return data
+        return [None] * len(time_data)
+
+    alt_data = get_aligned_stream_data("altitude")
+    flyby_data["alt"] = [int(alt) if alt is not None and not pd.isna(alt) else None for alt in alt_data]
+
+    velocity_data = get_aligned_stream_data("velocity_smooth")
+    pace_data = []
+    for i, velocity in enumerate(velocity_data):
+        if time_data[i] == 0:
+            pace_data.append(0.0)
+            continue
+        if velocity is not None and not pd.isna(velocity) and velocity > 0:
+            pace = (1000.0 / 60.0) / velocity
+            if 1.0 <= pace <= 30.0:
+                pace_data.append(round(pace, 2))
+            else:
+                pace_data.append(0.0)
+        else:
+            pace_data.append(0.0)
+    flyby_data["pace"] = pace_data
+
+    hr_data = get_aligned_stream_data("heartrate")
+    flyby_data["hr"] = [int(hr) if hr is not None and not pd.isna(hr) and 0 <= hr <= 255 else None for hr in hr_data]
+
+    dist_data = get_aligned_stream_data("distance")
+    flyby_data["distance"] = [int(dist) if dist is not None and not pd.isna(dist) else None for dist in dist_data]
+
+    cad_data = get_aligned_stream_data("cadence")
+    flyby_data["cadence"] = [int(c) if c is not None and not pd.isna(c) else None for c in cad_data]
+
+    watts_data = get_aligned_stream_data("watts")
+    flyby_data["watts"] = [int(w) if w is not None and not pd.isna(w) else None for w in watts_data]
+
+    flyby_df = pd.DataFrame(flyby_data)
+    flyby_df["activity_id"] = flyby_df["activity_id"].astype("int64")
+    flyby_df["time_offset"] = flyby_df["time_offset"].astype("int32")
+    return flyby_df
+
+
+def make_synthetic_streams(size, seed=42):
+    """Build stravalib-like streams with gaps, pauses and a short cadence stream."""
+    rng = np.random.default_rng(seed)
+    velocity = rng.uniform(0.0, 6.0, size)
+    velocity[rng.random(size) < 0.05] = 0.0
+    heartrate = rng.integers(60, 200, size).astype(float)
+    heartrate[rng.random(size) < 0.02] = np.nan
+    latlng = np.column_stack(
+        [39.9 + np.cumsum(rng.normal(0, 1e-5, size)), 116.4 + np.cumsum(rng.normal(0, 1e-5, size))]
+    )
+
+    def stream(values):
+        return SimpleNamespace(data=[None if isinstance(v, float) and np.isnan(v) else v for v in values])
+
+    return {
+        "time": SimpleNamespace(data=list(range(size))),
+        "latlng": SimpleNamespace(data=latlng.tolist()),
+        "altitude": stream(rng.uniform(-10.0, 2000.0, size).tolist()),
+        "velocity_smooth": stream(velocity.tolist()),
+        "heartrate": stream(heartrate.tolist()),
+        "distance": stream(np.cumsum(velocity).tolist()),
+        "cadence": stream(rng.integers(0, 200, size - size // 10).astype(float).tolist()),
+        "watts": stream(rng.uniform(0.0, 400.0, size).tolist()),
+    }
+
+
+def rows_equal(left, right):
+    """Compare two flyby frames row by row, treating None/NaN/NA as equal."""
+    if list(left.columns) != list(right.columns) or len(left) != len(right):
+        return False
+
+    def normalize(df):
+        return [tuple(None if pd.isna(v) else v for v in row) for row in df.astype(object).itertuples(index=False)]
+
+    return normalize(left) == normalize(right)
+
+
+def best_of(func, activity, streams, repeat):
+    timings = []
+    for _ in range(repeat):
+        # The legacy implementation pads streams in place, so give every run a fresh copy.
+        fresh = copy.deepcopy(streams)
+        start = time.perf_counter()
+        func(activity, fresh)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(sizes, repeat):
+    logging.getLogger("scripts.generator.db").setLevel(logging.WARNING)
+    activity = SimpleNamespace(id=1)
+    print(f"{'points':>10} {'legacy (ms)':>12} {'vectorized (ms)':>16} {'speedup':>8} {'identical':>10}")
+    for size in sizes:
+        streams = make_synthetic_streams(size)
+        identical = rows_equal(
+            legacy_convert_streams_to_flyby_dataframe(activity, copy.deepcopy(streams)),
+            convert_streams_to_flyby_dataframe(activity, streams),
+        )
+        legacy = best_of(legacy_convert_streams_to_flyby_dataframe, activity, streams, repeat)
+        vectorized = best_of(convert_streams_to_flyby_dataframe, activity, streams, repeat)
+        print(
+            f"{size:>10} {legacy * 1000:>12.2f} {vectorized * 1000:>16.2f} "
+            f"{legacy / vectorized:>7.1f}x {str(identical):>10}"
+        )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark stream-to-flyby conversion")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Stream lengths to benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per size; the best time is reported")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.sizes, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Benchmark for matching local activities to Garmin activities.
+
+Builds synthetic local and Garmin activity lists (most local activities have a
+Garmin counterpart a few seconds away), assigns them one-to-one like
+_reconcile_rows with the linear scan sync_garmin used before and with
+GarminMatcher, and checks that both give the same assignment.
+
+Usage:
+    python -m benchmarks.garmin_matcher [--activities 2000] [--repeat 3] [--skip-legacy]
+"""
+
+import argparse
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+from scripts.strava_cli_core.sync_garmin import (
+    GarminMatcher,
+    _extract_garmin_type_key,
+    _parse_garmin_duration_seconds,
+    _parse_garmin_start_time,
+    _prefer_duration_match,
+    _strava_type_aliases,
+)
+
+TOLERANCES = {"match_window_seconds": 180, "distance_tolerance_meters": 50.0, "duration_tolerance_seconds": 120}
+TYPES = (("Run", "running", 10000.0), ("Ride", "cycling", 30000.0), ("Workout", "strength_training", 0.0))
+
+
+def make_activities(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2015, 1, 1, tzinfo=timezone.utc)
+    local, remote = [], []
+    for index in range(count):
+        started = start + timedelta(hours=6 * index + rng.randrange(4))
+        strava_type, garmin_type, distance = rng.choice(TYPES)
+        elapsed = rng.randrange(1200, 7200)
+        local.append(
+            pd.Series(
+                {
+                    "run_id": index,
+                    "start_date": started,
+                    "distance": distance,
+                    "elapsed_time": elapsed,
+                    "type": strava_type,
+                }
+            )
+        )
+        if rng.random() < 0.9:
+            remote.append(
+                {
+                    "activityId": 10_000_000 + index,
+                    "startTimeGMT": (started + timedelta(seconds=rng.randrange(-60, 60))).strftime("%Y-%m-%d %H:%M:%S"),
+                    "distance": distance + rng.uniform(-20, 20),
+                    "duration": elapsed + rng.uniform(-30, 30),
+                    "activityType": {"typeKey": garmin_type},
+                }
+            )
+    rng.shuffle(remote)
+    return local, remote
+
+
+def legacy_match(activity_row, garmin_activities, reserved_activity_ids):
+    """_is_existing_in_garmin before GarminMatcher: a scan of every Garmin activity."""
+    strava_start = pd.to_datetime(activity_row["start_date"]).to_pydatetime()
+    strava_distance = float(activity_row.get("distance") or 0)
+    strava_elapsed = float(activity_row.get("elapsed_time") or 0)
+    prefer_duration = _prefer_duration_match(activity_row)
+    allowed_types = _strava_type_aliases(activity_row.get("type"))
+    candidates = []
+    for garmin_activity in garmin_activities:
+        garmin_start = _parse_garmin_start_time(garmin_activity.get("startTimeGMT"))
+        garmin_activity_id = int(garmin_activity["activityId"])
+        if garmin_activity_id in reserved_activity_ids:
+            continue
+        time_delta = abs((strava_start - garmin_start).total_seconds())
+        if time_delta > TOLERANCES["match_window_seconds"]:
+            continue
+        garmin_type = _extract_garmin_type_key(garmin_activity)
+        if allowed_types and garmin_type and garmin_type not in allowed_types:
+            continue
+        if prefer_duration:
+            secondary_delta = abs(strava_elapsed - _parse_garmin_duration_seconds(garmin_activity))
+            if secondary_delta > TOLERANCES["duration_tolerance_seconds"]:
+                continue
+        else:
+            secondary_delta = abs(strava_distance - float(garmin_activity.get("distance") or 0))
+            if secondary_delta > TOLERANCES["distance_tolerance_meters"]:
+                continue
+        candidates.append((time_delta, secondary_delta, garmin_activity_id))
+    return min(candidates)[2] if candidates else None
+
+
+def assign_legacy(local, remote):
+    reserved, matches = set(), []
+    for activity_row in local:
+        matched = legacy_match(activity_row, remote, reserved)
+        if matched is not None:
+            reserved.add(matched)
+        matches.append(matched)
+    return matches
+
+
+def assign_indexed(local, remote):
+    matcher = GarminMatcher(remote, **TOLERANCES)
+    matches = []
+    for activity_row in local:
+        matched = matcher.match(activity_row)
+        if matched is not None:
+            matcher.reserve(matched)
+        matches.append(matched)
+    return matches
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(activities, repeat, skip_legacy=False):
+    logging.disable(logging.WARNING)
+    local, remote = make_activities(activities)
+    print(f"{len(local)} local x {len(remote)} Garmin activities")
+
+    indexed_time, indexed = timed(lambda: assign_indexed(local, remote), repeat)
+    print(f"{'implementation':<16} {'time (s)':>9} {'speedup':>8}")
+    if skip_legacy:
+        print(f"{'GarminMatcher':<16} {indexed_time:>9.3f}")
+        print(f"matched: {sum(match is not None for match in indexed)}")
+        return
+    legacy_time, legacy = timed(lambda: assign_legacy(local, remote), 1)
+    print(f"{'linear scan':<16} {legacy_time:>9.3f} {1:>7.1f}x")
+    print(f"{'GarminMatcher':<16} {indexed_time:>9.3f} {legacy_time / indexed_time:>7.1f}x")
+    print(f"identical: {legacy == indexed}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark matching local activities to Garmin activities")
+    parser.add_argument("--activities", type=int, default=2000, help="Number of local activities")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time GarminMatcher (for large sizes)")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.activities, args.repeat, args.skip_legacy)
+
+
+if __name__ == "__main__":
+    main()
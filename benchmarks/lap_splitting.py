@@ -0,0 +1,190 @@
+"""
+Benchmark for export_fit.calculate_laps_from_records.
+
+Builds synthetic records (1 Hz, ~2.9 m/s with GPS jitter, heart rate,
+cadence and power with a few gaps), compares the previous per-record loop
+with the vectorized split engine on 1 km splits and checks that both produce
+the same lap frame, then times the other split kinds.
+
+Usage:
+    python -m benchmarks.lap_splitting [--points 50000] [--repeat 3]
+"""
+
+import argparse
+import datetime
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from scripts.export_fit import calculate_laps_from_records
+
+OTHER_SPLITS = ["1mi", "400m", "5min"]
+
+
+def legacy_calculate_laps_from_records(fit_record, activity_id, start_date):
+    """The per-record implementation kept verbatim as a baseline."""
+    if fit_record.empty or "distance" not in fit_record.columns:
+        return None
+
+    # Drop records without distance and ensure sorted
+    df = fit_record.dropna(subset=["distance"]).sort_values("timestamp").reset_index(drop=True)
+    if df.empty:
+        return None
+
+    laps = []
+    start_idx = 0
+    lap_start_dist = df.iloc[0]["distance"]
+    lap_start_time = df.iloc[0]["timestamp"]
+    split_dist_meters = 1000.0
+
+    for i in range(len(df)):
+        curr_dist = df.iloc[i]["distance"]
+        dist_covered = curr_dist - lap_start_dist
+
+        if dist_covered >= split_dist_meters:
+            end_time = df.iloc[i]["timestamp"]
+            # Slice range: start_idx (exclusive) to i (inclusive)
+            seg_start = start_idx + 1 if start_idx < i else start_idx
+            segment = df.iloc[seg_start : i + 1]
+
+            elapsed_time = (end_time - lap_start_time).total_seconds()
+            distance = dist_covered
+
+            # Calculate averages
+            if elapsed_time > 0:
+                avg_speed = distance / elapsed_time
+            elif "speed" in segment and not segment["speed"].isnull().all():
+                avg_speed = segment["speed"].mean()
+            else:
+                avg_speed = 0.0
+
+            avg_hr = segment["heart_rate"].mean() if "heart_rate" in segment else None
+            avg_cadence = segment["cadence"].mean() if "cadence" in segment else None
+            avg_power = segment["power"].mean() if "power" in segment else None
+
+            laps.append(
+                {
+                    "activity_id": activity_id,
+                    "timestamp": end_time,
+                    "start_time": lap_start_time,
+                    "total_elapsed_time": elapsed_time,
+                    "total_timer_time": elapsed_time,
+                    "total_distance": distance,
+                    "avg_speed": avg_speed,
+                    "avg_heart_rate": int(avg_hr) if pd.notna(avg_hr) else None,
+                    "avg_cadence": int(avg_cadence) if pd.notna(avg_cadence) else None,
+                    "avg_power": int(avg_power) if pd.notna(avg_power) else None,
+                }
+            )
+
+            # Reset for next lap
+            start_idx = i
+            lap_start_dist = curr_dist
+            lap_start_time = end_time
+
+    # Handle final lap (remainder)
+    if start_idx < len(df) - 1:
+        i = len(df) - 1
+        end_time = df.iloc[i]["timestamp"]
+        curr_dist = df.iloc[i]["distance"]
+        dist_covered = curr_dist - lap_start_dist
+        elapsed_time = (end_time - lap_start_time).total_seconds()
+
+        if dist_covered > 10 or elapsed_time > 5:
+            seg_start = start_idx + 1 if start_idx < i else start_idx
+            segment = df.iloc[seg_start : i + 1]
+
+            if elapsed_time > 0:
+                avg_speed = dist_covered / elapsed_time
+            elif "speed" in segment and not segment["speed"].isnull().all():
+                avg_speed = segment["speed"].mean()
+            else:
+                avg_speed = 0.0
+
+            avg_hr = segment["heart_rate"].mean() if "heart_rate" in segment else None
+            avg_cadence = segment["cadence"].mean() if "cadence" in segment else None
+            avg_power = segment["power"].mean() if "power" in segment else None
+
+            laps.append(
+                {
+                    "activity_id": activity_id,
+                    "timestamp": end_time,
+                    "start_time": lap_start_time,
+                    "total_elapsed_time": elapsed_time,
+                    "total_timer_time": elapsed_time,
+                    "total_distance": dist_covered,
+                    "avg_speed": avg_speed,
+                    "avg_heart_rate": int(avg_hr) if pd.notna(avg_hr) else None,
+                    "avg_cadence": int(avg_cadence) if pd.notna(avg_cadence) else None,
+                    "avg_power": int(avg_power) if pd.notna(avg_power) else None,
+                }
+            )
+
+    return pd.DataFrame(laps) if laps else None
+
+
+def make_records(points, seed=0):
+    rng = np.random.default_rng(seed)
+    start = datetime.datetime(2024, 1, 1, 7, 0, 0)
+    step = np.clip(rng.normal(2.9, 0.4, points), 0, None)
+    step[rng.random(points) < 0.01] = 0  # stops
+    heart_rate = np.clip(rng.normal(150, 8, points), 60, 200).round()
+    heart_rate[rng.random(points) < 0.02] = np.nan
+    return pd.DataFrame(
+        {
+            "timestamp": pd.date_range(start, periods=points, freq="s"),
+            "distance": np.cumsum(step).round(1),
+            "speed": step.round(3),
+            "heart_rate": heart_rate,
+            "cadence": rng.integers(160, 190, points).astype("float64"),
+            "power": rng.integers(180, 320, points).astype("float64"),
+        }
+    )
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(points, repeat):
+    logging.disable(logging.WARNING)
+    records = make_records(points)
+    start_date = records["timestamp"].iloc[0]
+    print(f"{points} records, {records['distance'].iloc[-1] / 1000:.1f} km")
+
+    legacy_time, legacy = timed(lambda: legacy_calculate_laps_from_records(records, 1, start_date), repeat)
+    vectorized_time, vectorized = timed(lambda: calculate_laps_from_records(records, 1, start_date), repeat)
+    pd.testing.assert_frame_equal(legacy, vectorized)
+
+    print(f"{'implementation':<24} {'laps':>5} {'time (s)':>9} {'speedup':>8}")
+    print(f"{'legacy (1km)':<24} {len(legacy):>5} {legacy_time:>9.3f} {1:>7.1f}x")
+    print(
+        f"{'vectorized (1km)':<24} {len(vectorized):>5} {vectorized_time:>9.3f} {legacy_time / vectorized_time:>7.1f}x"
+    )
+    for split in OTHER_SPLITS:
+        split_time, laps = timed(lambda: calculate_laps_from_records(records, 1, start_date, split=split), repeat)
+        print(f"{'vectorized (' + split + ')':<24} {len(laps):>5} {split_time:>9.3f}")
+    print("identical: True")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark FIT lap splitting")
+    parser.add_argument("--points", type=int, default=50_000, help="Number of records")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.points, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
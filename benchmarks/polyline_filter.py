@@ -0,0 +1,167 @@
+"""
+Benchmark for the summary-polyline privacy filter.
+
+Builds a synthetic corpus of 5k activities (runs of 80-600 points starting
+around a few home locations), hides the start/end and the surroundings of an
+IGNORE_POLYLINE with ~40 points, and compares:
+
+  * legacy      - the previous pure-Python haversine implementation
+  * vectorized  - polyline_processor.filter_polyline
+  * cached      - db.filter_polylines against a warm polyline_filter_cache
+
+and checks that legacy and vectorized produce the same polylines.
+
+Usage:
+    python -m benchmarks.polyline_filter [--activities 5000] [--ignore-range 500] [--start-end-range 200]
+"""
+
+import argparse
+import logging
+import math
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+import polyline
+from haversine import haversine
+
+from scripts import polyline_processor
+from scripts.generator.db import filter_polylines, init_db
+
+HOMES = [(39.9042, 116.4074), (31.2304, 121.4737), (22.5431, 114.0579)]
+
+
+def legacy_filter_out(polyline_str, ignore_points, ignore_range, start_end_range):
+    """The per-point implementation kept verbatim as a baseline."""
+
+    def point_in_list_points_range(point, points, distance):
+        return any([haversine(point, p) < distance for p in points])
+
+    def range_hiding(pl, points, distance):
+        return [point for point in pl if not point_in_list_points_range(point, points, distance)]
+
+    def start_end_hiding(pl, distance):
+        start_index, end_index = 0, len(pl) - 1
+
+        starting_distance = 0
+        for i in range(1, len(pl)):
+            starting_distance += haversine(pl[i], pl[i - 1])
+            if starting_distance > distance:
+                start_index = i
+                break
+
+        ending_distance = 0
+        for i in range(len(pl) - 2, -1, -1):
+            ending_distance += haversine(pl[i], pl[i + 1])
+            if ending_distance > distance:
+                end_index = i
+                break
+
+        if start_index >= end_index:
+            return []
+        return pl[start_index : end_index + 1]
+
+    if not polyline_str:
+        return
+    pl = polyline.decode(polyline_str)
+    if not pl:
+        return polyline_str
+
+    new_pl = start_end_hiding(pl, start_end_range)
+    new_pl = range_hiding(new_pl, ignore_points, ignore_range)
+
+    if not new_pl:
+        return
+    return polyline.encode(new_pl)
+
+
+def make_corpus(activities, seed=0):
+    """Random-walk summary polylines, most of them starting near one of HOMES."""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for _ in range(activities):
+        lat, lng = HOMES[rng.integers(len(HOMES))]
+        lat += rng.normal(0, 0.01)
+        lng += rng.normal(0, 0.01)
+        size = int(rng.integers(80, 600))
+        # ~30 m steps with a slowly turning heading.
+        heading = np.cumsum(rng.normal(0, 0.3, size)) + rng.uniform(0, 2 * math.pi)
+        lats = lat + np.cumsum(np.cos(heading)) * 0.00027
+        lngs = lng + np.cumsum(np.sin(heading)) * 0.00027 / math.cos(math.radians(lat))
+        corpus.append(polyline.encode(list(zip(lats.round(5), lngs.round(5)))))
+    return corpus
+
+
+def make_ignore_points(seed=1, size=40):
+    """A loop of points around the first home, as one would draw for IGNORE_POLYLINE."""
+    rng = np.random.default_rng(seed)
+    lat, lng = HOMES[0]
+    angles = np.linspace(0, 2 * math.pi, size, endpoint=False)
+    return [
+        (lat + 0.01 * math.sin(a) + rng.normal(0, 0.001), lng + 0.01 * math.cos(a) + rng.normal(0, 0.001))
+        for a in angles
+    ]
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def run(activities, ignore_range_m, start_end_range_m):
+    logging.disable(logging.WARNING)
+    corpus = make_corpus(activities)
+    ignore_points = make_ignore_points()
+    ignore_range, start_end_range = ignore_range_m / 1000, start_end_range_m / 1000
+    total_points = sum(len(polyline.decode(p)) for p in corpus)
+    print(f"{activities} activities, {total_points} points, {len(ignore_points)} ignore points")
+
+    legacy_time, legacy = timed(
+        lambda: [legacy_filter_out(p, ignore_points, ignore_range, start_end_range) for p in corpus]
+    )
+    vectorized_time, vectorized = timed(
+        lambda: [polyline_processor.filter_polyline(p, ignore_points, ignore_range, start_end_range) for p in corpus]
+    )
+
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        patch.multiple(
+            polyline_processor,
+            IGNORE_POLYLINE=ignore_points,
+            IGNORE_RANGE=ignore_range,
+            IGNORE_START_END_RANGE=start_end_range,
+        ),
+    ):
+        polyline_processor._filter_out.cache_clear()
+        con = init_db(Path(tmp) / "bench.duckdb")
+        cold_time, cold = timed(lambda: filter_polylines(con, corpus))
+        polyline_processor._filter_out.cache_clear()
+        warm_time, warm = timed(lambda: filter_polylines(con, corpus))
+        con.close()
+
+    print(f"{'implementation':<24} {'time (s)':>9} {'speedup':>8}")
+    print(f"{'legacy':<24} {legacy_time:>9.2f} {1:>7.1f}x")
+    print(f"{'vectorized':<24} {vectorized_time:>9.2f} {legacy_time / vectorized_time:>7.1f}x")
+    print(f"{'cached (cold)':<24} {cold_time:>9.2f} {legacy_time / cold_time:>7.1f}x")
+    print(f"{'cached (warm)':<24} {warm_time:>9.2f} {legacy_time / warm_time:>7.1f}x")
+    print(f"identical: {legacy == vectorized == cold == warm}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark summary polyline privacy filtering")
+    parser.add_argument("--activities", type=int, default=5000, help="Number of activities in the corpus")
+    parser.add_argument("--ignore-range", type=int, default=500, help="IGNORE_RANGE in meters")
+    parser.add_argument("--start-end-range", type=int, default=200, help="IGNORE_START_END_RANGE in meters")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.activities, args.ignore_range, args.start_end_range)
+
+
+if __name__ == "__main__":
+    main()
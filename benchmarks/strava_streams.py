@@ -0,0 +1,97 @@
+"""
+Benchmark for turning Strava streams into FIT track points.
+
+Builds synthetic stravalib-like streams (1 Hz track with position, altitude,
+speed, heart rate, cadence and distance), compares the fit_record DataFrame of
+get_dataframes_for_fit_tables with the arrays of activity_data_from_strava,
+and checks that both encode to the same FIT record messages.
+
+Usage:
+    python -m benchmarks.strava_streams [--points 40000] [--repeat 3]
+"""
+
+import argparse
+import datetime
+import logging
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from scripts.generator.activity_data import activity_data_from_strava
+from scripts.generator.db import get_dataframes_for_fit_tables
+from scripts.generator.fit_encoder import encode_record_messages
+
+
+def make_activity(points, seed=0):
+    rng = np.random.default_rng(seed)
+    step = np.clip(rng.normal(2.9, 0.4, points), 0, None)
+    heading = np.cumsum(rng.normal(0, 0.05, points))
+    latlng = np.column_stack(
+        (
+            39.9 + np.cumsum(np.cos(heading) * step) / 111_000,
+            116.4 + np.cumsum(np.sin(heading) * step) / 85_000,
+        )
+    )
+    streams = {
+        "time": np.arange(points).tolist(),
+        "latlng": latlng.tolist(),
+        "altitude": (50 + np.cumsum(rng.normal(0, 0.1, points))).round(1).tolist(),
+        "velocity_smooth": step.round(3).tolist(),
+        "heartrate": rng.integers(120, 180, points).tolist(),
+        "cadence": rng.integers(80, 95, points).tolist(),
+        "distance": np.cumsum(step).round(1).tolist(),
+    }
+    activity = SimpleNamespace(
+        id=1,
+        name="Morning Run",
+        type="Run",
+        start_date=datetime.datetime(2024, 1, 1, 7, tzinfo=datetime.timezone.utc),
+        elapsed_time=datetime.timedelta(seconds=points),
+        moving_time=datetime.timedelta(seconds=points),
+        distance=float(np.sum(step)),
+        average_speed=float(np.mean(step)),
+        average_heartrate=150.0,
+        average_cadence=87.0,
+        calories=None,
+    )
+    return activity, {name: SimpleNamespace(data=data) for name, data in streams.items()}
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(points, repeat):
+    logging.disable(logging.WARNING)
+    activity, streams = make_activity(points)
+    print(f"{points} points")
+
+    frames_time, frames = timed(lambda: get_dataframes_for_fit_tables(activity, streams), repeat)
+    arrays_time, data = timed(lambda: activity_data_from_strava(activity, streams), repeat)
+
+    print(f"{'implementation':<30} {'time (s)':>9} {'speedup':>8}")
+    print(f"{'get_dataframes_for_fit_tables':<30} {frames_time:>9.3f} {1:>7.1f}x")
+    print(f"{'activity_data_from_strava':<30} {arrays_time:>9.3f} {frames_time / arrays_time:>7.1f}x")
+    print(f"identical: {encode_record_messages(frames['fit_record']) == encode_record_messages(data.records)}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark Strava streams to FIT track points")
+    parser.add_argument("--points", type=int, default=40_000, help="Number of stream points")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.points, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
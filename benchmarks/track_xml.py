@@ -0,0 +1,170 @@
+"""
+Benchmark for TCX/GPX export serialization.
+
+Builds a synthetic 1 Hz activity in the activities_flyby layout, renders it
+with the minidom/gpxpy builders the export used before and with the streaming
+writers of generator/track_xml.py, and checks that both give the same
+documents. Also times the compact and gzip-compressed layouts.
+
+Usage:
+    python -m benchmarks.track_xml [--points 50000] [--repeat 3]
+"""
+
+import argparse
+import io
+import logging
+import math
+import time
+from xml.dom import minidom
+from xml.etree.ElementTree import Element, SubElement, tostring
+
+import gpxpy.gpx
+import numpy as np
+import pandas as pd
+
+from scripts.export_fit import build_record_frame
+from scripts.generator.track_xml import TCX_ROOT_ATTRIBUTES, open_track_file
+from scripts.strava_cli_core.export import _write_gpx, _write_tcx
+
+
+def make_activity(points, seed=0):
+    rng = np.random.default_rng(seed)
+    step = np.clip(rng.normal(2.9, 0.4, points), 0, None)
+    heading = np.cumsum(rng.normal(0, 0.05, points))
+    flyby_df = pd.DataFrame(
+        {
+            "activity_id": 1,
+            "time_offset": np.arange(points, dtype="float64"),
+            "lat": 39.9 + np.cumsum(np.cos(heading) * step) / 111_000,
+            "lng": 116.4 + np.cumsum(np.sin(heading) * step) / 85_000,
+            "distance": np.cumsum(step).round(1),
+            "alt": (50 + np.cumsum(rng.normal(0, 0.1, points))).round(1),
+            "pace": 5.0,
+            "hr": rng.integers(120, 180, points).astype("float64"),
+            "cadence": 87.0,
+            "watts": np.nan,
+        }
+    )
+    activity_row = pd.Series(
+        {
+            "run_id": 1,
+            "name": "Morning Run",
+            "type": "Run",
+            "start_date": "2024-01-01 07:00:00",
+            "elapsed_time": points,
+            "distance": float(np.sum(step)),
+        }
+    )
+    return activity_row, flyby_df
+
+
+def _legacy_points(activity_row, flyby_df):
+    records = build_record_frame(flyby_df, pd.to_datetime(activity_row["start_date"]))
+    return records.dropna(subset=["position_lat", "position_long"]).to_dict("records")
+
+
+def legacy_gpx(activity_row, flyby_df):
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack(name=str(activity_row.get("name") or activity_row.get("run_id")))
+    segment = gpxpy.gpx.GPXTrackSegment()
+    for point in _legacy_points(activity_row, flyby_df):
+        altitude = point.get("altitude")
+        segment.points.append(
+            gpxpy.gpx.GPXTrackPoint(
+                latitude=point["position_lat"],
+                longitude=point["position_long"],
+                elevation=None if altitude is None or math.isnan(altitude) else altitude,
+                time=point["timestamp"].to_pydatetime(),
+            )
+        )
+    track.segments.append(segment)
+    gpx.tracks.append(track)
+    return gpx.to_xml()
+
+
+def legacy_tcx(activity_row, flyby_df):
+    root = Element("TrainingCenterDatabase", TCX_ROOT_ATTRIBUTES)
+    activities = SubElement(root, "Activities")
+    start = pd.to_datetime(activity_row["start_date"]).isoformat()
+    activity = SubElement(activities, "Activity", {"Sport": str(activity_row.get("type") or "Other")})
+    SubElement(activity, "Id").text = start
+    lap = SubElement(activity, "Lap", {"StartTime": start})
+    SubElement(lap, "TotalTimeSeconds").text = str(float(activity_row.get("elapsed_time") or 0))
+    SubElement(lap, "DistanceMeters").text = str(float(activity_row.get("distance") or 0))
+    SubElement(lap, "Intensity").text = "Active"
+    SubElement(lap, "TriggerMethod").text = "Manual"
+    track = SubElement(lap, "Track")
+    for point in _legacy_points(activity_row, flyby_df):
+        trackpoint = SubElement(track, "Trackpoint")
+        SubElement(trackpoint, "Time").text = point["timestamp"].isoformat()
+        position = SubElement(trackpoint, "Position")
+        SubElement(position, "LatitudeDegrees").text = str(point["position_lat"])
+        SubElement(position, "LongitudeDegrees").text = str(point["position_long"])
+        if not math.isnan(point["altitude"]):
+            SubElement(trackpoint, "AltitudeMeters").text = str(point["altitude"])
+        if not math.isnan(point["heart_rate"]):
+            heart_rate = SubElement(trackpoint, "HeartRateBpm")
+            SubElement(heart_rate, "Value").text = str(int(point["heart_rate"]))
+    creator = SubElement(activity, "Creator", {"xsi:type": "Device_t"})
+    SubElement(creator, "Name").text = "Strava"
+    return minidom.parseString(tostring(root, "utf-8")).toprettyxml(indent="  ")
+
+
+def streamed(write, activity_row, flyby_df, indent="  "):
+    out = io.StringIO()
+    write(out, activity_row, flyby_df, indent=indent)
+    return out.getvalue()
+
+
+def timed(func, repeat):
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run(points, repeat, tmp_dir="."):
+    logging.disable(logging.WARNING)
+    activity_row, flyby_df = make_activity(points)
+    print(f"{points} points")
+    print(f"{'implementation':<18} {'time (s)':>9} {'points/s':>11} {'speedup':>8}")
+
+    identical = True
+    for fmt, legacy, write in (("gpx", legacy_gpx, _write_gpx), ("tcx", legacy_tcx, _write_tcx)):
+        legacy_time, expected = timed(lambda: legacy(activity_row, flyby_df), repeat)
+        stream_time, document = timed(lambda: streamed(write, activity_row, flyby_df), repeat)
+        compact_time, _ = timed(lambda: streamed(write, activity_row, flyby_df, indent=None), repeat)
+
+        def write_gzip():
+            with open_track_file(f"{tmp_dir}/benchmark.{fmt}.gz", compress=True) as out:
+                write(out, activity_row, flyby_df, indent=None)
+
+        gzip_time, _ = timed(write_gzip, repeat)
+        identical = identical and document == expected
+        for name, elapsed in (
+            (f"{fmt} legacy", legacy_time),
+            (f"{fmt} streamed", stream_time),
+            (f"{fmt} compact", compact_time),
+            (f"{fmt} compact+gzip", gzip_time),
+        ):
+            print(f"{name:<18} {elapsed:>9.3f} {points / elapsed:>11,.0f} {legacy_time / elapsed:>7.1f}x")
+    print(f"identical: {identical}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark TCX/GPX export serialization")
+    parser.add_argument("--points", type=int, default=50_000, help="Number of track points")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    parser.add_argument("--tmp-dir", default=".", help="Directory for the gzip output")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    run(args.points, args.repeat, args.tmp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,12 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="Force sync all activities.",
     )
+    parser.add_argument(
+        "--verify-json",
+        dest="verify_json",
+        action="store_true",
+        help="Check the incremental activities.json export against a full rebuild.",
+    )
     return parser
 
 
@@ -46,6 +52,7 @@ def main() -> None:
         gen_tcx=options.gen_tcx,
         is_fit=options.is_fit,
         force_sync=options.force_sync,
+        verify_json=options.verify_json,
     )
 
 
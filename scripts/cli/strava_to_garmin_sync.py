@@ -1,7 +1,7 @@
 import argparse
 import asyncio
 
-from ..strava_to_garmin_sync import run_strava_to_garmin_sync
+from ..strava_to_garmin_sync import UPLOAD_CONCURRENCY, run_strava_to_garmin_sync
 
 
 def build_parser() -> argparse.ArgumentParser:
@@ -33,6 +33,19 @@ def build_parser() -> argparse.ArgumentParser:
         action="store_true",
         help="fix heart rate in fit file",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="worker processes building FIT files (default: 1, a thread)",
+    )
+    parser.add_argument(
+        "--upload-concurrency",
+        dest="upload_concurrency",
+        type=int,
+        default=UPLOAD_CONCURRENCY,
+        help=f"concurrent Garmin uploads (default: {UPLOAD_CONCURRENCY})",
+    )
     return parser
 
 
@@ -48,6 +61,8 @@ def main() -> None:
             options.is_cn,
             options.use_fake_garmin_device,
             options.fix_hr,
+            jobs=max(1, options.jobs),
+            upload_concurrency=max(1, options.upload_concurrency),
         )
     )
 
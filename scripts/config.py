@@ -19,6 +19,7 @@ SQL_FILE: Final[Path] = DATA_ROOT / "data.duckdb"
 JSON_FILE: Final[Path] = PROJECT_ROOT / "src" / "static" / "activities.json"
 SYNCED_FILE: Final[Path] = PROJECT_ROOT / "imported.json"
 SYNCED_ACTIVITY_FILE: Final[Path] = PROJECT_ROOT / "synced_activity.json"
+FIT_INDEX_FILE: Final[Path] = DATA_ROOT / "fit_index.json"
 
 # TODO: Move into nike_sync NRC THINGS
 
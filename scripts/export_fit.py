@@ -1,13 +1,25 @@
+import hashlib
 import os
+import re
 import sys
+from pathlib import Path
 
 import duckdb  # noqa: F401
+import numpy as np
 import pandas as pd
 
 from .config import FIT_FOLDER, SQL_FILE
 from .garmin_device_adaptor import GARMIN_DEVICE_PRODUCT_ID, GARMIN_SOFTWARE_VERSION, MANUFACTURER
 from .generator import Generator
-from .generator.db import get_db_connection
+from .generator.activity_data import activity_data_from_dataframes
+from .generator.db import (
+    ensure_export_manifest_table,
+    get_activity_fingerprints,
+    get_db_connection,
+    get_export_manifest,
+    is_export_current,
+    record_exports,
+)
 from .utils import get_logger, load_env_config
 
 logger = get_logger(__name__)
@@ -48,9 +60,70 @@ def fetch_flyby_data(con, activity_id):
         return pd.DataFrame()
 
 
-def calculate_laps_from_records(fit_record, activity_id, start_date):
+# Lap split units: kind of split and the size of one unit in meters or seconds.
+LAP_SPLIT_UNITS = {
+    "m": ("distance", 1.0),
+    "km": ("distance", 1000.0),
+    "mi": ("distance", 1609.344),
+    "s": ("time", 1.0),
+    "min": ("time", 60.0),
+}
+DEFAULT_LAP_SPLIT = "1km"
+_LAP_SPLIT_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*(km|mi|min|m|s)\s*$")
+
+
+def parse_lap_split(split):
+    """
+    Parses a lap split such as "1km", "1mi", "400m", "5min" or "90s"
+    into ("distance", meters) or ("time", seconds).
+    """
+    match = _LAP_SPLIT_RE.match(split or "")
+    if not match or float(match.group(1)) <= 0:
+        raise ValueError(f"Invalid lap split: {split!r}. Use e.g. 1km, 1mi, 400m, 5min or 90s.")
+    kind, unit = LAP_SPLIT_UNITS[match.group(2)]
+    return kind, float(match.group(1)) * unit
+
+
+# Bump when the FIT/TCX/GPX writers change their output, so the export manifest rebuilds every file.
+EXPORT_FILE_VERSION = 1
+
+
+def export_settings_hash(fmt, lap_split=DEFAULT_LAP_SPLIT, compress=False, indent=True):
+    """Fingerprint of the settings that affect an exported file besides its source rows."""
+    settings = repr((EXPORT_FILE_VERSION, fmt, lap_split if fmt == "fit" else None))
+    if compress or not indent:
+        # Appended only for non-default layouts, so existing manifests stay current.
+        settings += repr((compress, indent))
+    return hashlib.sha1(settings.encode()).hexdigest()
+
+
+def _split_ends(values, start, split):
+    """
+    Indices of the records closing each full lap: a lap ends at the first record
+    at least ``split`` past the record that closed the previous lap.
     """
-    Generate 1km laps from record data.
+    # Running maximum, so a binary search finds the first record reaching a target
+    # even if the values are not monotonic (GPS distance can step back).
+    reached = np.maximum.accumulate(values)
+    ends = []
+    while True:
+        target = values[start] + split
+        slack = 1e-9 * max(1.0, abs(target))
+        lo = int(np.searchsorted(reached, target - slack, side="left"))
+        hi = int(np.searchsorted(reached, target + slack, side="left"))
+        if lo >= len(values):
+            return ends
+        # Resolve the records within rounding distance of the target exactly as `value - start >= split`.
+        window = np.flatnonzero(values[lo : hi + 1] - values[start] >= split)
+        if not len(window):
+            return ends
+        start = lo + int(window[0])
+        ends.append(start)
+
+
+def calculate_laps_from_records(fit_record, activity_id, start_date, split=DEFAULT_LAP_SPLIT):
+    """
+    Generate laps from record data, every ``split`` of distance or time (see parse_lap_split).
     """
     if fit_record.empty or "distance" not in fit_record.columns:
         return None
@@ -60,101 +133,120 @@ def calculate_laps_from_records(fit_record, activity_id, start_date):
     if df.empty:
         return None
 
-    laps = []
-    start_idx = 0
-    lap_start_dist = df.iloc[0]["distance"]
-    lap_start_time = df.iloc[0]["timestamp"]
-    split_dist_meters = 1000.0
-
-    for i in range(len(df)):
-        curr_dist = df.iloc[i]["distance"]
-        dist_covered = curr_dist - lap_start_dist
-
-        if dist_covered >= split_dist_meters:
-            end_time = df.iloc[i]["timestamp"]
-            # Slice range: start_idx (exclusive) to i (inclusive)
-            seg_start = start_idx + 1 if start_idx < i else start_idx
-            segment = df.iloc[seg_start : i + 1]
-
-            elapsed_time = (end_time - lap_start_time).total_seconds()
-            distance = dist_covered
-
-            # Calculate averages
-            if elapsed_time > 0:
-                avg_speed = distance / elapsed_time
-            elif "speed" in segment and not segment["speed"].isnull().all():
-                avg_speed = segment["speed"].mean()
-            else:
-                avg_speed = 0.0
-
-            avg_hr = segment["heart_rate"].mean() if "heart_rate" in segment else None
-            avg_cadence = segment["cadence"].mean() if "cadence" in segment else None
-            avg_power = segment["power"].mean() if "power" in segment else None
-
-            laps.append(
-                {
-                    "activity_id": activity_id,
-                    "timestamp": end_time,
-                    "start_time": lap_start_time,
-                    "total_elapsed_time": elapsed_time,
-                    "total_timer_time": elapsed_time,
-                    "total_distance": distance,
-                    "avg_speed": avg_speed,
-                    "avg_heart_rate": int(avg_hr) if pd.notna(avg_hr) else None,
-                    "avg_cadence": int(avg_cadence) if pd.notna(avg_cadence) else None,
-                    "avg_power": int(avg_power) if pd.notna(avg_power) else None,
-                }
-            )
-
-            # Reset for next lap
-            start_idx = i
-            lap_start_dist = curr_dist
-            lap_start_time = end_time
+    kind, split_size = parse_lap_split(split)
+    timestamps = df["timestamp"]
+    distances = df["distance"].to_numpy(dtype="float64")
+    if kind == "distance":
+        split_values = distances
+    else:
+        split_values = (timestamps - timestamps.iloc[0]).dt.total_seconds().to_numpy(dtype="float64")
 
-    # Handle final lap (remainder)
-    if start_idx < len(df) - 1:
-        i = len(df) - 1
-        end_time = df.iloc[i]["timestamp"]
-        curr_dist = df.iloc[i]["distance"]
-        dist_covered = curr_dist - lap_start_dist
-        elapsed_time = (end_time - lap_start_time).total_seconds()
+    last = len(df) - 1
+    ends = _split_ends(split_values, 0, split_size)
+    starts = [0] + ends[:-1] if ends else []
 
+    # Keep the remainder as a final lap if it is long enough.
+    remainder_start = ends[-1] if ends else 0
+    if remainder_start < last:
+        dist_covered = distances[last] - distances[remainder_start]
+        elapsed_time = (timestamps.iloc[last] - timestamps.iloc[remainder_start]).total_seconds()
         if dist_covered > 10 or elapsed_time > 5:
-            seg_start = start_idx + 1 if start_idx < i else start_idx
-            segment = df.iloc[seg_start : i + 1]
+            starts.append(remainder_start)
+            ends.append(last)
+    if not ends:
+        return None
 
-            if elapsed_time > 0:
-                avg_speed = dist_covered / elapsed_time
-            elif "speed" in segment and not segment["speed"].isnull().all():
-                avg_speed = segment["speed"].mean()
-            else:
-                avg_speed = 0.0
+    starts, ends = np.asarray(starts), np.asarray(ends)
+    elapsed_times = (
+        (timestamps.iloc[ends].reset_index(drop=True) - timestamps.iloc[starts].reset_index(drop=True))
+        .dt.total_seconds()
+        .to_numpy()
+    )
+    lap_distances = distances[ends] - distances[starts]
+
+    # Lap of every record: a lap covers the records after its start up to its end.
+    lap_index = np.searchsorted(ends, np.arange(len(df)), side="left")
+    lap_index[0] = len(ends)
+    columns = [col for col in ("speed", "heart_rate", "cadence", "power") if col in df.columns]
+    means = df[columns].astype("float64").groupby(lap_index).mean().reindex(range(len(ends)))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_speeds = np.where(elapsed_times > 0, lap_distances / elapsed_times, np.nan)
+    if "speed" in means:
+        avg_speeds = np.where(elapsed_times > 0, avg_speeds, means["speed"].to_numpy())
+    avg_speeds = np.where(np.isnan(avg_speeds), 0.0, avg_speeds)
+
+    def int_means(column):
+        if column not in means:
+            return [None] * len(ends)
+        return [int(value) if pd.notna(value) else None for value in means[column].tolist()]
+
+    return pd.DataFrame(
+        {
+            "activity_id": activity_id,
+            "timestamp": timestamps.iloc[ends].tolist(),
+            "start_time": timestamps.iloc[starts].tolist(),
+            "total_elapsed_time": elapsed_times.tolist(),
+            "total_timer_time": elapsed_times.tolist(),
+            "total_distance": lap_distances.tolist(),
+            "avg_speed": avg_speeds.tolist(),
+            "avg_heart_rate": int_means("heart_rate"),
+            "avg_cadence": int_means("cadence"),
+            "avg_power": int_means("power"),
+        }
+    )
 
-            avg_hr = segment["heart_rate"].mean() if "heart_rate" in segment else None
-            avg_cadence = segment["cadence"].mean() if "cadence" in segment else None
-            avg_power = segment["power"].mean() if "power" in segment else None
 
-            laps.append(
-                {
-                    "activity_id": activity_id,
-                    "timestamp": end_time,
-                    "start_time": lap_start_time,
-                    "total_elapsed_time": elapsed_time,
-                    "total_timer_time": elapsed_time,
-                    "total_distance": dist_covered,
-                    "avg_speed": avg_speed,
-                    "avg_heart_rate": int(avg_hr) if pd.notna(avg_hr) else None,
-                    "avg_cadence": int(avg_cadence) if pd.notna(avg_cadence) else None,
-                    "avg_power": int(avg_power) if pd.notna(avg_power) else None,
-                }
-            )
+def build_record_frame(flyby_df, start_date, stationary=False):
+    """
+    Columnar track points from activities_flyby rows, shared by the FIT, GPX and TCX exports.
+
+    Speed is derived from pace (0 when unknown), cadence is NaN when missing or
+    not positive, power is passed through unchanged, and step length is
+    speed / (cadence / 60) when that is between 0.2 and 3 meters. Stationary
+    activities keep only time, heart rate, cadence and power. Returns an empty
+    frame without flyby data.
+    """
+    if flyby_df.empty:
+        return pd.DataFrame()
 
-    return pd.DataFrame(laps) if laps else None
+    def column(name):
+        if name not in flyby_df.columns:
+            return np.full(len(flyby_df), np.nan)
+        return flyby_df[name].astype("float64").to_numpy()
+
+    pace = column("pace")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = np.where(np.isnan(pace) | (pace == 0), 0.0, (1000.0 / 60.0) / pace)
+        cadence = column("cadence")
+        cadence = np.where(cadence > 0, cadence, np.nan)
+        # Strava cadence is steps per minute, so stride length = speed (m/s) / steps per second.
+        step_length = speed / (cadence / 60.0)
+        step_length = np.where((speed > 0) & (step_length > 0.2) & (step_length < 3.0), step_length, np.nan)
+
+    records = pd.DataFrame(
+        {
+            "timestamp": start_date + pd.to_timedelta(flyby_df["time_offset"].to_numpy(dtype="int64"), unit="s"),
+            "position_lat": column("lat"),
+            "position_long": column("lng"),
+            "distance": column("distance"),
+            "altitude": column("alt"),
+            "speed": speed,
+            "heart_rate": column("hr"),
+            "cadence": cadence,
+            "power": column("watts"),
+            "step_length": step_length,
+        }
+    )
+    if stationary:
+        records[["position_lat", "position_long", "distance", "speed", "altitude", "step_length"]] = np.nan
+    return records
 
 
-def construct_dataframes(activity_row, flyby_df):
+def construct_dataframes(activity_row, flyby_df, lap_split=DEFAULT_LAP_SPLIT):
     """
     Build the dictionary of DataFrames required by the Generator.
+    Laps are split every ``lap_split`` (see parse_lap_split).
     """
     activity_id = activity_row["run_id"]
     start_date = pd.to_datetime(activity_row["start_date"])
@@ -171,70 +263,6 @@ def construct_dataframes(activity_row, flyby_df):
     }
     fit_file_id = pd.DataFrame(file_id_data)
 
-    # 2. Records (Track Points)
-    if not flyby_df.empty:
-        timestamps = [start_date + pd.Timedelta(seconds=int(offset)) for offset in flyby_df["time_offset"]]
-
-        def pace_to_speed(p):
-            if pd.isna(p) or p == 0:
-                return 0.0
-            return (1000.0 / 60.0) / float(p)
-
-        speeds = [pace_to_speed(p) for p in flyby_df["pace"]]
-
-        # Stride Length Calculation: Speed (m/s) / (Cadence (spm) / 60)
-        # Note: Strava cadence is usually SPM (steps per minute, both legs).
-        # stride length = speed / (cadence / 60)
-        stride_lengths = []
-        cadences = []
-        watts = []
-
-        has_cadence = "cadence" in flyby_df.columns
-        has_watts = "watts" in flyby_df.columns
-
-        for i in range(len(flyby_df)):
-            s = speeds[i]
-            c = float(flyby_df["cadence"].iloc[i]) if has_cadence and pd.notna(flyby_df["cadence"].iloc[i]) else 0.0
-            w = float(flyby_df["watts"].iloc[i]) if has_watts and pd.notna(flyby_df["watts"].iloc[i]) else None
-
-            cadences.append(c if c > 0 else None)
-            watts.append(w)
-
-            if s > 0 and c > 0:
-                # Speed (m/s) / (Steps/sec)
-                # c is steps per minute. c/60 is steps per second.
-                # If c is ~180, c/60 = 3 steps/sec.
-                # If s is 3.33 m/s (5:00 pace), stride = 3.33 / 3 = 1.11 meters. Checks out.
-                # Use *1000 for mm if FIT requires mm, but typically float meters is fine for internal dataframe,
-                # mapped to fit_tool field. fit_tool expects meters?
-                # Checking fit_tool RecordMessage: step_length is usually in mm or m?
-                # Standard FIT is meters for step_length. But fit_tool uses specific units.
-                # Usually best to store as float meters.
-                sl = s / (c / 60.0)
-                # Filter unrealistic values (e.g. > 3 meters)
-                if 0.2 < sl < 3.0:
-                    stride_lengths.append(sl)
-                else:
-                    stride_lengths.append(None)
-            else:
-                stride_lengths.append(None)
-
-        record_data = {
-            "timestamp": timestamps,
-            "position_lat": flyby_df["lat"].astype(float),
-            "position_long": flyby_df["lng"].astype(float),
-            "distance": flyby_df["distance"].astype(float),
-            "altitude": flyby_df["alt"].astype(float),
-            "speed": speeds,
-            "heart_rate": flyby_df["hr"].astype(float) if "hr" in flyby_df else None,
-            "cadence": cadences,
-            "power": watts,
-            "step_length": stride_lengths,
-        }
-        fit_record = pd.DataFrame(record_data)
-    else:
-        fit_record = pd.DataFrame()
-
     # 3. Session (Summary)
     # Define Sport and SubSport mappings
     # Default to Generic/Generic
@@ -335,68 +363,7 @@ def construct_dataframes(activity_row, flyby_df):
         is_stationary = True
 
     # 2. Records (Track Points)
-    if not flyby_df.empty:
-        timestamps = [start_date + pd.Timedelta(seconds=int(offset)) for offset in flyby_df["time_offset"]]
-
-        def pace_to_speed(p):
-            if pd.isna(p) or p == 0:
-                return 0.0
-            return (1000.0 / 60.0) / float(p)
-
-        speeds = [pace_to_speed(p) for p in flyby_df["pace"]]
-
-        # Stride Length Calculation
-        stride_lengths = []
-        cadences = []
-        watts = []
-
-        has_cadence = "cadence" in flyby_df.columns
-        has_watts = "watts" in flyby_df.columns
-
-        for i in range(len(flyby_df)):
-            s = speeds[i]
-            c = float(flyby_df["cadence"].iloc[i]) if has_cadence and pd.notna(flyby_df["cadence"].iloc[i]) else 0.0
-            w = float(flyby_df["watts"].iloc[i]) if has_watts and pd.notna(flyby_df["watts"].iloc[i]) else None
-
-            cadences.append(c if c > 0 else None)
-            watts.append(w)
-
-            if s > 0 and c > 0:
-                sl = s / (c / 60.0)
-                if 0.2 < sl < 3.0:
-                    stride_lengths.append(sl)
-                else:
-                    stride_lengths.append(None)
-            else:
-                stride_lengths.append(None)
-
-        record_data = {
-            "timestamp": timestamps,
-            "position_lat": flyby_df["lat"].astype(float),
-            "position_long": flyby_df["lng"].astype(float),
-            "distance": flyby_df["distance"].astype(float),
-            "altitude": flyby_df["alt"].astype(float),
-            "speed": speeds,
-            "heart_rate": flyby_df["hr"].astype(float) if "hr" in flyby_df else None,
-            "cadence": cadences,
-            "power": watts,
-            "step_length": stride_lengths,
-        }
-
-        # Apply Stationary Logic to Records
-        if is_stationary:
-            # Clear location, distance, speed, altitude for stationary sports
-            # Keep HR, Cadence, Power, Timestamp
-            record_data["position_lat"] = [None] * len(timestamps)
-            record_data["position_long"] = [None] * len(timestamps)
-            record_data["distance"] = [None] * len(timestamps)
-            record_data["speed"] = [None] * len(timestamps)
-            record_data["altitude"] = [None] * len(timestamps)
-            record_data["step_length"] = [None] * len(timestamps)
-
-        fit_record = pd.DataFrame(record_data)
-    else:
-        fit_record = pd.DataFrame()
+    fit_record = build_record_frame(flyby_df, start_date, stationary=is_stationary)
 
     elapsed_time = float(activity_row["elapsed_time"])
 
@@ -433,7 +400,7 @@ def construct_dataframes(activity_row, flyby_df):
         fit_lap = pd.DataFrame()
     else:
         # Try detailed laps first
-        fit_lap = calculate_laps_from_records(fit_record, activity_id, start_date)
+        fit_lap = calculate_laps_from_records(fit_record, activity_id, start_date, split=lap_split)
 
         # Fallback to single lap if no detailed laps generated
         if fit_lap is None or fit_lap.empty:
@@ -448,6 +415,14 @@ def construct_dataframes(activity_row, flyby_df):
     return {"fit_file_id": fit_file_id, "fit_record": fit_record, "fit_session": fit_session, "fit_lap": fit_lap}
 
 
+def build_activity_data(activity_row, flyby_df, lap_split=DEFAULT_LAP_SPLIT):
+    """
+    The ActivityData read by Generator.build_fit_file, from the DataFrames of
+    construct_dataframes.
+    """
+    return activity_data_from_dataframes(construct_dataframes(activity_row, flyby_df, lap_split=lap_split))
+
+
 def _fit_safe_activity_name(raw_name, activity_id) -> str:
     if raw_name is None:
         return f"Strava {activity_id}"
@@ -502,7 +477,8 @@ def export_fit(activity_id, output_file=None, force=False):
 
     # 1. Connect & Validate
     try:
-        con = get_db_connection(database=SQL_FILE, read_only=True)
+        con = get_db_connection(database=SQL_FILE)
+        ensure_export_manifest_table(con)
     except Exception as e:
         logger.error(f"Error connecting to database: {e}")
         return
@@ -513,6 +489,14 @@ def export_fit(activity_id, output_file=None, force=False):
         logger.error(f"Activity ID {activity_id} does not exist in the database.")
         return
 
+    output_path = str(Path(output_file).resolve())
+    settings_hash = export_settings_hash("fit")
+    _, source_hash = get_activity_fingerprints(con, [int(activity_id)])[int(activity_id)]
+    entry = get_export_manifest(con, [output_path]).get(output_path)
+    if not force and is_export_current(entry, settings_hash, source_hash, output_path):
+        logger.info(f"{output_file} is up to date, skipping.")
+        return
+
     logger.info(f"Found Activity: {activity_row['name']} ({activity_row['start_date']})")
 
     # 2. Fetch Data
@@ -522,18 +506,34 @@ def export_fit(activity_id, output_file=None, force=False):
     else:
         logger.info(f"Found {len(flyby_df)} track points.")
 
-    # 3. Construct DataFrames
-    dataframes = construct_dataframes(activity_row, flyby_df)
+    # 3. Construct the activity data
+    activity_data = build_activity_data(activity_row, flyby_df)
 
     # 4. Generate FIT File
     logger.info("Building FIT file...")
     try:
         generator = Generator(SQL_FILE)
-        fit_bytes = generator.build_fit_file_from_dataframes(dataframes)
+        fit_bytes = generator.build_fit_file(activity_data)
 
         with open(output_file, "wb") as f:
             f.write(fit_bytes)
 
+        stat = os.stat(output_file)
+        record_exports(
+            con,
+            [
+                {
+                    "output_path": output_path,
+                    "activity_id": int(activity_id),
+                    "format": "fit",
+                    "settings_hash": settings_hash,
+                    "source_hash": source_hash,
+                    "output_sha256": hashlib.sha256(fit_bytes).hexdigest(),
+                    "output_size": stat.st_size,
+                    "output_mtime_ns": stat.st_mtime_ns,
+                }
+            ],
+        )
         logger.info(f"File saved to: {output_file}")
     except Exception as e:
         logger.error(f"Error building FIT file: {e}")
@@ -0,0 +1,169 @@
+"""
+FIT file_id scanning for fit_to_garmin_sync.
+
+read_fit_time_created parses a FIT file only up to its file_id message instead
+of decoding the whole file, and iter_fit_files keeps the time_created of every
+file of a folder in a JSON index keyed by file name, size and mtime, so only
+new or changed files are opened at all.
+"""
+
+import concurrent.futures
+import json
+import os
+import struct
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+FitFile = namedtuple("FitFile", ["path", "time_created"])
+
+FIT_INDEX_VERSION = 1
+FIT_SCAN_WORKERS = 8
+# Seconds between the Unix epoch and the FIT epoch (1989-12-31T00:00:00Z).
+FIT_EPOCH_OFFSET = 631065600
+FILE_ID_MESG_NUM = 0
+TIME_CREATED_FIELD_NUM = 4
+# file_id is the first data message of a FIT file; give up on files where it is not.
+MAX_HEADER_MESSAGES = 64
+
+
+def _read_exact(file, size):
+    data = file.read(size)
+    if len(data) != size:
+        raise ValueError("Truncated FIT file")
+    return data
+
+
+def _file_id_time_created(endian, fields, content):
+    offset = 0
+    for index in range(0, len(fields), 3):
+        field_num, field_size = fields[index], fields[index + 1]
+        if field_num == TIME_CREATED_FIELD_NUM and field_size == 4:
+            value = struct.unpack(f"{endian}I", content[offset : offset + 4])[0]
+            if value == 0xFFFFFFFF:
+                return None
+            return datetime.fromtimestamp(value + FIT_EPOCH_OFFSET, tz=timezone.utc)
+        offset += field_size
+    return None
+
+
+def read_fit_time_created(path):
+    """
+    time_created of the file_id message of the FIT file at ``path`` as an aware
+    UTC datetime, or None when the file has none. Reads only the file header and
+    the messages up to file_id.
+    """
+    with open(path, "rb") as file:
+        header = _read_exact(file, 12)
+        if header[8:12] != b".FIT" or header[0] < 12:
+            raise ValueError(f"{path} is not a FIT file")
+        data_size = struct.unpack("<I", header[4:8])[0]
+        file.seek(header[0])
+
+        definitions = {}
+        consumed = 0
+        for _ in range(MAX_HEADER_MESSAGES):
+            if consumed >= data_size:
+                break
+            record_header = _read_exact(file, 1)[0]
+            consumed += 1
+            if record_header & 0x80:
+                # Compressed timestamp header, always a data message.
+                local_type = (record_header >> 5) & 0x03
+            elif record_header & 0x40:
+                _, architecture = _read_exact(file, 2)
+                endian = ">" if architecture else "<"
+                global_num, field_count = struct.unpack(f"{endian}HB", _read_exact(file, 3))
+                fields = _read_exact(file, 3 * field_count)
+                consumed += 5 + 3 * field_count
+                developer_size = 0
+                if record_header & 0x20:
+                    developer_count = _read_exact(file, 1)[0]
+                    developer_size = sum(_read_exact(file, 3 * developer_count)[1::3])
+                    consumed += 1 + 3 * developer_count
+                definitions[record_header & 0x0F] = (endian, global_num, fields, sum(fields[1::3]) + developer_size)
+                continue
+            else:
+                local_type = record_header & 0x0F
+
+            if local_type not in definitions:
+                raise ValueError(f"{path} has a data message without a definition")
+            endian, global_num, fields, size = definitions[local_type]
+            content = _read_exact(file, size)
+            consumed += size
+            if global_num == FILE_ID_MESG_NUM:
+                return _file_id_time_created(endian, fields, content)
+    return None
+
+
+def load_fit_index(index_file):
+    """``{file name: [size, mtime_ns, time_created seconds or None]}`` saved by save_fit_index."""
+    if not os.path.exists(index_file):
+        return {}
+    try:
+        with open(index_file, "r") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.error(f"json load {index_file} error: {e}")
+        return {}
+    if data.get("version") != FIT_INDEX_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def save_fit_index(index_file, index):
+    tmp_file = f"{index_file}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"version": FIT_INDEX_VERSION, "files": index}, f, sort_keys=True)
+    os.replace(tmp_file, index_file)
+
+
+def _scan(path):
+    try:
+        time_created = read_fit_time_created(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable FIT file {path}: {e}")
+        return None
+    if time_created is None:
+        logger.warning(f"Skipping FIT file without file_id time_created: {path}")
+        return None
+    return int(time_created.timestamp())
+
+
+def iter_fit_files(folder, index_file=None, workers=FIT_SCAN_WORKERS):
+    """
+    Yields a FitFile for each .fit file of ``folder``, newest time_created first.
+    Files listed in ``index_file`` with the same size and mtime are not opened;
+    the others are scanned with read_fit_time_created in ``workers`` threads and
+    the index is rewritten. Files without a time_created are skipped.
+    """
+    index = load_fit_index(index_file) if index_file else {}
+    entries = {}
+    stale = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if not entry.name.lower().endswith(".fit") or not entry.is_file():
+                continue
+            stat = entry.stat()
+            cached = index.get(entry.name)
+            if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+                entries[entry.name] = cached
+            else:
+                stale.append((entry.name, [stat.st_size, stat.st_mtime_ns]))
+
+    if stale:
+        logger.info(f"Reading the file_id of {len(stale)} new or changed FIT files in {folder}")
+        paths = [os.path.join(folder, name) for name, _ in stale]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for (name, key), created in zip(stale, pool.map(_scan, paths)):
+                entries[name] = key + [created]
+    if index_file and (stale or entries.keys() != index.keys()):
+        save_fit_index(index_file, entries)
+
+    # Newest first; equal times in reverse file name order, like the old name-sorted listing.
+    dated = sorted(((created, name) for name, (_, _, created) in entries.items() if created is not None), reverse=True)
+    for created, name in dated:
+        yield FitFile(path=os.path.join(folder, name), time_created=datetime.fromtimestamp(created, tz=timezone.utc))
@@ -1,12 +1,11 @@
 import json
 import os
-from collections import namedtuple
 from datetime import datetime, timezone
 
 import httpx
-from garmin_fit_sdk import Decoder, Stream
 
-from .config import FIT_FOLDER
+from .config import FIT_FOLDER, FIT_INDEX_FILE
+from .fit_index import iter_fit_files
 from .garmin_sync import Garmin
 from .utils import get_logger, load_env_config
 
@@ -56,23 +55,8 @@ class FitToGarmin(Garmin):
 
 
 def get_fit_files():
-    FitFile = namedtuple("FitFile", ["path", "time_created"])
-    fit_files = []
-    for filename in os.listdir(FIT_FOLDER):
-        if filename.lower().endswith(".fit"):
-            fit_files.append(filename)
-
-    fit_files_sorted = sorted(fit_files, reverse=True)
-    fit_files_fullpath = [os.path.join(FIT_FOLDER, filename) for filename in fit_files_sorted]
-    files = []
-    for file_path in fit_files_fullpath:
-        stream = Stream.from_file(file_path)
-        decoder = Decoder(stream)
-        messages, errors = decoder.read()
-        time_created = messages["file_id_mesgs"][0]["time_created"]
-        # Assume the time in FIT file is UTC
-        files.append(FitFile(path=file_path, time_created=time_created.replace(tzinfo=timezone.utc)))
-    return files
+    """FitFiles of FIT_FOLDER, newest time_created first (see fit_index.iter_fit_files)."""
+    return list(iter_fit_files(FIT_FOLDER, FIT_INDEX_FILE))
 
 
 async def _upload_new_fit_activities(secret_string, garmin_auth_domain):
@@ -83,16 +67,16 @@ async def _upload_new_fit_activities(secret_string, garmin_auth_domain):
         logger.error(f"Failed to get last activity from Garmin: {e}")
         return
 
-    all_fit_files = get_fit_files()
+    fit_files = iter_fit_files(FIT_FOLDER, FIT_INDEX_FILE)
     upload_files = []
     if not last_activity:
         logger.info("No Garmin activity found, preparing to upload all local files.")
-        upload_files = [f.path for f in all_fit_files]
+        upload_files = [f.path for f in fit_files]
     else:
         after_datetime_str = last_activity[0]["startTimeGMT"]
         after_datetime = datetime.strptime(after_datetime_str, DATE_FORMAT).replace(tzinfo=timezone.utc)
         logger.info(f"Garmin's last activity date: {after_datetime}")
-        for fit_file in all_fit_files:
+        for fit_file in fit_files:
             if after_datetime >= fit_file.time_created:
                 # Stop when we find a file that is older or same as the last synced one
                 break
@@ -1,3 +1,5 @@
+import numpy as np
+import pandas as pd
 from fit_tool.fit_file import FitFile
 from fit_tool.fit_file_builder import FitFileBuilder
 from fit_tool.profile.messages.device_info_message import DeviceInfoMessage
@@ -25,66 +27,56 @@ def is_fit_file(file):
     return header == b".FIT"
 
 
-def add_fake_device_info(file_content):
+def rewrite_fit(file_content, *transforms):
     """
-    add fake garmin device info to fit file
+    Decodes a FIT file once, passes its messages through ``transforms`` in
+    order and encodes the result once. A transform takes and returns the list
+    of messages (definition and data messages, in file order).
     """
     fit_file = FitFile.from_bytes(file_content)
-    builder = FitFileBuilder(auto_define=True)
+    messages = [record.message for record in fit_file.records]
+    for transform in transforms:
+        messages = transform(messages)
 
-    for record in fit_file.records:
-        message = record.message
-        if message.global_id == DeviceInfoMessage.ID:
-            # ignore file device info, like WorkoutDoors APP
-            continue
+    builder = FitFileBuilder(auto_define=True)
+    for message in messages:
         builder.add(message)
-
-    # Add device info
-    device_info_message = get_device_info_message()
-    builder.add(device_info_message)
-
-    modified_file = builder.build()
-    logger.info("add garmin device info success")
-    return modified_file.to_bytes()
+    return builder.build().to_bytes()
 
 
-def fix_heart_rate(file_content):
+def replace_device_info(messages):
     """
-    Process garmin data, fix heart rate data
+    Transform: drops the file's device info, like WorkoutDoors APP,
+    and adds the fake Garmin device info.
     """
-    fit_file = FitFile.from_bytes(file_content)
-    builder = FitFileBuilder(auto_define=True)
-
-    record_messages = []
-
-    for record in fit_file.records:
-        message = record.message
-        if not isinstance(message, RecordMessage):
-            builder.add(message)
-        else:
-            record_messages.append(message)
-
-    # Process and add heart rate data
-    for message in get_processed_heart_rate_message(record_messages):
-        builder.add(message)
-
-    modified_file = builder.build()
+    messages = [message for message in messages if message.global_id != DeviceInfoMessage.ID]
+    messages.append(get_device_info_message())
+    return messages
+
+
+def fill_heart_rate(messages):
+    """Transform: fills missing record heart rates (see get_processed_heart_rate_message)."""
+    positions = [index for index, message in enumerate(messages) if isinstance(message, RecordMessage)]
+    processed = get_processed_heart_rate_message([messages[index] for index in positions])
+    messages = list(messages)
+    for index, message in zip(positions, processed):
+        messages[index] = message
     logger.info("process garmin data success")
-    return modified_file.to_bytes()
-
+    return messages
 
-def find_valid_heart_rate(messages, current_index):
-    """Find the nearest valid heart rate value."""
 
-    for msg in messages[current_index + 1 :]:
-        if msg.heart_rate is not None and msg.heart_rate != 255:
-            return msg.heart_rate
+def add_fake_device_info(file_content):
+    """
+    add fake garmin device info to fit file
+    """
+    return rewrite_fit(file_content, replace_device_info)
 
-    for msg in reversed(messages[:current_index]):
-        if msg.heart_rate is not None and msg.heart_rate != 255:
-            return msg.heart_rate
 
-    return None
+def fix_heart_rate(file_content):
+    """
+    Process garmin data, fix heart rate data
+    """
+    return rewrite_fit(file_content, fill_heart_rate)
 
 
 def create_new_record_message(old_message, heart_rate):
@@ -92,30 +84,38 @@ def create_new_record_message(old_message, heart_rate):
     new_message = RecordMessage()
 
     for field in old_message.fields:
-        field_name = field.name
-        if hasattr(old_message, field_name):
-            field_value = getattr(old_message, field_name)
-            if field_name == "heart_rate":
-                setattr(new_message, field_name, heart_rate)
-            elif field_value is not None:
-                setattr(new_message, field_name, field_value)
+        # Only the fields set in the old message, the others would read back as None.
+        if not field.is_valid() or field.name == "heart_rate":
+            continue
+        field_value = getattr(old_message, field.name, None)
+        if field_value is not None:
+            setattr(new_message, field.name, field_value)
+    new_message.heart_rate = heart_rate
 
     return new_message
 
 
 def get_processed_heart_rate_message(record_messages):
-    """Process heart rate data, replacing None/255 values with nearby valid values."""
-    processed_messages = []
-
-    for i, message in enumerate(record_messages):
-        if message.heart_rate is None or message.heart_rate == 255:
-            valid_heart_rate = find_valid_heart_rate(record_messages, i)
-            if valid_heart_rate is not None:
-                processed_messages.append(create_new_record_message(message, valid_heart_rate))
-            else:
-                processed_messages.append(message)
+    """
+    Process heart rate data, replacing None/255 values with the next valid value,
+    or the previous one after the last valid sample. One forward and one backward
+    fill over the whole activity.
+    """
+    heart_rates = pd.Series(
+        [message.heart_rate if message.heart_rate != 255 else None for message in record_messages], dtype="float64"
+    )
+    missing = heart_rates.isna().to_numpy()
+    filled = heart_rates.bfill().fillna(heart_rates.ffill())
+
+    processed_messages = list(record_messages)
+    for i in np.flatnonzero(missing & filled.notna().to_numpy()).tolist():
+        message = record_messages[i]
+        heart_rate_field = message.get_field_by_name("heart_rate")
+        if heart_rate_field is not None and heart_rate_field.is_valid():
+            # An invalid (255) sample: the field is in the definition, overwrite it in place.
+            message.heart_rate = int(filled.iat[i])
         else:
-            processed_messages.append(message)
+            processed_messages[i] = create_new_record_message(message, int(filled.iat[i]))
 
     logger.info("process heart rate data success")
     return processed_messages
@@ -16,7 +16,7 @@ from lxml import etree
 
 from .config import FOLDER_DICT, JSON_FILE, SQL_FILE
 from .exceptions import AuthenticationError, RateLimitError, SyncError
-from .garmin_device_adaptor import add_fake_device_info, fix_heart_rate
+from .garmin_device_adaptor import fill_heart_rate, replace_device_info, rewrite_fit
 from .utils import get_logger, load_env_config, make_activities_file
 
 logger = get_logger(__name__)
@@ -24,6 +24,14 @@ logger = get_logger(__name__)
 TIME_OUT = httpx.Timeout(240.0, connect=360.0)
 
 
+def _retry_after_seconds(response):
+    """Seconds of a Retry-After header, or None when it is missing or an HTTP date."""
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
 def get_garmin_urls(domain="com"):
     """Return Garmin Connect URLs for a given domain."""
     return {
@@ -76,10 +84,12 @@ class Garmin:
         try:
             response = await self.req.get(url, headers=self.headers)
             if response.status_code == 429:
-                raise GarminConnectTooManyRequestsError("Too many requests")
+                raise GarminConnectTooManyRequestsError("Too many requests", _retry_after_seconds(response))
             logger.debug(f"fetch_data got response code {response.status_code}")
             response.raise_for_status()
             return response.json()
+        except GarminConnectTooManyRequestsError:
+            raise
         except httpx.HTTPStatusError as err:
             logger.error(f"HTTP error occurred: {err}")
             if retrying:
@@ -136,51 +146,16 @@ class Garmin:
             use_fake_garmin_device,
             fix_hr,
         )
+        transforms = fit_upload_transforms(use_fake_garmin_device, fix_hr)
         failed_uploads = []
         results = []
         for data in datas:
             try:
-                # Process content in memory
+                # Process content in memory, decoding and re-encoding the FIT file once
                 file_content = b"".join(data.content)
-                if use_fake_garmin_device:
-                    file_content = add_fake_device_info(file_content)
-                if fix_hr:
-                    file_content = fix_heart_rate(file_content)
-                files = {"file": (os.path.basename(data.filename), file_content)}
-
-                res = await self.req.post(self.upload_url, files=files, headers=self.headers)
-
-                logger.info(f"Upload Response Code: {res.status_code}")
-
-                if logger.isEnabledFor(logging.DEBUG):
-                    safe_headers = {
-                        k: v
-                        for k, v in res.headers.items()
-                        if k.lower() not in ("authorization", "cookie", "set-cookie", "x-auth-token")
-                    }
-                    logger.debug(f"Upload Response Headers: {safe_headers}")
-                    body_preview = res.text[:500] + "..." if len(res.text) > 500 else res.text
-                    logger.debug(f"Upload Response Body: {body_preview}")
-
-                res.raise_for_status()
-
-                # Handle successful upload with no content response
-                if res.status_code == 204:
-                    logger.info("Garmin upload for %s success with status 204.", data.filename)
-                    results.append(None)
-                    continue
-
-                try:
-                    resp = res.json()["detailedImportResult"]
-                    logger.info("Garmin upload success: %s", resp)
-                    results.append(resp)
-                except Exception as e:
-                    logger.error(
-                        "Failed to parse Garmin response, status: %d, response: %s",
-                        res.status_code,
-                        res.text,
-                    )
-                    raise e
+                if transforms:
+                    file_content = rewrite_fit(file_content, *transforms)
+                results.append(await self.upload_fit(data.filename, file_content))
             except Exception as e:
                 logger.exception("Garmin upload for %s failed: %s", data.filename, e)
                 failed_uploads.append(data.filename)
@@ -190,6 +165,49 @@ class Garmin:
             )
         return results
 
+    async def upload_fit(self, filename, file_content):
+        """
+        Uploads one FIT file as is and returns Garmin's detailedImportResult,
+        or None for a 204 response. Raises GarminConnectTooManyRequestsError on
+        a 429 response and httpx errors on other HTTP errors.
+        """
+        files = {"file": (os.path.basename(filename), file_content)}
+
+        res = await self.req.post(self.upload_url, files=files, headers=self.headers)
+
+        logger.info(f"Upload Response Code: {res.status_code}")
+        if res.status_code == 429:
+            raise GarminConnectTooManyRequestsError("Too many requests", _retry_after_seconds(res))
+
+        if logger.isEnabledFor(logging.DEBUG):
+            safe_headers = {
+                k: v
+                for k, v in res.headers.items()
+                if k.lower() not in ("authorization", "cookie", "set-cookie", "x-auth-token")
+            }
+            logger.debug(f"Upload Response Headers: {safe_headers}")
+            body_preview = res.text[:500] + "..." if len(res.text) > 500 else res.text
+            logger.debug(f"Upload Response Body: {body_preview}")
+
+        res.raise_for_status()
+
+        # Handle successful upload with no content response
+        if res.status_code == 204:
+            logger.info("Garmin upload for %s success with status 204.", filename)
+            return None
+
+        try:
+            resp = res.json()["detailedImportResult"]
+            logger.info("Garmin upload success: %s", resp)
+            return resp
+        except Exception as e:
+            logger.error(
+                "Failed to parse Garmin response, status: %d, response: %s",
+                res.status_code,
+                res.text,
+            )
+            raise e
+
     async def upload_activity_from_file(self, file_path):
         logger.info("Uploading %s", file_path)
         try:
@@ -238,6 +256,16 @@ class GarminConnectAuthenticationError(AuthenticationError):
     pass
 
 
+def fit_upload_transforms(use_fake_garmin_device=False, fix_hr=False):
+    """The rewrite_fit transforms applied to FIT files before they are uploaded."""
+    transforms = []
+    if use_fake_garmin_device:
+        transforms.append(replace_device_info)
+    if fix_hr:
+        transforms.append(fill_heart_rate)
+    return transforms
+
+
 def get_info_text_value(summary_infos, key_name):
     return str(summary_infos.get(key_name, ""))
 
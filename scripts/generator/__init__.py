@@ -1,10 +1,14 @@
 """Generator package for activity synchronization and file generation."""
 
+from .activity_data import ActivityData, activity_data_from_dataframes, activity_data_from_strava
 from .db import (
+    FlybyBatchWriter,
+    close_db_connections,
     convert_streams_to_flyby_dataframe,
     get_dataframe_from_strava_activities,
     get_dataframes_for_fit_tables,
     get_db_connection,
+    get_db_connection_stats,
     init_db,
     prune_activities_not_in_remote_ids,
     store_flyby_data,
@@ -23,11 +27,18 @@ __all__ = [
     "FitBuilderMixin",
     "TcxBuilderMixin",
     "StravaClientMixin",
+    # Activity data
+    "ActivityData",
+    "activity_data_from_dataframes",
+    "activity_data_from_strava",
     # DB utilities
+    "FlybyBatchWriter",
+    "close_db_connections",
     "convert_streams_to_flyby_dataframe",
     "get_dataframe_from_strava_activities",
     "get_dataframes_for_fit_tables",
     "get_db_connection",
+    "get_db_connection_stats",
     "init_db",
     "prune_activities_not_in_remote_ids",
     "store_flyby_data",
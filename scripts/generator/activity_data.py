@@ -0,0 +1,263 @@
+"""
+Columnar activity data shared by the FIT and TCX builders.
+
+An ActivityData holds the summary of one activity as plain scalars and its
+track points and laps as struct-of-arrays: one numpy array per field, with
+timestamps as int64 Unix milliseconds and every other field as float64 with
+NaN where the value is missing. Both the Strava streams path and the database
+path produce it, and the builders read it without going through pandas.
+"""
+
+import math
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from fit_tool.profile.profile_type import Sport, SubSport
+
+from ..garmin_device_adaptor import GARMIN_DEVICE_PRODUCT_ID, GARMIN_SOFTWARE_VERSION, MANUFACTURER
+
+# Track point fields besides "timestamp", in the units of the fit_record columns.
+RECORD_FIELDS = (
+    "position_lat",
+    "position_long",
+    "distance",
+    "altitude",
+    "speed",
+    "heart_rate",
+    "cadence",
+    "power",
+    "step_length",
+)
+
+# Lap fields besides "start_time" and "timestamp".
+LAP_FIELDS = (
+    "total_elapsed_time",
+    "total_timer_time",
+    "total_distance",
+    "avg_speed",
+    "avg_heart_rate",
+    "avg_cadence",
+    "avg_power",
+)
+
+# Strava streams read into track point fields.
+STREAM_FIELDS = {
+    "distance": "distance",
+    "altitude": "altitude",
+    "velocity_smooth": "speed",
+    "heartrate": "heart_rate",
+    "cadence": "cadence",
+}
+
+STRAVA_SPORTS = {
+    "Run": Sport.RUNNING.value,
+    "Hike": Sport.HIKING.value,
+    "Walk": Sport.WALKING.value,
+    "EBikeRide": Sport.E_BIKING.value,
+    "Swim": Sport.SWIMMING.value,
+    "Ride": Sport.CYCLING.value,
+    "Workout": Sport.TRAINING.value,
+    "WeightTraining": Sport.TRAINING.value,
+}
+
+
+@dataclass
+class ActivityData:
+    """One activity as FIT messages see it. Times are Unix milliseconds, durations seconds, distances meters."""
+
+    activity_id: int
+    name: str | None
+    sport: int
+    sub_sport: int
+    start_time: int
+    timestamp: int
+    total_elapsed_time: float
+    total_timer_time: float
+    total_distance: float
+    avg_speed: float | None = None
+    avg_heart_rate: float | None = None
+    avg_cadence: float | None = None
+    avg_power: float | None = None
+    calories: float | None = None
+    # Strava activity type, e.g. "Run", used as the TCX sport.
+    activity_type: str | None = None
+    time_created: int | None = None
+    manufacturer: int = MANUFACTURER
+    product: int = GARMIN_DEVICE_PRODUCT_ID
+    software_version: float = GARMIN_SOFTWARE_VERSION
+    file_type: int = 4  # Activity
+    # "timestamp" plus RECORD_FIELDS, all of the same length.
+    records: dict[str, np.ndarray] = field(default_factory=dict)
+    # "start_time" and "timestamp" plus LAP_FIELDS, all of the same length.
+    laps: dict[str, np.ndarray] = field(default_factory=dict)
+
+    @property
+    def record_count(self) -> int:
+        return len(self.records["timestamp"]) if "timestamp" in self.records else 0
+
+    @property
+    def lap_count(self) -> int:
+        return len(self.laps["timestamp"]) if "timestamp" in self.laps else 0
+
+
+def optional_float(value):
+    """``value`` as a float, or None when it is missing (None or NaN)."""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def strava_activity_type(activity):
+    """Activity type as a plain string; stravalib 2 wraps it in a pydantic root model."""
+    activity_type = getattr(activity, "type", None)
+    activity_type = getattr(activity_type, "root", activity_type)
+    return None if activity_type is None else str(activity_type)
+
+
+def strava_fit_sport(activity_type, name=None):
+    """FIT (sport, sub_sport) of a Strava activity type, with boxing detected from the name."""
+    sport = STRAVA_SPORTS.get(activity_type, Sport.GENERIC.value)
+
+    # By default generic SubSport
+    sub_sport = SubSport.GENERIC.value
+
+    # Heuristic for specific sports based on name
+    if sport == Sport.GENERIC.value or sport == Sport.TRAINING.value:
+        # For Workout/WeightTraining (mapped to TRAINING), default to Strength Training
+        if sport == Sport.TRAINING.value:
+            sub_sport = SubSport.STRENGTH_TRAINING.value
+
+        if name:
+            lower_name = name.lower()
+            if "boxing" in lower_name or "拳击" in lower_name:
+                sport = Sport.BOXING.value
+                sub_sport = SubSport.GENERIC.value  # Boxing doesn't have specific subsport usually
+    return sport, sub_sport
+
+
+def _stream_array(streams, stream_name, length):
+    """A stream as float64 aligned to ``length`` points: NaN for missing values, padded or truncated."""
+    aligned = np.full(length, np.nan)
+    stream = streams.get(stream_name)
+    if stream and stream.data:
+        values = pd.to_numeric(pd.Series(stream.data[:length], dtype=object), errors="coerce")
+        aligned[: len(values)] = values.to_numpy(dtype="float64", na_value=np.nan)
+    return aligned
+
+
+def activity_data_from_strava(activity, streams):
+    """
+    ActivityData from a stravalib activity and its streams. Track points need
+    the time and latlng streams; the activity totals make up a single lap.
+    """
+    start_time = round(activity.start_date.timestamp() * 1000)
+    name = getattr(activity, "name", "Activity")
+    activity_type = strava_activity_type(activity)
+    sport, sub_sport = strava_fit_sport(activity_type, getattr(activity, "name", ""))
+
+    records = {}
+    if streams and streams.get("time") and streams.get("latlng"):
+        time_stream = np.asarray(streams.get("time").data, dtype="float64")
+        count = len(time_stream)
+        records["timestamp"] = start_time + np.rint(time_stream * 1000).astype("int64")
+
+        latlng = np.full((count, 2), np.nan)
+        points = [point if point is not None else (np.nan, np.nan) for point in streams.get("latlng").data[:count]]
+        if points:
+            latlng[: len(points)] = np.asarray(points, dtype="float64")
+        records["position_lat"] = latlng[:, 0]
+        records["position_long"] = latlng[:, 1]
+        for stream_name, field_name in STREAM_FIELDS.items():
+            records[field_name] = _stream_array(streams, stream_name, count)
+
+    elapsed_time = activity.elapsed_time.total_seconds()
+    data = ActivityData(
+        activity_id=activity.id,
+        name=name,
+        sport=sport,
+        sub_sport=sub_sport,
+        start_time=start_time,
+        timestamp=start_time + round(elapsed_time * 1000),
+        total_elapsed_time=elapsed_time,
+        total_timer_time=activity.moving_time.total_seconds(),
+        total_distance=float(activity.distance),
+        avg_speed=optional_float(activity.average_speed),
+        avg_heart_rate=optional_float(activity.average_heartrate),
+        avg_cadence=optional_float(activity.average_cadence),
+        calories=optional_float(getattr(activity, "calories", None)),
+        activity_type=activity_type,
+        time_created=start_time,
+        records=records,
+    )
+    data.laps = {
+        "start_time": np.array([data.start_time], dtype="int64"),
+        "timestamp": np.array([data.timestamp], dtype="int64"),
+    }
+    for field_name in LAP_FIELDS:
+        value = getattr(data, field_name)
+        data.laps[field_name] = np.array([np.nan if value is None else value], dtype="float64")
+    return data
+
+
+def _timestamps_ms(values):
+    """Unix milliseconds like round(ts.timestamp() * 1000); naive timestamps are UTC."""
+    timestamps = pd.to_datetime(pd.Series(values), utc=True).dt.tz_localize(None)
+    ns = timestamps.to_numpy(dtype="datetime64[ns]").astype("int64")
+    return np.rint(ns / 1e6).astype("int64")
+
+
+def _columns(df, timestamp_fields, fields):
+    """Struct-of-arrays view of ``df``: int64 milliseconds and float64 columns, NaN for missing ones."""
+    if df is None or df.empty:
+        return {}
+    columns = {name: _timestamps_ms(df[name]) for name in timestamp_fields}
+    for name in fields:
+        if name in df.columns:
+            values = pd.to_numeric(df[name], errors="coerce")
+            columns[name] = values.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            columns[name] = np.full(len(df), np.nan)
+    return columns
+
+
+def activity_data_from_dataframes(dataframes):
+    """
+    ActivityData from the fit_file_id, fit_session, fit_record and fit_lap
+    DataFrames of construct_dataframes or get_dataframes_for_fit_tables.
+    """
+    session = dataframes["fit_session"].iloc[0]
+    file_id = dataframes.get("fit_file_id")
+    file_id = file_id.iloc[0] if file_id is not None and not file_id.empty else None
+
+    def value(name):
+        return optional_float(session[name]) if name in session else None
+
+    sub_sport = value("sub_sport")
+    name = session["name"] if "name" in session and pd.notna(session["name"]) else None
+    start_time = _timestamps_ms([session["start_time"]])[0]
+    data = ActivityData(
+        activity_id=int(session["activity_id"]) if "activity_id" in session else 0,
+        name=None if name is None else str(name),
+        sport=int(session["sport"]),
+        sub_sport=SubSport.GENERIC.value if sub_sport is None else int(sub_sport),
+        start_time=int(start_time),
+        timestamp=int(_timestamps_ms([session["timestamp"]])[0]),
+        total_elapsed_time=float(session["total_elapsed_time"]),
+        total_timer_time=float(session["total_timer_time"]),
+        total_distance=float(session["total_distance"]),
+        avg_speed=value("avg_speed"),
+        avg_heart_rate=value("avg_heart_rate"),
+        avg_cadence=value("avg_cadence"),
+        avg_power=value("avg_power"),
+        records=_columns(dataframes.get("fit_record"), ("timestamp",), RECORD_FIELDS),
+        laps=_columns(dataframes.get("fit_lap"), ("start_time", "timestamp"), LAP_FIELDS),
+    )
+    if file_id is not None:
+        data.time_created = int(_timestamps_ms([file_id["time_created"]])[0])
+        data.manufacturer = int(file_id["manufacturer"])
+        data.product = int(file_id["product"])
+        data.software_version = float(file_id["software_version"])
+        data.file_type = int(file_id["type"])
+    return data
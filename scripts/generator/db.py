@@ -1,6 +1,10 @@
 import concurrent.futures
 import datetime
+import functools
+import os
 import ssl
+import threading
+import time
 from contextlib import contextmanager
 from pathlib import Path
 from typing import Iterator
@@ -8,12 +12,16 @@ from typing import Iterator
 import certifi
 import duckdb
 import geopy
+import numpy as np
 import pandas as pd
-from fit_tool.profile.profile_type import Sport, SubSport
+import s2sphere
 from geopy.geocoders import Nominatim
 
 from ..exceptions import StorageError
+from ..offline_geocoder import lookup_countries
+from ..polyline_processor import filter_out, filter_settings_key, polyline_hash
 from ..utils import get_logger, load_env_config
+from .activity_data import strava_activity_type, strava_fit_sport
 
 logger = get_logger(__name__)
 
@@ -131,6 +139,67 @@ FLYBY_QUEUE_SCHEMA = {
     "updated_at": "TIMESTAMP",
 }
 
+POLYLINE_FILTER_CACHE_SCHEMA = {
+    "polyline_hash": "VARCHAR NOT NULL",
+    "settings_hash": "VARCHAR NOT NULL",
+    "summary_polyline": "VARCHAR",
+    "updated_at": "TIMESTAMP",
+}
+
+GEOCODE_CACHE_SCHEMA = {
+    "cell_id": "VARCHAR PRIMARY KEY",
+    "level": "INTEGER",
+    "location_country": "VARCHAR",
+    "hits": "BIGINT DEFAULT 0",
+    "updated_at": "TIMESTAMP",
+}
+
+# One row per exported FIT/TCX/GPX file: what it was built from and what was written.
+EXPORT_MANIFEST_SCHEMA = {
+    "output_path": "VARCHAR PRIMARY KEY",
+    "activity_id": "BIGINT NOT NULL",
+    "format": "VARCHAR NOT NULL",
+    "settings_hash": "VARCHAR NOT NULL",
+    "source_hash": "VARCHAR NOT NULL",
+    "output_sha256": "VARCHAR",
+    "output_size": "BIGINT",
+    "output_mtime_ns": "BIGINT",
+    "exported_at": "TIMESTAMP",
+}
+
+# Content fingerprint of every activity (see activity_fingerprints_sql), kept current by the
+# activities and activities_flyby writers of this module in the transaction of each write.
+ACTIVITY_FINGERPRINTS_SCHEMA = {
+    "run_id": "BIGINT PRIMARY KEY",
+    "flyby_points": "BIGINT NOT NULL",
+    "fingerprint": "VARCHAR NOT NULL",
+    "updated_at": "TIMESTAMP",
+}
+# The activity and flyby columns a fingerprint covers: those the exported files
+# and the Garmin uploads are built from.
+FINGERPRINT_ACTIVITY_COLUMNS = (
+    "start_date",
+    "name",
+    "type",
+    "distance",
+    "moving_time",
+    "elapsed_time",
+    "elevation_gain",
+    "average_speed",
+    "average_heartrate",
+)
+FINGERPRINT_FLYBY_COLUMNS = ("time_offset", "lat", "lng", "alt", "pace", "hr", "cadence", "watts", "distance")
+
+# Materialized streaks, one row per activity in export order (start_date_local, run_id).
+# scope is "all" or "run" (only_run).
+ACTIVITY_STREAKS_SCHEMA = {
+    "scope": "VARCHAR NOT NULL",
+    "pos": "BIGINT NOT NULL",
+    "run_id": "BIGINT NOT NULL",
+    "day": "DATE",
+    "streak": "BIGINT NOT NULL",
+}
+
 
 def _create_table_if_not_exists(db_connection, table_name, schema):
     columns_def = ", ".join([f"{name} {dtype}" for name, dtype in schema.items()])
@@ -182,19 +251,15 @@ def _migrate_schema(db_connection):
         logger.warning(f"Could not perform schema migration: {e}")
 
 
-def get_db_connection(database: str | Path, read_only: bool = False) -> duckdb.DuckDBPyConnection:
-    db_path = Path(database)
-    if not read_only:
-        db_path.parent.mkdir(parents=True, exist_ok=True)
-
+@functools.lru_cache(maxsize=1)
+def _resolve_encryption_key() -> str | None:
+    """DUCKDB_ENCRYPTION_KEY from .env.local or the environment, resolved once per process."""
     env_config = load_env_config()
     key = env_config.get("duckdb_encryption_key") if env_config else None
+    return key or os.getenv("DUCKDB_ENCRYPTION_KEY")
 
-    if not key:
-        import os
-
-        key = os.getenv("DUCKDB_ENCRYPTION_KEY")
 
+def _open_connection(database: str | Path, read_only: bool, key: str | None) -> duckdb.DuckDBPyConnection:
     if key:
         try:
             # Use in-memory connection and attach the encrypted DB
@@ -212,8 +277,87 @@ def get_db_connection(database: str | Path, read_only: bool = False) -> duckdb.D
             raise StorageError(f"Failed to open database with encryption key: {e}") from e
 
     # No key provided, standard connect
-    con = duckdb.connect(database=database, read_only=read_only)
-    return con
+    return duckdb.connect(database=database, read_only=read_only)
+
+
+class ConnectionManager:
+    """
+    Keeps one DuckDB connection per database file for the whole process and
+    hands out cursors on it, so a run opens (and, when encrypted, attaches)
+    each database once instead of on every get_db_connection() call.
+
+    A database first opened read-only is reopened writable the first time a
+    writable cursor is requested; cursors handed out before that are closed
+    with the old connection. Cursors requested read-only on a writable
+    connection are not restricted.
+    """
+
+    def __init__(self):
+        self._connections = {}  # path -> (connection, read_only, encrypted)
+        self._lock = threading.Lock()
+        self.stats = {"opens": 0, "open_seconds": 0.0, "reopens": 0, "cursors": 0}
+
+    def cursor(self, database: str | Path, read_only: bool = False) -> duckdb.DuckDBPyConnection:
+        db_path = Path(database)
+        if not read_only:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+        path = str(db_path.resolve())
+
+        with self._lock:
+            entry = self._connections.get(path)
+            if entry is not None and entry[1] and not read_only:
+                logger.debug(f"Reopening {database} writable.")
+                self._connections.pop(path)[0].close()
+                self.stats["reopens"] += 1
+                entry = None
+            if entry is None:
+                key = _resolve_encryption_key()
+                started = time.perf_counter()
+                connection = _open_connection(database, read_only, key)
+                self.stats["opens"] += 1
+                self.stats["open_seconds"] += time.perf_counter() - started
+                entry = (connection, read_only, bool(key))
+                self._connections[path] = entry
+
+            connection, _, encrypted = entry
+            cursor = connection.cursor()
+            if encrypted:
+                cursor.execute("USE main_db")
+            self.stats["cursors"] += 1
+            return cursor
+
+    def close(self) -> None:
+        """Closes every pooled connection (and the cursors handed out on them)."""
+        with self._lock:
+            for connection, _, _ in self._connections.values():
+                connection.close()
+            self._connections.clear()
+
+
+_connection_manager = ConnectionManager()
+
+
+def get_db_connection(database: str | Path, read_only: bool = False) -> duckdb.DuckDBPyConnection:
+    """
+    Cursor on the process-wide connection to ``database`` (see ConnectionManager).
+    Closing it leaves the shared connection open.
+    """
+    if str(database) == ":memory:":
+        return _open_connection(database, read_only, None)
+    return _connection_manager.cursor(database, read_only)
+
+
+def close_db_connections() -> None:
+    """Closes the pooled connections and forgets the resolved encryption key."""
+    _connection_manager.close()
+    _resolve_encryption_key.cache_clear()
+
+
+def get_db_connection_stats() -> dict:
+    """Connection opens, time spent opening them, writable reopens and cursors handed out."""
+    stats = dict(_connection_manager.stats)
+    stats["open_seconds"] = round(stats["open_seconds"], 3)
+    return stats
 
 
 def _ensure_primary_keys(db_connection):
@@ -310,6 +454,30 @@ def _ensure_primary_keys(db_connection):
         raise
 
 
+def _create_polyline_filter_cache_table(db_connection):
+    columns_def = ", ".join([f"{name} {dtype}" for name, dtype in POLYLINE_FILTER_CACHE_SCHEMA.items()])
+    db_connection.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS polyline_filter_cache (
+            {columns_def},
+            PRIMARY KEY (polyline_hash, settings_hash)
+        );
+        """
+    )
+
+
+def _create_activity_streaks_table(db_connection):
+    columns_def = ", ".join([f"{name} {dtype}" for name, dtype in ACTIVITY_STREAKS_SCHEMA.items()])
+    db_connection.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS activity_streaks (
+            {columns_def},
+            PRIMARY KEY (scope, pos)
+        );
+        """
+    )
+
+
 def init_db(db_path: str | Path) -> duckdb.DuckDBPyConnection:
     """
     Initializes the DuckDB database,
@@ -332,6 +500,21 @@ def init_db(db_path: str | Path) -> duckdb.DuckDBPyConnection:
     # Create queue table for pending flyby sync
     _create_table_if_not_exists(con, "activities_flyby_queue", FLYBY_QUEUE_SCHEMA)
 
+    # Persistent reverse-geocoding cache
+    _create_table_if_not_exists(con, "geocode_cache", GEOCODE_CACHE_SCHEMA)
+
+    # Privacy-filtered summary polylines, keyed by polyline and IGNORE_* settings
+    _create_polyline_filter_cache_table(con)
+
+    # Streaks derived from activities, refreshed by refresh_activity_streaks()
+    _create_activity_streaks_table(con)
+
+    # Exported files and the content hashes they were built from
+    ensure_export_manifest_table(con)
+
+    # Per-activity content fingerprints for exports and the Garmin sync
+    _create_table_if_not_exists(con, "activity_fingerprints", ACTIVITY_FINGERPRINTS_SCHEMA)
+
     return con
 
 
@@ -429,6 +612,7 @@ def update_or_create_activities(db_connection: duckdb.DuckDBPyConnection, activi
 
         with transaction(db_connection):
             db_connection.execute(query)
+            refresh_activity_fingerprints(db_connection, activities_df["run_id"].tolist())
 
         return len(activities_df)
     except Exception as e:
@@ -489,14 +673,35 @@ def prune_activities_not_in_remote_ids(
             WHERE run_id IN (SELECT activity_id FROM temp_stale_activity_ids)
             """
         )
+        refresh_activity_fingerprints(db_connection, stale_id_values)
     finally:
         db_connection.unregister("temp_stale_activity_ids")
 
     return len(stale_id_values)
 
 
-# Cache for geocoding results to avoid repeated API calls for the same location
+# Reverse-geocoding results are cached per S2 cell: in-process in _geocode_cache and
+# across runs in the geocode_cache table. Level 10 cells are about 10 km wide, fine
+# enough to resolve countries everywhere but close to a border.
+GEOCODE_CELL_LEVEL = int(os.getenv("GEOCODE_CELL_LEVEL", "10"))
+GEOCODE_CACHE_TTL_DAYS = int(os.getenv("GEOCODE_CACHE_TTL_DAYS", "365"))
+# Offline mode never calls Nominatim; cells missing from the country index and the cache stay unresolved.
+GEOCODE_OFFLINE = os.getenv("GEOCODE_OFFLINE", "").lower() in ("1", "true", "yes")
+
 _geocode_cache = {}
+_geocode_stats = {"hits": 0, "misses": 0, "offline": 0, "lookups": 0}
+
+
+def geocode_cell_id(lat, lon, level=None):
+    """Token of the S2 cell at ``level`` (default GEOCODE_CELL_LEVEL) containing the point."""
+    level = GEOCODE_CELL_LEVEL if level is None else level
+    cell = s2sphere.CellId.from_lat_lng(s2sphere.LatLng.from_degrees(float(lat), float(lon)))
+    return cell.parent(level).to_token()
+
+
+def get_geocode_cache_stats():
+    """Cache hits and misses, offline index resolutions and Nominatim lookups made by this process."""
+    return dict(_geocode_stats)
 
 
 def _get_location_country(lat, lon):
@@ -506,11 +711,13 @@ def _get_location_country(lat, lon):
     if pd.isna(lat) or pd.isna(lon):
         return ""
 
-    # Use a tuple key for the cache
-    cache_key = (round(lat, 4), round(lon, 4))
+    cache_key = geocode_cell_id(lat, lon)
     if cache_key in _geocode_cache:
         return _geocode_cache[cache_key]
 
+    if GEOCODE_OFFLINE:
+        return ""
+
     try:
         location = get_geocoder().reverse(f"{lat},{lon}", language="zh-CN", timeout=10)
         country = location.raw.get("address", {}).get("country", "")
@@ -522,10 +729,131 @@ def _get_location_country(lat, lon):
         return ""
 
 
-def get_dataframe_from_strava_activities(activities):
+def lookup_geocode_cache(db_connection: duckdb.DuckDBPyConnection, cell_ids) -> dict[str, str]:
+    """
+    Resolves cell ids against the geocode_cache table with a single join and
+    counts a hit on every matched cell. Entries older than the TTL are ignored
+    unless running offline.
+    """
+    cell_ids = list(dict.fromkeys(cell_ids))
+    if not cell_ids:
+        return {}
+
+    ttl_clause = "" if GEOCODE_OFFLINE else f"AND g.updated_at >= NOW() - INTERVAL {GEOCODE_CACHE_TTL_DAYS} DAY"
+    db_connection.register("temp_geocode_cells", pd.DataFrame({"cell_id": cell_ids}))
+    try:
+        rows = db_connection.execute(
+            f"""
+            SELECT g.cell_id, g.location_country
+            FROM temp_geocode_cells c
+            JOIN geocode_cache g ON g.cell_id = c.cell_id
+            WHERE g.location_country <> '' {ttl_clause}
+            """
+        ).fetchall()
+        if rows:
+            db_connection.execute(
+                "UPDATE geocode_cache SET hits = hits + 1 WHERE cell_id IN (SELECT UNNEST(?))",
+                [[cell_id for cell_id, _ in rows]],
+            )
+    finally:
+        db_connection.unregister("temp_geocode_cells")
+    return dict(rows)
+
+
+def store_geocode_cache(db_connection: duckdb.DuckDBPyConnection, countries: dict[str, str]) -> int:
+    """Upserts resolved cells into the geocode_cache table. Failed (empty) lookups are not persisted."""
+    rows = [(cell_id, country) for cell_id, country in countries.items() if country]
+    if not rows:
+        return 0
+    df = pd.DataFrame(rows, columns=["cell_id", "location_country"])
+    df["level"] = GEOCODE_CELL_LEVEL
+    db_connection.register("temp_geocode_results", df)
+    try:
+        db_connection.execute(
+            """
+            INSERT INTO geocode_cache (cell_id, level, location_country, hits, updated_at)
+            SELECT cell_id, level, location_country, 0, NOW() FROM temp_geocode_results
+            ON CONFLICT (cell_id) DO UPDATE SET
+                location_country = excluded.location_country,
+                level = excluded.level,
+                updated_at = excluded.updated_at
+            """
+        )
+    finally:
+        db_connection.unregister("temp_geocode_results")
+    return len(rows)
+
+
+def _resolve_location_countries(cells: pd.DataFrame, db_connection=None) -> dict[str, str]:
+    """
+    Resolves the country of every cell in ``cells`` (cell_id, start_lat, start_lon),
+    trying the in-process cache, the bundled country index, the geocode_cache
+    table and finally Nominatim for cells near a border.
+    """
+    cell_ids = cells["cell_id"].tolist()
+    resolved = {cell_id: _geocode_cache[cell_id] for cell_id in cell_ids if cell_id in _geocode_cache}
+
+    _geocode_stats["hits"] += len(resolved)
+
+    missing = [cell_id for cell_id in cell_ids if cell_id not in resolved]
+    if missing:
+        points = cells[cells["cell_id"].isin(missing)]
+        offline = {
+            cell_id: country
+            for cell_id, country in zip(
+                points["cell_id"], lookup_countries(points["start_lat"].tolist(), points["start_lon"].tolist())
+            )
+            if country
+        }
+        _geocode_stats["offline"] += len(offline)
+        _geocode_cache.update(offline)
+        resolved.update(offline)
+        missing = [cell_id for cell_id in missing if cell_id not in offline]
+
+    if missing and db_connection is not None:
+        try:
+            stored = lookup_geocode_cache(db_connection, missing)
+        except duckdb.Error as e:
+            logger.warning(f"Could not read the geocode cache: {e}")
+            stored = {}
+        _geocode_stats["hits"] += len(stored)
+        _geocode_cache.update(stored)
+        resolved.update(stored)
+        missing = [cell_id for cell_id in missing if cell_id not in stored]
+
+    _geocode_stats["misses"] += len(missing)
+
+    if not missing or GEOCODE_OFFLINE:
+        if missing:
+            logger.info(f"Offline geocoding: {len(missing)} locations not in cache, leaving them unresolved.")
+        return resolved
+
+    # Query Nominatim with the first start point seen in each missing cell.
+    to_fetch = cells[cells["cell_id"].isin(missing)]
+    _geocode_stats["lookups"] += len(to_fetch)
+    logger.info(f"Fetching {len(to_fetch)} unique new locations...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+        fetched = dict(
+            zip(
+                to_fetch["cell_id"],
+                executor.map(_get_location_country, to_fetch["start_lat"], to_fetch["start_lon"]),
+            )
+        )
+    resolved.update(fetched)
+
+    if db_connection is not None:
+        try:
+            store_geocode_cache(db_connection, fetched)
+        except duckdb.Error as e:
+            logger.warning(f"Could not update the geocode cache: {e}")
+    return resolved
+
+
+def get_dataframe_from_strava_activities(activities, db_connection=None):
     """
     Converts a list of Strava activity objects to a pandas DataFrame,
     handling data transformation and geocoding.
+    If a db_connection is given, geocoding results are cached in its geocode_cache table.
     """
     if not activities:
         return pd.DataFrame()
@@ -574,29 +902,20 @@ def get_dataframe_from_strava_activities(activities):
     if needs_geocoding_mask.any():
         logger.info("Performing reverse geocoding for missing locations...")
 
-        # Step 1: Identify unique, uncached coordinates that need to be fetched
-        coords_to_fetch = df.loc[needs_geocoding_mask, ["start_lat", "start_lon"]].dropna().drop_duplicates()
-
-        # Convert to tuples for caching and processing
-        unique_coords = [(round(row.start_lat, 4), round(row.start_lon, 4)) for row in coords_to_fetch.itertuples()]
-
-        # Filter out coordinates that are already in the cache
-        uncached_coords = [coord for coord in unique_coords if coord not in _geocode_cache]
-
-        # Step 2: Concurrently fetch data for uncached coordinates
-        if uncached_coords:
-            logger.info(f"Fetching {len(uncached_coords)} unique new locations...")
-            with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                # We just need to execute the tasks to populate the cache
-                list(executor.map(lambda p: _get_location_country(p[0], p[1]), uncached_coords))
+        # Bucket start points into S2 cells; rows without coordinates resolve to "".
+        points = df.loc[needs_geocoding_mask, ["start_lat", "start_lon"]].dropna()
+        cell_ids = pd.Series(
+            [geocode_cell_id(lat, lon) for lat, lon in zip(points["start_lat"], points["start_lon"])],
+            index=points.index,
+            dtype=object,
+        )
+        cells = points.assign(cell_id=cell_ids).drop_duplicates("cell_id")
+        countries = _resolve_location_countries(cells, db_connection) if not cells.empty else {}
 
-        # Step 3: Apply the now-cached results to the DataFrame
-        geocoded_countries = df.loc[needs_geocoding_mask].apply(
-            lambda row: _get_location_country(row["start_lat"], row["start_lon"]),
-            axis=1,
+        df.loc[needs_geocoding_mask, "location_country"] = (
+            cell_ids.map(countries).reindex(df.index[needs_geocoding_mask]).fillna("")
         )
-        df.loc[needs_geocoding_mask, "location_country"] = geocoded_countries
-        logger.info("Geocoding complete.")
+        logger.info(f"Geocoding complete. Cache stats: {get_geocode_cache_stats()}")
 
     # Drop temporary lat/lon columns before returning
     df = df.drop(columns=["start_lat", "start_lon"], errors="ignore")
@@ -604,10 +923,324 @@ def get_dataframe_from_strava_activities(activities):
     return df
 
 
+def filter_polylines(db_connection: duckdb.DuckDBPyConnection, polylines) -> list:
+    """
+    Applies polyline_processor.filter_out to ``polylines`` through the
+    polyline_filter_cache table, so a polyline is only filtered once per IGNORE_* setting.
+    Rows cached for other settings are dropped when new results are stored.
+    """
+    polylines = list(polylines)
+    if db_connection is None:
+        return [filter_out(value) for value in polylines]
+
+    results = [None] * len(polylines)
+    settings_hash = filter_settings_key()
+    hashes = {}
+    for i, value in enumerate(polylines):
+        if isinstance(value, str) and value:
+            hashes.setdefault(polyline_hash(value), []).append(i)
+    if not hashes:
+        return results
+
+    try:
+        cached = dict(
+            db_connection.execute(
+                """
+                SELECT polyline_hash, summary_polyline FROM polyline_filter_cache
+                WHERE settings_hash = ? AND polyline_hash IN (SELECT UNNEST(?))
+                """,
+                [settings_hash, list(hashes)],
+            ).fetchall()
+        )
+    except duckdb.Error as e:
+        logger.warning(f"Could not read the polyline filter cache: {e}")
+        cached = {}
+
+    missing = {key: filter_out(polylines[rows[0]]) for key, rows in hashes.items() if key not in cached}
+    for key, rows in hashes.items():
+        value = cached[key] if key in cached else missing[key]
+        for i in rows:
+            results[i] = value
+
+    if missing:
+        df = pd.DataFrame({"polyline_hash": list(missing), "summary_polyline": list(missing.values())})
+        db_connection.register("temp_polyline_filter", df)
+        try:
+            with transaction(db_connection):
+                db_connection.execute("DELETE FROM polyline_filter_cache WHERE settings_hash <> ?", [settings_hash])
+                db_connection.execute(
+                    """
+                    INSERT INTO polyline_filter_cache (polyline_hash, settings_hash, summary_polyline, updated_at)
+                    SELECT polyline_hash, ?, summary_polyline, NOW() FROM temp_polyline_filter
+                    ON CONFLICT DO NOTHING
+                    """,
+                    [settings_hash],
+                )
+        except duckdb.Error as e:
+            logger.warning(f"Could not update the polyline filter cache: {e}")
+        finally:
+            db_connection.unregister("temp_polyline_filter")
+    return results
+
+
+def _ordered_activities_sql(only_run: bool) -> str:
+    where = "WHERE type = 'Run'" if only_run else ""
+    return f"""
+        SELECT ROW_NUMBER() OVER (ORDER BY start_date_local, run_id) AS pos,
+               run_id,
+               CAST(start_date_local AS DATE) AS day
+        FROM activities
+        {where}
+    """
+
+
+def activity_streaks_sql(only_run: bool = False, from_pos: int = 1) -> str:
+    """
+    Window-function query yielding (pos, run_id, day, streak) for every activity
+    at or after ``from_pos``, ordered by start_date_local, run_id.
+
+    An activity continues the streak of the previous one if that one started on
+    the previous day, otherwise it starts a new streak at 1. ``from_pos`` must be
+    the first activity of a streak.
+    """
+    return f"""
+        WITH ordered AS ({_ordered_activities_sql(only_run)}),
+        tail AS (
+            SELECT pos, run_id, day, day - LAG(day) OVER (ORDER BY pos) AS gap
+            FROM ordered
+            WHERE pos >= {int(from_pos)}
+        ),
+        islands AS (
+            SELECT pos, run_id, day,
+                   SUM(CASE WHEN gap = 1 THEN 0 ELSE 1 END) OVER (ORDER BY pos) AS island
+            FROM tail
+        )
+        SELECT pos, run_id, day, ROW_NUMBER() OVER (PARTITION BY island ORDER BY pos) AS streak
+        FROM islands
+    """
+
+
+def _streaks_scope(only_run: bool) -> str:
+    return "run" if only_run else "all"
+
+
+def refresh_activity_streaks(db_connection: duckdb.DuckDBPyConnection, only_run: bool = False) -> int:
+    """
+    Brings the activity_streaks rows of a scope up to date with the activities table.
+
+    Stored rows are kept up to the first activity whose position or day changed;
+    the tail is recomputed from the start of the streak that activity continues.
+    Returns the number of recomputed rows.
+    """
+    scope = _streaks_scope(only_run)
+    first_change = db_connection.execute(
+        f"""
+        WITH current AS ({_ordered_activities_sql(only_run)}),
+        stored AS (SELECT pos, run_id, day FROM activity_streaks WHERE scope = ?)
+        SELECT MIN(COALESCE(c.pos, s.pos))
+        FROM current c
+        FULL OUTER JOIN stored s ON c.pos = s.pos
+        WHERE c.run_id IS DISTINCT FROM s.run_id OR c.day IS DISTINCT FROM s.day
+        """,
+        [scope],
+    ).fetchone()[0]
+    if first_change is None:
+        return 0
+
+    tail_start = 1
+    if first_change > 1:
+        previous_streak = db_connection.execute(
+            "SELECT streak FROM activity_streaks WHERE scope = ? AND pos = ?", [scope, first_change - 1]
+        ).fetchone()[0]
+        tail_start = first_change - previous_streak
+
+    with transaction(db_connection):
+        db_connection.execute("DELETE FROM activity_streaks WHERE scope = ? AND pos >= ?", [scope, tail_start])
+        db_connection.execute(
+            f"""
+            INSERT INTO activity_streaks (scope, pos, run_id, day, streak)
+            SELECT ?, pos, run_id, day, streak FROM ({activity_streaks_sql(only_run, tail_start)})
+            """,
+            [scope],
+        )
+        recomputed = db_connection.execute(
+            "SELECT COUNT(*) FROM activity_streaks WHERE scope = ? AND pos >= ?", [scope, tail_start]
+        ).fetchone()[0]
+    return recomputed
+
+
+def activity_streaks_source(db_connection: duckdb.DuckDBPyConnection | None, only_run: bool = False) -> str:
+    """
+    SQL relation of (run_id, streak) for the activities in scope: the refreshed
+    activity_streaks table on a writable connection, else computed inline.
+    """
+    if db_connection is None:
+        return f"(SELECT run_id, streak FROM ({activity_streaks_sql(only_run)}))"
+    refresh_activity_streaks(db_connection, only_run)
+    return f"(SELECT run_id, streak FROM activity_streaks WHERE scope = '{_streaks_scope(only_run)}')"
+
+
+def ensure_export_manifest_table(db_connection: duckdb.DuckDBPyConnection) -> None:
+    _create_table_if_not_exists(db_connection, "export_manifest", EXPORT_MANIFEST_SCHEMA)
+
+
+def get_export_manifest(db_connection: duckdb.DuckDBPyConnection, output_paths: list[str]) -> dict[str, tuple]:
+    """(settings_hash, source_hash, output_size, output_mtime_ns) of every recorded file in ``output_paths``."""
+    if not output_paths:
+        return {}
+    rows = db_connection.execute(
+        """
+        SELECT output_path, settings_hash, source_hash, output_size, output_mtime_ns
+        FROM export_manifest
+        WHERE output_path IN (SELECT UNNEST(?))
+        """,
+        [output_paths],
+    ).fetchall()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def is_export_current(entry: tuple | None, settings_hash: str, source_hash: str, output_path: str | Path) -> bool:
+    """
+    True if ``output_path`` was exported with the same settings from the same
+    source rows and has not been touched since (same size and mtime).
+    """
+    if entry is None or entry[:2] != (settings_hash, source_hash):
+        return False
+    try:
+        stat = os.stat(output_path)
+    except OSError:
+        return False
+    return (stat.st_size, stat.st_mtime_ns) == entry[2:]
+
+
+def record_exports(db_connection: duckdb.DuckDBPyConnection, exports: list[dict]) -> int:
+    """Upserts export_manifest rows (dicts keyed by EXPORT_MANIFEST_SCHEMA columns, without exported_at)."""
+    if not exports:
+        return 0
+    columns = [column for column in EXPORT_MANIFEST_SCHEMA if column != "exported_at"]
+    # The last export of a path wins, as one INSERT cannot update the same key twice.
+    df = pd.DataFrame(exports, columns=columns).drop_duplicates("output_path", keep="last")
+    db_connection.register("temp_export_manifest", df)
+    try:
+        update_cols = ", ".join(f"{col} = excluded.{col}" for col in columns[1:])
+        with transaction(db_connection):
+            db_connection.execute(
+                f"""
+                INSERT INTO export_manifest ({", ".join(columns)}, exported_at)
+                SELECT {", ".join(columns)}, NOW() FROM temp_export_manifest
+                ON CONFLICT (output_path) DO UPDATE SET {update_cols}, exported_at = excluded.exported_at
+                """
+            )
+    finally:
+        db_connection.unregister("temp_export_manifest")
+    return len(df)
+
+
+def _fingerprint_text(columns, alias):
+    # Empty text for NULLs, so a NULL cannot be confused with a shifted value.
+    return ", ".join(f"COALESCE(CAST({alias}.{column} AS VARCHAR), '')" for column in columns)
+
+
+def activity_fingerprints_sql(filtered: bool = False) -> str:
+    """
+    Query for ``(run_id, flyby_points, fingerprint)`` of every activity, or only
+    of the ids bound to ``$activity_ids`` when ``filtered``: md5 of the
+    FINGERPRINT_ACTIVITY_COLUMNS of the activity and of its
+    FINGERPRINT_FLYBY_COLUMNS in time_offset order. The one definition of an
+    activity's content hash; refresh_activity_fingerprints stores it in
+    activity_fingerprints, which the export manifest and the Garmin sync read.
+    """
+    flyby_filter = "WHERE f.activity_id IN (SELECT UNNEST($activity_ids))" if filtered else ""
+    activity_filter = "WHERE a.run_id IN (SELECT UNNEST($activity_ids))" if filtered else ""
+    return f"""
+        SELECT
+            a.run_id,
+            COALESCE(flyby.points, 0) AS flyby_points,
+            md5(concat_ws('|', {_fingerprint_text(FINGERPRINT_ACTIVITY_COLUMNS, "a")},
+                COALESCE(flyby.points, 0), COALESCE(flyby.points_hash, ''))) AS fingerprint
+        FROM activities a
+        LEFT JOIN (
+            SELECT
+                f.activity_id,
+                COUNT(*) AS points,
+                md5(string_agg(concat_ws(',', {_fingerprint_text(FINGERPRINT_FLYBY_COLUMNS, "f")}), ';'
+                    ORDER BY f.time_offset)) AS points_hash
+            FROM activities_flyby f
+            {flyby_filter}
+            GROUP BY f.activity_id
+        ) flyby ON flyby.activity_id = a.run_id
+        {activity_filter}
+    """
+
+
+def refresh_activity_fingerprints(
+    db_connection: duckdb.DuckDBPyConnection,
+    activity_ids: list[int] | None = None,
+) -> int:
+    """
+    Recomputes the activity_fingerprints rows of ``activity_ids`` (all activities
+    when None) with activity_fingerprints_sql. Rows of ids no longer in
+    activities are dropped. Returns the rows written.
+    """
+    if activity_ids is not None and not activity_ids:
+        return 0
+    _create_table_if_not_exists(db_connection, "activity_fingerprints", ACTIVITY_FINGERPRINTS_SCHEMA)
+    if activity_ids is None:
+        params = {}
+        db_connection.execute("DELETE FROM activity_fingerprints")
+    else:
+        params = {"activity_ids": [int(activity_id) for activity_id in activity_ids]}
+        db_connection.execute(
+            "DELETE FROM activity_fingerprints WHERE run_id IN (SELECT UNNEST($activity_ids))", params
+        )
+    written = db_connection.execute(
+        f"""
+        INSERT INTO activity_fingerprints (run_id, flyby_points, fingerprint, updated_at)
+        SELECT run_id, flyby_points, fingerprint, NOW()
+        FROM ({activity_fingerprints_sql(filtered=activity_ids is not None)})
+        """,
+        params,
+    ).fetchone()
+    return int(written[0])
+
+
+def backfill_activity_fingerprints(db_connection: duckdb.DuckDBPyConnection) -> int:
+    """Fingerprints the activities without an activity_fingerprints row yet. Returns the rows written."""
+    _create_table_if_not_exists(db_connection, "activity_fingerprints", ACTIVITY_FINGERPRINTS_SCHEMA)
+    missing = db_connection.execute(
+        "SELECT run_id FROM activities ANTI JOIN activity_fingerprints USING (run_id)"
+    ).fetchall()
+    return refresh_activity_fingerprints(db_connection, [row[0] for row in missing])
+
+
+def get_activity_fingerprints(
+    db_connection: duckdb.DuckDBPyConnection,
+    activity_ids: list[int] | None = None,
+) -> dict[int, tuple[int, str]]:
+    """
+    ``{run_id: (flyby_points, fingerprint)}`` of every activity in ``activity_ids``
+    that exists (all activities when None), read from activity_fingerprints after
+    backfilling the activities that have no row yet.
+    """
+    if activity_ids is not None and not activity_ids:
+        return {}
+    backfill_activity_fingerprints(db_connection)
+    query = "SELECT run_id, flyby_points, fingerprint FROM activity_fingerprints SEMI JOIN activities USING (run_id)"
+    if activity_ids is None:
+        rows = db_connection.execute(query).fetchall()
+    else:
+        rows = db_connection.execute(
+            f"{query} WHERE run_id IN (SELECT UNNEST(?))",
+            [[int(activity_id) for activity_id in activity_ids]],
+        ).fetchall()
+    return {int(run_id): (int(points), fingerprint) for run_id, points, fingerprint in rows}
+
+
 def get_dataframes_for_fit_tables(activity, streams):
     """
     Converts Strava activity and streams object into a dictionary of DataFrames
-    with data types suitable for database insertion.
+    with data types suitable for database insertion. FIT generation reads the
+    streams through activity_data_from_strava instead.
     """
 
     from ..garmin_device_adaptor import (
@@ -650,33 +1283,7 @@ def get_dataframes_for_fit_tables(activity, streams):
         dataframes["fit_record"] = pd.DataFrame(columns=FIT_RECORD_SCHEMA.keys())
 
     # Create fit_lap and fit_session DataFrames
-    sport_map = {
-        "Run": Sport.RUNNING.value,
-        "Hike": Sport.HIKING.value,
-        "Walk": Sport.WALKING.value,
-        "EBikeRide": Sport.E_BIKING.value,
-        "Swim": Sport.SWIMMING.value,
-        "Ride": Sport.CYCLING.value,
-        "Workout": Sport.TRAINING.value,
-        "WeightTraining": Sport.TRAINING.value,
-    }
-    sport = sport_map.get(activity.type, Sport.GENERIC.value)
-
-    # By default generic SubSport
-    sub_sport = SubSport.GENERIC.value
-
-    # Heuristic for specific sports based on name
-    if sport == Sport.GENERIC.value or sport == Sport.TRAINING.value:
-        # For Workout/WeightTraining (mapped to TRAINING), default to Strength Training
-        if sport == Sport.TRAINING.value:
-            sub_sport = SubSport.STRENGTH_TRAINING.value
-
-        activity_name = getattr(activity, "name", "")
-        if activity_name:
-            lower_name = activity_name.lower()
-            if "boxing" in lower_name or "拳击" in lower_name:
-                sport = Sport.BOXING.value
-                sub_sport = SubSport.GENERIC.value  # Boxing doesn't have specific subsport usually
+    sport, sub_sport = strava_fit_sport(strava_activity_type(activity), getattr(activity, "name", ""))
 
     session_data = {
         "activity_id": [activity.id],
@@ -702,6 +1309,63 @@ def get_dataframes_for_fit_tables(activity, streams):
     return dataframes
 
 
+# Pace is stored as minutes per kilometre: (1000 / 60) / velocity.
+_PACE_FACTOR = 1000.0 / 60.0
+_PACE_MIN = 1.0
+_PACE_MAX = 30.0
+
+
+def _aligned_stream_array(streams, stream_name, length):
+    """
+    Return a stream as a float array aligned to ``length`` points.
+
+    Missing values become NaN, short streams are padded with NaN and long
+    streams are truncated. The stream object itself is never modified.
+    """
+    aligned = np.full(length, np.nan)
+    stream = streams.get(stream_name)
+    if stream and stream.data:
+        values = np.asarray(stream.data[:length], dtype=float)
+        aligned[: len(values)] = values
+    return aligned
+
+
+def _truncate_to_nullable_int(values, valid=None):
+    """Truncate floats towards zero like int() and return a nullable Int64 array."""
+    mask = np.isnan(values)
+    if valid is not None:
+        mask |= ~valid
+    if np.isinf(values[~mask]).any():
+        raise ValueError("cannot convert float infinity to integer")
+    ints = np.zeros(len(values), dtype=np.int64)
+    ints[~mask] = np.trunc(values[~mask])
+    return pd.arrays.IntegerArray(ints, mask)
+
+
+def _compute_pace(time_offsets, velocity):
+    """
+    Vectorized pace (min/km) from velocity_smooth.
+
+    Pace is 0.0 for the first point, for non-positive or missing velocity and
+    for values outside the plausible 1-30 min/km range. Rounding matches
+    Python's round(pace, 2) exactly.
+    """
+    pace = np.zeros(len(velocity))
+    moving = (time_offsets != 0) & (velocity > 0)
+    raw = np.zeros(len(velocity))
+    raw[moving] = _PACE_FACTOR / velocity[moving]
+    plausible = moving & (raw >= _PACE_MIN) & (raw <= _PACE_MAX)
+    pace[plausible] = np.round(raw[plausible], 2)
+
+    # np.round scales by 100 before rounding, which can differ from Python's
+    # correctly rounded round() right at a .xx5 tie. Fix those few points up.
+    scaled = raw * 100.0
+    near_tie = plausible & (np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)
+    for i in np.flatnonzero(near_tie):
+        pace[i] = round(float(raw[i]), 2)
+    return pace
+
+
 def convert_streams_to_flyby_dataframe(activity, streams):
     """
     Convert the Strava activity streams into a DataFrame
@@ -714,104 +1378,111 @@ def convert_streams_to_flyby_dataframe(activity, streams):
 
     try:
         time_data = streams.get("time").data
+        length = len(time_data)
 
         # Handle LatLng (Optional for Indoor)
         latlng_stream = streams.get("latlng")
         if latlng_stream and latlng_stream.data:
             latlng_data = latlng_stream.data
-            if len(time_data) != len(latlng_data):
+            if length != len(latlng_data):
                 logger.warning(f"Activity {activity.id} has mismatched time/latlng data lengths")
-                min_length = min(len(time_data), len(latlng_data))
-                time_data = time_data[:min_length]
-                latlng_data = latlng_data[:min_length]
-
-            # Vectorized LatLng
-            latlng_df = pd.DataFrame(latlng_data, columns=["lat", "lng"])
-            lats = latlng_df["lat"].round(6).tolist()
-            lngs = latlng_df["lng"].round(6).tolist()
+                length = min(length, len(latlng_data))
+
+            latlng = np.asarray(latlng_data[:length], dtype=float).reshape(length, 2)
+            lats = np.round(latlng[:, 0], 6)
+            lngs = np.round(latlng[:, 1], 6)
         else:
             # No GPS data
-            lats = [None] * len(time_data)
-            lngs = [None] * len(time_data)
-
-        flyby_data = {
-            "activity_id": [activity.id] * len(time_data),
-            "time_offset": time_data,
-            "lat": lats,
-            "lng": lngs,
-        }
+            lats = np.full(length, np.nan)
+            lngs = np.full(length, np.nan)
+
+        time_offsets = np.asarray(time_data[:length]).astype(np.int32)
+
+        heart_rate = _aligned_stream_array(streams, "heartrate", length)
+        flyby_df = pd.DataFrame(
+            {
+                "activity_id": np.full(length, activity.id, dtype=np.int64),
+                "time_offset": time_offsets,
+                "lat": lats,
+                "lng": lngs,
+                "alt": _truncate_to_nullable_int(_aligned_stream_array(streams, "altitude", length)),
+                "pace": _compute_pace(time_offsets, _aligned_stream_array(streams, "velocity_smooth", length)),
+                "hr": _truncate_to_nullable_int(heart_rate, valid=(heart_rate >= 0) & (heart_rate <= 255)),
+                "distance": _truncate_to_nullable_int(_aligned_stream_array(streams, "distance", length)),
+                "cadence": _truncate_to_nullable_int(_aligned_stream_array(streams, "cadence", length)),
+                "watts": _truncate_to_nullable_int(_aligned_stream_array(streams, "watts", length)),
+            }
+        )
 
-        # Helper to align stream length to time stream
-        def get_aligned_stream_data(stream_name):
-            stream = streams.get(stream_name)
-            if stream and stream.data:
-                data = stream.data
-                if len(data) < len(time_data):
-                    data.extend([None] * (len(time_data) - len(data)))
-                elif len(data) > len(time_data):
-                    data = data[: len(time_data)]
-                return data
-            return [None] * len(time_data)
-
-        # Altitude
-        alt_data = get_aligned_stream_data("altitude")
-        flyby_data["alt"] = [int(alt) if alt is not None and not pd.isna(alt) else None for alt in alt_data]
-
-        # Velocity / Pace
-        velocity_data = get_aligned_stream_data("velocity_smooth")
-        # Avoid division by zero
-        # Pace = (1000 / 60) / velocity
-        # If velocity is 0, pace is 0 (or infinite, but we use 0 for "stopped")
-
-        # We can use numpy where
-        # pace = np.where(vel > 0, (1000.0/60.0)/vel, 0.0)
-        # But we also need to respect time_offset == 0 logic if present, though usually time[0]=0.
-
-        # Let's keep it simple with list comp for complex logic or verify numpy logic
-        pace_data = []
-        for i, velocity in enumerate(velocity_data):
-            if time_data[i] == 0:
-                pace_data.append(0.0)
-                continue
-            if velocity is not None and not pd.isna(velocity) and velocity > 0:
-                pace = (1000.0 / 60.0) / velocity
-                if 1.0 <= pace <= 30.0:
-                    pace_data.append(round(pace, 2))
-                else:
-                    pace_data.append(0.0)
-            else:
-                pace_data.append(0.0)
-        flyby_data["pace"] = pace_data
+        logger.info(f"Converted {len(flyby_df)} flyby records for activity {activity.id}")
+        return flyby_df
 
-        # Heart Rate
-        hr_data = get_aligned_stream_data("heartrate")
-        flyby_data["hr"] = [
-            int(hr) if hr is not None and not pd.isna(hr) and 0 <= hr <= 255 else None for hr in hr_data
-        ]
+    except Exception as e:
+        logger.error(f"Error converting streams to flyby dataframe for activity {activity.id}: {e}")
+        raise StorageError(f"Error converting streams to flyby dataframe for activity {activity.id}: {e}") from e
 
-        # Distance
-        dist_data = get_aligned_stream_data("distance")
-        flyby_data["distance"] = [int(dist) if dist is not None and not pd.isna(dist) else None for dist in dist_data]
 
-        # Cadence
-        cad_data = get_aligned_stream_data("cadence")
-        flyby_data["cadence"] = [int(c) if c is not None and not pd.isna(c) else None for c in cad_data]
+def _prepare_flyby_dataframe(flyby_df):
+    """
+    Validate a flyby DataFrame and normalize it to the activities_flyby column order and dtypes.
+    """
+    expected_columns = set(ACTIVITIES_FLYBY_SCHEMA.keys())
+    df_columns = set(flyby_df.columns)
 
-        # Watts
-        watts_data = get_aligned_stream_data("watts")
-        flyby_data["watts"] = [int(w) if w is not None and not pd.isna(w) else None for w in watts_data]
+    if not expected_columns.issubset(df_columns):
+        missing_columns = expected_columns - df_columns
+        logger.error(f"Missing required columns in flyby DataFrame: {missing_columns}")
+        raise StorageError(f"Missing required columns in flyby DataFrame: {missing_columns}")
 
-        flyby_df = pd.DataFrame(flyby_data)
+    ordered_columns = [col for col in ACTIVITIES_FLYBY_SCHEMA.keys() if col in flyby_df.columns]
+    flyby_df_ordered = flyby_df[ordered_columns].copy()
 
-        flyby_df["activity_id"] = flyby_df["activity_id"].astype("int64")
-        flyby_df["time_offset"] = flyby_df["time_offset"].astype("int32")
+    try:
+        # Clean and convert data types in a more streamlined way
+        flyby_df_ordered.dropna(subset=["activity_id", "time_offset"], inplace=True)
+        flyby_df_ordered["activity_id"] = flyby_df_ordered["activity_id"].astype("int64")
+        flyby_df_ordered["time_offset"] = flyby_df_ordered["time_offset"].astype("int32")
+        flyby_df_ordered["lat"] = pd.to_numeric(flyby_df_ordered["lat"], errors="coerce")
+        flyby_df_ordered["lng"] = pd.to_numeric(flyby_df_ordered["lng"], errors="coerce")
+        flyby_df_ordered["alt"] = pd.to_numeric(flyby_df_ordered["alt"], errors="coerce").astype("Int16")
+        flyby_df_ordered["pace"] = pd.to_numeric(flyby_df_ordered["pace"], errors="coerce").fillna(0.0)
+        flyby_df_ordered["hr"] = pd.to_numeric(flyby_df_ordered["hr"], errors="coerce").astype("Int16")
+        flyby_df_ordered["distance"] = pd.to_numeric(flyby_df_ordered["distance"], errors="coerce").astype("Int32")
+
+        # New fields: cadence and watts
+        # Use get in case they are missing from df (e.g. older data in memory)
+        if "cadence" in flyby_df_ordered.columns:
+            flyby_df_ordered["cadence"] = pd.to_numeric(flyby_df_ordered["cadence"], errors="coerce").astype("Int16")
+        else:
+            flyby_df_ordered["cadence"] = None
 
-        logger.info(f"Converted {len(flyby_df)} flyby records for activity {activity.id}")
-        return flyby_df
+        if "watts" in flyby_df_ordered.columns:
+            flyby_df_ordered["watts"] = pd.to_numeric(flyby_df_ordered["watts"], errors="coerce").astype("Int16")
+        else:
+            flyby_df_ordered["watts"] = None
 
     except Exception as e:
-        logger.error(f"Error converting streams to flyby dataframe for activity {activity.id}: {e}")
-        raise StorageError(f"Error converting streams to flyby dataframe for activity {activity.id}: {e}") from e
+        logger.error(f"Error converting flyby data types: {e}")
+        raise StorageError(f"Error converting flyby data types: {e}") from e
+
+    return flyby_df_ordered
+
+
+def _flyby_insert_sql(temp_table_name, ordered_columns, upsert=True):
+    columns_list = ", ".join(ordered_columns)
+    values_list = ", ".join([f"temp.{col}" for col in ordered_columns])
+    insert_sql = f"""
+    INSERT INTO activities_flyby ({columns_list})
+    SELECT {values_list} FROM {temp_table_name} temp
+    """
+    if not upsert:
+        return insert_sql
+
+    non_pk_columns = [col for col in ordered_columns if col not in ["activity_id", "time_offset"]]
+    update_set_clause = ", ".join([f"{col} = excluded.{col}" for col in non_pk_columns])
+    if update_set_clause:
+        return insert_sql + f"ON CONFLICT (activity_id, time_offset) DO UPDATE SET {update_set_clause}"
+    return insert_sql + "ON CONFLICT (activity_id, time_offset) DO NOTHING"
 
 
 def store_flyby_data(db_connection, flyby_df):
@@ -822,71 +1493,17 @@ def store_flyby_data(db_connection, flyby_df):
     try:
         _create_activities_flyby_table(db_connection)
 
-        expected_columns = set(ACTIVITIES_FLYBY_SCHEMA.keys())
-        df_columns = set(flyby_df.columns)
-
-        if not expected_columns.issubset(df_columns):
-            missing_columns = expected_columns - df_columns
-            logger.error(f"Missing required columns in flyby DataFrame: {missing_columns}")
-            raise StorageError(f"Missing required columns in flyby DataFrame: {missing_columns}")
-
-        ordered_columns = [col for col in ACTIVITIES_FLYBY_SCHEMA.keys() if col in flyby_df.columns]
-        flyby_df_ordered = flyby_df[ordered_columns].copy()
-
-        try:
-            # Clean and convert data types in a more streamlined way
-            flyby_df_ordered.dropna(subset=["activity_id", "time_offset"], inplace=True)
-            flyby_df_ordered["activity_id"] = flyby_df_ordered["activity_id"].astype("int64")
-            flyby_df_ordered["time_offset"] = flyby_df_ordered["time_offset"].astype("int32")
-            flyby_df_ordered["lat"] = pd.to_numeric(flyby_df_ordered["lat"], errors="coerce")
-            flyby_df_ordered["lng"] = pd.to_numeric(flyby_df_ordered["lng"], errors="coerce")
-            flyby_df_ordered["alt"] = pd.to_numeric(flyby_df_ordered["alt"], errors="coerce").astype("Int16")
-            flyby_df_ordered["pace"] = pd.to_numeric(flyby_df_ordered["pace"], errors="coerce").fillna(0.0)
-            flyby_df_ordered["hr"] = pd.to_numeric(flyby_df_ordered["hr"], errors="coerce").astype("Int16")
-            flyby_df_ordered["distance"] = pd.to_numeric(flyby_df_ordered["distance"], errors="coerce").astype("Int32")
-
-            # New fields: cadence and watts
-            # Use get in case they are missing from df (e.g. older data in memory)
-            if "cadence" in flyby_df_ordered.columns:
-                flyby_df_ordered["cadence"] = pd.to_numeric(flyby_df_ordered["cadence"], errors="coerce").astype(
-                    "Int16"
-                )
-            else:
-                flyby_df_ordered["cadence"] = None
-
-            if "watts" in flyby_df_ordered.columns:
-                flyby_df_ordered["watts"] = pd.to_numeric(flyby_df_ordered["watts"], errors="coerce").astype("Int16")
-            else:
-                flyby_df_ordered["watts"] = None
-
-        except Exception as e:
-            logger.error(f"Error converting flyby data types: {e}")
-            raise StorageError(f"Error converting flyby data types: {e}") from e
+        flyby_df_ordered = _prepare_flyby_dataframe(flyby_df)
+        ordered_columns = list(flyby_df_ordered.columns)
 
         temp_table_name = "temp_flyby_data"
         db_connection.register(temp_table_name, flyby_df_ordered)
 
+        activity_ids = flyby_df_ordered["activity_id"].unique().tolist()
         try:
-            columns_list = ", ".join(ordered_columns)
-            values_list = ", ".join([f"temp.{col}" for col in ordered_columns])
-
-            non_pk_columns = [col for col in ordered_columns if col not in ["activity_id", "time_offset"]]
-            update_set_clause = ", ".join([f"{col} = excluded.{col}" for col in non_pk_columns])
-
-            if update_set_clause:
-                upsert_sql = f"""
-                INSERT INTO activities_flyby ({columns_list})
-                SELECT {values_list} FROM {temp_table_name} temp
-                ON CONFLICT (activity_id, time_offset) DO UPDATE SET {update_set_clause}
-                """
-            else:
-                upsert_sql = f"""
-                INSERT INTO activities_flyby ({columns_list})
-                SELECT {values_list} FROM {temp_table_name} temp
-                ON CONFLICT (activity_id, time_offset) DO NOTHING
-                """
-
-            db_connection.execute(upsert_sql)
+            with transaction(db_connection):
+                db_connection.execute(_flyby_insert_sql(temp_table_name, ordered_columns))
+                refresh_activity_fingerprints(db_connection, activity_ids)
 
             records_processed = len(flyby_df_ordered)
 
@@ -897,11 +1514,9 @@ def store_flyby_data(db_connection, flyby_df):
             logger.error(f"Error executing flyby data UPSERT: {e}")
             try:
                 logger.info("Attempting fallback INSERT operation...")
-                insert_sql = f"""
-                INSERT INTO activities_flyby ({columns_list})
-                SELECT {values_list} FROM {temp_table_name} temp
-                """
-                db_connection.execute(insert_sql)
+                with transaction(db_connection):
+                    db_connection.execute(_flyby_insert_sql(temp_table_name, ordered_columns, upsert=False))
+                    refresh_activity_fingerprints(db_connection, activity_ids)
                 records_inserted = len(flyby_df_ordered)
                 logger.info(f"Fallback INSERT successful: {records_inserted} records")
                 return records_inserted
@@ -920,6 +1535,102 @@ def store_flyby_data(db_connection, flyby_df):
         raise StorageError(f"Unexpected error in store_flyby_data: {e}") from e
 
 
+class FlybyBatchWriter:
+    """
+    Buffer flyby frames for several activities and write them in one transaction.
+
+    Each flush upserts all buffered rows into activities_flyby and removes the
+    finished activities from activities_flyby_queue in the same commit, so a
+    crash loses at most the un-flushed batch, which simply stays queued.
+
+    Usage:
+        with FlybyBatchWriter(con) as writer:
+            writer.add(activity_id, flyby_df)
+            writer.mark_done(activity_id)
+    """
+
+    def __init__(self, db_connection, max_rows=50_000, max_bytes=64 * 1024 * 1024):
+        self.db_connection = db_connection
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._frames = []
+        self._done_ids = []
+        self._rows = 0
+        self._bytes = 0
+        self.flushed_rows = 0
+        self.flush_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # On errors the buffered activities are left queued for the next run.
+        if exc_type is None:
+            self.flush()
+        return False
+
+    @property
+    def pending_rows(self):
+        return self._rows
+
+    def add(self, activity_id, flyby_df):
+        """Buffer the flyby rows of one activity. Returns the number of buffered rows."""
+        if flyby_df is None or flyby_df.empty:
+            return 0
+        self._frames.append(flyby_df)
+        self._rows += len(flyby_df)
+        self._bytes += int(flyby_df.memory_usage(index=False).sum())
+        logger.debug(f"Buffered {len(flyby_df)} flyby records for activity {activity_id}")
+        return len(flyby_df)
+
+    def mark_done(self, activity_id):
+        """
+        Mark an activity as finished. Its queue entry is removed with the next flush,
+        which happens here once the buffer reaches the row or byte limit.
+        """
+        self._done_ids.append(int(activity_id))
+        if self._rows >= self.max_rows or self._bytes >= self.max_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write all buffered rows and queue completions in a single transaction."""
+        if not self._frames and not self._done_ids:
+            return 0
+
+        frames, done_ids = self._frames, self._done_ids
+        self._frames, self._done_ids = [], []
+        self._rows = self._bytes = 0
+
+        db_connection = self.db_connection
+        temp_table_name = "temp_flyby_batch"
+        records = 0
+        try:
+            _create_activities_flyby_table(db_connection)
+            flyby_df = _prepare_flyby_dataframe(pd.concat(frames, ignore_index=True)) if frames else None
+            with transaction(db_connection):
+                if flyby_df is not None and not flyby_df.empty:
+                    db_connection.register(temp_table_name, flyby_df)
+                    try:
+                        db_connection.execute(_flyby_insert_sql(temp_table_name, list(flyby_df.columns)))
+                    finally:
+                        db_connection.unregister(temp_table_name)
+                    refresh_activity_fingerprints(db_connection, flyby_df["activity_id"].unique().tolist())
+                    records = len(flyby_df)
+                if done_ids:
+                    db_connection.execute(
+                        "DELETE FROM activities_flyby_queue WHERE activity_id IN (SELECT UNNEST(?))",
+                        [done_ids],
+                    )
+        except Exception as e:
+            logger.error(f"Error flushing flyby batch for {len(done_ids)} activities: {e}")
+            raise StorageError(f"Error flushing flyby batch for {len(done_ids)} activities: {e}") from e
+
+        self.flushed_rows += records
+        self.flush_count += 1
+        logger.info(f"Flushed {records} flyby records for {len(done_ids)} activities")
+        return records
+
+
 def write_fit_dataframes(db_connection, dataframes):
     """
     Writes a dictionary of DataFrames to their respective tables in the database
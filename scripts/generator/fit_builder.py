@@ -1,6 +1,7 @@
 """FIT file building utilities."""
 
-import pandas as pd
+import math
+
 from fit_tool.fit_file_builder import FitFileBuilder
 from fit_tool.profile.messages.activity_message import ActivityMessage
 from fit_tool.profile.messages.device_info_message import DeviceInfoMessage
@@ -8,7 +9,6 @@ from fit_tool.profile.messages.event_message import EventMessage
 from fit_tool.profile.messages.file_creator_message import FileCreatorMessage
 from fit_tool.profile.messages.file_id_message import FileIdMessage
 from fit_tool.profile.messages.lap_message import LapMessage
-from fit_tool.profile.messages.record_message import RecordMessage
 from fit_tool.profile.messages.session_message import SessionMessage
 from fit_tool.profile.messages.sport_message import SportMessage
 from fit_tool.profile.profile_type import (
@@ -18,73 +18,85 @@ from fit_tool.profile.profile_type import (
     FileType,
     SessionTrigger,
     SourceType,
-    SubSport,
 )
 
+from .activity_data import activity_data_from_dataframes
+from .fit_encoder import append_fit_data, encode_record_messages
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
 
 class FitBuilderMixin:
     """Mixin class providing FIT file building methods for Generator."""
 
     @staticmethod
     def _fit_distance_raw(distance_m):
-        if pd.isna(distance_m):
+        if _is_missing(distance_m):
             return None
         return int(round(float(distance_m) * 100))
 
     @staticmethod
     def _fit_speed_raw(speed_mps):
-        if pd.isna(speed_mps):
+        if _is_missing(speed_mps):
             return None
         return int(round(float(speed_mps) * 1000))
 
     @staticmethod
     def _fit_duration_raw(duration_s):
-        if pd.isna(duration_s):
+        if _is_missing(duration_s):
             return None
         return int(round(float(duration_s) * 1000))
 
-    @staticmethod
-    def _fit_altitude_raw(altitude_m):
-        if pd.isna(altitude_m):
-            return None
-        # fit_tool's RecordAltitudeField applies an extra +500 offset during encoding.
-        # Input value must satisfy: ((value + 500) / 5 - 500) == altitude_m.
-        return int(round(float(altitude_m) * 5.0 + 2000.0))
-
     def build_fit_file_from_dataframes(self, dataframes):
         """
-        Builds a FIT file from a dictionary of DataFrames,
+        Builds a FIT file from the dictionary of DataFrames of construct_dataframes
+        or get_dataframes_for_fit_tables.
+        """
+        return self.build_fit_file(activity_data_from_dataframes(dataframes))
+
+    def build_fit_file(self, activity):
+        """
+        Builds a FIT file from an ActivityData,
         following the official example's logic.
         """
         builder = FitFileBuilder(auto_define=True)
 
         # The order of messages is important.
-        fit_lap_df = dataframes.get("fit_lap")
-        self._last_fit_lap_count = len(fit_lap_df) if fit_lap_df is not None else 0
+        self._last_fit_lap_count = activity.lap_count
 
-        self._add_file_id_mesg(builder, dataframes.get("fit_file_id"))
+        self._add_file_id_mesg(builder, activity)
         self._add_file_creator_mesg(builder)
-        self._add_device_info_mesg(builder, dataframes.get("fit_file_id"))
-        self._add_sport_mesg(builder, dataframes.get("fit_session"))
-        self._add_event_mesg(builder, dataframes, event_type="start")
-        self._add_record_mesgs(builder, dataframes.get("fit_record"))
-        self._add_lap_mesg(builder, fit_lap_df)
-        self._add_event_mesg(builder, dataframes, event_type="stop")
-        self._add_session_mesg(builder, dataframes.get("fit_session"))
-        self._add_activity_mesg(builder, dataframes.get("fit_session"))
-
-        return builder.build().to_bytes()
-
-    def _add_file_id_mesg(self, builder, df):
-        if df is None or df.empty:
+        self._add_device_info_mesg(builder, activity)
+        self._add_sport_mesg(builder, activity)
+        self._add_event_mesg(builder, activity, event_type="start")
+
+        # Records are encoded straight from the columns (see fit_encoder). The messages
+        # after them go to a fresh builder, so their definitions are written again just
+        # as they would be after a record definition, and are appended to the file.
+        record_bytes = encode_record_messages(activity.records)
+        tail = FitFileBuilder(auto_define=True) if record_bytes else builder
+
+        self._add_lap_mesg(tail, activity)
+        self._add_event_mesg(tail, activity, event_type="stop")
+        self._add_session_mesg(tail, activity)
+        self._add_activity_mesg(tail, activity)
+
+        fit_bytes = builder.build().to_bytes()
+        if tail is builder:
+            return fit_bytes
+        return append_fit_data(fit_bytes, record_bytes + b"".join(record.to_bytes() for record in tail.records))
+
+    def _add_file_id_mesg(self, builder, activity):
+        if activity.time_created is None:
             return
         msg = FileIdMessage()
-        row = df.iloc[0]
-        msg.type = FileType(row["type"])
+        msg.type = FileType(activity.file_type)
         msg.manufacturer = 1  # Force Garmin for compatibility
-        msg.product = row["product"]
+        msg.product = activity.product
         msg.serial_number = self.serial_number
-        msg.time_created = round(row["time_created"].timestamp() * 1000)
+        msg.time_created = activity.time_created
         builder.add(msg)
 
     def _add_file_creator_mesg(self, builder):
@@ -93,35 +105,32 @@ class FitBuilderMixin:
         msg.hardware_version = 0
         builder.add(msg)
 
-    def _add_device_info_mesg(self, builder, df):
-        if df is None or df.empty:
+    def _add_device_info_mesg(self, builder, activity):
+        if activity.time_created is None:
             return
-        row = df.iloc[0]
 
         msg = DeviceInfoMessage()
         msg.serial_number = self.serial_number
-        msg.manufacturer = row["manufacturer"]
-        msg.garmin_product = row["product"]
-        msg.software_version = row["software_version"]
+        msg.manufacturer = activity.manufacturer
+        msg.garmin_product = activity.product
+        msg.software_version = activity.software_version
         msg.device_index = 0
         msg.source_type = SourceType.LOCAL
-        msg.product = row["product"]
-        msg.timestamp = round(row["time_created"].timestamp() * 1000)
+        msg.product = activity.product
+        msg.timestamp = activity.time_created
 
         builder.add(msg)
 
-    def _add_event_mesg(self, builder, dataframes, event_type):
+    def _add_event_mesg(self, builder, activity, event_type):
         if event_type == "start":
-            timestamp = dataframes["fit_session"].iloc[0]["start_time"]
+            timestamp_ms = activity.start_time
             event_type_enum = EventType.START
             event_enum = Event.TIMER
         else:  # stop
-            timestamp = dataframes["fit_session"].iloc[0]["timestamp"]
+            timestamp_ms = activity.timestamp
             event_type_enum = EventType.STOP_ALL
             event_enum = Event.TIMER  # Use TIMER for stop event
 
-        timestamp_ms = round(timestamp.timestamp() * 1000)
-
         event_msg = EventMessage()
         event_msg.event = event_enum
         event_msg.event_type = event_type_enum
@@ -129,107 +138,60 @@ class FitBuilderMixin:
         event_msg.data = 0  # Match reference file
         builder.add(event_msg)
 
-    def _add_record_mesgs(self, builder, df):
-        if df is None or df.empty:
-            return
-        for row in df.itertuples(index=False):
-            msg = RecordMessage()
-            msg.timestamp = round(row.timestamp.timestamp() * 1000)
-
-            if pd.notna(row.position_lat):
-                msg.position_lat = row.position_lat
-            if pd.notna(row.position_long):
-                msg.position_long = row.position_long
-            if pd.notna(row.distance):
-                msg.distance = self._fit_distance_raw(row.distance)
-            if pd.notna(row.altitude):
-                msg.altitude = self._fit_altitude_raw(row.altitude)
-            if pd.notna(row.speed):
-                msg.speed = self._fit_speed_raw(row.speed)
-            if pd.notna(row.heart_rate):
-                msg.heart_rate = int(row.heart_rate)
-            if pd.notna(row.cadence):
-                msg.cadence = int(row.cadence)
-            if pd.notna(row.power):
-                msg.power = int(row.power)
-            if pd.notna(row.step_length):
-                msg.step_length = float(row.step_length * 1000)
-
-            builder.add(msg)
-
-    def _add_activity_mesg(self, builder, df):
-        if df is None or df.empty:
-            return
-        row = df.iloc[0]
+    def _add_activity_mesg(self, builder, activity):
         msg = ActivityMessage()
-        msg.timestamp = round(row["timestamp"].timestamp() * 1000)
-        msg.total_timer_time = self._fit_duration_raw(row["total_timer_time"])
+        msg.timestamp = activity.timestamp
+        msg.total_timer_time = self._fit_duration_raw(activity.total_timer_time)
         msg.num_sessions = 1
         msg.type = Activity.MANUAL
         msg.event = Event.ACTIVITY
         msg.event_type = EventType.STOP
         builder.add(msg)
 
-    def _add_lap_mesg(self, builder, df):
-        if df is None or df.empty:
-            # Skip adding Lap message if dataframe is empty
-            return
-        for index, row in enumerate(df.itertuples(index=False)):
+    def _add_lap_mesg(self, builder, activity):
+        # Laps are few, so read them back as Python lists rather than through numpy scalars.
+        laps = {name: values.tolist() for name, values in activity.laps.items()}
+        for index in range(activity.lap_count):
             msg = LapMessage()
             msg.message_index = index
-            msg.timestamp = round(row.timestamp.timestamp() * 1000)
-            msg.start_time = round(row.start_time.timestamp() * 1000)
-            msg.total_elapsed_time = self._fit_duration_raw(row.total_elapsed_time)
-            msg.total_timer_time = self._fit_duration_raw(row.total_timer_time)
-            msg.total_distance = self._fit_distance_raw(row.total_distance)
-            if pd.notna(row.avg_speed):
-                msg.avg_speed = self._fit_speed_raw(row.avg_speed)
-            if pd.notna(row.avg_heart_rate):
-                msg.avg_heart_rate = row.avg_heart_rate
-            if pd.notna(row.avg_cadence):
-                msg.avg_cadence = row.avg_cadence
-            if hasattr(row, "avg_power") and pd.notna(row.avg_power):
-                msg.avg_power = row.avg_power
+            msg.timestamp = laps["timestamp"][index]
+            msg.start_time = laps["start_time"][index]
+            msg.total_elapsed_time = self._fit_duration_raw(laps["total_elapsed_time"][index])
+            msg.total_timer_time = self._fit_duration_raw(laps["total_timer_time"][index])
+            msg.total_distance = self._fit_distance_raw(laps["total_distance"][index])
+            if not _is_missing(laps["avg_speed"][index]):
+                msg.avg_speed = self._fit_speed_raw(laps["avg_speed"][index])
+            if not _is_missing(laps["avg_heart_rate"][index]):
+                msg.avg_heart_rate = laps["avg_heart_rate"][index]
+            if not _is_missing(laps["avg_cadence"][index]):
+                msg.avg_cadence = laps["avg_cadence"][index]
+            if not _is_missing(laps["avg_power"][index]):
+                msg.avg_power = laps["avg_power"][index]
             builder.add(msg)
 
-    def _add_sport_mesg(self, builder, df):
-        if df is None or df.empty:
-            return
-        row = df.iloc[0]
+    def _add_sport_mesg(self, builder, activity):
         msg = SportMessage()
-        msg.sport = row["sport"]
-
-        # SubSport Mapping based on Activity Type
-        if "sub_sport" in row and pd.notna(row["sub_sport"]):
-            msg.sub_sport = row["sub_sport"]
-        else:
-            msg.sub_sport = SubSport.GENERIC
+        msg.sport = activity.sport
+        msg.sub_sport = activity.sub_sport
 
         # Add activity title so Garmin can reuse it instead of a generic localized label.
-        if "name" in row and pd.notna(row["name"]):
-            msg.sport_name = str(row["name"])
+        if activity.name is not None:
+            msg.sport_name = activity.name
 
         builder.add(msg)
 
-    def _add_session_mesg(self, builder, df):
-        if df is None or df.empty:
-            return
+    def _add_session_mesg(self, builder, activity):
         msg = SessionMessage()
-        row = df.iloc[0]
-
-        msg.timestamp = round(row["timestamp"].timestamp() * 1000)
 
-        msg.start_time = round(row["start_time"].timestamp() * 1000)
+        msg.timestamp = activity.timestamp
 
-        msg.total_elapsed_time = self._fit_duration_raw(row["total_elapsed_time"])
-        msg.total_timer_time = self._fit_duration_raw(row["total_timer_time"])
-        msg.total_distance = self._fit_distance_raw(row["total_distance"])
-        msg.sport = row["sport"]
+        msg.start_time = activity.start_time
 
-        if "sub_sport" in row and pd.notna(row["sub_sport"]):
-            msg.sub_sport = row["sub_sport"]
-        else:
-            msg.sub_sport = SubSport.GENERIC
+        msg.total_elapsed_time = self._fit_duration_raw(activity.total_elapsed_time)
+        msg.total_timer_time = self._fit_duration_raw(activity.total_timer_time)
+        msg.total_distance = self._fit_distance_raw(activity.total_distance)
+        msg.sport = activity.sport
+        msg.sub_sport = activity.sub_sport
 
         lap_count = 1
         if hasattr(self, "_last_fit_lap_count"):
@@ -240,18 +202,14 @@ class FitBuilderMixin:
         msg.event_type = EventType.STOP
         msg.trigger = SessionTrigger.ACTIVITY_END
 
-        # Add Sport Event if available
-        if "sport_event" in row and pd.notna(row["sport_event"]):
-            msg.sport_event = row["sport_event"]
-
-        if pd.notna(row["avg_speed"]):
-            msg.avg_speed = self._fit_speed_raw(row["avg_speed"])
-        if pd.notna(row["avg_heart_rate"]):
-            msg.avg_heart_rate = row["avg_heart_rate"]
-        if pd.notna(row["avg_cadence"]):
-            msg.avg_cadence = row["avg_cadence"]
-        if "avg_power" in row and pd.notna(row["avg_power"]):
-            msg.avg_power = row["avg_power"]
-        if "name" in row and pd.notna(row["name"]):
-            msg.sport_profile_name = str(row["name"])
+        if activity.avg_speed is not None:
+            msg.avg_speed = self._fit_speed_raw(activity.avg_speed)
+        if activity.avg_heart_rate is not None:
+            msg.avg_heart_rate = activity.avg_heart_rate
+        if activity.avg_cadence is not None:
+            msg.avg_cadence = activity.avg_cadence
+        if activity.avg_power is not None:
+            msg.avg_power = activity.avg_power
+        if activity.name is not None:
+            msg.sport_profile_name = activity.name
         builder.add(msg)
@@ -0,0 +1,175 @@
+"""Incremental activities.json export."""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from ..utils import ActivityJSONEncoder
+
+EXPORT_MANIFEST_VERSION = 2
+
+# Light-weight view of the activities in scope: enough to order rows, get their
+# streak and detect changed rows without reading polylines. {streaks} is a
+# (run_id, streak) relation from db.activity_streaks_source.
+EXPORT_INDEX_QUERY = """
+    SELECT a.run_id, md5(CAST(a AS VARCHAR)) AS row_hash, s.streak
+    FROM activities a
+    JOIN {streaks} s USING (run_id)
+    ORDER BY a.start_date_local, a.run_id
+"""
+
+EXPORT_ROWS_QUERY = """
+    SELECT a.*, s.streak
+    FROM activities a
+    JOIN {streaks} s USING (run_id)
+    WHERE a.run_id IN (SELECT UNNEST(?))
+    ORDER BY a.start_date_local, a.run_id
+"""
+
+
+def manifest_path(json_file):
+    """The manifest describing an exported activities.json lives next to it."""
+    json_file = Path(json_file)
+    return json_file.with_name(f"{json_file.stem}.manifest.json")
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path, text):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+class JsonExportMixin:
+    """
+    Mixin class writing activities.json for Generator.
+
+    Every export records a manifest with the row hash, streak and byte range
+    of each activity in the written file. The next export re-encodes only
+    activities that are new, changed, or whose streak changed, and copies
+    everything else from the previous file. Streaks come from DuckDB.
+    """
+
+    def export_activities_json(self, json_file, incremental=True, verify=False):
+        """
+        Writes activities.json (same content as ``json.dump(self.load())``).
+
+        With ``verify`` the result is compared against a full rebuild by checksum;
+        on a mismatch the full rebuild is written and the manifest reset.
+        Returns export statistics.
+        """
+        json_file = Path(json_file)
+        manifest_file = manifest_path(json_file)
+
+        streaks_source = self._streaks_source()
+        index = self._read_activities(EXPORT_INDEX_QUERY.format(streaks=streaks_source)) or []
+
+        manifest = self._load_export_manifest(json_file, manifest_file) if incremental else None
+        previous, old_text = (manifest["previous"], manifest["text"]) if manifest is not None else ({}, "")
+
+        changed = [
+            row["run_id"]
+            for row in index
+            if previous.get(row["run_id"], (None, None))[:2] != (row["row_hash"], row["streak"])
+        ]
+        encoded = self._encode_activities(changed, streaks_source)
+
+        fragments, entries, offset = [], [], 1
+        for row in index:
+            run_id = row["run_id"]
+            if run_id in encoded:
+                fragment = encoded[run_id]
+            else:
+                _, _, start, length = previous[run_id]
+                fragment = old_text[start : start + length]
+            fragments.append(fragment)
+            entries.append([run_id, row["row_hash"], row["streak"], offset, len(fragment)])
+            offset += len(fragment) + 2
+        text = "[" + ", ".join(fragments) + "]"
+
+        verified = None
+        if verify:
+            full_text = json.dumps(self.load(), cls=ActivityJSONEncoder)
+            verified = _sha256(full_text) == _sha256(text)
+            if verified:
+                self.logger.info(f"Incremental export verified against a full rebuild (sha256 {_sha256(text)}).")
+            else:
+                self.logger.warning("Incremental export differs from a full rebuild, writing the full rebuild.")
+                text, entries = full_text, None
+
+        _write_atomic(json_file, text)
+        if entries is None:
+            manifest_file.unlink(missing_ok=True)
+        else:
+            _write_atomic(
+                manifest_file,
+                json.dumps(
+                    {
+                        "version": EXPORT_MANIFEST_VERSION,
+                        "settings": self._export_settings(),
+                        "json_sha256": _sha256(text),
+                        "entries": entries,
+                    },
+                    separators=(",", ":"),
+                ),
+            )
+
+        stats = {
+            "mode": "incremental" if manifest is not None else "full",
+            "activities": len(index),
+            "reencoded": len(changed),
+            "verified": verified,
+        }
+        self.logger.info(
+            f"Exported {stats['activities']} activities to {json_file} "
+            f"({stats['mode']}, {stats['reencoded']} re-encoded)."
+        )
+        return stats
+
+    def _export_settings(self):
+        """Everything besides the DB rows that affects the exported JSON."""
+        from . import service
+
+        return {
+            "only_run": bool(self.only_run),
+            "ignore_before_saving": bool(service.IGNORE_BEFORE_SAVING),
+            "ignore_polyline": os.getenv("IGNORE_POLYLINE", ""),
+            "ignore_range": os.getenv("IGNORE_RANGE", "0"),
+            "ignore_start_end_range": os.getenv("IGNORE_START_END_RANGE", "0"),
+        }
+
+    def _load_export_manifest(self, json_file, manifest_file):
+        """Previous export state, or None when a full rebuild is needed."""
+        try:
+            manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+            text = json_file.read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None
+
+        if manifest.get("version") != EXPORT_MANIFEST_VERSION or manifest.get("settings") != self._export_settings():
+            self.logger.info("Export settings changed, rebuilding activities.json.")
+            return None
+        if manifest.get("json_sha256") != _sha256(text):
+            self.logger.info("activities.json does not match its manifest, rebuilding it.")
+            return None
+
+        previous = {
+            run_id: (row_hash, streak, start, length) for run_id, row_hash, streak, start, length in manifest["entries"]
+        }
+        return {"previous": previous, "text": text}
+
+    def _encode_activities(self, run_ids, streaks_source):
+        """JSON fragment of every activity in ``run_ids``, keyed by run_id."""
+        if not run_ids:
+            return {}
+        activities = self._read_activities(EXPORT_ROWS_QUERY.format(streaks=streaks_source), [run_ids])
+        return {
+            record["run_id"]: json.dumps(record, cls=ActivityJSONEncoder)
+            for record in self._finalize_activities(activities)
+        }
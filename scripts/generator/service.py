@@ -3,39 +3,40 @@
 import datetime
 import os
 import random
-import ssl
 
-import certifi
-import geopy
 import pandas as pd
 import stravalib
-from geopy.geocoders import Nominatim
 
 from ..gpxtrackposter import track_loader
-from ..polyline_processor import filter_out
+from ..offline_geocoder import lookup_countries
+from ..strava_rate_limit import get_strava_governor
 from ..utils import get_logger
 from .db import (
+    activity_streaks_source,
+    filter_polylines,
     get_db_connection,
     init_db,
     update_or_create_activities,
 )
 from .fit_builder import FitBuilderMixin
+from .json_export import JsonExportMixin
 from .strava_client import StravaClientMixin
 from .tcx_builder import TcxBuilderMixin
 
 IGNORE_BEFORE_SAVING = os.getenv("IGNORE_BEFORE_SAVING", False)
 
 
-geopy.geocoders.options.default_user_agent = "running-data-sync"
-# reverse the location (lat, lon) -> location detail
-ctx = ssl.create_default_context(cafile=certifi.where())
-geopy.geocoders.options.default_ssl_context = ctx
-g = Nominatim(user_agent="running-data-sync", timeout=10)
+def _fetch_records(cursor):
+    """Result rows as dicts, straight from DuckDB tuples (NULL -> None)."""
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
 
 
-class Generator(FitBuilderMixin, TcxBuilderMixin, StravaClientMixin):
+class Generator(FitBuilderMixin, TcxBuilderMixin, StravaClientMixin, JsonExportMixin):
     def __init__(self, db_path):
-        self.client = stravalib.Client()
+        # One budget for every Strava call in the process, including the flyby fetch workers.
+        self.rate_governor = get_strava_governor()
+        self.client = stravalib.Client(rate_limiter=self.rate_governor)
         # Lazy-init DB to avoid unnecessary writes; hold path and connect only when needed
         self.db_path = db_path
         self.db_connection = None
@@ -71,8 +72,12 @@ class Generator(FitBuilderMixin, TcxBuilderMixin, StravaClientMixin):
             self.logger.info("No tracks to sync from app.")
             return
 
+        # Resolve countries from the bundled index only, the tracks are synced offline.
+        start_points = [t.start_latlng or (None, None) for t in app_tracks]
+        countries = lookup_countries([p[0] for p in start_points], [p[1] for p in start_points])
+
         activities_data = []
-        for t in app_tracks:
+        for t, country in zip(app_tracks, countries):
             # Convert track object to a dictionary-like structure
             track_data = t.to_namedtuple()._asdict()
             record = {
@@ -85,7 +90,7 @@ class Generator(FitBuilderMixin, TcxBuilderMixin, StravaClientMixin):
                 "subtype": track_data["subtype"],
                 "start_date": datetime.datetime.strptime(track_data["start_date"], "%Y-%m-%d %H:%M:%S"),
                 "start_date_local": datetime.datetime.strptime(track_data["start_date_local"], "%Y-%m-%d %H:%M:%S"),
-                "location_country": "",  # GPX/FIT files don't have this
+                "location_country": country or "",
                 "summary_polyline": track_data["map"].summary_polyline,
                 "average_heartrate": track_data["average_heartrate"],
                 "average_speed": track_data["average_speed"],
@@ -103,53 +108,52 @@ class Generator(FitBuilderMixin, TcxBuilderMixin, StravaClientMixin):
 
     def load(self):
         """
-        Loads activities from the database and calculates the running streak.
+        Loads activities from the database with their running streak.
+        Streaks are computed in DuckDB (see db.activity_streaks_sql).
+        """
+        activities = self._read_activities(
+            f"""
+            SELECT a.*, s.streak
+            FROM activities a
+            JOIN {self._streaks_source()} s USING (run_id)
+            ORDER BY a.start_date_local, a.run_id
+            """
+        )
+        if not activities:
+            return []
+        return self._finalize_activities(activities)
+
+    def _streaks_source(self):
+        """(run_id, streak) relation for the activities in scope (see db.activity_streaks_source)."""
+        return activity_streaks_source(self.db_connection, self.only_run)
+
+    def _read_activities(self, query, params=None):
+        """
+        Runs a query against the activities DB and returns its rows as dicts;
+        returns None if the DB cannot be read.
         """
-        query = "SELECT * FROM activities ORDER BY start_date_local"
         # Use existing writable connection if available, otherwise open a read-only one
         if self.db_connection is not None:
-            activities_df = self.db_connection.execute(query).fetchdf()
-        else:
+            return _fetch_records(self.db_connection.execute(query, params))
+        try:
+            ro_con = get_db_connection(database=self.db_path, read_only=True)
             try:
-                ro_con = get_db_connection(database=self.db_path, read_only=True)
-                activities_df = ro_con.execute(query).fetchdf()
+                return _fetch_records(ro_con.execute(query, params))
+            finally:
                 ro_con.close()
-            except FileNotFoundError:
-                self.logger.info("Database file not found, returning empty list.")
-                return []
-            except Exception as e:
-                self.logger.warning(f"Failed to load activities from database: {e}")
-                return []
-
-        if self.only_run:
-            activities_df = activities_df[activities_df["type"] == "Run"].copy()
-
-        if activities_df.empty:
-            return []
-
-        # Calculate streak
-        activities_df["start_date_local_date"] = pd.to_datetime(activities_df["start_date_local"]).dt.date
-        activities_df = activities_df.sort_values("start_date_local_date")
-        # Get the difference in days between consecutive runs
-        activities_df["date_diff"] = (
-            activities_df["start_date_local_date"].diff().apply(lambda x: x.days if pd.notna(x) else None)
-        )
-        # Identify the start of a new streak
-        activities_df["new_streak"] = (activities_df["date_diff"] != 1).cumsum()
-        # Calculate streak number within each group
-        activities_df["streak"] = activities_df.groupby("new_streak").cumcount() + 1
-
-        # Drop temporary columns
-        activities_df = activities_df.drop(columns=["start_date_local_date", "date_diff", "new_streak"])
+        except FileNotFoundError:
+            self.logger.info("Database file not found, returning empty list.")
+        except Exception as e:
+            self.logger.warning(f"Failed to load activities from database: {e}")
+        return None
 
-        # Polyline filtering
+    def _finalize_activities(self, activities):
+        """Applies polyline privacy filtering to activity records, in place."""
         if not IGNORE_BEFORE_SAVING:
-            activities_df["summary_polyline"] = activities_df["summary_polyline"].apply(filter_out)
-
-        # Replace NaN/NaT with None for JSON compatibility
-        activities_df = activities_df.where(pd.notna(activities_df), None)
-
-        return activities_df.to_dict("records")
+            polylines = filter_polylines(self.db_connection, [record["summary_polyline"] for record in activities])
+            for record, summary_polyline in zip(activities, polylines):
+                record["summary_polyline"] = summary_polyline
+        return activities
 
     def get_old_tracks_ids(self):
         try:
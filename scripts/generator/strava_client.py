@@ -1,31 +1,62 @@
 """Strava API interaction utilities."""
 
+import concurrent.futures
 import datetime
 import os
-import time
+import threading
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
 
 import arrow
 import stravalib
 
 from ..config import FIT_FOLDER
 from ..exceptions import FlybySyncError
+from .activity_data import activity_data_from_strava
 from .db import (
+    FlybyBatchWriter,
     convert_streams_to_flyby_dataframe,
     enqueue_flyby_activities,
     get_dataframe_from_strava_activities,
-    get_dataframes_for_fit_tables,
     get_db_connection,
     init_db,
     list_pending_flyby_activities,
-    mark_flyby_activity_done,
     prune_activities_not_in_remote_ids,
     store_flyby_data,
     update_flyby_activity_error,
     update_or_create_activities,
 )
 
-FLYBY_REQUEST_SLEEP_SECONDS = float(os.getenv("STRAVA_FLYBY_REQUEST_SLEEP", "0.5"))
+# Number of concurrent stream fetches; pacing is left to the shared rate limiter.
+FLYBY_WORKERS = max(1, int(os.getenv("STRAVA_FLYBY_WORKERS", "4")))
 FLYBY_MAX_RETRIES = int(os.getenv("STRAVA_FLYBY_MAX_RETRIES", "3"))
+# Flyby rows are buffered and written in one transaction once either limit is reached.
+FLYBY_BATCH_ROWS = int(os.getenv("STRAVA_FLYBY_BATCH_ROWS", "50000"))
+FLYBY_BATCH_BYTES = int(os.getenv("STRAVA_FLYBY_BATCH_BYTES", str(64 * 1024 * 1024)))
+
+FLYBY_STREAM_TYPES = [
+    "time",
+    "latlng",
+    "altitude",
+    "heartrate",
+    "distance",
+    "velocity_smooth",
+    "cadence",
+    "watts",
+]
+
+
+@dataclass
+class FlybyFetchResult:
+    """Outcome of fetching one queued activity in the flyby pipeline."""
+
+    activity_id: int
+    activity: Any = None
+    streams: dict | None = None
+    status: str = "ok"  # ok | error | rate_limited | cancelled
+    error: Exception | None = None
 
 
 class StravaClientMixin:
@@ -49,7 +80,13 @@ class StravaClientMixin:
         Sync activities from Strava to the local DuckDB database.
         """
         self.check_access()
+        self.load_rate_budget()
+        try:
+            self._sync_activities(force, prune)
+        finally:
+            self.save_rate_budget()
 
+    def _sync_activities(self, force, prune):
         self.logger.info("Starting Strava DB sync. force=%s prune=%s", force, prune)
         if force:
             filters = {"before": datetime.datetime.now(datetime.timezone.utc)}
@@ -71,7 +108,7 @@ class StravaClientMixin:
             else:
                 filters = {"before": datetime.datetime.now(datetime.timezone.utc)}
 
-        strava_activities = list(self.client.get_activities(**filters))
+        strava_activities = self.rate_governor.call_pages(self.client.get_activities, **filters)
 
         # Filter out activities that already exist in DB by run_id using read-only connection
         try:
@@ -95,7 +132,7 @@ class StravaClientMixin:
 
         if prune:
             # Prune requires a full remote ID snapshot, independent of incremental sync window.
-            all_remote_ids = {int(a.id) for a in self.client.get_activities()}
+            all_remote_ids = {int(a.id) for a in self.rate_governor.call_pages(self.client.get_activities)}
             pruned = prune_activities_not_in_remote_ids(self.db_connection, all_remote_ids)
             if pruned > 0:
                 self.logger.info("Pruned %d local activities missing on Strava.", pruned)
@@ -107,7 +144,7 @@ class StravaClientMixin:
             # Continue to process any pending flyby queue entries.
         else:
             # Convert to DataFrame and upsert only truly new activities
-            activities_df = get_dataframe_from_strava_activities(activities_to_process)
+            activities_df = get_dataframe_from_strava_activities(activities_to_process, self.db_connection)
             updated_count = update_or_create_activities(self.db_connection, activities_df)
             self.logger.info(f"Synced {updated_count} activities to the database.")
 
@@ -120,93 +157,167 @@ class StravaClientMixin:
             return
 
         activity_map = {int(a.id): a for a in activities_to_process}
+        total_flyby_records = self._sync_flyby_queue(pending_ids, activity_map)
+
+        if total_flyby_records > 0:
+            self.logger.info(f"Successfully synced {total_flyby_records} flyby records.")
+        else:
+            self.logger.info("No flyby data available to sync for queued activities.")
+
+    def _sync_flyby_queue(self, pending_ids, activity_map):
+        """
+        Fetch and store flyby data for queued activities.
+
+        A bounded pool of workers fetches activities and streams from Strava,
+        paced by ``self.rate_governor``. Conversion and every DuckDB write happen
+        on this thread, so the connection is never shared between threads.
+        Failed activities keep their queue row with an 'error' or 'rate_limited'
+        status and are retried on the next run.
+        """
         total_flyby_records = 0
+        existing_counts = self._existing_flyby_counts(pending_ids)
+        max_in_flight = FLYBY_WORKERS * 2
+        cancelled = threading.Event()
+        pending = iter(int(activity_id) for activity_id in pending_ids)
+        in_flight = deque()
+
+        flyby_writer = FlybyBatchWriter(self.db_connection, max_rows=FLYBY_BATCH_ROWS, max_bytes=FLYBY_BATCH_BYTES)
+        with flyby_writer, concurrent.futures.ThreadPoolExecutor(max_workers=FLYBY_WORKERS) as executor:
+            while True:
+                while not cancelled.is_set() and len(in_flight) < max_in_flight:
+                    activity_id = next(pending, None)
+                    if activity_id is None:
+                        break
+                    if activity_id in existing_counts:
+                        self.logger.info(
+                            f"Flyby data for activity {activity_id} already exists "
+                            f"({existing_counts[activity_id]} records), skipping."
+                        )
+                        total_flyby_records += existing_counts[activity_id]
+                        flyby_writer.mark_done(activity_id)
+                        continue
+                    in_flight.append(
+                        executor.submit(self._fetch_flyby_job, activity_id, activity_map.get(activity_id), cancelled)
+                    )
 
-        for activity_id in pending_ids:
-            activity = activity_map.get(int(activity_id))
-            if activity is None:
-                try:
-                    if FLYBY_REQUEST_SLEEP_SECONDS > 0:
-                        time.sleep(FLYBY_REQUEST_SLEEP_SECONDS)
-                    activity = self.client.get_activity(activity_id)
-                except stravalib.exc.RateLimitExceeded as e:
-                    retry_after = getattr(e, "retry_after", None)
-                    wait = retry_after if retry_after else 60
+                if not in_flight:
+                    break
+
+                future = in_flight.popleft()
+                if future.cancelled():
+                    continue
+                result = future.result()
+
+                if result.status == "cancelled":
+                    continue
+                if result.status == "rate_limited":
                     update_flyby_activity_error(
-                        self.db_connection,
-                        int(activity_id),
-                        "rate_limited",
-                        str(e),
+                        self.db_connection, result.activity_id, "rate_limited", str(result.error)
                     )
                     self.logger.warning(
-                        f"Rate limit exceeded while fetching activity {activity_id}. "
-                        f"Waiting {wait} seconds and stopping flyby sync."
+                        f"Rate limit persists while syncing flyby for activity {result.activity_id}. "
+                        "Stopping flyby sync and leaving remaining activities in the queue."
                     )
-                    time.sleep(wait)
-                    return
-                except Exception as e:
-                    update_flyby_activity_error(
-                        self.db_connection,
-                        int(activity_id),
-                        "error",
-                        str(e),
+                    cancelled.set()
+                    for queued in in_flight:
+                        queued.cancel()
+                    continue
+                if result.status == "error":
+                    update_flyby_activity_error(self.db_connection, result.activity_id, "error", str(result.error))
+                    self.logger.warning(
+                        f"Failed to fetch flyby data for activity {result.activity_id}: {result.error}. "
+                        "Keeping it queued."
                     )
-                    self.logger.warning(f"Failed to fetch activity {activity_id}: {e}. Keeping it queued.")
                     continue
 
-            for attempt in range(FLYBY_MAX_RETRIES):
                 try:
-                    if FLYBY_REQUEST_SLEEP_SECONDS > 0:
-                        time.sleep(FLYBY_REQUEST_SLEEP_SECONDS)
-                    records = self._sync_flyby_for_activity(activity)
+                    records = self._store_flyby_streams(result.activity, result.streams, flyby_writer=flyby_writer)
                     total_flyby_records += records
-                    mark_flyby_activity_done(self.db_connection, int(activity.id))
-                    break
-                except stravalib.exc.RateLimitExceeded as e:
-                    retry_after = getattr(e, "retry_after", None)
-                    wait = retry_after if retry_after else min(60 * (2**attempt), 900)
-                    update_flyby_activity_error(
-                        self.db_connection,
-                        int(activity.id),
-                        "rate_limited",
-                        str(e),
-                    )
-                    self.logger.warning(
-                        f"Rate limit exceeded while syncing flyby for activity {activity.id}. "
-                        f"Waiting {wait} seconds (attempt {attempt + 1}/{FLYBY_MAX_RETRIES})."
-                    )
-                    time.sleep(wait)
-                    if attempt == FLYBY_MAX_RETRIES - 1:
-                        self.logger.warning(f"Rate limit persists. Leaving activity {activity.id} in the queue.")
-                        return
-                except FlybySyncError as activity_error:
-                    update_flyby_activity_error(
-                        self.db_connection,
-                        int(activity.id),
-                        "error",
-                        str(activity_error),
-                    )
-                    self.logger.warning(
-                        f"Flyby sync failed for activity {activity.id}: {activity_error}. Keeping it queued."
-                    )
-                    break
+                    flyby_writer.mark_done(result.activity_id)
                 except Exception as activity_error:
-                    update_flyby_activity_error(
-                        self.db_connection,
-                        int(activity.id),
-                        "error",
-                        str(activity_error),
-                    )
+                    update_flyby_activity_error(self.db_connection, result.activity_id, "error", str(activity_error))
                     self.logger.warning(
-                        f"Unexpected flyby sync failure for activity {activity.id}: {activity_error}. "
-                        "Keeping it queued."
+                        f"Flyby sync failed for activity {result.activity_id}: {activity_error}. Keeping it queued."
                     )
+
+        return total_flyby_records
+
+    def _existing_flyby_counts(self, activity_ids):
+        """Return {activity_id: row count} for the given activities that already have flyby data."""
+        try:
+            rows = self.db_connection.execute(
+                """
+                SELECT activity_id, COUNT(*) FROM activities_flyby
+                WHERE activity_id IN (SELECT UNNEST(?))
+                GROUP BY activity_id
+                """,
+                [[int(activity_id) for activity_id in activity_ids]],
+            ).fetchall()
+            return {int(activity_id): count for activity_id, count in rows}
+        except Exception as e:
+            self.logger.warning(f"Could not check existing flyby data: {e}")
+            return {}
+
+    def _fetch_flyby_job(self, activity_id, activity=None, cancelled=None):
+        """
+        Worker stage of the flyby pipeline: fetch the activity (if needed) and its streams.
+        Rate-limit errors pause every worker through the shared limiter and are retried.
+        """
+        last_error = None
+        for attempt in range(FLYBY_MAX_RETRIES):
+            if cancelled is not None and cancelled.is_set():
+                return FlybyFetchResult(activity_id, activity, status="cancelled")
+            try:
+                if activity is None:
+                    activity = self.rate_governor.call(self.client.get_activity, activity_id)
+                streams = self._fetch_flyby_streams(activity)
+                return FlybyFetchResult(activity_id, activity, streams=streams)
+            except stravalib.exc.RateLimitExceeded as e:
+                last_error = e
+                if attempt == FLYBY_MAX_RETRIES - 1:
                     break
+                wait = e.timeout if e.timeout else min(60 * (2**attempt), 900)
+                self.logger.warning(
+                    f"Rate limit exceeded while fetching flyby data for activity {activity_id}. "
+                    f"Pausing Strava requests for {wait} seconds (attempt {attempt + 1}/{FLYBY_MAX_RETRIES})."
+                )
+                self.rate_governor.block_for(wait)
+            except Exception as e:
+                return FlybyFetchResult(activity_id, activity, status="error", error=e)
+        return FlybyFetchResult(activity_id, activity, status="rate_limited", error=last_error)
 
-        if total_flyby_records > 0:
-            self.logger.info(f"Successfully synced {total_flyby_records} flyby records.")
-        else:
-            self.logger.info("No flyby data available to sync for queued activities.")
+    def load_rate_budget(self):
+        """Restore the Strava budget used by earlier runs into the shared governor."""
+        if self.db_connection is not None:
+            self.rate_governor.load_state(self.db_connection)
+            return
+        if not Path(self.db_path).exists():
+            return
+        try:
+            con = get_db_connection(database=self.db_path, read_only=True)
+            try:
+                self.rate_governor.load_state(con)
+            finally:
+                con.close()
+        except Exception as e:
+            self.logger.debug(f"Could not load Strava rate-limit state: {e}")
+
+    def save_rate_budget(self):
+        """Persist the remaining Strava budget and log the governor metrics."""
+        self.logger.info("Strava API usage: %s", self.rate_governor.metrics())
+        if self.db_connection is not None:
+            self.rate_governor.save_state(self.db_connection)
+            return
+        if not Path(self.db_path).exists():
+            return
+        try:
+            con = get_db_connection(database=self.db_path)
+            try:
+                self.rate_governor.save_state(con)
+            finally:
+                con.close()
+        except Exception as e:
+            self.logger.debug(f"Could not save Strava rate-limit state: {e}")
 
     def _get_latest_gps_activity(self):
         """
@@ -214,7 +325,7 @@ class StravaClientMixin:
         Returns: Activity object or None if no GPS activity found
         """
         try:
-            activities = list(self.client.get_activities(limit=30))
+            activities = self.rate_governor.call_pages(self.client.get_activities, limit=30)
 
             if not activities:
                 self.logger.info("No activities found from Strava API.")
@@ -227,7 +338,9 @@ class StravaClientMixin:
                 try:
                     # Get available stream types for this activity
                     stream_types = ["latlng"]
-                    streams = self.client.get_activity_streams(activity.id, types=stream_types, resolution="low")
+                    streams = self.rate_governor.call(
+                        self.client.get_activity_streams, activity.id, types=stream_types, resolution="low"
+                    )
 
                     # Check if latlng stream exists and has data
                     if streams.get("latlng") and streams["latlng"].data:
@@ -236,9 +349,6 @@ class StravaClientMixin:
                         )
                         return activity
 
-                    # Rate limiting to avoid hitting API limits
-                    time.sleep(0.5)
-
                 except Exception as e:
                     self.logger.warning(f"Failed to check streams for activity {activity.id}: {e}")
                     continue
@@ -274,15 +384,16 @@ class StravaClientMixin:
                     )
                     return 0
 
-                retry_after = getattr(e, "retry_after", 60)
+                retry_after = e.timeout if e.timeout else 60
                 self.logger.warning(f"Strava API rate limit exceeded during flyby sync: {e}")
                 self.logger.info(
-                    "Waiting %s seconds before retrying flyby sync (%d/%d)...",
+                    "Pausing Strava requests for %s seconds before retrying flyby sync (%d/%d)...",
                     retry_after,
                     retry_count,
                     FLYBY_MAX_RETRIES,
                 )
-                time.sleep(retry_after)
+                # The next governed call waits until the pause is over.
+                self.rate_governor.block_for(retry_after)
             except Exception as e:
                 self.logger.error(
                     f"Unexpected error during flyby data synchronization: {e}",
@@ -315,21 +426,35 @@ class StravaClientMixin:
                 except Exception as e:
                     self.logger.warning(f"Could not check existing flyby data: {e}")
 
-            # get the streams for the latest GPS activity
-            stream_types = [
-                "time",
-                "latlng",
-                "altitude",
-                "heartrate",
-                "distance",
-                "velocity_smooth",
-                "cadence",
-                "watts",
-            ]
+            streams = self._fetch_flyby_streams(activity)
+            return self._store_flyby_streams(activity, streams)
 
-            self.logger.info(f"Fetching stream data for activity {activity.id}...")
-            streams = self.client.get_activity_streams(activity.id, types=stream_types, resolution="high")
+        except stravalib.exc.RateLimitExceeded:
+            # Re-raise for caller-level retry and queue persistence.
+            raise
+        except stravalib.exc.ActivityUploadFailed as e:
+            raise FlybySyncError(f"Strava activity access failed during flyby sync: {e}") from e
+        except FlybySyncError:
+            raise
+        except Exception as e:
+            raise FlybySyncError(f"Unexpected flyby sync error for {activity.id}: {e}") from e
 
+    def _fetch_flyby_streams(self, activity):
+        """Fetch the high resolution streams used for flyby data."""
+        self.logger.info(f"Fetching stream data for activity {activity.id}...")
+        return self.rate_governor.call(
+            self.client.get_activity_streams,
+            activity.id,
+            types=FLYBY_STREAM_TYPES,
+            resolution="high",
+        )
+
+    def _store_flyby_streams(self, activity, streams, flyby_writer=None):
+        """
+        Convert fetched streams to flyby rows and store them, or buffer them in flyby_writer.
+        Returns the number of records stored or buffered.
+        """
+        try:
             # Check if the essential streams are present.
             # For indoor activities, latlng might be missing, but we need at least time.
             time_stream = streams.get("time")
@@ -375,6 +500,9 @@ class StravaClientMixin:
                 self.logger.warning(f"No flyby data generated for activity {activity.id}")
                 return 0
 
+            if flyby_writer is not None:
+                return flyby_writer.add(activity.id, flyby_df)
+
             records_stored = store_flyby_data(self.db_connection, flyby_df)
 
             if records_stored > 0:
@@ -384,11 +512,6 @@ class StravaClientMixin:
 
             return records_stored
 
-        except stravalib.exc.RateLimitExceeded:
-            # Re-raise for caller-level retry and queue persistence.
-            raise
-        except stravalib.exc.ActivityUploadFailed as e:
-            raise FlybySyncError(f"Strava activity access failed during flyby sync: {e}") from e
         except Exception as e:
             raise FlybySyncError(f"Unexpected flyby sync error for {activity.id}: {e}") from e
 
@@ -398,9 +521,10 @@ class StravaClientMixin:
         """
         self.check_access()
         self.logger.info(f"Syncing specific activity ID: {activity_id}")
+        self.load_rate_budget()
 
         try:
-            activity = self.client.get_activity(activity_id)
+            activity = self.rate_governor.call_with_retries(FLYBY_MAX_RETRIES, self.client.get_activity, activity_id)
         except Exception as e:
             self.logger.error(f"Failed to fetch activity {activity_id} from Strava: {e}")
             return
@@ -410,7 +534,7 @@ class StravaClientMixin:
             self.db_connection = init_db(self.db_path)
 
         # Sync Activity Summary
-        activities_df = get_dataframe_from_strava_activities([activity])
+        activities_df = get_dataframe_from_strava_activities([activity], self.db_connection)
         update_or_create_activities(self.db_connection, activities_df)
         self.logger.info(f"Synced summary for activity {activity_id}.")
 
@@ -418,10 +542,13 @@ class StravaClientMixin:
         try:
             self._sync_flyby_for_activity(activity, force=force)
         except stravalib.exc.RateLimitExceeded as e:
-            self.logger.warning(f"Rate limit exceeded while syncing activity {activity_id}: {e}")
-            # We could retry here, but for single activity maybe just fail is okay or wait
-            time.sleep(60)
+            wait = e.timeout if e.timeout else 60
+            self.logger.warning(f"Rate limit exceeded while syncing activity {activity_id}: {e}. Retrying in {wait}s.")
+            # The retried stream fetch waits in the governor until the pause is over.
+            self.rate_governor.block_for(wait)
             self._sync_flyby_for_activity(activity, force=force)
+        finally:
+            self.save_rate_budget()
 
     def sync_and_generate_fit(self, force=False):
         """
@@ -432,8 +559,8 @@ class StravaClientMixin:
         self.logger.info("Starting FIT file generation process.")
 
         filters = {}
+        existing_fit_files = set()
         if not force:
-            existing_fit_files = set()
             # Check existing FIT files instead of database records
             try:
                 if FIT_FOLDER.exists():
@@ -450,7 +577,14 @@ class StravaClientMixin:
                 self.logger.warning(f"Could not check existing FIT files, processing all activities. Error: {e}")
                 existing_fit_files = set()
 
-        activities = list(self.client.get_activities(**filters))
+        self.load_rate_budget()
+        try:
+            return self._generate_fit_files(filters, force, existing_fit_files)
+        finally:
+            self.save_rate_budget()
+
+    def _generate_fit_files(self, filters, force, existing_fit_files):
+        activities = self.rate_governor.call_pages(self.client.get_activities, **filters)
         if not activities:
             self.logger.info("No activities found to generate FIT files for.")
             return []
@@ -474,11 +608,16 @@ class StravaClientMixin:
                     "velocity_smooth",
                     "distance",
                 ]
-                streams = self.client.get_activity_streams(activity.id, types=stream_types, resolution="high")
+                streams = self.rate_governor.call_with_retries(
+                    FLYBY_MAX_RETRIES,
+                    self.client.get_activity_streams,
+                    activity.id,
+                    types=stream_types,
+                    resolution="high",
+                )
 
                 # Generate FIT data without writing to database
-                dataframes = get_dataframes_for_fit_tables(activity, streams)
-                fit_byte_data = self.build_fit_file_from_dataframes(dataframes)
+                fit_byte_data = self.build_fit_file(activity_data_from_strava(activity, streams))
 
                 filename = f"{activity.id}.fit"
                 FIT_FOLDER.mkdir(parents=True, exist_ok=True)
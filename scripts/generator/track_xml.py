@@ -0,0 +1,261 @@
+"""
+Streaming TCX and GPX writers.
+
+The writers emit a document straight to a text file handle, a chunk of
+trackpoints at a time, from track point columns: a mapping with "timestamp"
+as int64 Unix milliseconds and position_lat, position_long, altitude and
+heart_rate as float64 arrays with NaN where a value is missing (the records
+of an ActivityData). With ``indent`` set, the layout is the one of minidom's
+toprettyxml(indent=...) for TCX and of gpxpy's to_xml() for GPX; with
+``indent=None`` the document is written on a single line.
+"""
+
+import contextlib
+import gzip
+import io
+
+import numpy as np
+
+TCX_ROOT_ATTRIBUTES = {
+    "xmlns": "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2",
+    "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "xsi:schemaLocation": "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2 "
+    "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd",
+}
+GPX_ROOT_ATTRIBUTES = {
+    "xmlns": "http://www.topografix.com/GPX/1/1",
+    "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
+    "xsi:schemaLocation": "http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd",
+    "version": "1.1",
+    "creator": "gpx.py -- https://github.com/tkrajina/gpxpy",
+}
+
+# Trackpoints joined into one write() call.
+WRITE_CHUNK_POINTS = 2000
+
+# minidom escapes quotes in text nodes, gpxpy (xml.sax.saxutils.escape) does not.
+_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+_GPX_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_ATTRIBUTE_ESCAPES = str.maketrans(
+    {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "\r": "&#13;", "\n": "&#10;", "\t": "&#9;"}
+)
+
+
+def escape_text(value):
+    return str(value).translate(_TEXT_ESCAPES)
+
+
+def escape_attribute(value):
+    return str(value).translate(_ATTRIBUTE_ESCAPES)
+
+
+def format_float(value):
+    """A float as GPX text: repr-style, but never in scientific notation, which GPX 1.1 does not allow."""
+    text = str(value)
+    if "e" not in text:
+        return text
+    return format(value, ".10f").rstrip("0").rstrip(".")
+
+
+def format_times(timestamps_ms, suffix=""):
+    """
+    ISO 8601 texts of Unix millisecond timestamps, like datetime.isoformat()
+    of naive UTC times (microseconds only when non-zero), followed by ``suffix``.
+    """
+    timestamps_ms = np.asarray(timestamps_ms, dtype="int64")
+    texts = np.datetime_as_string(timestamps_ms.astype("datetime64[ms]"), unit="s").astype(object)
+    fractional = np.flatnonzero(timestamps_ms % 1000)
+    if len(fractional):
+        micros = np.datetime_as_string(
+            timestamps_ms[fractional].astype("datetime64[ms]").astype("datetime64[us]"), unit="us"
+        )
+        texts[fractional] = micros
+    return [text + suffix for text in texts.tolist()]
+
+
+class _Lines:
+    """Indented lines of an XML document; ``indent=None`` writes everything on one line."""
+
+    def __init__(self, out, indent):
+        self.out = out
+        self.indent = indent or ""
+        self.newline = "" if indent is None else "\n"
+
+    def prefix(self, depth):
+        return self.indent * depth
+
+    def line(self, depth, text):
+        self.out.write(f"{self.indent * depth}{text}{self.newline}")
+
+    def open(self, depth, tag, attributes=None):
+        attrs = "".join(f' {name}="{escape_attribute(value)}"' for name, value in (attributes or {}).items())
+        self.line(depth, f"<{tag}{attrs}>")
+
+    def close(self, depth, tag):
+        self.line(depth, f"</{tag}>")
+
+    def leaf(self, depth, tag, text):
+        self.line(depth, f"<{tag}>{escape_text(text)}</{tag}>")
+
+
+def _column(records, name, count):
+    values = records.get(name)
+    return np.full(count, np.nan) if values is None else np.asarray(values, dtype="float64")
+
+
+def _write_chunked(out, pieces):
+    chunk = []
+    for piece in pieces:
+        chunk.append(piece)
+        if len(chunk) >= WRITE_CHUNK_POINTS:
+            out.write("".join(chunk))
+            chunk = []
+    out.write("".join(chunk))
+
+
+def write_tcx(
+    out,
+    records,
+    *,
+    sport,
+    start_time,
+    total_time_seconds,
+    distance_meters,
+    calories=None,
+    heart_rate_summary=False,
+    time_suffix="",
+    indent="  ",
+):
+    """
+    Writes a TCX document with a single lap to ``out``. ``start_time`` is in
+    Unix milliseconds. AltitudeMeters and HeartRateBpm are left out for
+    missing values; ``heart_rate_summary`` adds the average and maximum heart
+    rate of the track to the lap.
+    """
+    lines = _Lines(out, indent)
+    count = len(records["timestamp"]) if "timestamp" in records else 0
+    start_text = format_times([start_time], time_suffix)[0]
+    heart_rate = _column(records, "heart_rate", count)
+
+    out.write('<?xml version="1.0" ?>' + lines.newline)
+    lines.open(0, "TrainingCenterDatabase", TCX_ROOT_ATTRIBUTES)
+    lines.open(1, "Activities")
+    lines.open(2, "Activity", {"Sport": sport})
+    lines.leaf(3, "Id", start_text)
+    lines.open(3, "Lap", {"StartTime": start_text})
+    lines.leaf(4, "TotalTimeSeconds", float(total_time_seconds))
+    lines.leaf(4, "DistanceMeters", float(distance_meters))
+    if calories:
+        lines.leaf(4, "Calories", int(calories))
+    if heart_rate_summary and count and not np.isnan(heart_rate).all():
+        for tag, value in (
+            ("AverageHeartRateBpm", np.nanmean(heart_rate)),
+            ("MaximumHeartRateBpm", np.nanmax(heart_rate)),
+        ):
+            lines.open(4, tag)
+            lines.leaf(5, "Value", int(value))
+            lines.close(4, tag)
+    lines.leaf(4, "Intensity", "Active")
+    lines.leaf(4, "TriggerMethod", "Manual")
+
+    if not count:
+        lines.line(4, "<Track/>")
+    else:
+        lines.open(4, "Track")
+        nl = lines.newline
+        p5, p6, p7 = (nl + lines.prefix(depth) for depth in (5, 6, 7))
+        # The first trackpoint is preceded by the Track line's newline.
+        head = lines.prefix(5)
+
+        def trackpoints():
+            columns = zip(
+                format_times(records["timestamp"], time_suffix),
+                _column(records, "position_lat", count).tolist(),
+                _column(records, "position_long", count).tolist(),
+                _column(records, "altitude", count).tolist(),
+                heart_rate.tolist(),
+            )
+            for index, (time_text, lat, lng, alt, hr) in enumerate(columns):
+                parts = [head if index == 0 else p5, "<Trackpoint>", p6, "<Time>", time_text, "</Time>"]
+                if lat == lat and lng == lng:
+                    parts += (p6, "<Position>", p7, "<LatitudeDegrees>", str(lat), "</LatitudeDegrees>")
+                    parts += (p7, "<LongitudeDegrees>", str(lng), "</LongitudeDegrees>", p6, "</Position>")
+                if alt == alt:
+                    parts += (p6, "<AltitudeMeters>", str(alt), "</AltitudeMeters>")
+                if hr == hr:
+                    parts += (p6, "<HeartRateBpm>", p7, "<Value>", str(int(hr)), "</Value>", p6, "</HeartRateBpm>")
+                parts += (p5, "</Trackpoint>")
+                yield "".join(parts)
+
+        _write_chunked(out, trackpoints())
+        out.write(nl)
+        lines.close(4, "Track")
+
+    lines.close(3, "Lap")
+    lines.open(3, "Creator", {"xsi:type": "Device_t"})
+    lines.leaf(4, "Name", "Strava")
+    lines.close(3, "Creator")
+    lines.close(2, "Activity")
+    lines.close(1, "Activities")
+    lines.close(0, "TrainingCenterDatabase")
+
+
+def write_gpx(out, records, *, name, time_suffix="Z", indent="  "):
+    """Writes a GPX document with one track of one segment to ``out``; ele is left out for missing altitudes."""
+    lines = _Lines(out, indent)
+    count = len(records["timestamp"]) if "timestamp" in records else 0
+
+    out.write('<?xml version="1.0" encoding="UTF-8"?>' + lines.newline)
+    lines.open(0, "gpx", GPX_ROOT_ATTRIBUTES)
+    lines.open(1, "trk")
+    lines.line(2, f"<name>{str(name).translate(_GPX_TEXT_ESCAPES)}</name>")
+    lines.open(2, "trkseg")
+    if count:
+        nl = lines.newline
+        p3, p4 = (nl + lines.prefix(depth) for depth in (3, 4))
+        head = lines.prefix(3)
+
+        def trackpoints():
+            columns = zip(
+                format_times(records["timestamp"], time_suffix),
+                _column(records, "position_lat", count).tolist(),
+                _column(records, "position_long", count).tolist(),
+                _column(records, "altitude", count).tolist(),
+            )
+            for index, (time_text, lat, lng, alt) in enumerate(columns):
+                parts = [
+                    head if index == 0 else p3,
+                    '<trkpt lat="',
+                    format_float(lat),
+                    '" lon="',
+                    format_float(lng),
+                    '">',
+                ]
+                if alt == alt:
+                    parts += (p4, "<ele>", format_float(alt), "</ele>")
+                parts += (p4, "<time>", time_text, "</time>", p3, "</trkpt>")
+                yield "".join(parts)
+
+        _write_chunked(out, trackpoints())
+        out.write(nl)
+    lines.close(2, "trkseg")
+    lines.close(1, "trk")
+    # gpxpy ends the document without a newline.
+    out.write("</gpx>")
+
+
+@contextlib.contextmanager
+def open_track_file(path, compress=False):
+    """
+    UTF-8 text handle writing to ``path``; gzip-compressed when ``compress``,
+    with a zero mtime and no file name in the header so equal documents give
+    equal files.
+    """
+    with open(path, "wb") as raw:
+        if compress:
+            with gzip.GzipFile(filename="", mode="wb", compresslevel=6, fileobj=raw, mtime=0) as compressed:
+                with io.TextIOWrapper(compressed, encoding="utf-8", newline="") as out:
+                    yield out
+        else:
+            with io.TextIOWrapper(raw, encoding="utf-8", newline="") as out:
+                yield out
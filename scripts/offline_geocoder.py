@@ -0,0 +1,438 @@
+"""
+Offline country lookup backed by a precomputed S2 cell index.
+
+The index (``data/country_index.npz``) covers the land surface with S2 cells
+of a fixed level, each tagged with the country it lies in. Consecutive cells
+of the same country along the Hilbert curve are merged into one leaf-id range,
+so a lookup is a binary search over sorted ranges. Cells that straddle a
+border (or open sea) are left out; points there resolve to ``None`` and the
+caller can fall back to Nominatim.
+
+The index is built from the timezone boundaries shipped with timezonefinder:
+every land timezone belongs to exactly one country in tzdata's zone.tab.
+Rebuild it with ``python -m scripts.offline_geocoder --level 9``.
+"""
+
+import argparse
+import importlib.resources
+import threading
+from pathlib import Path
+
+import numpy as np
+import s2sphere
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+COUNTRY_INDEX_PATH = Path(__file__).parent / "data" / "country_index.npz"
+DEFAULT_INDEX_LEVEL = 9
+
+# Country names as Nominatim returns them for language="zh-CN", which is what
+# location_country has always held. Hong Kong and Macau are reported as China,
+# and the French overseas departments as France.
+COUNTRY_NAMES_ZH = {
+    "AD": "安道尔",
+    "AE": "阿拉伯联合酋长国",
+    "AF": "阿富汗",
+    "AG": "安提瓜和巴布达",
+    "AI": "安圭拉",
+    "AL": "阿尔巴尼亚",
+    "AM": "亚美尼亚",
+    "AO": "安哥拉",
+    "AQ": "南极洲",
+    "AR": "阿根廷",
+    "AS": "美属萨摩亚",
+    "AT": "奥地利",
+    "AU": "澳大利亚",
+    "AW": "阿鲁巴",
+    "AX": "奥兰群岛",
+    "AZ": "阿塞拜疆",
+    "BA": "波斯尼亚和黑塞哥维那",
+    "BB": "巴巴多斯",
+    "BD": "孟加拉国",
+    "BE": "比利时",
+    "BF": "布基纳法索",
+    "BG": "保加利亚",
+    "BH": "巴林",
+    "BI": "布隆迪",
+    "BJ": "贝宁",
+    "BL": "圣巴泰勒米",
+    "BM": "百慕大",
+    "BN": "文莱",
+    "BO": "玻利维亚",
+    "BQ": "荷兰加勒比区",
+    "BR": "巴西",
+    "BS": "巴哈马",
+    "BT": "不丹",
+    "BV": "布韦岛",
+    "BW": "博茨瓦纳",
+    "BY": "白俄罗斯",
+    "BZ": "伯利兹",
+    "CA": "加拿大",
+    "CC": "科科斯（基林）群岛",
+    "CD": "刚果民主共和国",
+    "CF": "中非共和国",
+    "CG": "刚果共和国",
+    "CH": "瑞士",
+    "CI": "科特迪瓦",
+    "CK": "库克群岛",
+    "CL": "智利",
+    "CM": "喀麦隆",
+    "CN": "中国",
+    "CO": "哥伦比亚",
+    "CR": "哥斯达黎加",
+    "CU": "古巴",
+    "CV": "佛得角",
+    "CW": "库拉索",
+    "CX": "圣诞岛",
+    "CY": "塞浦路斯",
+    "CZ": "捷克",
+    "DE": "德国",
+    "DJ": "吉布提",
+    "DK": "丹麦",
+    "DM": "多米尼克",
+    "DO": "多米尼加",
+    "DZ": "阿尔及利亚",
+    "EC": "厄瓜多尔",
+    "EE": "爱沙尼亚",
+    "EG": "埃及",
+    "EH": "西撒哈拉",
+    "ER": "厄立特里亚",
+    "ES": "西班牙",
+    "ET": "埃塞俄比亚",
+    "FI": "芬兰",
+    "FJ": "斐济",
+    "FK": "福克兰群岛",
+    "FM": "密克罗尼西亚联邦",
+    "FO": "法罗群岛",
+    "FR": "法国",
+    "GA": "加蓬",
+    "GB": "英国",
+    "GD": "格林纳达",
+    "GE": "格鲁吉亚",
+    "GF": "法国",
+    "GG": "根西",
+    "GH": "加纳",
+    "GI": "直布罗陀",
+    "GL": "格陵兰",
+    "GM": "冈比亚",
+    "GN": "几内亚",
+    "GP": "法国",
+    "GQ": "赤道几内亚",
+    "GR": "希腊",
+    "GS": "南乔治亚和南桑威奇群岛",
+    "GT": "危地马拉",
+    "GU": "关岛",
+    "GW": "几内亚比绍",
+    "GY": "圭亚那",
+    "HK": "中国",
+    "HM": "赫德岛和麦克唐纳群岛",
+    "HN": "洪都拉斯",
+    "HR": "克罗地亚",
+    "HT": "海地",
+    "HU": "匈牙利",
+    "ID": "印度尼西亚",
+    "IE": "爱尔兰",
+    "IL": "以色列",
+    "IM": "马恩岛",
+    "IN": "印度",
+    "IO": "英属印度洋领地",
+    "IQ": "伊拉克",
+    "IR": "伊朗",
+    "IS": "冰岛",
+    "IT": "意大利",
+    "JE": "泽西",
+    "JM": "牙买加",
+    "JO": "约旦",
+    "JP": "日本",
+    "KE": "肯尼亚",
+    "KG": "吉尔吉斯斯坦",
+    "KH": "柬埔寨",
+    "KI": "基里巴斯",
+    "KM": "科摩罗",
+    "KN": "圣基茨和尼维斯",
+    "KP": "朝鲜",
+    "KR": "韩国",
+    "KW": "科威特",
+    "KY": "开曼群岛",
+    "KZ": "哈萨克斯坦",
+    "LA": "老挝",
+    "LB": "黎巴嫩",
+    "LC": "圣卢西亚",
+    "LI": "列支敦士登",
+    "LK": "斯里兰卡",
+    "LR": "利比里亚",
+    "LS": "莱索托",
+    "LT": "立陶宛",
+    "LU": "卢森堡",
+    "LV": "拉脱维亚",
+    "LY": "利比亚",
+    "MA": "摩洛哥",
+    "MC": "摩纳哥",
+    "MD": "摩尔多瓦",
+    "ME": "黑山",
+    "MF": "法属圣马丁",
+    "MG": "马达加斯加",
+    "MH": "马绍尔群岛",
+    "MK": "北马其顿",
+    "ML": "马里",
+    "MM": "缅甸",
+    "MN": "蒙古国",
+    "MO": "中国",
+    "MP": "北马里亚纳群岛",
+    "MQ": "法国",
+    "MR": "毛里塔尼亚",
+    "MS": "蒙特塞拉特",
+    "MT": "马耳他",
+    "MU": "毛里求斯",
+    "MV": "马尔代夫",
+    "MW": "马拉维",
+    "MX": "墨西哥",
+    "MY": "马来西亚",
+    "MZ": "莫桑比克",
+    "NA": "纳米比亚",
+    "NC": "新喀里多尼亚",
+    "NE": "尼日尔",
+    "NF": "诺福克岛",
+    "NG": "尼日利亚",
+    "NI": "尼加拉瓜",
+    "NL": "荷兰",
+    "NO": "挪威",
+    "NP": "尼泊尔",
+    "NR": "瑙鲁",
+    "NU": "纽埃",
+    "NZ": "新西兰",
+    "OM": "阿曼",
+    "PA": "巴拿马",
+    "PE": "秘鲁",
+    "PF": "法属波利尼西亚",
+    "PG": "巴布亚新几内亚",
+    "PH": "菲律宾",
+    "PK": "巴基斯坦",
+    "PL": "波兰",
+    "PM": "圣皮埃尔和密克隆",
+    "PN": "皮特凯恩群岛",
+    "PR": "波多黎各",
+    "PS": "巴勒斯坦",
+    "PT": "葡萄牙",
+    "PW": "帕劳",
+    "PY": "巴拉圭",
+    "QA": "卡塔尔",
+    "RE": "法国",
+    "RO": "罗马尼亚",
+    "RS": "塞尔维亚",
+    "RU": "俄罗斯",
+    "RW": "卢旺达",
+    "SA": "沙特阿拉伯",
+    "SB": "所罗门群岛",
+    "SC": "塞舌尔",
+    "SD": "苏丹",
+    "SE": "瑞典",
+    "SG": "新加坡",
+    "SH": "圣赫勒拿、阿森松和特里斯坦-达库尼亚",
+    "SI": "斯洛文尼亚",
+    "SJ": "斯瓦尔巴和扬马延",
+    "SK": "斯洛伐克",
+    "SL": "塞拉利昂",
+    "SM": "圣马力诺",
+    "SN": "塞内加尔",
+    "SO": "索马里",
+    "SR": "苏里南",
+    "SS": "南苏丹",
+    "ST": "圣多美和普林西比",
+    "SV": "萨尔瓦多",
+    "SX": "荷属圣马丁",
+    "SY": "叙利亚",
+    "SZ": "斯威士兰",
+    "TC": "特克斯和凯科斯群岛",
+    "TD": "乍得",
+    "TF": "法属南部和南极领地",
+    "TG": "多哥",
+    "TH": "泰国",
+    "TJ": "塔吉克斯坦",
+    "TK": "托克劳",
+    "TL": "东帝汶",
+    "TM": "土库曼斯坦",
+    "TN": "突尼斯",
+    "TO": "汤加",
+    "TR": "土耳其",
+    "TT": "特立尼达和多巴哥",
+    "TV": "图瓦卢",
+    "TW": "台湾",
+    "TZ": "坦桑尼亚",
+    "UA": "乌克兰",
+    "UG": "乌干达",
+    "UM": "美国本土外小岛屿",
+    "US": "美国",
+    "UY": "乌拉圭",
+    "UZ": "乌兹别克斯坦",
+    "VA": "梵蒂冈",
+    "VC": "圣文森特和格林纳丁斯",
+    "VE": "委内瑞拉",
+    "VG": "英属维尔京群岛",
+    "VI": "美属维尔京群岛",
+    "VN": "越南",
+    "VU": "瓦努阿图",
+    "WF": "瓦利斯和富图纳",
+    "WS": "萨摩亚",
+    "YE": "也门",
+    "YT": "法国",
+    "ZA": "南非",
+    "ZM": "赞比亚",
+    "ZW": "津巴布韦",
+}
+
+
+class CountryIndex:
+    """Sorted, non-overlapping S2 leaf-id ranges, each mapped to a country name."""
+
+    def __init__(self, level, range_min, range_max, country, names):
+        self.level = int(level)
+        self.range_min = np.asarray(range_min, dtype=np.uint64)
+        self.range_max = np.asarray(range_max, dtype=np.uint64)
+        self.country = np.asarray(country, dtype=np.uint16)
+        self.names = [str(name) for name in names]
+
+    def __len__(self):
+        return len(self.range_min)
+
+    @classmethod
+    def load(cls, path=COUNTRY_INDEX_PATH):
+        with np.load(path) as data:
+            return cls(
+                int(data["level"]),
+                data["range_min"],
+                data["range_max"],
+                data["country"],
+                data["names"],
+            )
+
+    def save(self, path=COUNTRY_INDEX_PATH):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as f:
+            np.savez_compressed(
+                f,
+                level=np.int64(self.level),
+                range_min=self.range_min,
+                range_max=self.range_max,
+                country=self.country,
+                names=np.array(self.names),
+            )
+
+    def lookup(self, lat, lon):
+        """Country of a point, or None if it is near a border, at sea or not a valid coordinate."""
+        return self.lookup_many([lat], [lon])[0]
+
+    def lookup_many(self, lats, lons):
+        """Countries of many points at once; see lookup()."""
+        leaf_ids = np.fromiter((_leaf_id(lat, lon) for lat, lon in zip(lats, lons)), dtype=np.uint64)
+        if not len(leaf_ids) or not len(self):
+            return [None] * len(leaf_ids)
+
+        # Leaf id 0 is never a valid cell, so it marks missing coordinates.
+        pos = np.searchsorted(self.range_min, leaf_ids, side="right") - 1
+        clipped = pos.clip(0)
+        found = (pos >= 0) & (leaf_ids != 0) & (leaf_ids <= self.range_max[clipped])
+        return [self.names[c] if ok else None for c, ok in zip(self.country[clipped], found)]
+
+
+def _leaf_id(lat, lon):
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return 0
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return 0
+    return s2sphere.CellId.from_lat_lng(s2sphere.LatLng.from_degrees(lat, lon)).id()
+
+
+_country_index = None
+_country_index_lock = threading.Lock()
+
+
+def get_country_index():
+    """Return the bundled index, loading it on first use. None if the data file is missing."""
+    global _country_index
+    with _country_index_lock:
+        if _country_index is None:
+            try:
+                _country_index = CountryIndex.load()
+            except (OSError, KeyError, ValueError) as e:
+                logger.warning(f"Offline country index unavailable ({e}), falling back to online geocoding.")
+                _country_index = False
+        return _country_index or None
+
+
+def lookup_countries(lats, lons):
+    """Resolve points with the bundled index. Unresolved points (and all points without an index) are None."""
+    index = get_country_index()
+    if index is None:
+        return [None] * len(lats)
+    return index.lookup_many(lats, lons)
+
+
+def _timezone_countries():
+    """Map every tzdata zone to its ISO 3166 country code using zone.tab."""
+    zone_tab = importlib.resources.files("tzdata").joinpath("zoneinfo", "zone.tab").read_text(encoding="utf-8")
+    countries = {}
+    for line in zone_tab.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        code, _, zone = line.split("\t")[:3]
+        countries[zone] = code
+    return countries
+
+
+def build_country_index(level=DEFAULT_INDEX_LEVEL):
+    """
+    Tag every S2 cell of ``level`` with the country of its centre and corners.
+    Samples at sea are ignored; cells whose land samples disagree are dropped.
+    """
+    from timezonefinder import TimezoneFinder
+
+    finder = TimezoneFinder()
+    zone_countries = _timezone_countries()
+    names = sorted(set(COUNTRY_NAMES_ZH.values()))
+    name_ids = {name: i for i, name in enumerate(names)}
+
+    def sample(lat_lng):
+        zone = finder.timezone_at(lat=lat_lng.lat().degrees, lng=lat_lng.lng().degrees)
+        code = zone_countries.get(zone)
+        return COUNTRY_NAMES_ZH.get(code) if code else None
+
+    range_min, range_max, country = [], [], []
+    cell_id, end = s2sphere.CellId.begin(level), s2sphere.CellId.end(level)
+    while cell_id != end:
+        cell = s2sphere.Cell(cell_id)
+        points = [cell_id.to_lat_lng()] + [s2sphere.LatLng.from_point(cell.get_vertex(k)) for k in range(4)]
+        found = {sample(point) for point in points} - {None}
+        if len(found) == 1:
+            name_id = name_ids[found.pop()]
+            low, high = cell_id.range_min().id(), cell_id.range_max().id()
+            # Extend the previous range when it is the same country and directly adjacent.
+            if country and country[-1] == name_id and range_max[-1] + 2 == low:
+                range_max[-1] = high
+            else:
+                range_min.append(low)
+                range_max.append(high)
+                country.append(name_id)
+        cell_id = cell_id.next()
+
+    return CountryIndex(level, range_min, range_max, country, names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline country index from timezone boundaries.")
+    parser.add_argument("--level", type=int, default=DEFAULT_INDEX_LEVEL, help="S2 cell level of the index.")
+    parser.add_argument("--output", type=Path, default=COUNTRY_INDEX_PATH, help="Where to write the index.")
+    args = parser.parse_args()
+
+    index = build_country_index(args.level)
+    index.save(args.output)
+    logger.info(f"Wrote {len(index)} ranges at S2 level {args.level} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
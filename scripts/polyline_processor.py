@@ -1,7 +1,11 @@
+import functools
+import hashlib
+import math
 import os
 import sys
 from typing import List, Tuple
 
+import numpy as np
 import polyline
 from haversine import haversine
 
@@ -22,6 +26,9 @@ except ValueError:
     logger.error("IGNORE_RANGE or IGNORE_START_END_RANGE is not a number")
     sys.exit(1)
 
+# Same mean earth radius as the haversine package, so distances match haversine().
+_AVG_EARTH_RADIUS_KM = 6371.0088
+
 
 def point_distance_in_range(point: Tuple[float], center_point: Tuple[float], distance: int) -> bool:
     return haversine(point, center_point) < distance
@@ -31,43 +38,123 @@ def point_in_list_points_range(point: Tuple[float], points: List[Tuple[float]],
     return any([point_distance_in_range(point, p, distance) for p in points])
 
 
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Element-wise (broadcasting) haversine distance in kilometers between points given in degrees."""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(v, dtype="float64")) for v in (lat1, lng1, lat2, lng2))
+    d = np.sin((lat2 - lat1) * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) * 0.5) ** 2
+    return 2 * _AVG_EARTH_RADIUS_KM * np.arcsin(np.sqrt(d))
+
+
+def _bbox_candidates(points: np.ndarray, centers: np.ndarray, distance: float) -> np.ndarray:
+    """
+    Mask of the points inside the bounding box of ``centers`` grown by ``distance`` km.
+    The box is conservative: it never excludes a point within ``distance`` of a center.
+    """
+    dlat = math.degrees(distance / _AVG_EARTH_RADIUS_KM) * 1.01
+    lat_min, lat_max = centers[:, 0].min() - dlat, centers[:, 0].max() + dlat
+    mask = (points[:, 0] >= lat_min) & (points[:, 0] <= lat_max)
+
+    max_abs_lat = max(abs(lat_min), abs(lat_max))
+    if max_abs_lat < 89:
+        dlng = dlat / math.cos(math.radians(max_abs_lat))
+        lng_min, lng_max = centers[:, 1].min() - dlng, centers[:, 1].max() + dlng
+        # Skip the longitude test if the box wraps around the antimeridian.
+        if lng_min >= -180 and lng_max <= 180:
+            mask &= (points[:, 1] >= lng_min) & (points[:, 1] <= lng_max)
+    return mask
+
+
+def range_hiding_mask(points: np.ndarray, hide_points: np.ndarray, distance: float) -> np.ndarray:
+    """Mask of the (N, 2) ``points`` that are not within ``distance`` km of any of ``hide_points``."""
+    keep = np.ones(len(points), dtype=bool)
+    if not len(points) or not len(hide_points) or distance <= 0:
+        return keep
+
+    candidates = np.flatnonzero(_bbox_candidates(points, hide_points, distance))
+    # Bound the (candidates x hide_points) distance matrix to a few MB.
+    chunk = max(1, 500_000 // len(hide_points))
+    for start in range(0, len(candidates), chunk):
+        idx = candidates[start : start + chunk]
+        distances = haversine_km(
+            points[idx, 0, None], points[idx, 1, None], hide_points[None, :, 0], hide_points[None, :, 1]
+        )
+        keep[idx] = ~(distances < distance).any(axis=1)
+    return keep
+
+
+def start_end_hiding_bounds(points: np.ndarray, distance: float) -> Tuple[int, int]:
+    """
+    Half-open index range of the points left after hiding ``distance`` km of
+    track at both ends; empty (start >= end) when nothing is left.
+    """
+    if len(points) < 2:
+        return 0, 0
+    segments = haversine_km(points[:-1, 0], points[:-1, 1], points[1:, 0], points[1:, 1])
+
+    # First point whose distance from the start exceeds the range.
+    from_start = np.cumsum(segments)
+    past_start = np.flatnonzero(from_start > distance)
+    start_index = int(past_start[0]) + 1 if len(past_start) else 0
+
+    # Last point whose distance to the end exceeds the range.
+    to_end = np.cumsum(segments[::-1])[::-1]
+    before_end = np.flatnonzero(to_end > distance)
+    end_index = int(before_end[-1]) if len(before_end) else len(points) - 1
+
+    if start_index >= end_index:
+        return 0, 0
+    return start_index, end_index + 1
+
+
 def range_hiding(polyline: List[Tuple[float]], points: List[Tuple[float]], distance: int) -> List[Tuple[float]]:
-    return [point for point in polyline if not point_in_list_points_range(point, points, distance)]
+    if not polyline:
+        return []
+    hide_points = np.asarray(points, dtype="float64").reshape(-1, 2)
+    keep = range_hiding_mask(np.asarray(polyline, dtype="float64"), hide_points, distance)
+    return [point for point, kept in zip(polyline, keep) if kept]
 
 
 def start_end_hiding(polyline: List[Tuple[float]], distance: int) -> List[Tuple[float]]:
-    start_index, end_index = 0, len(polyline) - 1
-
-    starting_distance = 0
-    for i in range(1, len(polyline)):
-        starting_distance += haversine(polyline[i], polyline[i - 1])
-        if starting_distance > distance:
-            start_index = i
-            break
-
-    ending_distance = 0
-    for i in range(len(polyline) - 2, -1, -1):
-        ending_distance += haversine(polyline[i], polyline[i + 1])
-        if ending_distance > distance:
-            end_index = i
-            break
+    start_index, end_index = start_end_hiding_bounds(np.asarray(polyline, dtype="float64"), distance)
+    return polyline[start_index:end_index]
 
-    if start_index >= end_index:
-        return []
 
-    return polyline[start_index : end_index + 1]
+def filter_settings_key() -> str:
+    """Fingerprint of the IGNORE_* settings that affect filter_out()."""
+    settings = repr((IGNORE_POLYLINE, IGNORE_RANGE, IGNORE_START_END_RANGE))
+    return hashlib.sha1(settings.encode()).hexdigest()
 
 
-def filter_out(polyline_str):
-    if not polyline_str:
-        return
+def polyline_hash(polyline_str: str) -> str:
+    return hashlib.sha1(polyline_str.encode()).hexdigest()
+
+
+def filter_polyline(polyline_str: str, ignore_points, ignore_range: float, start_end_range: float):
+    """
+    Decodes ``polyline_str``, hides ``start_end_range`` km at both ends and every
+    point within ``ignore_range`` km of ``ignore_points``, and re-encodes the rest.
+    Returns None if nothing is left.
+    """
     pl = polyline.decode(polyline_str)
     if not pl:
         return polyline_str
 
-    new_pl = start_end_hiding(pl, IGNORE_START_END_RANGE)
-    new_pl = range_hiding(new_pl, IGNORE_POLYLINE, IGNORE_RANGE)
+    points = np.asarray(pl, dtype="float64")
+    start_index, end_index = start_end_hiding_bounds(points, start_end_range)
+    points = points[start_index:end_index]
+    points = points[range_hiding_mask(points, np.asarray(ignore_points, dtype="float64").reshape(-1, 2), ignore_range)]
 
-    if not new_pl:
+    if not len(points):
         return
-    return polyline.encode(new_pl)
+    return polyline.encode([tuple(point) for point in points.tolist()])
+
+
+def filter_out(polyline_str):
+    if not isinstance(polyline_str, str) or not polyline_str:
+        return
+    return _filter_out(polyline_str)
+
+
+@functools.lru_cache(maxsize=16384)
+def _filter_out(polyline_str):
+    return filter_polyline(polyline_str, IGNORE_POLYLINE, IGNORE_RANGE, IGNORE_START_END_RANGE)
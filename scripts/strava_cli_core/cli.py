@@ -4,12 +4,13 @@ import argparse
 import sys
 from pathlib import Path
 
+from ..export_fit import DEFAULT_LAP_SPLIT
 from ..utils import get_logger
 from .config import CredentialInput, get_runtime_config, resolve_garmin_credentials, resolve_strava_credentials
-from .export import run_export
+from .export import DEFAULT_EXPORT_JOBS, EXPORT_BATCH_SIZE, run_export
 from .status import run_vendor_status
 from .sync_db import run_sync_db
-from .sync_garmin import run_reconcile_garmin_sync, run_sync_garmin_sync
+from .sync_garmin import GARMIN_UPLOAD_CONCURRENCY, run_reconcile_garmin_sync, run_sync_garmin_sync
 from .upload_files import run_upload_files_to_garmin_sync
 
 logger = get_logger(__name__)
@@ -33,6 +34,12 @@ def _build_sync_subcommands(subparsers) -> None:
         action="store_true",
         help="Remove local activities not present in current Strava account (also deletes activities_flyby).",
     )
+    sync_db.add_argument(
+        "--verify-json",
+        dest="verify_json",
+        action="store_true",
+        help="Check the incremental activities.json export against a full rebuild.",
+    )
     sync_db.set_defaults(handler=_handle_sync_db)
 
 
@@ -51,6 +58,18 @@ def _build_vendor_subcommands(subparsers) -> None:
         action="store_true",
         help="Force full resync by deleting all remote Garmin activities first",
     )
+    vendor_garmin.add_argument(
+        "--delta",
+        action="store_true",
+        help="Only reconcile and sync activities that are new, changed or not synced yet",
+    )
+    vendor_garmin.add_argument(
+        "--upload-concurrency",
+        dest="upload_concurrency",
+        type=int,
+        default=GARMIN_UPLOAD_CONCURRENCY,
+        help=f"Concurrent Garmin uploads (default: {GARMIN_UPLOAD_CONCURRENCY})",
+    )
     vendor_garmin.add_argument("--match-window-sec", type=int, default=300)
     vendor_garmin.add_argument("--distance-tolerance-m", type=float, default=50.0)
     vendor_garmin.add_argument("--duration-tolerance-sec", type=int, default=120)
@@ -94,6 +113,26 @@ def _build_export_subcommand(subparsers) -> None:
     export_parser.add_argument("--id", action="append", dest="ids", type=int, default=[], help="Activity id")
     export_parser.add_argument("--id-range", help="Activity id range, e.g. 100:200")
     export_parser.add_argument("--output-dir", type=Path, help="Output directory")
+    export_parser.add_argument(
+        "--lap-split",
+        default=DEFAULT_LAP_SPLIT,
+        help="FIT lap split by distance or time, e.g. 1km, 1mi, 400m, 5min (default: 1km)",
+    )
+    export_parser.add_argument(
+        "--jobs",
+        type=int,
+        default=DEFAULT_EXPORT_JOBS,
+        help=f"Worker processes building files (default: {DEFAULT_EXPORT_JOBS})",
+    )
+    export_parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=EXPORT_BATCH_SIZE,
+        help=f"Activities read from DuckDB per query (default: {EXPORT_BATCH_SIZE})",
+    )
+    export_parser.add_argument("--force", action="store_true", help="Rewrite files that are already up to date")
+    export_parser.add_argument("--gzip", action="store_true", help="Write TCX/GPX files gzip-compressed (.gz)")
+    export_parser.add_argument("--compact", action="store_true", help="Write TCX/GPX files without indentation")
     export_parser.set_defaults(handler=_handle_export)
 
 
@@ -130,7 +169,7 @@ def _credential_input_from_args(args: argparse.Namespace) -> CredentialInput:
 
 def _handle_sync_db(args: argparse.Namespace) -> None:
     credentials = resolve_strava_credentials(_credential_input_from_args(args))
-    run_sync_db(credentials, force=args.force, prune=args.prune)
+    run_sync_db(credentials, force=args.force, prune=args.prune, verify_json=args.verify_json)
 
 
 def _handle_sync_garmin(args: argparse.Namespace) -> None:
@@ -142,6 +181,8 @@ def _handle_sync_garmin(args: argparse.Namespace) -> None:
         use_fake_garmin_device=args.use_fake_garmin_device,
         fix_hr=args.fix_hr,
         force=args.force,
+        delta=args.delta,
+        upload_concurrency=max(1, args.upload_concurrency),
         match_window_seconds=args.match_window_sec,
         distance_tolerance_meters=args.distance_tolerance_m,
         duration_tolerance_seconds=args.duration_tolerance_sec,
@@ -178,6 +219,12 @@ def _handle_export(args: argparse.Namespace) -> None:
         include_ids=args.ids,
         id_range=_parse_range(args.id_range),
         output_dir=args.output_dir,
+        lap_split=args.lap_split,
+        jobs=args.jobs,
+        batch_size=args.batch_size,
+        force=args.force,
+        compress=args.gzip,
+        indent=not args.compact,
     )
 
 
@@ -1,22 +1,41 @@
 from __future__ import annotations
 
-from datetime import timedelta
+import concurrent.futures
+import hashlib
+import os
+import time
 from pathlib import Path
-from xml.dom import minidom
-from xml.etree.ElementTree import Element, SubElement, tostring
 
-import gpxpy.gpx
+import numpy as np
 import pandas as pd
 
-from ..export_fit import construct_dataframes
+from ..export_fit import (
+    DEFAULT_LAP_SPLIT,
+    build_activity_data,
+    build_record_frame,
+    export_settings_hash,
+    parse_lap_split,
+)
 from ..generator import Generator
-from ..generator.db import get_db_connection
+from ..generator.db import (
+    ensure_export_manifest_table,
+    get_activity_fingerprints,
+    get_db_connection,
+    get_db_connection_stats,
+    get_export_manifest,
+    is_export_current,
+    record_exports,
+)
+from ..generator.track_xml import open_track_file, write_gpx, write_tcx
 from ..utils import get_logger
 from .types import RuntimeConfig
 
 logger = get_logger(__name__)
 
 SUPPORTED_EXPORT_FORMATS = {"fit", "tcx", "gpx"}
+EXPORT_BATCH_SIZE = 200
+DEFAULT_EXPORT_JOBS = min(4, os.cpu_count() or 1)
+_TRACK_COLUMNS = ("position_lat", "position_long", "altitude", "heart_rate")
 
 
 def _iter_target_activity_ids(
@@ -41,91 +60,123 @@ def _iter_target_activity_ids(
     return sorted(ids)
 
 
-def _write_gpx(activity_row: pd.Series, flyby_df: pd.DataFrame, output_file: Path) -> None:
+def _located_records(activity_row: pd.Series, flyby_df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """Track point columns with a position, built by export_fit.build_record_frame (see track_xml)."""
+    records = build_record_frame(flyby_df, pd.to_datetime(activity_row["start_date"]))
+    records = records.dropna(subset=["position_lat", "position_long"])
+    columns = {name: records[name].to_numpy(dtype="float64") for name in _TRACK_COLUMNS}
+    columns["timestamp"] = records["timestamp"].to_numpy(dtype="datetime64[ms]").astype("int64")
+    return columns
+
+
+def _write_gpx(out, activity_row: pd.Series, flyby_df: pd.DataFrame, indent: str | None = "  ") -> None:
     if flyby_df.empty:
         raise ValueError("No flyby data available for GPX export.")
-    gpx = gpxpy.gpx.GPX()
-    track = gpxpy.gpx.GPXTrack()
-    track.name = str(activity_row.get("name") or activity_row.get("run_id"))
-    gpx.tracks.append(track)
-    segment = gpxpy.gpx.GPXTrackSegment()
-    track.segments.append(segment)
+    write_gpx(
+        out,
+        _located_records(activity_row, flyby_df),
+        name=str(activity_row.get("name") or activity_row.get("run_id")),
+        indent=indent,
+    )
+
 
+def _write_tcx(out, activity_row: pd.Series, flyby_df: pd.DataFrame, indent: str | None = "  ") -> None:
+    if flyby_df.empty:
+        raise ValueError("No flyby data available for TCX export.")
     start_date = pd.to_datetime(activity_row["start_date"])
-    for row in flyby_df.itertuples(index=False):
-        if pd.isna(row.lat) or pd.isna(row.lng):
-            continue
-        point_time = start_date + timedelta(seconds=int(row.time_offset))
-        segment.points.append(
-            gpxpy.gpx.GPXTrackPoint(
-                latitude=float(row.lat),
-                longitude=float(row.lng),
-                elevation=float(row.alt) if row.alt is not None and not pd.isna(row.alt) else None,
-                time=point_time,
-            )
-        )
+    write_tcx(
+        out,
+        _located_records(activity_row, flyby_df),
+        sport=str(activity_row.get("type") or "Other"),
+        start_time=int(start_date.to_datetime64().astype("datetime64[ms]").astype("int64")),
+        total_time_seconds=float(activity_row.get("elapsed_time") or 0),
+        distance_meters=float(activity_row.get("distance") or 0),
+        indent=indent,
+    )
 
-    output_file.write_text(gpx.to_xml(), encoding="utf-8")
 
+def _iter_export_batches(con, activity_ids: list[int], batch_size: int):
+    """
+    Yields (activity_id, activity_row, flyby_df) for ``activity_ids`` in id order,
+    reading activities and activities_flyby with two queries per batch of ids.
+    activity_row is None for ids missing from the activities table.
+    """
+    for start in range(0, len(activity_ids), batch_size):
+        batch = activity_ids[start : start + batch_size]
+        activities_df = con.execute(
+            "SELECT * FROM activities WHERE run_id IN (SELECT UNNEST(?)) ORDER BY run_id",
+            [batch],
+        ).fetchdf()
+        flyby_df = con.execute(
+            """
+            SELECT * FROM activities_flyby
+            WHERE activity_id BETWEEN ? AND ? AND activity_id IN (SELECT UNNEST(?))
+            ORDER BY activity_id, time_offset
+            """,
+            [batch[0], batch[-1], batch],
+        ).fetchdf()
 
-def _write_tcx(activity_row: pd.Series, flyby_df: pd.DataFrame, output_file: Path) -> None:
-    if flyby_df.empty:
-        raise ValueError("No flyby data available for TCX export.")
+        rows = {int(row["run_id"]): row for _, row in activities_df.iterrows()}
+        flyby_ids = flyby_df["activity_id"].to_numpy()
+        for activity_id in batch:
+            lo, hi = np.searchsorted(flyby_ids, [activity_id, activity_id + 1])
+            yield activity_id, rows.get(activity_id), flyby_df.iloc[lo:hi].reset_index(drop=True)
 
-    start_date = pd.to_datetime(activity_row["start_date"])
-    root = Element("TrainingCenterDatabase")
-    root.attrib = {
-        "xmlns": "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2",
-        "xmlns:xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsi:schemaLocation": "http://www.garmin.com/xmlschemas/TrainingCenterDatabase/v2 "
-        "http://www.garmin.com/xmlschemas/TrainingCenterDatabasev2.xsd",
-    }
-    activities_node = SubElement(root, "Activities")
-    activity_node = SubElement(activities_node, "Activity")
-    activity_node.set("Sport", str(activity_row.get("type") or "Other"))
-    activity_id_node = SubElement(activity_node, "Id")
-    activity_id_node.text = start_date.isoformat()
-
-    lap_node = SubElement(activity_node, "Lap")
-    lap_node.set("StartTime", start_date.isoformat())
-    SubElement(lap_node, "TotalTimeSeconds").text = str(float(activity_row.get("elapsed_time") or 0))
-    SubElement(lap_node, "DistanceMeters").text = str(float(activity_row.get("distance") or 0))
-    SubElement(lap_node, "Intensity").text = "Active"
-    SubElement(lap_node, "TriggerMethod").text = "Manual"
-    track_node = SubElement(lap_node, "Track")
-
-    for row in flyby_df.itertuples(index=False):
-        if pd.isna(row.lat) or pd.isna(row.lng):
-            continue
-        trackpoint_node = SubElement(track_node, "Trackpoint")
-        point_time = start_date + timedelta(seconds=int(row.time_offset))
-        SubElement(trackpoint_node, "Time").text = point_time.isoformat()
-        position_node = SubElement(trackpoint_node, "Position")
-        SubElement(position_node, "LatitudeDegrees").text = str(float(row.lat))
-        SubElement(position_node, "LongitudeDegrees").text = str(float(row.lng))
-        if row.alt is not None and not pd.isna(row.alt):
-            SubElement(trackpoint_node, "AltitudeMeters").text = str(float(row.alt))
-        if row.hr is not None and not pd.isna(row.hr):
-            hr_node = SubElement(trackpoint_node, "HeartRateBpm")
-            SubElement(hr_node, "Value").text = str(int(row.hr))
-
-    creator_node = SubElement(activity_node, "Creator")
-    creator_node.set("xsi:type", "Device_t")
-    SubElement(creator_node, "Name").text = "Strava"
-
-    xml_str = tostring(root, "utf-8")
-    output_file.write_text(minidom.parseString(xml_str).toprettyxml(indent="  "), encoding="utf-8")
-
-
-def _load_activity_and_flyby(con, activity_id: int) -> tuple[pd.Series, pd.DataFrame]:
-    activity_df = con.execute("SELECT * FROM activities WHERE run_id = ?", [activity_id]).fetchdf()
-    if activity_df.empty:
-        raise ValueError(f"Activity {activity_id} not found in DuckDB.")
-    flyby_df = con.execute(
-        "SELECT * FROM activities_flyby WHERE activity_id = ? ORDER BY time_offset",
-        [activity_id],
-    ).fetchdf()
-    return activity_df.iloc[0], flyby_df
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+def _stream_atomic(path: Path, write, compress: bool) -> str:
+    """Streams ``write(out)`` into a temporary file moved over ``path``; returns the file's sha256."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    try:
+        with open_track_file(tmp_path, compress=compress) as out:
+            write(out)
+        with open(tmp_path, "rb") as written:
+            digest = hashlib.file_digest(written, "sha256").hexdigest()
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    os.replace(tmp_path, path)
+    return digest
+
+
+_worker_generator = None
+
+
+def _export_activity(
+    fmt: str,
+    lap_split: str,
+    activity_row: pd.Series,
+    flyby_df: pd.DataFrame,
+    output_file: Path,
+    compress: bool = False,
+    indent: bool = True,
+):
+    """
+    Builds and atomically writes one export file; runs in the export worker processes.
+    TCX/GPX documents are streamed to disk, gzip-compressed when ``compress`` and on
+    a single line unless ``indent``. Returns the sha256, size and mtime of the written file.
+    """
+    global _worker_generator
+    if fmt == "fit":
+        if _worker_generator is None:
+            _worker_generator = Generator(None)
+        data = _worker_generator.build_fit_file(build_activity_data(activity_row, flyby_df, lap_split=lap_split))
+        _write_atomic(output_file, data)
+        output_sha256 = hashlib.sha256(data).hexdigest()
+    else:
+        render = _write_tcx if fmt == "tcx" else _write_gpx
+        output_sha256 = _stream_atomic(
+            output_file,
+            lambda out: render(out, activity_row, flyby_df, indent="  " if indent else None),
+            compress,
+        )
+    stat = output_file.stat()
+    return output_sha256, stat.st_size, stat.st_mtime_ns
 
 
 def run_export(
@@ -136,27 +187,42 @@ def run_export(
     include_ids: list[int],
     id_range: tuple[int, int] | None,
     output_dir: Path | None,
+    lap_split: str = DEFAULT_LAP_SPLIT,
+    jobs: int = 1,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    force: bool = False,
+    compress: bool = False,
+    indent: bool = True,
 ) -> list[Path]:
+    """
+    Exports activities to FIT/TCX/GPX files, building them in ``jobs`` worker processes.
+    Files whose activities/activities_flyby rows did not change since the last
+    export (see the export_manifest table) are skipped unless ``force``.
+    TCX/GPX files are written as ``<id>.<format>.gz`` when ``compress`` and
+    without indentation unless ``indent``. Returns the written files.
+    """
     fmt = export_format.lower()
     if fmt not in SUPPORTED_EXPORT_FORMATS:
         raise ValueError(f"Unsupported format: {export_format}. Supported: {sorted(SUPPORTED_EXPORT_FORMATS)}")
 
     if not export_all and not include_ids and not id_range:
         raise ValueError("Export target is empty. Use --all, --id, or --id-range.")
+    parse_lap_split(lap_split)
+    if compress and fmt == "fit":
+        raise ValueError("Compressed export is only supported for TCX and GPX.")
 
-    generator = Generator(runtime_config.sql_file)
-    con = get_db_connection(runtime_config.sql_file, read_only=True)
-    try:
-        activity_ids = _iter_target_activity_ids(
-            con,
-            export_all=export_all,
-            include_ids=include_ids,
-            id_range=id_range,
-        )
-    finally:
-        con.close()
+    started = time.perf_counter()
+    con = get_db_connection(runtime_config.sql_file)
+    ensure_export_manifest_table(con)
+    activity_ids = _iter_target_activity_ids(
+        con,
+        export_all=export_all,
+        include_ids=include_ids,
+        id_range=id_range,
+    )
 
     if not activity_ids:
+        con.close()
         logger.info("No activities matched export filters.")
         return []
 
@@ -167,24 +233,91 @@ def run_export(
             "gpx": runtime_config.gpx_dir,
         }[fmt]
     output_dir.mkdir(parents=True, exist_ok=True)
+    settings_hash = export_settings_hash(fmt, lap_split, compress=compress, indent=indent)
+    source_hashes = {
+        activity_id: fingerprint
+        for activity_id, (_, fingerprint) in get_activity_fingerprints(con, activity_ids).items()
+    }
+    suffix = f".{fmt}.gz" if compress else f".{fmt}"
+    output_files = {activity_id: output_dir / f"{activity_id}{suffix}" for activity_id in activity_ids}
+    manifest = get_export_manifest(con, [str(path.resolve()) for path in output_files.values()])
 
     written_files: list[Path] = []
-    con = get_db_connection(runtime_config.sql_file, read_only=True)
+    exports: list[dict] = []
+    skipped = failed = 0
+    stale_ids = []
     for activity_id in activity_ids:
+        source_hash = source_hashes.get(activity_id)
+        if source_hash is None:
+            failed += 1
+            logger.error("Failed to export activity %s to %s: not found in DuckDB.", activity_id, fmt)
+            continue
+        output_path = str(output_files[activity_id].resolve())
+        if not force and is_export_current(manifest.get(output_path), settings_hash, source_hash, output_path):
+            skipped += 1
+            continue
+        stale_ids.append(activity_id)
+
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 and stale_ids else None
+    pending = {}
+
+    def finish(activity_id, result):
+        nonlocal failed
+        output_file = output_files[activity_id]
         try:
-            activity_row, flyby_df = _load_activity_and_flyby(con, activity_id)
-            output_file = output_dir / f"{activity_id}.{fmt}"
-            if fmt == "fit":
-                dataframes = construct_dataframes(activity_row, flyby_df)
-                output_file.write_bytes(generator.build_fit_file_from_dataframes(dataframes))
-            elif fmt == "tcx":
-                _write_tcx(activity_row, flyby_df, output_file)
-            else:
-                _write_gpx(activity_row, flyby_df, output_file)
-            written_files.append(output_file)
+            output_sha256, size, mtime_ns = result()
         except Exception as exc:
+            failed += 1
             logger.error("Failed to export activity %s to %s: %s", activity_id, fmt, exc, exc_info=True)
-    con.close()
+            return
+        exports.append(
+            {
+                "output_path": str(output_file.resolve()),
+                "activity_id": activity_id,
+                "format": fmt,
+                "settings_hash": settings_hash,
+                "source_hash": source_hashes[activity_id],
+                "output_sha256": output_sha256,
+                "output_size": size,
+                "output_mtime_ns": mtime_ns,
+            }
+        )
+        written_files.append(output_file)
+
+    def collect(futures):
+        for future in futures:
+            finish(pending.pop(future), future.result)
+
+    try:
+        for activity_id, activity_row, flyby_df in _iter_export_batches(con, stale_ids, batch_size):
+            task = (fmt, lap_split, activity_row, flyby_df, output_files[activity_id], compress, indent)
+            if pool is None:
+                finish(activity_id, lambda: _export_activity(*task))
+                continue
+            pending[pool.submit(_export_activity, *task)] = activity_id
+            # Bound the rows held by queued tasks.
+            if len(pending) >= 4 * jobs:
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        try:
+            record_exports(con, exports)
+        finally:
+            con.close()
 
-    logger.info("Exported %d/%d activities to %s.", len(written_files), len(activity_ids), output_dir)
+    elapsed = time.perf_counter() - started
+    logger.info(
+        "Exported %d/%d activities to %s (%d up to date, %d failed) in %.1fs, %.1f activities/s.",
+        len(written_files),
+        len(activity_ids),
+        output_dir,
+        skipped,
+        failed,
+        elapsed,
+        len(activity_ids) / elapsed if elapsed > 0 else 0.0,
+    )
+    logger.info("DuckDB connections: %s", get_db_connection_stats())
     return written_files
@@ -1,13 +1,21 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from datetime import datetime
+from dataclasses import dataclass, fields, replace
+from datetime import datetime, timedelta
 
 import duckdb
+import pandas as pd
 
-from ..generator.db import get_db_connection
+from ..generator.db import backfill_activity_fingerprints, get_db_connection, transaction
 
 SYNCED_STATUSES = {"synced", "skipped_exists"}
+# Dirty rows a VendorSyncState holds before writing them back.
+VENDOR_SYNC_FLUSH_ROWS = 500
+# Failed uploads are retried after SYNC_RETRY_BASE, doubling per attempt up to
+# SYNC_RETRY_MAX, and no longer retried automatically after SYNC_MAX_ATTEMPTS.
+SYNC_MAX_ATTEMPTS = 5
+SYNC_RETRY_BASE = timedelta(hours=1)
+SYNC_RETRY_MAX = timedelta(days=1)
 
 
 @dataclass(frozen=True)
@@ -23,6 +31,34 @@ class VendorSyncRow:
     next_retry_at: datetime | None
     uploaded_at: datetime | None
     last_verified_at: datetime | None
+    # The pipeline that last wrote the row, when it marks its rows (strava_to_garmin_sync).
+    source: str | None = None
+
+
+def sync_retry_at(attempt_count: int, now: datetime | None = None) -> datetime:
+    """next_retry_at of an upload that has failed ``attempt_count`` times, as naive local time."""
+    backoff = min(SYNC_RETRY_BASE * 2 ** max(attempt_count - 1, 0), SYNC_RETRY_MAX)
+    return (now or datetime.now()) + backoff
+
+
+def is_sync_due(row: VendorSyncRow | None, now: datetime | None = None, *, source: str | None = None) -> bool:
+    """
+    Whether the activity of vendor_activity_sync row ``row`` (None when it has
+    none) should be uploaded: not synced or in conflict, and when failed, below
+    SYNC_MAX_ATTEMPTS and past its next_retry_at. With ``source``, rows last
+    written by another pipeline are left to it.
+    """
+    if row is None:
+        return True
+    if source is not None and row.source != source:
+        return False
+    if row.status in SYNCED_STATUSES or row.status == "conflict":
+        return False
+    if row.status == "failed":
+        if row.attempt_count >= SYNC_MAX_ATTEMPTS:
+            return False
+        return row.next_retry_at is None or row.next_retry_at <= (now or datetime.now())
+    return True
 
 
 def ensure_vendor_sync_table(db_path: str) -> duckdb.DuckDBPyConnection:
@@ -42,10 +78,12 @@ def ensure_vendor_sync_table(db_path: str) -> duckdb.DuckDBPyConnection:
             uploaded_at TIMESTAMP,
             last_verified_at TIMESTAMP,
             updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+            source VARCHAR,
             PRIMARY KEY (activity_id, vendor, account)
         )
         """
     )
+    con.execute("ALTER TABLE vendor_activity_sync ADD COLUMN IF NOT EXISTS source VARCHAR")
     return con
 
 
@@ -68,7 +106,8 @@ def load_vendor_sync_rows(
             attempt_count,
             next_retry_at,
             uploaded_at,
-            last_verified_at
+            last_verified_at,
+            source
         FROM vendor_activity_sync
         WHERE vendor = ? AND account = ?
         """,
@@ -89,10 +128,55 @@ def load_vendor_sync_rows(
             next_retry_at=row[8],
             uploaded_at=row[9],
             last_verified_at=row[10],
+            source=row[11],
         )
     return result
 
 
+def load_pending_sync_activity_ids(
+    con: duckdb.DuckDBPyConnection,
+    *,
+    vendor: str,
+    account: str,
+) -> list[int]:
+    """
+    Ids of the activities the account has not synced with their current
+    activity_fingerprints fingerprint: never synced, synced and changed
+    since, or due for another attempt (is_sync_due). Conflicts and failed
+    uploads waiting for their next_retry_at are left out.
+    """
+    backfill_activity_fingerprints(con)
+    rows = con.execute(
+        """
+        SELECT a.run_id
+        FROM activities a
+        JOIN activity_fingerprints f ON f.run_id = a.run_id
+        LEFT JOIN vendor_activity_sync s
+            ON s.activity_id = a.run_id AND s.vendor = ? AND s.account = ?
+        WHERE s.status IS NULL
+            OR (s.status IN (SELECT UNNEST(?)) AND s.content_hash IS DISTINCT FROM f.fingerprint)
+            OR (
+                s.status NOT IN (SELECT UNNEST(?))
+                AND s.status <> 'conflict'
+                AND (
+                    s.status <> 'failed'
+                    OR (s.attempt_count < ? AND (s.next_retry_at IS NULL OR s.next_retry_at <= ?))
+                )
+            )
+        ORDER BY a.run_id
+        """,
+        [
+            vendor,
+            account,
+            sorted(SYNCED_STATUSES),
+            sorted(SYNCED_STATUSES),
+            SYNC_MAX_ATTEMPTS,
+            datetime.now(),
+        ],
+    ).fetchall()
+    return [int(row[0]) for row in rows]
+
+
 def upsert_vendor_sync_status(
     con: duckdb.DuckDBPyConnection,
     *,
@@ -107,6 +191,7 @@ def upsert_vendor_sync_status(
     next_retry_at: datetime | None = None,
     uploaded_at: datetime | None = None,
     last_verified_at: datetime | None = None,
+    source: str | None = None,
 ) -> None:
     con.execute(
         """
@@ -122,10 +207,11 @@ def upsert_vendor_sync_status(
             next_retry_at,
             uploaded_at,
             last_verified_at,
-            updated_at
+            updated_at,
+            source
         )
         VALUES (
-            ?, ?, ?, ?, ?, ?, ?, COALESCE(?, 0), ?, ?, ?, NOW()
+            ?, ?, ?, ?, ?, ?, ?, COALESCE(?, 0), ?, ?, ?, NOW(), ?
         )
         ON CONFLICT (activity_id, vendor, account) DO UPDATE
         SET
@@ -137,7 +223,8 @@ def upsert_vendor_sync_status(
             next_retry_at = excluded.next_retry_at,
             uploaded_at = COALESCE(excluded.uploaded_at, vendor_activity_sync.uploaded_at),
             last_verified_at = COALESCE(excluded.last_verified_at, vendor_activity_sync.last_verified_at),
-            updated_at = NOW()
+            updated_at = NOW(),
+            source = excluded.source
         """,
         [
             activity_id,
@@ -151,10 +238,177 @@ def upsert_vendor_sync_status(
             next_retry_at,
             uploaded_at,
             last_verified_at,
+            source,
         ],
     )
 
 
+def _as_stored_timestamp(value: datetime | None) -> datetime | None:
+    # TIMESTAMP columns keep aware datetimes as naive local time, like a bound parameter.
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone().replace(tzinfo=None)
+
+
+class VendorSyncState:
+    """
+    vendor_activity_sync rows of one vendor account, kept in memory for a sync run.
+
+    ``update`` changes a row like upsert_vendor_sync_status, without a source;
+    changed rows are written back in one statement per ``flush_rows`` rows and when the ``with``
+    block is left, also on an error.
+    """
+
+    def __init__(
+        self,
+        con: duckdb.DuckDBPyConnection,
+        *,
+        vendor: str,
+        account: str,
+        flush_rows: int = VENDOR_SYNC_FLUSH_ROWS,
+    ):
+        self.con = con
+        self.vendor = vendor
+        self.account = account
+        self.flush_rows = flush_rows
+        self.rows = load_vendor_sync_rows(con, vendor=vendor, account=account)
+        self._dirty: set[int] = set()
+
+    def __enter__(self) -> VendorSyncState:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+    def get(self, activity_id: int) -> VendorSyncRow | None:
+        return self.rows.get(activity_id)
+
+    def values(self):
+        return self.rows.values()
+
+    def update(
+        self,
+        *,
+        activity_id: int,
+        status: str,
+        remote_activity_id: int | None = None,
+        content_hash: str | None = None,
+        last_error: str | None = None,
+        attempt_count: int | None = None,
+        next_retry_at: datetime | None = None,
+        uploaded_at: datetime | None = None,
+        last_verified_at: datetime | None = None,
+    ) -> VendorSyncRow:
+        """Same arguments and merge rules as upsert_vendor_sync_status; returns the new row."""
+        current = self.rows.get(activity_id)
+        if current is None:
+            current = VendorSyncRow(
+                activity_id=activity_id,
+                vendor=self.vendor,
+                account=self.account,
+                status=status,
+                remote_activity_id=None,
+                content_hash=None,
+                last_error=None,
+                attempt_count=0,
+                next_retry_at=None,
+                uploaded_at=None,
+                last_verified_at=None,
+            )
+        row = replace(
+            current,
+            status=status,
+            remote_activity_id=remote_activity_id if remote_activity_id is not None else current.remote_activity_id,
+            content_hash=content_hash if content_hash is not None else current.content_hash,
+            last_error=last_error,
+            # The upsert inserts COALESCE(attempt_count, 0), so a missing count resets it.
+            attempt_count=attempt_count or 0,
+            next_retry_at=_as_stored_timestamp(next_retry_at),
+            uploaded_at=_as_stored_timestamp(uploaded_at) or current.uploaded_at,
+            last_verified_at=_as_stored_timestamp(last_verified_at) or current.last_verified_at,
+            source=None,
+        )
+        self.rows[activity_id] = row
+        self._dirty.add(activity_id)
+        if len(self._dirty) >= self.flush_rows:
+            self.flush()
+        return row
+
+    def clear(self) -> None:
+        """Deletes every row of the account, in the table and in memory."""
+        self.con.execute(
+            "DELETE FROM vendor_activity_sync WHERE vendor = ? AND account = ?",
+            [self.vendor, self.account],
+        )
+        self.rows.clear()
+        self._dirty.clear()
+
+    def flush(self) -> int:
+        """Writes the rows changed since the last flush; returns their number."""
+        if not self._dirty:
+            return 0
+        columns = [field.name for field in fields(VendorSyncRow)]
+        df = pd.DataFrame(
+            [[getattr(self.rows[activity_id], column) for column in columns] for activity_id in sorted(self._dirty)],
+            columns=columns,
+            dtype=object,
+        )
+        self.con.register("temp_vendor_activity_sync", df)
+        try:
+            with transaction(self.con):
+                self.con.execute(
+                    """
+                    INSERT INTO vendor_activity_sync (
+                        activity_id,
+                        vendor,
+                        account,
+                        status,
+                        remote_activity_id,
+                        content_hash,
+                        last_error,
+                        attempt_count,
+                        next_retry_at,
+                        uploaded_at,
+                        last_verified_at,
+                        updated_at,
+                        source
+                    )
+                    SELECT
+                        CAST(activity_id AS BIGINT),
+                        vendor,
+                        account,
+                        status,
+                        CAST(remote_activity_id AS BIGINT),
+                        CAST(content_hash AS VARCHAR),
+                        CAST(last_error AS VARCHAR),
+                        CAST(attempt_count AS INTEGER),
+                        CAST(next_retry_at AS TIMESTAMP),
+                        CAST(uploaded_at AS TIMESTAMP),
+                        CAST(last_verified_at AS TIMESTAMP),
+                        NOW(),
+                        CAST(source AS VARCHAR)
+                    FROM temp_vendor_activity_sync
+                    ON CONFLICT (activity_id, vendor, account) DO UPDATE
+                    SET
+                        status = excluded.status,
+                        remote_activity_id = excluded.remote_activity_id,
+                        content_hash = excluded.content_hash,
+                        last_error = excluded.last_error,
+                        attempt_count = excluded.attempt_count,
+                        next_retry_at = excluded.next_retry_at,
+                        uploaded_at = excluded.uploaded_at,
+                        last_verified_at = excluded.last_verified_at,
+                        updated_at = excluded.updated_at,
+                        source = excluded.source
+                    """
+                )
+        finally:
+            self.con.unregister("temp_vendor_activity_sync")
+        flushed = len(self._dirty)
+        self._dirty.clear()
+        return flushed
+
+
 def retry_failed_sync_rows(
     con: duckdb.DuckDBPyConnection,
     *,
@@ -5,7 +5,9 @@ from .types import StravaCredentials
 logger = get_logger(__name__)
 
 
-def run_sync_db(credentials: StravaCredentials, *, force: bool = False, prune: bool = False) -> None:
+def run_sync_db(
+    credentials: StravaCredentials, *, force: bool = False, prune: bool = False, verify_json: bool = False
+) -> None:
     logger.info("Starting Strava -> DuckDB sync. force=%s prune=%s", force, prune)
     run_strava_sync(
         credentials.client_id,
@@ -13,4 +15,5 @@ def run_sync_db(credentials: StravaCredentials, *, force: bool = False, prune: b
         credentials.refresh_token,
         force_sync=force,
         prune=prune,
+        verify_json=verify_json,
     )
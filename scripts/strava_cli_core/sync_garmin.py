@@ -1,24 +1,40 @@
 from __future__ import annotations
 
 import asyncio
-import hashlib
-import json
+import bisect
+import concurrent.futures
+import time
 from collections import namedtuple
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 
 import pandas as pd
 
-from ..export_fit import construct_dataframes
-from ..garmin_sync import Garmin
+from ..export_fit import build_activity_data
+from ..garmin_device_adaptor import rewrite_fit
+from ..garmin_sync import Garmin, GarminConnectTooManyRequestsError, fit_upload_transforms
 from ..generator import Generator
+from ..generator.db import get_activity_fingerprints, get_db_connection_stats
 from ..utils import get_logger
-from .store import SYNCED_STATUSES, ensure_vendor_sync_table, load_vendor_sync_rows, upsert_vendor_sync_status
+from .store import (
+    SYNCED_STATUSES,
+    VendorSyncState,
+    ensure_vendor_sync_table,
+    is_sync_due,
+    load_pending_sync_activity_ids,
+    sync_retry_at,
+)
 from .types import GarminCredentials, RuntimeConfig
 
 logger = get_logger(__name__)
-FIT_UPLOAD_RECORD = namedtuple("FitUploadRecord", ["filename", "content"])
+PendingUpload = namedtuple("PendingUpload", ["activity_row", "content_hash", "attempt_count"])
 
 VENDOR_NAME = "garmin"
+GARMIN_UPLOAD_CONCURRENCY = 2
+# Uploads between two lookups of the Garmin ids their responses did not include.
+GARMIN_UPLOAD_WAVE = 10
+GARMIN_RATE_LIMIT_RETRIES = 3
+# Pause after a 429 response without a usable Retry-After header.
+GARMIN_RATE_LIMIT_WAIT_SECONDS = 60
 
 
 def _account_name(is_cn: bool) -> str:
@@ -29,6 +45,11 @@ def _auth_domain(is_cn: bool) -> str:
     return "CN" if is_cn else ""
 
 
+def _is_legacy_content_hash(content_hash: str | None) -> bool:
+    # Rows synced before activity_fingerprints hold a sha256 of the pandas rows, not an md5 fingerprint.
+    return content_hash is not None and len(content_hash) == 64
+
+
 def _parse_garmin_start_time(value: str | None) -> datetime | None:
     if not value:
         return None
@@ -108,6 +129,103 @@ def _prefer_duration_match(activity_row: pd.Series) -> bool:
     }
 
 
+class GarminMatcher:
+    """
+    Garmin activities indexed by start time, matched one-to-one against local activities.
+
+    Activities are parsed once into start-time-sorted columns, so a lookup only
+    visits the activities within ``match_window_seconds`` of the local start.
+    ``reserve`` takes a Garmin activity out of later matches; local activities
+    are assigned greedily in the order they are matched.
+    """
+
+    def __init__(
+        self,
+        garmin_activities: list[dict],
+        *,
+        match_window_seconds: int,
+        distance_tolerance_meters: float,
+        duration_tolerance_seconds: int,
+        reserved_activity_ids: set[int] | None = None,
+    ):
+        self.match_window_seconds = match_window_seconds
+        self.distance_tolerance_meters = distance_tolerance_meters
+        self.duration_tolerance_seconds = duration_tolerance_seconds
+        self.reserved: set[int] = set(reserved_activity_ids or ())
+
+        indexed = []
+        for garmin_activity in garmin_activities:
+            garmin_start = _parse_garmin_start_time(garmin_activity.get("startTimeGMT"))
+            if garmin_start is None:
+                continue
+            garmin_activity_id = garmin_activity.get("activityId")
+            if not garmin_activity_id:
+                continue
+            indexed.append((garmin_start.timestamp(), garmin_start, int(garmin_activity_id), garmin_activity))
+        # Stable, so equal start times keep the order of garmin_activities.
+        indexed.sort(key=lambda item: item[0])
+
+        self._timestamps = [item[0] for item in indexed]
+        self._starts = [item[1] for item in indexed]
+        self._ids = [item[2] for item in indexed]
+        self._types = [_extract_garmin_type_key(item[3]) for item in indexed]
+        self._distances = [float(item[3].get("distance") or 0) for item in indexed]
+        self._durations = [_parse_garmin_duration_seconds(item[3]) for item in indexed]
+
+    def reserve(self, garmin_activity_id: int) -> None:
+        self.reserved.add(garmin_activity_id)
+
+    def match(self, activity_row: pd.Series, *, include_reserved: bool = False) -> int | None:
+        """
+        Id of the closest Garmin activity in start time, then in duration (stationary
+        activities, see _prefer_duration_match) or distance, within the tolerances
+        and of a compatible type, or None. Reserved activities are skipped unless
+        ``include_reserved``.
+        """
+        strava_start = pd.to_datetime(activity_row["start_date"]).to_pydatetime()
+        if strava_start.tzinfo is None:
+            strava_start = strava_start.replace(tzinfo=timezone.utc)
+        strava_distance = float(activity_row.get("distance") or 0)
+        strava_elapsed = float(activity_row.get("elapsed_time") or 0)
+        prefer_duration = _prefer_duration_match(activity_row)
+        allowed_types = _strava_type_aliases(activity_row.get("type"))
+
+        # One second of slack on the float timestamps; the exact check below uses datetimes.
+        timestamp = strava_start.timestamp()
+        lo = bisect.bisect_left(self._timestamps, timestamp - self.match_window_seconds - 1)
+        hi = bisect.bisect_right(self._timestamps, timestamp + self.match_window_seconds + 1)
+
+        best: tuple[float, float, int] | None = None
+        for index in range(lo, hi):
+            garmin_activity_id = self._ids[index]
+            if not include_reserved and garmin_activity_id in self.reserved:
+                continue
+            time_delta = abs((strava_start - self._starts[index]).total_seconds())
+            if time_delta > self.match_window_seconds:
+                continue
+            garmin_type = self._types[index]
+            if allowed_types and garmin_type and garmin_type not in allowed_types:
+                continue
+
+            if prefer_duration:
+                garmin_duration = self._durations[index]
+                if garmin_duration is None:
+                    continue
+                secondary_delta = abs(strava_elapsed - garmin_duration)
+                if secondary_delta > self.duration_tolerance_seconds:
+                    continue
+            else:
+                secondary_delta = abs(strava_distance - self._distances[index])
+                if secondary_delta > self.distance_tolerance_meters:
+                    continue
+
+            candidate = (time_delta, secondary_delta, garmin_activity_id)
+            if best is None or candidate < best:
+                best = candidate
+
+        return None if best is None else best[2]
+
+
 def _is_existing_in_garmin(
     activity_row: pd.Series,
     garmin_activities: list[dict],
@@ -117,79 +235,14 @@ def _is_existing_in_garmin(
     duration_tolerance_seconds: int,
     reserved_activity_ids: set[int] | None = None,
 ) -> int | None:
-    strava_start = pd.to_datetime(activity_row["start_date"]).to_pydatetime()
-    if strava_start.tzinfo is None:
-        strava_start = strava_start.replace(tzinfo=timezone.utc)
-    strava_distance = float(activity_row.get("distance") or 0)
-    strava_elapsed = float(activity_row.get("elapsed_time") or 0)
-    prefer_duration = _prefer_duration_match(activity_row)
-    allowed_types = _strava_type_aliases(activity_row.get("type"))
-
-    candidates: list[tuple[float, float, int]] = []
-    for garmin_activity in garmin_activities:
-        garmin_start = _parse_garmin_start_time(garmin_activity.get("startTimeGMT"))
-        if garmin_start is None:
-            continue
-        garmin_activity_id = garmin_activity.get("activityId")
-        if not garmin_activity_id:
-            continue
-        garmin_activity_id = int(garmin_activity_id)
-        if reserved_activity_ids and garmin_activity_id in reserved_activity_ids:
-            continue
-
-        time_delta = abs((strava_start - garmin_start).total_seconds())
-        if time_delta > match_window_seconds:
-            continue
-
-        garmin_type = _extract_garmin_type_key(garmin_activity)
-
-        if prefer_duration:
-            if allowed_types and garmin_type and garmin_type not in allowed_types:
-                continue
-            garmin_duration = _parse_garmin_duration_seconds(garmin_activity)
-            if garmin_duration is None:
-                continue
-            secondary_delta = abs(strava_elapsed - garmin_duration)
-            if secondary_delta > duration_tolerance_seconds:
-                continue
-        else:
-            if allowed_types and garmin_type and garmin_type not in allowed_types:
-                continue
-            garmin_distance = float(garmin_activity.get("distance") or 0)
-            secondary_delta = abs(strava_distance - garmin_distance)
-            if secondary_delta > distance_tolerance_meters:
-                continue
-
-        candidates.append((time_delta, secondary_delta, garmin_activity_id))
-
-    if not candidates:
-        return None
-    candidates.sort(key=lambda item: (item[0], item[1], item[2]))
-    return candidates[0][2]
-
-
-def _activity_content_hash(activity_row: pd.Series, flyby_df: pd.DataFrame) -> str:
-    # Keep the hash stable across runs to detect local changes and trigger re-validation/re-upload.
-    activity_payload = {
-        "run_id": int(activity_row["run_id"]),
-        "start_date": str(activity_row.get("start_date") or ""),
-        "distance": float(activity_row.get("distance") or 0),
-        "moving_time": float(activity_row.get("moving_time") or 0),
-        "elapsed_time": float(activity_row.get("elapsed_time") or 0),
-        "total_elevation_gain": float(activity_row.get("total_elevation_gain") or 0),
-        "average_speed": float(activity_row.get("average_speed") or 0),
-        "average_heartrate": float(activity_row.get("average_heartrate") or 0),
-    }
-    desired_columns = ["time_offset", "lat", "lng", "alt", "hr", "cadence", "speed", "distance"]
-    available_columns = [column for column in desired_columns if column in flyby_df.columns]
-    if not available_columns:
-        flyby_payload = []
-    else:
-        subset = flyby_df[available_columns].copy().astype(object)
-        subset = subset.where(pd.notna(subset), None)
-        flyby_payload = subset.to_dict(orient="records")
-    raw = json.dumps({"activity": activity_payload, "flyby": flyby_payload}, ensure_ascii=True, sort_keys=True)
-    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    """One-off GarminMatcher lookup; build a GarminMatcher to match many activities."""
+    return GarminMatcher(
+        garmin_activities,
+        match_window_seconds=match_window_seconds,
+        distance_tolerance_meters=distance_tolerance_meters,
+        duration_tolerance_seconds=duration_tolerance_seconds,
+        reserved_activity_ids=reserved_activity_ids,
+    ).match(activity_row)
 
 
 def _extract_remote_activity_id_from_upload_result(upload_result) -> int | None:
@@ -219,7 +272,12 @@ async def _fetch_garmin_activities(
     *,
     page_size: int = 100,
     max_pages: int | None = None,
+    since: datetime | None = None,
 ) -> list[dict]:
+    """
+    Garmin activities, newest first, one page of ``page_size`` at a time. With
+    ``since``, stops after the first page that reaches back before it.
+    """
     activities: list[dict] = []
     page = 0
     while True:
@@ -231,6 +289,11 @@ async def _fetch_garmin_activities(
         activities.extend(batch)
         if len(batch) < page_size:
             break
+        if since is not None:
+            starts = [_parse_garmin_start_time(activity.get("startTimeGMT")) for activity in batch]
+            starts = [start for start in starts if start is not None]
+            if starts and min(starts) < since:
+                break
         page += 1
     return activities
 
@@ -258,51 +321,46 @@ def _load_local_activities(db_con) -> pd.DataFrame:
 
 def _reconcile_rows(
     *,
-    db_con,
+    sync_state: VendorSyncState,
     activities_df: pd.DataFrame,
     garmin_activities: list[dict],
-    account: str,
     match_window_seconds: int,
     distance_tolerance_meters: float,
     duration_tolerance_seconds: int,
+    reserved_activity_ids: set[int] | None = None,
 ) -> None:
-    state_map = load_vendor_sync_rows(db_con, vendor=VENDOR_NAME, account=account)
     garmin_ids = {
         int(activity["activityId"])
         for activity in garmin_activities
         if activity.get("activityId") is not None
     }
-    reserved_remote_ids: set[int] = set()
+    matcher = GarminMatcher(
+        garmin_activities,
+        match_window_seconds=match_window_seconds,
+        distance_tolerance_meters=distance_tolerance_meters,
+        duration_tolerance_seconds=duration_tolerance_seconds,
+        reserved_activity_ids=reserved_activity_ids,
+    )
 
     for _, activity_row in activities_df.iterrows():
         activity_id = int(activity_row["run_id"])
-        state = state_map.get(activity_id)
+        state = sync_state.get(activity_id)
 
         matched_remote_id: int | None = None
         if (
             state
             and state.remote_activity_id
             and state.remote_activity_id in garmin_ids
-            and state.remote_activity_id not in reserved_remote_ids
+            and state.remote_activity_id not in matcher.reserved
         ):
             matched_remote_id = state.remote_activity_id
         else:
-            matched_remote_id = _is_existing_in_garmin(
-                activity_row,
-                garmin_activities,
-                match_window_seconds=match_window_seconds,
-                distance_tolerance_meters=distance_tolerance_meters,
-                duration_tolerance_seconds=duration_tolerance_seconds,
-                reserved_activity_ids=reserved_remote_ids,
-            )
+            matched_remote_id = matcher.match(activity_row)
 
         if matched_remote_id is not None:
-            reserved_remote_ids.add(matched_remote_id)
-            upsert_vendor_sync_status(
-                db_con,
+            matcher.reserve(matched_remote_id)
+            sync_state.update(
                 activity_id=activity_id,
-                vendor=VENDOR_NAME,
-                account=account,
                 status="synced",
                 remote_activity_id=matched_remote_id,
                 last_error=None,
@@ -311,11 +369,8 @@ def _reconcile_rows(
             continue
 
         if state and state.status in SYNCED_STATUSES:
-            upsert_vendor_sync_status(
-                db_con,
+            sync_state.update(
                 activity_id=activity_id,
-                vendor=VENDOR_NAME,
-                account=account,
                 status="missing_remote",
                 remote_activity_id=state.remote_activity_id,
                 content_hash=state.content_hash,
@@ -349,16 +404,18 @@ async def run_reconcile_garmin(
         await garmin_reader.req.aclose()
 
     logger.info("Loaded %d Garmin activities for reconcile.", len(garmin_activities))
-    _reconcile_rows(
-        db_con=db_con,
-        activities_df=activities_df,
-        garmin_activities=garmin_activities,
-        account=account,
-        match_window_seconds=match_window_seconds,
-        distance_tolerance_meters=distance_tolerance_meters,
-        duration_tolerance_seconds=duration_tolerance_seconds,
-    )
-    db_con.close()
+    try:
+        with VendorSyncState(db_con, vendor=VENDOR_NAME, account=account) as sync_state:
+            _reconcile_rows(
+                sync_state=sync_state,
+                activities_df=activities_df,
+                garmin_activities=garmin_activities,
+                match_window_seconds=match_window_seconds,
+                distance_tolerance_meters=distance_tolerance_meters,
+                duration_tolerance_seconds=duration_tolerance_seconds,
+            )
+    finally:
+        db_con.close()
 
 
 def run_reconcile_garmin_sync(
@@ -380,6 +437,172 @@ def run_reconcile_garmin_sync(
     )
 
 
+class GarminBackoff:
+    """
+    Pause shared by the concurrent requests of a sync run: once Garmin answers
+    429, every request waits out its retry_after before being sent.
+    """
+
+    def __init__(self, retries: int = GARMIN_RATE_LIMIT_RETRIES):
+        self.retries = retries
+        self._resume_at = 0.0
+
+    def block_for(self, seconds: float) -> None:
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+
+    async def wait(self) -> None:
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def call(self, func, *args, **kwargs):
+        """Awaits ``func(*args, **kwargs)``, retrying up to ``retries`` times after 429 responses."""
+        for attempt in range(self.retries + 1):
+            await self.wait()
+            try:
+                return await func(*args, **kwargs)
+            except GarminConnectTooManyRequestsError as exc:
+                if attempt == self.retries:
+                    raise
+                delay = exc.retry_after or GARMIN_RATE_LIMIT_WAIT_SECONDS
+                logger.warning("Garmin rate limit reached, pausing requests for %.0f seconds.", delay)
+                self.block_for(delay)
+
+
+def _build_upload_fit(generator: Generator, activity_row: pd.Series, flyby_df: pd.DataFrame, transforms) -> bytes:
+    fit_bytes = generator.build_fit_file(build_activity_data(activity_row, flyby_df))
+    if transforms:
+        fit_bytes = rewrite_fit(fit_bytes, *transforms)
+    return fit_bytes
+
+
+async def _upload_activities(
+    uploads: list[PendingUpload],
+    *,
+    db_con,
+    generator: Generator,
+    garmin_client: Garmin,
+    sync_state: VendorSyncState,
+    matcher: GarminMatcher,
+    account: str,
+    transforms,
+    concurrency: int = GARMIN_UPLOAD_CONCURRENCY,
+    wave_size: int = GARMIN_UPLOAD_WAVE,
+) -> None:
+    """
+    Uploads ``uploads`` and records them as synced or failed in ``sync_state``.
+
+    FIT files are built one ahead per upload slot in a worker thread while
+    ``concurrency`` uploads are in flight over ``garmin_client``, all of them
+    behind one GarminBackoff. The Garmin ids missing from upload responses are
+    looked up in one fetch of the recent Garmin activities per ``wave_size``
+    uploads, and matched with the tolerances of ``matcher``.
+    """
+    if not uploads:
+        return
+    loop = asyncio.get_running_loop()
+    backoff = GarminBackoff()
+    built: asyncio.Queue = asyncio.Queue(maxsize=concurrency)
+    unresolved: list[PendingUpload] = []
+    completed = 0
+
+    def record_failure(upload: PendingUpload, exc: Exception) -> None:
+        activity_id = int(upload.activity_row["run_id"])
+        sync_state.update(
+            activity_id=activity_id,
+            status="failed",
+            content_hash=upload.content_hash,
+            last_error=str(exc),
+            attempt_count=upload.attempt_count + 1,
+            next_retry_at=sync_retry_at(upload.attempt_count + 1),
+        )
+        logger.error("Failed syncing activity %s to %s: %s", activity_id, account, exc, exc_info=True)
+
+    def record_synced(upload: PendingUpload, remote_activity_id: int | None) -> None:
+        activity_id = int(upload.activity_row["run_id"])
+        if remote_activity_id is not None:
+            matcher.reserve(remote_activity_id)
+        sync_state.update(
+            activity_id=activity_id,
+            status="synced",
+            remote_activity_id=remote_activity_id,
+            content_hash=upload.content_hash,
+            last_error=None,
+            attempt_count=upload.attempt_count,
+            uploaded_at=datetime.now(tz=timezone.utc),
+        )
+        logger.info("Synced activity %s to %s.", activity_id, account)
+
+    async def resolve_remote_ids() -> None:
+        # Some Garmin responses do not include an activity id. Re-fetch latest records as fallback.
+        batch = unresolved[:]
+        unresolved.clear()
+        if not batch:
+            return
+        try:
+            recent_activities = await backoff.call(_fetch_garmin_activities, garmin_client, page_size=50, max_pages=2)
+        except Exception as exc:
+            logger.warning("Could not look up the Garmin ids of %d uploads: %s", len(batch), exc)
+            recent_activities = []
+        recent_matcher = GarminMatcher(
+            recent_activities,
+            match_window_seconds=matcher.match_window_seconds,
+            distance_tolerance_meters=matcher.distance_tolerance_meters,
+            duration_tolerance_seconds=matcher.duration_tolerance_seconds,
+            reserved_activity_ids=matcher.reserved,
+        )
+        for upload in batch:
+            remote_activity_id = recent_matcher.match(upload.activity_row)
+            if remote_activity_id is not None:
+                recent_matcher.reserve(remote_activity_id)
+            record_synced(upload, remote_activity_id)
+
+    async def build(pool) -> None:
+        for upload in uploads:
+            activity_id = int(upload.activity_row["run_id"])
+            try:
+                flyby_df = db_con.execute(
+                    "SELECT * FROM activities_flyby WHERE activity_id = ? ORDER BY time_offset",
+                    [activity_id],
+                ).fetchdf()
+                fit_bytes = await loop.run_in_executor(
+                    pool, _build_upload_fit, generator, upload.activity_row, flyby_df, transforms
+                )
+            except Exception as exc:
+                record_failure(upload, exc)
+                continue
+            await built.put((upload, fit_bytes))
+        for _ in range(concurrency):
+            await built.put(None)
+
+    async def upload_worker() -> None:
+        nonlocal completed
+        while (item := await built.get()) is not None:
+            upload, fit_bytes = item
+            filename = f"{int(upload.activity_row['run_id'])}.fit"
+            try:
+                result = await backoff.call(garmin_client.upload_fit, filename, fit_bytes)
+            except Exception as exc:
+                record_failure(upload, exc)
+                continue
+            remote_activity_id = _extract_remote_activity_id_from_upload_result(result)
+            if remote_activity_id is None:
+                unresolved.append(upload)
+            else:
+                record_synced(upload, remote_activity_id)
+            completed += 1
+            if completed % wave_size == 0:
+                await resolve_remote_ids()
+
+    # One build thread: Generator.build_fit_file keeps per-file state on the generator.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+        async with asyncio.TaskGroup() as tasks:
+            tasks.create_task(build(pool))
+            for _ in range(concurrency):
+                tasks.create_task(upload_worker())
+    await resolve_remote_ids()
+
+
 async def run_sync_garmin(
     *,
     garmin_credentials: GarminCredentials,
@@ -387,10 +610,19 @@ async def run_sync_garmin(
     use_fake_garmin_device: bool,
     fix_hr: bool,
     force: bool,
+    delta: bool,
     match_window_seconds: int,
     distance_tolerance_meters: float,
     duration_tolerance_seconds: int,
+    upload_concurrency: int = GARMIN_UPLOAD_CONCURRENCY,
 ) -> None:
+    """
+    Uploads the local activities missing on Garmin and records their status in
+    vendor_activity_sync. Without ``delta`` every Garmin activity is fetched and
+    every local activity reconciled; with it, only the activities that are not
+    synced with their current fingerprint are, against the Garmin activities
+    back to their earliest start. Up to ``upload_concurrency`` uploads run at once.
+    """
     account = _account_name(garmin_credentials.is_cn)
     auth_domain = _auth_domain(garmin_credentials.is_cn)
 
@@ -403,9 +635,26 @@ async def run_sync_garmin(
         db_con.close()
         return
 
+    pending_ids: set[int] | None = None
+    since: datetime | None = None
+    if delta and not force:
+        pending_ids = set(load_pending_sync_activity_ids(db_con, vendor=VENDOR_NAME, account=account))
+        if not pending_ids:
+            logger.info("All %d activities are synced and unchanged for %s.", len(activities_df), account)
+            db_con.close()
+            return
+        total = len(activities_df)
+        activities_df = activities_df[activities_df["run_id"].isin(pending_ids)]
+        first_start = pd.to_datetime(activities_df["start_date"], utc=True).min()
+        if not pd.isna(first_start):
+            since = first_start.to_pydatetime() - timedelta(seconds=match_window_seconds)
+        logger.info("%d of %d activities to sync to %s.", len(activities_df), total, account)
+    # Content hashes of the activities to sync, from the activity_fingerprints table.
+    fingerprints = get_activity_fingerprints(db_con, None if pending_ids is None else sorted(pending_ids))
+
     garmin_reader = Garmin(garmin_credentials.secret_string, auth_domain)
     try:
-        garmin_activities = await _fetch_garmin_activities(garmin_reader)
+        garmin_activities = await _fetch_garmin_activities(garmin_reader, since=since)
         if force:
             deleted = await _delete_all_garmin_activities(garmin_reader, garmin_activities)
             logger.info("Force mode enabled: deleted %d remote Garmin activities for %s.", deleted, account)
@@ -413,65 +662,85 @@ async def run_sync_garmin(
     finally:
         await garmin_reader.req.aclose()
 
-    if force:
-        db_con.execute(
-            "DELETE FROM vendor_activity_sync WHERE vendor = ? AND account = ?",
-            [VENDOR_NAME, account],
+    garmin_uploader = Garmin(garmin_credentials.secret_string, auth_domain)
+    # The statuses are written back in batches, and when the run ends or fails.
+    with VendorSyncState(db_con, vendor=VENDOR_NAME, account=account) as sync_state:
+        if force:
+            sync_state.clear()
+            logger.info("Force mode enabled: cleared local sync status for %s.", account)
+
+        # In delta mode the activities left out keep their Garmin activities.
+        _reconcile_rows(
+            sync_state=sync_state,
+            activities_df=activities_df,
+            garmin_activities=garmin_activities,
+            match_window_seconds=match_window_seconds,
+            distance_tolerance_meters=distance_tolerance_meters,
+            duration_tolerance_seconds=duration_tolerance_seconds,
+            reserved_activity_ids=None
+            if pending_ids is None
+            else {
+                int(row.remote_activity_id)
+                for row in sync_state.values()
+                if row.activity_id not in pending_ids
+                and row.status in SYNCED_STATUSES
+                and row.remote_activity_id is not None
+            },
         )
-        logger.info("Force mode enabled: cleared local sync status for %s.", account)
 
-    _reconcile_rows(
-        db_con=db_con,
-        activities_df=activities_df,
-        garmin_activities=garmin_activities,
-        account=account,
-        match_window_seconds=match_window_seconds,
-        distance_tolerance_meters=distance_tolerance_meters,
-        duration_tolerance_seconds=duration_tolerance_seconds,
-    )
+        no_flyby_type_counts: dict[str, int] = {}
+        matcher = GarminMatcher(
+            garmin_activities,
+            match_window_seconds=match_window_seconds,
+            distance_tolerance_meters=distance_tolerance_meters,
+            duration_tolerance_seconds=duration_tolerance_seconds,
+            reserved_activity_ids={
+                int(row.remote_activity_id)
+                for row in sync_state.values()
+                if row.status in SYNCED_STATUSES and row.remote_activity_id is not None
+            },
+        )
 
-    state_map = load_vendor_sync_rows(db_con, vendor=VENDOR_NAME, account=account)
-    no_flyby_type_counts: dict[str, int] = {}
-    reserved_remote_ids = {
-        int(row.remote_activity_id)
-        for row in state_map.values()
-        if row.status in SYNCED_STATUSES and row.remote_activity_id is not None
-    }
+        # Matching decides what to upload; the uploads then run in _upload_activities.
+        uploads: list[PendingUpload] = []
+        changed_after_upload: list[int] = []
+        for _, activity_row in activities_df.iterrows():
+            activity_id = int(activity_row["run_id"])
 
-    garmin_uploader = Garmin(garmin_credentials.secret_string, auth_domain)
-    for _, activity_row in activities_df.iterrows():
-        activity_id = int(activity_row["run_id"])
+            flyby_points, content_hash = fingerprints[activity_id]
+            if not flyby_points:
+                activity_type = str(activity_row.get("type") or "Unknown")
+                no_flyby_type_counts[activity_type] = no_flyby_type_counts.get(activity_type, 0) + 1
 
-        flyby_df = db_con.execute(
-            "SELECT * FROM activities_flyby WHERE activity_id = ? ORDER BY time_offset",
-            [activity_id],
-        ).fetchdf()
-        if flyby_df.empty:
-            activity_type = str(activity_row.get("type") or "Unknown")
-            no_flyby_type_counts[activity_type] = no_flyby_type_counts.get(activity_type, 0) + 1
-
-        content_hash = _activity_content_hash(activity_row, flyby_df)
-        state = state_map.get(activity_id)
-        if not force and state and state.status in SYNCED_STATUSES and state.content_hash == content_hash:
-            continue
+            state = sync_state.get(activity_id)
+            if not force and state and state.status in SYNCED_STATUSES and state.content_hash == content_hash:
+                continue
+            if not force and state and state.status in SYNCED_STATUSES and state.remote_activity_id is not None:
+                # _reconcile_rows found the Garmin activity, so the local content changed after the upload.
+                if _is_legacy_content_hash(state.content_hash):
+                    sync_state.update(
+                        activity_id=activity_id,
+                        status=state.status,
+                        remote_activity_id=state.remote_activity_id,
+                        content_hash=content_hash,
+                        last_error=None,
+                        attempt_count=state.attempt_count,
+                    )
+                else:
+                    # Uploading again would duplicate the Garmin activity. The old hash stays,
+                    # so the activity keeps being reported until it is re-synced with --force.
+                    changed_after_upload.append(activity_id)
+                continue
+            if not force and state and state.status == "failed" and not is_sync_due(state):
+                # Still backing off (or out of attempts) since the last failed upload.
+                continue
 
-        try:
             if not force:
-                existing_garmin_id = _is_existing_in_garmin(
-                    activity_row,
-                    garmin_activities,
-                    match_window_seconds=match_window_seconds,
-                    distance_tolerance_meters=distance_tolerance_meters,
-                    duration_tolerance_seconds=duration_tolerance_seconds,
-                    reserved_activity_ids=reserved_remote_ids,
-                )
+                existing_garmin_id = matcher.match(activity_row)
                 if existing_garmin_id is not None:
-                    reserved_remote_ids.add(existing_garmin_id)
-                    upsert_vendor_sync_status(
-                        db_con,
+                    matcher.reserve(existing_garmin_id)
+                    sync_state.update(
                         activity_id=activity_id,
-                        vendor=VENDOR_NAME,
-                        account=account,
                         status="synced",
                         remote_activity_id=existing_garmin_id,
                         content_hash=content_hash,
@@ -481,22 +750,12 @@ async def run_sync_garmin(
                     )
                     continue
 
-                # If an equivalent remote activity exists but has been reserved by another local activity in this run,
-                # mark conflict instead of uploading duplicates.
-                reserved_match = _is_existing_in_garmin(
-                    activity_row,
-                    garmin_activities,
-                    match_window_seconds=match_window_seconds,
-                    distance_tolerance_meters=distance_tolerance_meters,
-                    duration_tolerance_seconds=duration_tolerance_seconds,
-                    reserved_activity_ids=set(),
-                )
-                if reserved_match is not None and reserved_match in reserved_remote_ids:
-                    upsert_vendor_sync_status(
-                        db_con,
+                # If an equivalent remote activity exists but has been reserved by another local activity
+                # in this run, mark conflict instead of uploading duplicates.
+                reserved_match = matcher.match(activity_row, include_reserved=True)
+                if reserved_match is not None and reserved_match in matcher.reserved:
+                    sync_state.update(
                         activity_id=activity_id,
-                        vendor=VENDOR_NAME,
-                        account=account,
                         status="conflict",
                         remote_activity_id=reserved_match,
                         content_hash=content_hash,
@@ -505,84 +764,44 @@ async def run_sync_garmin(
                     )
                     continue
 
-            upsert_vendor_sync_status(
-                db_con,
+            sync_state.update(
                 activity_id=activity_id,
-                vendor=VENDOR_NAME,
-                account=account,
                 status="uploading",
                 content_hash=content_hash,
                 attempt_count=state.attempt_count if state else 0,
             )
+            uploads.append(PendingUpload(activity_row, content_hash, state.attempt_count if state else 0))
 
-            dataframes = construct_dataframes(activity_row, flyby_df)
-            fit_bytes = generator.build_fit_file_from_dataframes(dataframes)
-            fit_record = FIT_UPLOAD_RECORD(filename=f"{activity_id}.fit", content=[fit_bytes])
-
-            upload_results = await garmin_uploader.upload_activities_original_from_strava(
-                [fit_record],
-                use_fake_garmin_device=use_fake_garmin_device,
-                fix_hr=fix_hr,
-            )
-
-            remote_activity_id = None
-            if upload_results:
-                remote_activity_id = _extract_remote_activity_id_from_upload_result(upload_results[0])
-
-            # Some Garmin responses do not include an activity id. Re-fetch latest records as fallback.
-            if remote_activity_id is None:
-                recent_activities = await _fetch_garmin_activities(garmin_uploader, page_size=50, max_pages=2)
-                garmin_activities = recent_activities
-                remote_activity_id = _is_existing_in_garmin(
-                    activity_row,
-                    recent_activities,
-                    match_window_seconds=match_window_seconds,
-                    distance_tolerance_meters=distance_tolerance_meters,
-                    duration_tolerance_seconds=duration_tolerance_seconds,
-                    reserved_activity_ids=reserved_remote_ids,
-                )
-
-            if remote_activity_id is not None:
-                reserved_remote_ids.add(remote_activity_id)
-
-            upsert_vendor_sync_status(
-                db_con,
-                activity_id=activity_id,
-                vendor=VENDOR_NAME,
-                account=account,
-                status="synced",
-                remote_activity_id=remote_activity_id,
-                content_hash=content_hash,
-                last_error=None,
-                attempt_count=state.attempt_count if state else 0,
-                uploaded_at=datetime.now(tz=timezone.utc),
-            )
-            logger.info("Synced activity %s to %s.", activity_id, account)
-        except Exception as exc:
-            next_attempt = (state.attempt_count if state else 0) + 1
-            upsert_vendor_sync_status(
-                db_con,
-                activity_id=activity_id,
-                vendor=VENDOR_NAME,
+        try:
+            await _upload_activities(
+                uploads,
+                db_con=db_con,
+                generator=generator,
+                garmin_client=garmin_uploader,
+                sync_state=sync_state,
+                matcher=matcher,
                 account=account,
-                status="failed",
-                content_hash=content_hash,
-                last_error=str(exc),
-                attempt_count=next_attempt,
+                transforms=fit_upload_transforms(use_fake_garmin_device, fix_hr),
+                concurrency=upload_concurrency,
             )
-            logger.error("Failed syncing activity %s to %s: %s", activity_id, account, exc, exc_info=True)
-
-        state_map = load_vendor_sync_rows(db_con, vendor=VENDOR_NAME, account=account)
-
-    if not garmin_uploader.req.is_closed:
-        await garmin_uploader.req.aclose()
-
+        finally:
+            if not garmin_uploader.req.is_closed:
+                await garmin_uploader.req.aclose()
+
+    if changed_after_upload:
+        logger.warning(
+            "%d activities changed locally after they were synced to %s and were not re-uploaded: %s",
+            len(changed_after_upload),
+            account,
+            ", ".join(str(activity_id) for activity_id in changed_after_upload),
+        )
     if no_flyby_type_counts:
         logger.info("Activities without activities_flyby were processed as summary-only FIT files:")
         for activity_type, count in sorted(no_flyby_type_counts.items(), key=lambda item: item[0]):
             logger.info("  %s: %d", activity_type, count)
 
     db_con.close()
+    logger.info("DuckDB connections: %s", get_db_connection_stats())
 
 
 def run_sync_garmin_sync(
@@ -592,9 +811,11 @@ def run_sync_garmin_sync(
     use_fake_garmin_device: bool,
     fix_hr: bool,
     force: bool,
+    delta: bool,
     match_window_seconds: int,
     distance_tolerance_meters: float,
     duration_tolerance_seconds: int,
+    upload_concurrency: int = GARMIN_UPLOAD_CONCURRENCY,
 ) -> None:
     asyncio.run(
         run_sync_garmin(
@@ -603,8 +824,10 @@ def run_sync_garmin_sync(
             use_fake_garmin_device=use_fake_garmin_device,
             fix_hr=fix_hr,
             force=force,
+            delta=delta,
             match_window_seconds=match_window_seconds,
             distance_tolerance_meters=distance_tolerance_meters,
             duration_tolerance_seconds=duration_tolerance_seconds,
+            upload_concurrency=upload_concurrency,
         )
     )
@@ -0,0 +1,328 @@
+"""Shared rate-limit governor for every Strava API call site."""
+
+import datetime
+import functools
+import threading
+import time
+
+from stravalib.exc import Fault, RateLimitExceeded
+from stravalib.util.limiter import get_seconds_until_next_day, get_seconds_until_next_quarter
+
+from .utils import get_logger
+
+logger = get_logger(__name__)
+
+# Strava's default limits for a single application: (15-minute, daily).
+# https://developers.strava.com/docs/rate-limits/
+DEFAULT_LIMITS = {
+    "read": (100, 1000),
+    "overall": (200, 2000),
+}
+
+RATE_LIMIT_STATE_SCHEMA = {
+    "scope": "VARCHAR PRIMARY KEY",
+    "short_usage": "INTEGER",
+    "long_usage": "INTEGER",
+    "short_limit": "INTEGER",
+    "long_limit": "INTEGER",
+    "updated_at": "TIMESTAMP",
+}
+
+
+def is_rate_limit_fault(error):
+    """Return True if a stravalib error is an HTTP 429 response."""
+    response = getattr(error, "response", None)
+    return isinstance(error, Fault) and getattr(response, "status_code", None) == 429
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class _RateWindow:
+    """Usage and limits of one Strava rate-limit scope (read or overall)."""
+
+    def __init__(self, short_limit, long_limit):
+        self.short_limit = short_limit
+        self.long_limit = long_limit
+        self.short_usage = 0
+        self.long_usage = 0
+        self.short_reset_at = 0.0
+        self.long_reset_at = 0.0
+        self.updated_at = None
+
+    def update(self, short_usage, long_usage, short_limit, long_limit, updated_at=None):
+        now = time.monotonic()
+        self.short_usage, self.long_usage = short_usage, long_usage
+        self.short_limit, self.long_limit = short_limit, long_limit
+        self.short_reset_at = now + get_seconds_until_next_quarter()
+        self.long_reset_at = now + get_seconds_until_next_day()
+        self.updated_at = updated_at or _utcnow()
+
+    def usage(self):
+        """Current (short, long) usage; usage from a window that has since reset no longer counts."""
+        now = time.monotonic()
+        short_usage = self.short_usage if now < self.short_reset_at else 0
+        long_usage = self.long_usage if now < self.long_reset_at else 0
+        return short_usage, long_usage
+
+    def budget_left(self):
+        short_usage, long_usage = self.usage()
+        return max(self.short_limit - short_usage, 0), max(self.long_limit - long_usage, 0)
+
+    def exhausted_for(self):
+        """Seconds until this window allows calls again, 0 if it is not exhausted."""
+        short_left, long_left = self.budget_left()
+        if long_left <= 0:
+            return get_seconds_until_next_day()
+        if short_left <= 0:
+            return get_seconds_until_next_quarter()
+        return 0
+
+    def rate(self, reserve):
+        """Calls per second that spread the remaining budget evenly over the window."""
+        short_usage, long_usage = self.usage()
+        # Keep the bucket's burst in reserve so a full bucket can never overrun the window.
+        short_left = max(self.short_limit - short_usage - reserve, 0)
+        rate = short_left / max(get_seconds_until_next_quarter(), 1)
+        if long_usage >= self.long_limit / 2:
+            long_left = max(self.long_limit - long_usage, 0)
+            rate = min(rate, long_left / max(get_seconds_until_next_day(), 1))
+        return rate
+
+
+class StravaRateGovernor:
+    """
+    Token bucket shared by every Strava call in the process.
+
+    Usage and limits for the read and overall scopes are taken from the
+    X-ReadRateLimit-* / X-RateLimit-* response headers (the instance is passed
+    to ``stravalib.Client(rate_limiter=...)``), and the bucket refills at the
+    rate that spreads the remaining 15-minute budget over the rest of the
+    window, so calls are scheduled evenly instead of bursting into a 429.
+    Once half of the daily budget is used the daily window is respected too.
+
+    ``call()`` and ``call_with_retries()`` wrap stravalib calls, ``call_pages()``
+    paged listings one page request at a time, ``acquire()``
+    blocks until a call may be made and is safe to use from several threads,
+    and ``load_state()`` / ``save_state()`` carry the budget across runs.
+    """
+
+    def __init__(self, burst=20):
+        self.burst = burst
+        self.windows = {scope: _RateWindow(*limits) for scope, limits in DEFAULT_LIMITS.items()}
+        self.calls = 0
+        self.seconds_slept = 0.0
+        self.rate_limit_hits = 0
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, response_headers, method):
+        """stravalib hook, called with the headers of every API response."""
+        headers = {key.casefold(): value for key, value in response_headers.items()}
+        for scope, prefix in (("read", "x-readratelimit"), ("overall", "x-ratelimit")):
+            usage, limit = headers.get(f"{prefix}-usage"), headers.get(f"{prefix}-limit")
+            if not usage or not limit:
+                continue
+            try:
+                short_usage, long_usage = (int(v) for v in usage.split(",")[:2])
+                short_limit, long_limit = (int(v) for v in limit.split(",")[:2])
+            except ValueError:
+                logger.debug(f"Ignoring malformed Strava rate-limit headers: {usage!r} / {limit!r}")
+                continue
+            self.update(short_usage, long_usage, short_limit, long_limit, scope=scope)
+
+    def update(self, short_usage, long_usage, short_limit, long_limit, scope="read", updated_at=None):
+        """Record the usage reported by Strava and block if a limit is exhausted."""
+        with self._lock:
+            self._refill()
+            window = self.windows[scope]
+            window.update(short_usage, long_usage, short_limit, long_limit, updated_at)
+            wait = window.exhausted_for()
+            if wait:
+                self._block(wait)
+                logger.warning(
+                    f"Strava {scope} rate limit reached ({short_usage}/{short_limit} 15-min, "
+                    f"{long_usage}/{long_limit} daily). Pausing requests for {wait} seconds."
+                )
+
+    def block_for(self, seconds):
+        """Pause all callers for ``seconds``, e.g. after a 429 response."""
+        with self._lock:
+            self._block(seconds)
+
+    def seconds_until_available(self):
+        with self._lock:
+            return max(0.0, self._blocked_until - time.monotonic())
+
+    def rate(self, scope="read"):
+        """Calls per second allowed by the remaining budget of ``scope``."""
+        scopes = ["read", "overall"] if scope == "read" else [scope]
+        return min(self.windows[name].rate(self.burst) for name in scopes)
+
+    def acquire(self, scope="read"):
+        """Block until a call may be made and take a token for it. Returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill(scope)
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    self.calls += 1
+                    self.seconds_slept += waited
+                    return waited
+                else:
+                    rate = self.rate(scope)
+                    wait = (1 - self._tokens) / rate if rate > 0 else get_seconds_until_next_quarter()
+            # Re-check at least once a minute so header updates from other threads are picked up.
+            wait = min(wait, 60.0)
+            time.sleep(wait)
+            waited += wait
+
+    def call(self, func, *args, scope="read", **kwargs):
+        """
+        Call a stravalib method once the budget allows it.
+        HTTP 429 responses are raised as stravalib.exc.RateLimitExceeded.
+        """
+        self.acquire(scope)
+        try:
+            return func(*args, **kwargs)
+        except Fault as e:
+            if not is_rate_limit_fault(e):
+                raise
+            with self._lock:
+                self.rate_limit_hits += 1
+            timeout = self.seconds_until_available() or None
+            raise RateLimitExceeded(str(e), timeout=timeout) from e
+        except RateLimitExceeded:
+            with self._lock:
+                self.rate_limit_hits += 1
+            raise
+
+    def call_pages(self, func, *args, scope="read", **kwargs):
+        """
+        List every result of a paged stravalib call such as Client.get_activities,
+        making each page request through call() instead of the whole listing
+        taking a single token.
+        """
+        results = func(*args, **kwargs)
+        fetch = getattr(results, "result_fetcher", None)
+        if fetch is None:
+            return self.call(list, results, scope=scope)
+        results.result_fetcher = functools.partial(self.call, fetch, scope=scope)
+        return list(results)
+
+    def call_with_retries(self, max_retries, func, *args, scope="read", **kwargs):
+        """
+        Like call(), but on a rate-limit error pause every caller until the budget
+        resets (or for an exponential backoff when unknown) and try again.
+        """
+        for attempt in range(max_retries):
+            try:
+                return self.call(func, *args, scope=scope, **kwargs)
+            except RateLimitExceeded as e:
+                if attempt == max_retries - 1:
+                    raise
+                wait = e.timeout if e.timeout else min(60 * (2**attempt), 900)
+                logger.warning(
+                    f"Strava rate limit exceeded, pausing requests for {wait} seconds "
+                    f"(attempt {attempt + 1}/{max_retries})."
+                )
+                self.block_for(wait)
+
+    def budget_left(self, scope="read"):
+        """Remaining (15-minute, daily) calls for ``scope``."""
+        with self._lock:
+            return self.windows[scope].budget_left()
+
+    def metrics(self):
+        """Calls made, seconds slept, 429s seen and the remaining budget per scope."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "seconds_slept": round(self.seconds_slept, 1),
+                "rate_limit_hits": self.rate_limit_hits,
+                "read_budget_left": self.windows["read"].budget_left(),
+                "overall_budget_left": self.windows["overall"].budget_left(),
+            }
+
+    def load_state(self, db_connection):
+        """Restore usage saved by an earlier run if its window has not reset yet."""
+        try:
+            rows = db_connection.execute(
+                "SELECT scope, short_usage, long_usage, short_limit, long_limit, updated_at FROM strava_rate_limit"
+            ).fetchall()
+        except Exception as e:
+            logger.debug(f"No persisted Strava rate-limit state: {e}")
+            return
+
+        now = _utcnow()
+        quarter_start = now.replace(minute=(now.minute // 15) * 15, second=0, microsecond=0)
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        for scope, short_usage, long_usage, short_limit, long_limit, updated_at in rows:
+            if scope not in self.windows or updated_at is None or updated_at < day_start:
+                continue
+            short_usage = short_usage if updated_at >= quarter_start else 0
+            self.update(short_usage, long_usage, short_limit, long_limit, scope=scope, updated_at=updated_at)
+            logger.info(
+                f"Restored Strava {scope} rate-limit usage: {short_usage}/{short_limit} 15-min, "
+                f"{long_usage}/{long_limit} daily"
+            )
+
+    def save_state(self, db_connection):
+        """Persist the last usage reported by Strava."""
+        columns_def = ", ".join(f"{name} {dtype}" for name, dtype in RATE_LIMIT_STATE_SCHEMA.items())
+        with self._lock:
+            rows = [
+                (scope, w.short_usage, w.long_usage, w.short_limit, w.long_limit, w.updated_at)
+                for scope, w in self.windows.items()
+                if w.updated_at is not None
+            ]
+        if not rows:
+            return
+        try:
+            db_connection.execute(f"CREATE TABLE IF NOT EXISTS strava_rate_limit ({columns_def})")
+            db_connection.executemany(
+                """
+                INSERT INTO strava_rate_limit (scope, short_usage, long_usage, short_limit, long_limit, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (scope) DO UPDATE SET
+                    short_usage = excluded.short_usage,
+                    long_usage = excluded.long_usage,
+                    short_limit = excluded.short_limit,
+                    long_limit = excluded.long_limit,
+                    updated_at = excluded.updated_at
+                """,
+                rows,
+            )
+        except Exception as e:
+            logger.warning(f"Could not persist Strava rate-limit state: {e}")
+
+    def _refill(self, scope="read"):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if elapsed > 0 and now >= self._blocked_until:
+            self._tokens = min(float(self.burst), self._tokens + elapsed * self.rate(scope))
+
+    def _block(self, seconds):
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_strava_governor():
+    """Return the process-wide governor so every Strava client shares one budget."""
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = StravaRateGovernor()
+        return _governor
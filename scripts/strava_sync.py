@@ -1,9 +1,9 @@
-import json
 import os
 
 from .config import FIT_FOLDER, JSON_FILE, SQL_FILE, TCX_FOLDER
 from .generator import Generator
-from .utils import ActivityJSONEncoder, get_logger, load_env_config
+from .generator.db import get_db_connection_stats
+from .utils import get_logger, load_env_config
 
 
 # for only run type, we use the same logic as garmin_sync
@@ -16,6 +16,7 @@ def run_strava_sync(
     is_fit=False,
     force_sync=False,
     prune=False,
+    verify_json=False,
 ):
     # Try to load from env if no credentials provided
     if not all([client_id, client_secret, refresh_token]):
@@ -56,10 +57,9 @@ def run_strava_sync(
         # Default behavior: sync activities to database
         logger.info("Running in default DB sync mode.")
         generator.sync(force=force_sync, prune=prune)
-        activities_list = generator.load()
-        with open(JSON_FILE, "w") as f:
-            json.dump(activities_list, f, cls=ActivityJSONEncoder)
+        generator.export_activities_json(JSON_FILE, verify=verify_json)
         logger.info("Default sync finished.")
+    logger.info("DuckDB connections: %s", get_db_connection_stats())
 
 
 if __name__ == "__main__":
@@ -1,18 +1,54 @@
 import asyncio
-from collections import namedtuple
+import concurrent.futures
 from datetime import datetime, timezone
 
-import stravalib
-
 from .config import SQL_FILE
-from .garmin_sync import Garmin
+from .exceptions import SyncError
+from .garmin_device_adaptor import rewrite_fit
+from .garmin_sync import Garmin, fit_upload_transforms
 from .generator import Generator
-from .generator.db import get_dataframes_for_fit_tables
+from .generator.activity_data import activity_data_from_strava
+from .strava_cli_core.store import (
+    ensure_vendor_sync_table,
+    is_sync_due,
+    load_vendor_sync_rows,
+    sync_retry_at,
+    upsert_vendor_sync_status,
+)
+from .strava_cli_core.sync_garmin import VENDOR_NAME, _account_name, _extract_remote_activity_id_from_upload_result
+from .strava_rate_limit import get_strava_governor
 from .strava_sync import run_strava_sync
 from .utils import get_logger, load_env_config, make_strava_client
 
 logger = get_logger(__name__)
 STREAM_FETCH_MAX_RETRIES = 3
+STREAM_TYPES = [
+    "time",
+    "latlng",
+    "altitude",
+    "heartrate",
+    "cadence",
+    "velocity_smooth",
+    "distance",
+]
+# Activities waiting between two stages; bounds the streams and FIT files held in memory.
+PIPELINE_QUEUE_SIZE = 4
+UPLOAD_CONCURRENCY = 2
+# vendor_activity_sync source of the rows this pipeline writes; it only resumes those.
+SYNC_SOURCE = "strava_to_garmin"
+
+_worker_generator = None
+
+
+def _build_upload(activity_data, transforms):
+    """FIT bytes to upload for an ActivityData; runs in the build worker threads or processes."""
+    global _worker_generator
+    if _worker_generator is None:
+        _worker_generator = Generator(None)
+    fit_bytes = _worker_generator.build_fit_file(activity_data)
+    if transforms:
+        fit_bytes = rewrite_fit(fit_bytes, *transforms)
+    return fit_bytes
 
 
 async def upload_to_activities(
@@ -20,7 +56,23 @@ async def upload_to_activities(
     strava_client,
     use_fake_garmin_device,
     fix_hr,
+    *,
+    account=None,
+    jobs=1,
+    upload_concurrency=UPLOAD_CONCURRENCY,
 ):
+    """
+    Mirrors new Strava activities to Garmin and returns the uploaded file names.
+
+    Stream fetches (paced by the Strava governor), FIT builds (in ``jobs``
+    worker processes, or a thread) and ``upload_concurrency`` concurrent uploads
+    run as stages connected by bounded queues. Progress is kept in
+    vendor_activity_sync: activities are recorded as pending before they enter
+    the pipeline and as synced once uploaded, so an interrupted run picks the
+    pending ones up again and never uploads an activity twice. Rows written by
+    run_sync_garmin are left to it.
+    """
+    account = account or _account_name(False)
     last_activity = await garmin_client.get_activities(0, 1)
     if not last_activity:
         logger.info("No Garmin activity found. Syncing all Strava activities.")
@@ -31,67 +83,170 @@ async def upload_to_activities(
         after_datetime = datetime.strptime(after_datetime_str, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
         logger.info(f"Last Garmin activity date: {after_datetime}")
         filters = {"after": after_datetime}
-    strava_activities = list(strava_client.get_activities(**filters))
-    files_list = []
-    logger.info(f"Found {len(strava_activities)} new Strava activities to sync.")
-    if not strava_activities:
-        return files_list
-
     # a cheap way to init generator
     generator = Generator(SQL_FILE)
-    FitFile = namedtuple("FitFile", ["filename", "content"])
-
-    # strava rate limit
-    for i in sorted(strava_activities, key=lambda i: int(i.id)):
-        logger.info(f"Processing activity: {i.name} ({i.id})")
-        stream_types = [
-            "time",
-            "latlng",
-            "altitude",
-            "heartrate",
-            "cadence",
-            "velocity_smooth",
-            "distance",
-        ]
-
-        streams = None
-        for attempt in range(STREAM_FETCH_MAX_RETRIES):
+    governor = get_strava_governor()
+    generator.load_rate_budget()
+
+    db_con = ensure_vendor_sync_table(str(SQL_FILE))
+    try:
+        state_map = load_vendor_sync_rows(db_con, vendor=VENDOR_NAME, account=account)
+        strava_activities = governor.call_pages(strava_client.get_activities, **filters)
+        activities = {
+            int(activity.id): activity
+            for activity in strava_activities
+            if is_sync_due(state_map.get(int(activity.id)), source=SYNC_SOURCE)
+        }
+        # Activities left pending by an interrupted run, or failed while later ones were
+        # uploaded, can be older than the last Garmin activity.
+        for activity_id, state in state_map.items():
+            if is_sync_due(state, source=SYNC_SOURCE) and activity_id not in activities:
+                try:
+                    activities[activity_id] = await asyncio.to_thread(
+                        governor.call_with_retries, STREAM_FETCH_MAX_RETRIES, strava_client.get_activity, activity_id
+                    )
+                except Exception as ex:
+                    logger.error("Failed to fetch pending activity %s: %s", activity_id, ex, exc_info=True)
+
+        logger.info(f"Found {len(activities)} new Strava activities to sync.")
+        if not activities:
+            return []
+        for activity_id in activities:
+            state = state_map.get(activity_id)
+            upsert_vendor_sync_status(
+                db_con,
+                activity_id=activity_id,
+                vendor=VENDOR_NAME,
+                account=account,
+                status="pending",
+                attempt_count=state.attempt_count if state else 0,
+                source=SYNC_SOURCE,
+            )
+
+        return await _run_upload_pipeline(
+            db_con,
+            garmin_client,
+            strava_client,
+            [activities[activity_id] for activity_id in sorted(activities)],
+            state_map=state_map,
+            account=account,
+            transforms=fit_upload_transforms(use_fake_garmin_device, fix_hr),
+            jobs=jobs,
+            upload_concurrency=upload_concurrency,
+        )
+    finally:
+        generator.save_rate_budget()
+        db_con.close()
+
+
+async def _run_upload_pipeline(
+    db_con,
+    garmin_client,
+    strava_client,
+    activities,
+    *,
+    state_map,
+    account,
+    transforms,
+    jobs,
+    upload_concurrency,
+):
+    governor = get_strava_governor()
+    loop = asyncio.get_running_loop()
+    fetched = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    built = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    uploaded_files = []
+    failed_uploads = []
+
+    def mark(activity_id, status, **fields):
+        state = state_map.get(activity_id)
+        attempt_count = state.attempt_count if state else 0
+        if status == "failed":
+            attempt_count += 1
+            fields["next_retry_at"] = sync_retry_at(attempt_count)
+        upsert_vendor_sync_status(
+            db_con,
+            activity_id=activity_id,
+            vendor=VENDOR_NAME,
+            account=account,
+            status=status,
+            attempt_count=attempt_count,
+            source=SYNC_SOURCE,
+            **fields,
+        )
+
+    async def fetch():
+        # strava rate limit: the shared governor paces every stream request
+        for activity in activities:
+            logger.info(f"Processing activity: {activity.name} ({activity.id})")
             try:
-                streams = strava_client.get_activity_streams(i.id, types=stream_types, resolution="high")
-                break
-            except stravalib.exc.RateLimitExceeded as ex:
-                wait_seconds = float(getattr(ex, "timeout", None) or 60)
-                logger.warning(
-                    "Strava rate limit when fetching streams for %s, waiting %.1fs (attempt %d/%d).",
-                    i.id,
-                    wait_seconds,
-                    attempt + 1,
+                streams = await asyncio.to_thread(
+                    governor.call_with_retries,
                     STREAM_FETCH_MAX_RETRIES,
+                    strava_client.get_activity_streams,
+                    activity.id,
+                    types=STREAM_TYPES,
+                    resolution="high",
                 )
-                await asyncio.sleep(wait_seconds)
             except Exception as ex:
-                if attempt == STREAM_FETCH_MAX_RETRIES - 1:
-                    logger.error("Failed to fetch streams for activity %s: %s", i.id, ex, exc_info=True)
-                else:
-                    await asyncio.sleep(2)
+                logger.error("Failed to fetch streams for activity %s: %s", activity.id, ex, exc_info=True)
+                mark(int(activity.id), "failed", last_error=str(ex))
+                continue
+            await fetched.put((activity, streams))
+        for _ in range(jobs):
+            await fetched.put(None)
 
-        if streams is None:
-            continue
+    async def build(pool):
+        while (item := await fetched.get()) is not None:
+            activity, streams = item
+            try:
+                activity_data = activity_data_from_strava(activity, streams)
+                fit_bytes = await loop.run_in_executor(pool, _build_upload, activity_data, transforms)
+            except Exception as ex:
+                logger.error(f"Failed to build FIT for activity {activity.id}: {ex}", exc_info=True)
+                mark(int(activity.id), "failed", last_error=str(ex))
+                continue
+            await built.put((int(activity.id), fit_bytes))
 
+    async def build_all():
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
         try:
-            dataframes = get_dataframes_for_fit_tables(i, streams)
-            fit_bytes = generator.build_fit_file_from_dataframes(dataframes)
-            file_to_upload = FitFile(filename=f"{i.id}.fit", content=[fit_bytes])
-            files_list.append(file_to_upload)
-        except Exception as ex:
-            logger.error(f"Failed to build FIT for activity {i.id}: {ex}", exc_info=True)
-            continue
+            await asyncio.gather(*(build(pool) for _ in range(jobs)))
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        for _ in range(upload_concurrency):
+            await built.put(None)
+
+    async def upload():
+        while (item := await built.get()) is not None:
+            activity_id, fit_bytes = item
+            filename = f"{activity_id}.fit"
+            try:
+                result = await garmin_client.upload_fit(filename, fit_bytes)
+            except Exception as ex:
+                logger.exception("Garmin upload for %s failed: %s", filename, ex)
+                mark(activity_id, "failed", last_error=str(ex))
+                failed_uploads.append(filename)
+                continue
+            mark(
+                activity_id,
+                "synced",
+                remote_activity_id=_extract_remote_activity_id_from_upload_result(result),
+                last_error=None,
+                uploaded_at=datetime.now(tz=timezone.utc),
+            )
+            uploaded_files.append(filename)
 
-        # sleep for a while to avoid strava rate limit
-        await asyncio.sleep(2)
+    async with asyncio.TaskGroup() as stages:
+        stages.create_task(fetch())
+        stages.create_task(build_all())
+        for _ in range(upload_concurrency):
+            stages.create_task(upload())
 
-    await garmin_client.upload_activities_original_from_strava(files_list, use_fake_garmin_device, fix_hr)
-    return files_list
+    if failed_uploads:
+        raise SyncError(f"Garmin upload failed for {len(failed_uploads)} file(s): {', '.join(failed_uploads[:5])}")
+    return uploaded_files
 
 
 async def run_strava_to_garmin_sync(
@@ -102,6 +257,8 @@ async def run_strava_to_garmin_sync(
     is_cn: bool,
     use_fake_garmin_device: bool,
     fix_hr: bool,
+    jobs: int = 1,
+    upload_concurrency: int = UPLOAD_CONCURRENCY,
 ) -> None:
     if not all([client_id, client_secret, refresh_token]):
         env_config = load_env_config()
@@ -135,6 +292,9 @@ async def run_strava_to_garmin_sync(
         strava_client,
         use_fake_garmin_device,
         fix_hr,
+        account=_account_name(is_cn),
+        jobs=jobs,
+        upload_concurrency=upload_concurrency,
     )
     logger.info("Uploaded %d files to Garmin. Starting Strava DB sync.", len(uploaded_files))
 
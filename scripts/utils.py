@@ -1,6 +1,5 @@
 import json
 import logging
-import time
 from datetime import datetime
 from pathlib import Path
 from typing import TYPE_CHECKING, Optional
@@ -9,7 +8,6 @@ from zoneinfo import ZoneInfo
 import pandas as pd
 from rich.logging import RichHandler
 from stravalib.client import Client
-from stravalib.exc import RateLimitExceeded
 
 if TYPE_CHECKING:
     from .type_defs import EnvConfig
@@ -248,13 +246,13 @@ def make_activities_file(
         file_suffix=file_suffix,
         activity_title_dict=activity_title_dict,
     )
-    activities_list = generator.load()
-    with open(json_file, "w") as f:
-        json.dump(activities_list, f, cls=ActivityJSONEncoder)
+    generator.export_activities_json(json_file)
 
 
 def make_strava_client(client_id, client_secret, refresh_token):
-    client = Client()
+    from .strava_rate_limit import get_strava_governor
+
+    client = Client(rate_limiter=get_strava_governor())
 
     refresh_response = client.refresh_access_token(
         client_id=client_id,
@@ -292,19 +290,16 @@ def get_strava_last_time(client, is_milliseconds=True):
 
 
 def upload_file_to_strava(client, file_name, data_type, force_to_run=True):
+    from .strava_rate_limit import get_strava_governor
+
     with open(file_name, "rb") as f:
-        try:
-            if force_to_run:
-                r = client.upload_activity(activity_file=f, data_type=data_type, activity_type="run")
-            else:
-                r = client.upload_activity(activity_file=f, data_type=data_type)
-
-        except RateLimitExceeded as e:
-            timeout = 60.0 if e.timeout is None else float(e.timeout)
-            logger.warning(f"Strava API Rate Limit Exceeded. Retry after {timeout} seconds")
-            time.sleep(timeout)
+
+        def upload():
+            # A retried upload has to send the whole file again.
+            f.seek(0)
             if force_to_run:
-                r = client.upload_activity(activity_file=f, data_type=data_type, activity_type="run")
-            else:
-                r = client.upload_activity(activity_file=f, data_type=data_type)
+                return client.upload_activity(activity_file=f, data_type=data_type, activity_type="run")
+            return client.upload_activity(activity_file=f, data_type=data_type)
+
+        r = get_strava_governor().call_with_retries(2, upload, scope="overall")
         logger.info(f"Uploading {data_type} file: {file_name} to strava, upload_id: {r.upload_id}.")
@@ -12,6 +12,15 @@ scripts_dir = Path(__file__).parent.parent / "scripts"
 sys.path.insert(0, str(scripts_dir))
 
 
+@pytest.fixture(autouse=True)
+def _close_db_connections():
+    """Don't let pooled DuckDB connections leak between tests."""
+    yield
+    from scripts.generator.db import close_db_connections
+
+    close_db_connections()
+
+
 @pytest.fixture
 def temp_dir():
     """Create a temporary directory for test files."""
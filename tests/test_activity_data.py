@@ -0,0 +1,142 @@
+"""Tests for generator/activity_data.py module."""
+
+import datetime
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from fit_tool.profile.profile_type import Sport, SubSport
+
+START = datetime.datetime(2024, 1, 1, 7, 0, tzinfo=datetime.timezone.utc)
+START_MS = 1704092400000
+
+
+def _activity(**overrides):
+    fields = {
+        "id": 7,
+        "name": "Evening Run",
+        "type": "Run",
+        "start_date": START,
+        "elapsed_time": datetime.timedelta(seconds=600),
+        "moving_time": datetime.timedelta(seconds=550),
+        "distance": 1500.0,
+        "average_speed": 2.7,
+        "average_heartrate": 149.5,
+        "average_cadence": None,
+        "calories": 120.0,
+    }
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def _streams(**streams):
+    return {name: SimpleNamespace(data=data) for name, data in streams.items()}
+
+
+class TestActivityDataFromStrava:
+    """Test cases for activity_data_from_strava function."""
+
+    def test_streams_become_aligned_arrays(self):
+        from scripts.generator.activity_data import activity_data_from_strava
+
+        streams = _streams(
+            time=[0, 1, 3],
+            latlng=[[39.9, 116.4], [39.91, 116.41]],
+            heartrate=[120, None, 130, 140],
+            distance=[0.0, 2.5, 7.5],
+        )
+        data = activity_data_from_strava(_activity(), streams)
+
+        assert data.record_count == 3
+        assert data.records["timestamp"].tolist() == [START_MS, START_MS + 1000, START_MS + 3000]
+        np.testing.assert_array_equal(data.records["position_lat"], [39.9, 39.91, np.nan])
+        np.testing.assert_array_equal(data.records["heart_rate"], [120, np.nan, 130])
+        assert np.isnan(data.records["speed"]).all()
+        assert (data.sport, data.sub_sport, data.activity_type) == (Sport.RUNNING.value, SubSport.GENERIC.value, "Run")
+        assert data.timestamp == START_MS + 600_000
+
+        assert data.lap_count == 1
+        assert data.laps["total_timer_time"].tolist() == [550.0]
+        assert np.isnan(data.laps["avg_cadence"]).all()
+
+    def test_summary_only_without_latlng(self):
+        from scripts.generator.activity_data import activity_data_from_strava
+
+        data = activity_data_from_strava(_activity(type="Workout", name="Boxing"), _streams(time=[0, 1]))
+
+        assert data.record_count == 0
+        assert (data.sport, data.sub_sport) == (Sport.BOXING.value, SubSport.GENERIC.value)
+
+
+class TestActivityDataFromDataframes:
+    """Test cases for activity_data_from_dataframes function."""
+
+    def test_matches_construct_dataframes(self):
+        from scripts.export_fit import construct_dataframes
+        from scripts.generator.activity_data import activity_data_from_dataframes
+        from scripts.generator.fit_encoder import encode_record_messages
+
+        activity_row = pd.Series(
+            {
+                "run_id": 12345,
+                "name": "Test Run",
+                "start_date": "2024-01-01 07:00:00",
+                "elapsed_time": 3600,
+                "moving_time": 3500,
+                "distance": 2500,
+                "type": "Run",
+                "average_speed": 2.8,
+                "average_heartrate": float("nan"),
+            }
+        )
+        flyby_df = pd.DataFrame(
+            {
+                "time_offset": np.arange(0, 1200, 60),
+                "lat": np.linspace(40.0, 40.02, 20),
+                "lng": np.linspace(-74.0, -74.02, 20),
+                "distance": np.arange(20) * 130.0,
+                "alt": 10.0,
+                "pace": 5.0,
+                "hr": 150.0,
+                "cadence": 180.0,
+                "watts": np.nan,
+            }
+        )
+        dataframes = construct_dataframes(activity_row, flyby_df)
+        data = activity_data_from_dataframes(dataframes)
+
+        assert data.activity_id == 12345
+        assert (data.start_time, data.time_created) == (START_MS, START_MS)
+        assert data.timestamp == START_MS + 3_600_000
+        assert (data.sport, data.sub_sport) == (Sport.RUNNING.value, SubSport.STREET.value)
+        assert data.avg_heart_rate is None
+        assert encode_record_messages(data.records) == encode_record_messages(dataframes["fit_record"])
+
+        laps = dataframes["fit_lap"]
+        assert data.lap_count == len(laps) == 3
+        assert data.laps["start_time"][1] == START_MS + 480_000
+        assert data.laps["total_distance"].tolist() == laps["total_distance"].tolist()
+        assert data.laps["avg_heart_rate"].tolist() == [150.0, 150.0, 150.0]
+
+
+class TestMakeTcx:
+    """Test cases for the TCX builder reading ActivityData."""
+
+    def test_track_points(self):
+        from scripts.generator.tcx_builder import TcxBuilderMixin
+
+        streams = _streams(time=[0, 1], latlng=[[39.9, 116.4], [39.91, 116.41]], heartrate=[120, 131])
+        tcx = TcxBuilderMixin()._make_tcx_from_streams(_activity(), streams)
+
+        assert '<Activity Sport="Run">' in tcx
+        assert "<Time>2024-01-01T07:00:01+00:00</Time>" in tcx
+        assert "<LatitudeDegrees>39.91</LatitudeDegrees>" in tcx
+        assert "<AltitudeMeters>" not in tcx
+        assert "<Calories>120</Calories>" in tcx
+        # Average and maximum heart rate, then the two track points.
+        assert [line.strip() for line in tcx.splitlines() if line.strip().startswith("<Value>")] == [
+            "<Value>125</Value>",
+            "<Value>131</Value>",
+            "<Value>120</Value>",
+            "<Value>131</Value>",
+        ]
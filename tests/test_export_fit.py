@@ -5,7 +5,13 @@ from unittest.mock import MagicMock, patch
 import pandas as pd
 from fit_tool.profile.profile_type import Sport, SubSport
 
-from scripts.export_fit import calculate_laps_from_records, construct_dataframes, validate_activity
+from scripts.export_fit import (
+    build_record_frame,
+    calculate_laps_from_records,
+    construct_dataframes,
+    parse_lap_split,
+    validate_activity,
+)
 
 
 class TestExportFit(unittest.TestCase):
@@ -55,6 +61,28 @@ class TestExportFit(unittest.TestCase):
         self.assertEqual(session.iloc[0]["sport"], Sport.RUNNING.value)
         self.assertEqual(session.iloc[0]["sub_sport"], SubSport.STREET.value)  # Should default to STREET for Run
 
+    def test_build_record_frame(self):
+        """Speed comes from pace, step length from speed and cadence; gaps become NaN"""
+        flyby_df = self.flyby_df.assign(
+            pace=[5.0, 0.0, None],
+            cadence=[180, None, 0],
+            watts=[200, None, 220],
+        )
+        records = build_record_frame(flyby_df, pd.Timestamp("2023-01-01 10:00:00"))
+
+        self.assertEqual(
+            records["timestamp"].tolist(), list(pd.date_range("2023-01-01 10:00:00", periods=3, freq="60s"))
+        )
+        self.assertAlmostEqual(records["speed"].iloc[0], 1000.0 / 60.0 / 5.0)
+        self.assertEqual(records["speed"].iloc[1:].tolist(), [0.0, 0.0])
+        self.assertAlmostEqual(records["step_length"].iloc[0], (1000.0 / 60.0 / 5.0) / 3.0)
+        self.assertTrue(records[["step_length", "cadence"]].iloc[1:].isna().all().all())
+        self.assertTrue(pd.isna(records["power"].iloc[1]))
+
+        stationary = build_record_frame(flyby_df, pd.Timestamp("2023-01-01 10:00:00"), stationary=True)
+        self.assertTrue(stationary[["position_lat", "distance", "speed", "step_length"]].isna().all().all())
+        self.assertEqual(stationary["heart_rate"].tolist(), [140.0, 150.0, 160.0])
+
     def test_construct_dataframes_subsport_mapping(self):
         """Test if different activity types map to correct SubSports"""
 
@@ -111,6 +139,35 @@ class TestExportFit(unittest.TestCase):
         self.assertEqual(len(laps), 1)
         self.assertEqual(laps.iloc[0]["total_distance"], 1100.0)
 
+    def test_parse_lap_split(self):
+        self.assertEqual(parse_lap_split("1km"), ("distance", 1000.0))
+        self.assertEqual(parse_lap_split("1mi"), ("distance", 1609.344))
+        self.assertEqual(parse_lap_split("400m"), ("distance", 400.0))
+        self.assertEqual(parse_lap_split("5min"), ("time", 300.0))
+        for invalid in ("", "0km", "fast", "1 lap"):
+            with self.assertRaises(ValueError):
+                parse_lap_split(invalid)
+
+    def test_laps_by_mile_and_time(self):
+        """Laps close at the first record past each split; the remainder becomes a final lap."""
+        fit_record = pd.DataFrame(
+            {
+                "timestamp": pd.date_range("2023-01-01 10:00:00", periods=11, freq="60s"),
+                "distance": [i * 400.0 for i in range(11)],
+                "heart_rate": [140, 150, 150, 150, 150, 160, 160, 160, 160, 170, 170],
+            }
+        )
+        start_date = datetime.datetime(2023, 1, 1, 10, 0, 0)
+
+        miles = calculate_laps_from_records(fit_record, 1, start_date, split="1mi")
+        self.assertEqual(miles["total_distance"].tolist(), [2000.0, 2000.0])
+        self.assertEqual(miles["avg_heart_rate"].tolist(), [152, 164])
+        self.assertEqual(miles["avg_speed"].tolist(), [2000.0 / 300, 2000.0 / 300])
+
+        minutes = calculate_laps_from_records(fit_record, 1, start_date, split="4min")
+        self.assertEqual(minutes["total_elapsed_time"].tolist(), [240.0, 240.0, 120.0])
+        self.assertEqual(minutes["start_time"].tolist(), list(fit_record["timestamp"].iloc[[0, 4, 8]]))
+
     @patch("scripts.export_fit.duckdb.connect")
     def test_validate_activity_found(self, mock_connect):
         """Test validate_activity when ID exists"""
@@ -0,0 +1,114 @@
+"""Tests for generator/fit_encoder.py module."""
+
+import numpy as np
+import pandas as pd
+import pytest
+from fit_tool.exceptions import FitEncodingError
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.event_message import EventMessage
+from fit_tool.profile.messages.record_message import RecordMessage
+from fit_tool.utils.crc import crc16
+
+
+def _records(size=300, seed=0):
+    rng = np.random.default_rng(seed)
+    records = pd.DataFrame(
+        {
+            "timestamp": pd.Timestamp("2024-01-01 07:00:00") + pd.to_timedelta(np.arange(size) * 1.5, unit="s"),
+            "position_lat": 39.9 + rng.normal(0, 0.01, size),
+            "position_long": 116.4 + rng.normal(0, 0.01, size),
+            "distance": np.arange(size) * 3.3,
+            "altitude": rng.normal(50, 20, size),
+            "speed": rng.uniform(0, 5, size),
+            "heart_rate": rng.integers(90, 190, size).astype("float64"),
+            "cadence": rng.uniform(150, 190, size),
+            "power": np.nan,
+            "step_length": rng.uniform(0.5, 1.5, size),
+        }
+    )
+    # Gaps change the set of fields, and so the definition, in the middle of the track.
+    records.loc[rng.random(size) < 0.05, "heart_rate"] = np.nan
+    records.loc[100:120, ["position_lat", "position_long"]] = np.nan
+    return records
+
+
+def _add_fit_tool_records(builder, records):
+    """One fit_tool RecordMessage per row, with the same fields as encode_record_messages."""
+    for row in records.itertuples(index=False):
+        msg = RecordMessage()
+        msg.timestamp = round(row.timestamp.timestamp() * 1000)
+        for name in ("position_lat", "position_long", "distance", "altitude", "speed"):
+            if pd.notna(getattr(row, name)):
+                setattr(msg, name, getattr(row, name))
+        for name in ("heart_rate", "cadence", "power"):
+            if pd.notna(getattr(row, name)):
+                setattr(msg, name, int(getattr(row, name)))
+        if pd.notna(row.step_length):
+            msg.step_length = float(row.step_length * 1000)
+        builder.add(msg)
+
+
+def _event(timestamp_ms):
+    msg = EventMessage()
+    msg.timestamp = timestamp_ms
+    msg.data = 0
+    return msg
+
+
+class TestEncodeRecordMessages:
+    """Test cases for encode_record_messages function."""
+
+    def test_matches_fit_tool_byte_for_byte(self):
+        from scripts.generator.fit_encoder import encode_record_messages
+
+        records = _records()
+        builder = FitFileBuilder(auto_define=True)
+        _add_fit_tool_records(builder, records)
+
+        assert encode_record_messages(records) == b"".join(record.to_bytes() for record in builder.records)
+
+    def test_missing_columns_and_empty_frames(self):
+        from scripts.generator.fit_encoder import encode_record_messages
+
+        records = _records(size=20).drop(columns=["power", "step_length"])
+        builder = FitFileBuilder(auto_define=True)
+        _add_fit_tool_records(builder, records.assign(power=np.nan, step_length=np.nan))
+
+        assert encode_record_messages(records) == b"".join(record.to_bytes() for record in builder.records)
+        assert encode_record_messages(records.iloc[:0]) == b""
+        assert encode_record_messages(None) == b""
+
+    def test_out_of_range_value_raises(self):
+        from scripts.generator.fit_encoder import encode_record_messages
+
+        with pytest.raises(FitEncodingError, match="heart_rate"):
+            encode_record_messages(_records(size=5).assign(heart_rate=300.0))
+
+
+class TestFitFile:
+    """Test cases for the FIT CRC and appending encoded records to a fit_tool file."""
+
+    def test_crc_matches_fit_tool(self):
+        from scripts.generator.fit_encoder import fit_crc16
+
+        data = np.random.default_rng(0).integers(0, 256, 1001, dtype=np.uint8).tobytes()
+        assert fit_crc16(data) == crc16(data)
+        assert fit_crc16(data[501:], fit_crc16(data[:501])) == crc16(data)
+
+    def test_appended_records_match_fit_tool_file(self):
+        from scripts.generator.fit_encoder import append_fit_data, encode_record_messages
+
+        records = _records(size=50)
+        builder = FitFileBuilder(auto_define=True)
+        builder.add(_event(1704092400000))
+        _add_fit_tool_records(builder, records)
+        builder.add(_event(1704092500000))
+        expected = builder.build().to_bytes()
+
+        head = FitFileBuilder(auto_define=True)
+        head.add(_event(1704092400000))
+        tail = FitFileBuilder(auto_define=True)
+        tail.add(_event(1704092500000))
+        tail_bytes = b"".join(record.to_bytes() for record in tail.records)
+
+        assert append_fit_data(head.build().to_bytes(), encode_record_messages(records) + tail_bytes) == expected
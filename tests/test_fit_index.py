@@ -0,0 +1,81 @@
+"""Tests for fit_index.py module."""
+
+import os
+from datetime import datetime, timezone
+from unittest.mock import patch
+
+CREATED = datetime(2024, 3, 1, 6, 30, 15, tzinfo=timezone.utc)
+
+
+def _write_fit(path, time_created, records=3):
+    from fit_tool.fit_file_builder import FitFileBuilder
+    from fit_tool.profile.messages.file_id_message import FileIdMessage
+    from fit_tool.profile.messages.record_message import RecordMessage
+    from fit_tool.profile.profile_type import FileType
+
+    builder = FitFileBuilder(auto_define=True)
+    file_id = FileIdMessage()
+    file_id.type = FileType.ACTIVITY
+    file_id.manufacturer = 1
+    file_id.time_created = int(time_created.timestamp() * 1000)
+    builder.add(file_id)
+    for second in range(records):
+        record = RecordMessage()
+        record.timestamp = int(time_created.timestamp() * 1000) + second * 1000
+        record.heart_rate = 120
+        builder.add(record)
+    path.write_bytes(builder.build().to_bytes())
+
+
+class TestReadFitTimeCreated:
+    """Test cases for read_fit_time_created function."""
+
+    def test_matches_garmin_fit_sdk(self, temp_dir):
+        from garmin_fit_sdk import Decoder, Stream
+
+        from scripts.fit_index import read_fit_time_created
+
+        _write_fit(temp_dir / "a.fit", CREATED)
+        messages, _ = Decoder(Stream.from_file(str(temp_dir / "a.fit"))).read()
+
+        expected = messages["file_id_mesgs"][0]["time_created"].replace(tzinfo=timezone.utc)
+        assert read_fit_time_created(temp_dir / "a.fit") == expected == CREATED
+
+    def test_rejects_other_files(self, temp_dir):
+        import pytest
+
+        from scripts.fit_index import read_fit_time_created
+
+        (temp_dir / "a.fit").write_bytes(b"<gpx></gpx>\n" * 4)
+        with pytest.raises(ValueError, match="not a FIT file"):
+            read_fit_time_created(temp_dir / "a.fit")
+
+
+class TestIterFitFiles:
+    """Test cases for iter_fit_files function."""
+
+    def test_newest_first_and_reuses_index(self, temp_dir):
+        from scripts.fit_index import iter_fit_files, load_fit_index
+
+        folder = temp_dir / "fit"
+        folder.mkdir()
+        index_file = temp_dir / "fit_index.json"
+        for name, day in (("b.fit", 3), ("c.FIT", 1), ("a.fit", 2)):
+            _write_fit(folder / name, CREATED.replace(day=day))
+        (folder / "broken.fit").write_bytes(b"not a fit file")
+        (folder / "notes.txt").write_text("ignored")
+
+        files = list(iter_fit_files(folder, index_file))
+        assert [os.path.basename(f.path) for f in files] == ["b.fit", "a.fit", "c.FIT"]
+        assert files[0].time_created == CREATED.replace(day=3)
+        assert set(load_fit_index(index_file)) == {"a.fit", "b.fit", "c.FIT", "broken.fit"}
+
+        _write_fit(folder / "d.fit", CREATED.replace(day=5))
+        (folder / "c.FIT").unlink()
+        with patch("scripts.fit_index.read_fit_time_created") as reader:
+            reader.return_value = CREATED.replace(day=5)
+            files = list(iter_fit_files(folder, index_file))
+
+        reader.assert_called_once_with(str(folder / "d.fit"))
+        assert [os.path.basename(f.path) for f in files] == ["d.fit", "b.fit", "a.fit"]
+        assert "c.FIT" not in load_fit_index(index_file)
@@ -0,0 +1,97 @@
+"""Tests for garmin_device_adaptor.py module."""
+
+from unittest.mock import patch
+
+from fit_tool.fit_file import FitFile
+from fit_tool.fit_file_builder import FitFileBuilder
+from fit_tool.profile.messages.device_info_message import DeviceInfoMessage
+from fit_tool.profile.messages.file_id_message import FileIdMessage
+from fit_tool.profile.messages.record_message import RecordMessage
+
+HEART_RATES = [None, None, 120, 255, None, 130, 140, None]
+
+
+def _fit_file():
+    builder = FitFileBuilder(auto_define=True)
+    file_id = FileIdMessage()
+    file_id.type = 4
+    file_id.manufacturer = 255
+    builder.add(file_id)
+
+    device_info = DeviceInfoMessage()
+    device_info.manufacturer = 255
+    device_info.serial_number = 42
+    builder.add(device_info)
+
+    for offset, heart_rate in enumerate(HEART_RATES):
+        record = RecordMessage()
+        record.timestamp = 1704092400000 + offset * 1000
+        record.distance = offset * 3.0
+        if heart_rate is not None:
+            record.heart_rate = heart_rate
+        builder.add(record)
+    return builder.build().to_bytes()
+
+
+def _data_messages(file_content):
+    return [record.message for record in FitFile.from_bytes(file_content).records if not record.is_definition]
+
+
+class TestGetProcessedHeartRateMessage:
+    """Test cases for get_processed_heart_rate_message function."""
+
+    def test_gaps_take_the_next_valid_sample_then_the_previous_one(self):
+        from scripts.garmin_device_adaptor import get_processed_heart_rate_message
+
+        messages = []
+        for heart_rate in HEART_RATES:
+            message = RecordMessage()
+            if heart_rate is not None:
+                message.heart_rate = heart_rate
+            messages.append(message)
+
+        processed = get_processed_heart_rate_message(messages)
+
+        assert [message.heart_rate for message in processed] == [120, 120, 120, 130, 130, 130, 140, 140]
+        assert processed[2] is messages[2]
+
+    def test_no_valid_sample_leaves_messages_unchanged(self):
+        from scripts.garmin_device_adaptor import get_processed_heart_rate_message
+
+        messages = [RecordMessage(), RecordMessage()]
+        assert get_processed_heart_rate_message(messages) == messages
+
+
+class TestRewriteFit:
+    """Test cases for rewrite_fit and its transforms."""
+
+    def test_transforms_are_applied_in_one_decode(self):
+        from scripts.garmin_device_adaptor import (
+            GARMIN_DEVICE_SERIAL_NUMBER,
+            fill_heart_rate,
+            replace_device_info,
+            rewrite_fit,
+        )
+
+        with patch("scripts.garmin_device_adaptor.FitFile.from_bytes", wraps=FitFile.from_bytes) as from_bytes:
+            rewritten = rewrite_fit(_fit_file(), replace_device_info, fill_heart_rate)
+        from_bytes.assert_called_once()
+
+        messages = _data_messages(rewritten)
+        device_infos = [message for message in messages if isinstance(message, DeviceInfoMessage)]
+        assert [message.serial_number for message in device_infos] == [GARMIN_DEVICE_SERIAL_NUMBER]
+
+        records = [message for message in messages if isinstance(message, RecordMessage)]
+        assert [message.heart_rate for message in records] == [120, 120, 120, 130, 130, 130, 140, 140]
+        assert [message.distance for message in records] == [offset * 3.0 for offset in range(len(HEART_RATES))]
+        assert isinstance(messages[0], FileIdMessage)
+
+    def test_single_transform_helpers(self):
+        from scripts.garmin_device_adaptor import add_fake_device_info, fix_heart_rate
+
+        with_device = _data_messages(add_fake_device_info(_fit_file()))
+        assert isinstance(with_device[-1], DeviceInfoMessage)
+        assert sum(isinstance(message, DeviceInfoMessage) for message in with_device) == 1
+
+        fixed = _data_messages(fix_heart_rate(_fit_file()))
+        assert [message.heart_rate for message in fixed if isinstance(message, RecordMessage)][:2] == [120, 120]
@@ -4,6 +4,7 @@ from unittest.mock import patch
 
 import duckdb
 import pandas as pd
+import pytest
 
 
 class TestDatabaseSchemas:
@@ -420,3 +421,610 @@ class TestGeocoding:
         from scripts.generator.db import _geocode_cache
 
         assert isinstance(_geocode_cache, dict)
+
+    @staticmethod
+    def _activity(run_id, lat, lon):
+        from types import SimpleNamespace
+
+        return SimpleNamespace(
+            id=run_id,
+            name=f"Run {run_id}",
+            distance=5000.0,
+            moving_time=pd.Timedelta(minutes=25),
+            elapsed_time=pd.Timedelta(minutes=26),
+            type="Run",
+            start_date=pd.Timestamp("2024-01-01 08:00"),
+            start_date_local=pd.Timestamp("2024-01-01 16:00"),
+            location_country="",
+            map=None,
+            average_heartrate=150.0,
+            average_speed=3.3,
+            total_elevation_gain=10.0,
+            start_latlng=SimpleNamespace(lat=lat, lon=lon) if lat is not None else None,
+        )
+
+    @pytest.fixture
+    def geocoding_db(self, temp_dir, monkeypatch):
+        from scripts.generator import db
+
+        monkeypatch.setattr(db, "_geocode_cache", {})
+        monkeypatch.setattr(db, "_geocode_stats", {"hits": 0, "misses": 0, "offline": 0, "lookups": 0})
+        con = db.init_db(str(temp_dir / "test.duckdb"))
+        yield con
+        con.close()
+
+    def test_nearby_points_share_a_cell(self):
+        from scripts.generator.db import geocode_cell_id
+
+        assert geocode_cell_id(39.9042, 116.4074) == geocode_cell_id(39.9043, 116.4075)
+        assert geocode_cell_id(39.9042, 116.4074) != geocode_cell_id(31.2304, 121.4737)
+
+    def test_lookups_are_persisted_and_reused(self, geocoding_db, monkeypatch):
+        """A second run resolves cached cells from DuckDB without calling Nominatim."""
+        from scripts.generator import db
+
+        # Behave like a border cell the offline index cannot resolve.
+        monkeypatch.setattr(db, "lookup_countries", lambda lats, lons: [None] * len(lats))
+
+        activities = [self._activity(1, 39.9042, 116.4074), self._activity(2, 39.9043, 116.4075)]
+        with patch.object(db, "_get_location_country", return_value="中国") as geocode:
+            df = db.get_dataframe_from_strava_activities(activities, geocoding_db)
+        assert geocode.call_count == 1
+        assert df["location_country"].tolist() == ["中国", "中国"]
+        assert "start_lat" not in df.columns
+
+        monkeypatch.setattr(db, "_geocode_cache", {})
+        with patch.object(db, "_get_location_country") as geocode:
+            df = db.get_dataframe_from_strava_activities(activities, geocoding_db)
+        geocode.assert_not_called()
+        assert df["location_country"].tolist() == ["中国", "中国"]
+        assert geocoding_db.execute("SELECT hits FROM geocode_cache").fetchall() == [(1,)]
+        assert db.get_geocode_cache_stats() == {"hits": 1, "misses": 1, "offline": 0, "lookups": 1}
+
+    def test_expired_entries_are_refetched(self, geocoding_db):
+        from scripts.generator import db
+
+        cell_id = db.geocode_cell_id(39.9042, 116.4074)
+        db.store_geocode_cache(geocoding_db, {cell_id: "中国"})
+        geocoding_db.execute("UPDATE geocode_cache SET updated_at = NOW() - INTERVAL 400 DAY")
+
+        assert db.lookup_geocode_cache(geocoding_db, [cell_id]) == {}
+
+    def test_offline_mode_never_calls_geocoder(self, geocoding_db, monkeypatch):
+        from scripts.generator import db
+
+        monkeypatch.setattr(db, "GEOCODE_OFFLINE", True)
+        monkeypatch.setattr(db, "lookup_countries", lambda lats, lons: [None] * len(lats))
+        db.store_geocode_cache(geocoding_db, {db.geocode_cell_id(39.9042, 116.4074): "中国"})
+        activities = [
+            self._activity(1, 39.9042, 116.4074),
+            self._activity(2, 48.8566, 2.3522),
+            self._activity(3, None, None),
+        ]
+
+        with patch.object(db, "get_geocoder") as geocoder:
+            df = db.get_dataframe_from_strava_activities(activities, geocoding_db)
+        geocoder.assert_not_called()
+        assert df["location_country"].tolist() == ["中国", "", ""]
+
+    def test_offline_index_resolves_without_network(self, geocoding_db):
+        from scripts.generator import db
+
+        activities = [self._activity(1, 39.9042, 116.4074), self._activity(2, 48.8566, 2.3522)]
+
+        with patch.object(db, "get_geocoder") as geocoder:
+            df = db.get_dataframe_from_strava_activities(activities, geocoding_db)
+        geocoder.assert_not_called()
+        assert df["location_country"].tolist() == ["中国", "法国"]
+        assert db.get_geocode_cache_stats()["offline"] == 2
+        # Offline results are not persisted, the index is always available.
+        assert geocoding_db.execute("SELECT COUNT(*) FROM geocode_cache").fetchone()[0] == 0
+
+
+class TestFilterPolylines:
+    """Test cases for the persistent polyline filter cache."""
+
+    def test_results_are_cached_per_settings(self, temp_dir, monkeypatch):
+        import polyline
+
+        from scripts import polyline_processor
+        from scripts.generator.db import filter_polylines, init_db
+
+        monkeypatch.setattr(polyline_processor, "IGNORE_START_END_RANGE", 0.0)
+        polyline_processor._filter_out.cache_clear()
+        encoded = polyline.encode([(39.90 + i * 0.001, 116.40) for i in range(10)])
+        con = init_db(str(temp_dir / "test.duckdb"))
+
+        first = filter_polylines(con, [encoded, None, encoded, ""])
+        assert first[1:] == [None, first[0], None]
+        assert con.execute("SELECT COUNT(*) FROM polyline_filter_cache").fetchone()[0] == 1
+
+        with patch("scripts.generator.db.filter_out") as filter_out:
+            assert filter_polylines(con, [encoded]) == [first[0]]
+        filter_out.assert_not_called()
+
+        # New settings miss the cache and replace the stale rows.
+        monkeypatch.setattr(polyline_processor, "IGNORE_START_END_RANGE", 0.5)
+        polyline_processor._filter_out.cache_clear()
+        second = filter_polylines(con, [encoded])
+        assert second != [first[0]]
+        assert con.execute("SELECT COUNT(*) FROM polyline_filter_cache").fetchone()[0] == 1
+        polyline_processor._filter_out.cache_clear()
+        con.close()
+
+
+class TestConnectionManager:
+    """Test cases for the process-wide DuckDB connection pool."""
+
+    def test_database_is_opened_once_and_reopened_writable(self, temp_dir):
+        from scripts.generator.db import ConnectionManager
+
+        db_path = temp_dir / "pool.duckdb"
+        duckdb.connect(str(db_path)).execute("CREATE TABLE t AS SELECT 1 AS x").close()
+        manager = ConnectionManager()
+
+        for _ in range(3):
+            cursor = manager.cursor(db_path, read_only=True)
+            assert cursor.execute("SELECT x FROM t").fetchone() == (1,)
+            cursor.close()
+        assert manager.stats["opens"] == 1
+        assert manager.stats["cursors"] == 3
+
+        cursor = manager.cursor(db_path)
+        cursor.execute("INSERT INTO t VALUES (2)")
+        cursor.close()
+        assert manager.cursor(db_path, read_only=True).execute("SELECT COUNT(*) FROM t").fetchone() == (2,)
+        assert (manager.stats["opens"], manager.stats["reopens"]) == (2, 1)
+        manager.close()
+
+    def test_encryption_key_is_resolved_once(self, temp_dir):
+        from scripts.generator.db import close_db_connections, get_db_connection
+
+        close_db_connections()
+        with patch("scripts.generator.db.load_env_config", return_value={}) as load_env_config:
+            get_db_connection(temp_dir / "a.duckdb").close()
+            get_db_connection(temp_dir / "b.duckdb").close()
+        load_env_config.assert_called_once()
+
+
+class TestActivityStreaks:
+    """Test cases for the materialized activity_streaks table."""
+
+    @staticmethod
+    def _streaks(con, scope="all"):
+        return con.execute(
+            "SELECT run_id, streak FROM activity_streaks WHERE scope = ? ORDER BY pos", [scope]
+        ).fetchall()
+
+    def test_refresh_recomputes_only_the_changed_tail(self, temp_dir):
+        from scripts.generator.db import init_db, refresh_activity_streaks
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        days = {1: "01", 2: "02", 3: "03", 5: "05", 6: "06", 7: "07"}
+        for run_id, day in days.items():
+            con.execute(
+                "INSERT INTO activities (run_id, type, start_date_local) VALUES (?, ?, ?)",
+                [run_id, "Run" if run_id != 2 else "Ride", f"2024-01-{day} 07:00:00"],
+            )
+
+        assert refresh_activity_streaks(con) == 6
+        assert self._streaks(con) == [(1, 1), (2, 2), (3, 3), (5, 1), (6, 2), (7, 3)]
+        assert refresh_activity_streaks(con) == 0
+
+        # An appended activity only recomputes the streak it belongs to.
+        con.execute("INSERT INTO activities (run_id, type, start_date_local) VALUES (8, 'Run', '2024-01-09 07:00:00')")
+        assert refresh_activity_streaks(con) == 4
+        assert self._streaks(con)[3:] == [(5, 1), (6, 2), (7, 3), (8, 1)]
+
+        # A backfilled day joins two streaks.
+        con.execute("INSERT INTO activities (run_id, type, start_date_local) VALUES (4, 'Run', '2024-01-04 07:00:00')")
+        assert refresh_activity_streaks(con) == 8
+        assert self._streaks(con) == [(1, 1), (2, 2), (3, 3), (4, 4), (5, 5), (6, 6), (7, 7), (8, 1)]
+
+        # Scopes are materialized independently.
+        refresh_activity_streaks(con, only_run=True)
+        assert self._streaks(con, "run") == [(1, 1), (3, 1), (4, 2), (5, 3), (6, 4), (7, 5), (8, 1)]
+
+        con.execute("DELETE FROM activities WHERE run_id = 8")
+        assert refresh_activity_streaks(con) == 7
+        assert self._streaks(con)[-1] == (7, 7)
+        con.close()
+
+
+class TestExportManifest:
+    """Test cases for activity source hashes and the export_manifest table."""
+
+    def test_source_hash_follows_activity_and_flyby_rows(self, temp_dir):
+        from scripts.generator.db import get_activity_fingerprints, init_db, refresh_activity_fingerprints
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        for run_id in (1, 2):
+            con.execute("INSERT INTO activities (run_id, name, distance) VALUES (?, 'Run', 1000.0)", [run_id])
+        con.execute("INSERT INTO activities_flyby (activity_id, time_offset, hr) VALUES (1, 0, 150), (1, 10, 151)")
+
+        before = get_activity_fingerprints(con, [1, 2, 3])
+        assert sorted(before) == [1, 2]
+        assert get_activity_fingerprints(con, [1, 2]) == before
+        assert get_activity_fingerprints(con, [1]) == {1: before[1]}
+        assert get_activity_fingerprints(con, []) == {}
+
+        con.execute("UPDATE activities_flyby SET hr = 160 WHERE activity_id = 1 AND time_offset = 10")
+        con.execute("UPDATE activities SET name = 'Renamed' WHERE run_id = 2")
+        assert get_activity_fingerprints(con, [1, 2]) == before
+        assert refresh_activity_fingerprints(con, [1, 2]) == 2
+        after = get_activity_fingerprints(con, [1, 2])
+        assert after[1] != before[1]
+        assert after[2] != before[2]
+
+    def test_recorded_export_is_current_until_the_file_changes(self, temp_dir):
+        from scripts.generator.db import get_export_manifest, init_db, is_export_current, record_exports
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        output = temp_dir / "1.gpx"
+        output.write_text("<gpx/>")
+        stat = output.stat()
+        export = {
+            "output_path": str(output),
+            "activity_id": 1,
+            "format": "gpx",
+            "settings_hash": "settings",
+            "source_hash": "source",
+            "output_sha256": "sha",
+            "output_size": stat.st_size,
+            "output_mtime_ns": stat.st_mtime_ns,
+        }
+        assert record_exports(con, [export, {**export, "output_path": str(temp_dir / "2.gpx")}]) == 2
+        assert record_exports(con, [{**export, "source_hash": "old"}, export]) == 1
+        assert con.execute("SELECT COUNT(*) FROM export_manifest").fetchone() == (2,)
+
+        entry = get_export_manifest(con, [str(output)])[str(output)]
+        assert is_export_current(entry, "settings", "source", output)
+        assert not is_export_current(entry, "settings", "changed", output)
+        assert not is_export_current(entry, "other", "source", output)
+        output.write_text("<gpx></gpx>")
+        assert not is_export_current(entry, "settings", "source", output)
+
+
+class TestActivityFingerprints:
+    """Test cases for the activity fingerprints shared by exports and the Garmin sync."""
+
+    @staticmethod
+    def _flyby_df(activity_id, hr):
+        return pd.DataFrame(
+            {
+                "activity_id": [activity_id] * 2,
+                "time_offset": [0, 10],
+                "lat": [39.9, 39.91],
+                "lng": [116.4, 116.41],
+                "alt": [50, 51],
+                "pace": [5.0, 5.0],
+                "hr": [150, hr],
+                "distance": [0.0, 30.0],
+                "cadence": [None, None],
+                "watts": [None, None],
+            }
+        )
+
+    def test_fingerprints_follow_writes(self, temp_dir):
+        from scripts.generator.db import (
+            get_activity_fingerprints,
+            init_db,
+            prune_activities_not_in_remote_ids,
+            store_flyby_data,
+            update_or_create_activities,
+        )
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        activities_df = pd.DataFrame(
+            {
+                "run_id": [1, 2],
+                "name": ["Run 1", "Run 2"],
+                "distance": [5000.0, 10000.0],
+                "moving_time": [1800, 3600],
+                "elapsed_time": [1850, 3700],
+                "type": ["Run", "Run"],
+                "subtype": [None, None],
+                "start_date": pd.to_datetime(["2024-01-15", "2024-01-16"]),
+                "start_date_local": pd.to_datetime(["2024-01-15", "2024-01-16"]),
+                "location_country": [None, None],
+                "summary_polyline": [None, None],
+                "average_heartrate": [145.0, 150.0],
+                "average_speed": [2.78, 2.78],
+                "elevation_gain": [50.0, 100.0],
+            }
+        )
+        update_or_create_activities(con, activities_df)
+        store_flyby_data(con, self._flyby_df(1, 151))
+
+        before = get_activity_fingerprints(con)
+        assert sorted(before) == [1, 2]
+        assert before[1][0] == 2
+        assert before[2][0] == 0
+
+        store_flyby_data(con, self._flyby_df(1, 160))
+        activities_df.loc[1, "distance"] = 10001.0
+        update_or_create_activities(con, activities_df)
+        after = get_activity_fingerprints(con)
+        assert after[1][1] != before[1][1]
+        assert after[2][1] != before[2][1]
+
+        prune_activities_not_in_remote_ids(con, {1})
+        assert sorted(get_activity_fingerprints(con)) == [1]
+        assert con.execute("SELECT COUNT(*) FROM activity_fingerprints").fetchone() == (1,)
+
+    def test_missing_rows_are_backfilled(self, temp_dir):
+        from scripts.generator.db import get_activity_fingerprints, init_db, refresh_activity_fingerprints
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        con.execute("INSERT INTO activities (run_id, name) VALUES (1, 'A'), (2, 'B')")
+        con.execute("INSERT INTO activities_flyby (activity_id, time_offset, hr) VALUES (1, 0, 150)")
+
+        assert get_activity_fingerprints(con, [1]) == {1: (1, get_activity_fingerprints(con)[1][1])}
+        assert con.execute("SELECT COUNT(*) FROM activity_fingerprints").fetchone() == (2,)
+        fingerprints = get_activity_fingerprints(con)
+        assert refresh_activity_fingerprints(con) == 2
+        assert get_activity_fingerprints(con) == fingerprints
+        assert refresh_activity_fingerprints(con, []) == 0
+
+    @pytest.mark.parametrize(
+        "update",
+        [
+            "UPDATE activities_flyby SET pace = 6.5 WHERE time_offset = 10",
+            "UPDATE activities_flyby SET watts = 250 WHERE time_offset = 10",
+            "UPDATE activities_flyby SET time_offset = 20 WHERE time_offset = 10",
+            "UPDATE activities SET name = 'Renamed'",
+        ],
+    )
+    def test_fingerprint_covers_exported_columns(self, temp_dir, update):
+        from scripts.generator.db import get_activity_fingerprints, init_db, refresh_activity_fingerprints
+
+        con = init_db(str(temp_dir / "test.duckdb"))
+        con.execute("INSERT INTO activities (run_id, name) VALUES (1, 'A')")
+        con.execute("INSERT INTO activities_flyby (activity_id, time_offset, pace) VALUES (1, 0, 5.0), (1, 10, 5.0)")
+
+        before = get_activity_fingerprints(con)
+        assert get_activity_fingerprints(con) == before
+        con.execute(update)
+        refresh_activity_fingerprints(con, [1])
+        assert get_activity_fingerprints(con)[1] != before[1]
+        con.close()
+
+
+class TestConvertStreamsToFlybyDataframe:
+    """Test cases for convert_streams_to_flyby_dataframe."""
+
+    @staticmethod
+    def _streams(**streams):
+        from types import SimpleNamespace
+
+        return {name: SimpleNamespace(data=data) for name, data in streams.items()}
+
+    def test_converts_and_aligns_streams(self):
+        """Streams are rounded, truncated and padded to the time stream."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+        streams = self._streams(
+            time=[0, 1, 2, 3],
+            latlng=[[39.90421234, 116.40741234], [39.9050, 116.4080], [39.9060, 116.4090], [39.9070, 116.4100]],
+            altitude=[10.9, -1.5, None, 12.0],
+            velocity_smooth=[3.0, 0.0, 0.1, 3.333333],
+            heartrate=[140, 300, None],
+            distance=[0.0, 2.7, 5.9, 8.2, 11.0],
+            cadence=[80],
+        )
+
+        df = convert_streams_to_flyby_dataframe(SimpleNamespace(id=42), streams)
+
+        assert list(df.columns) == [
+            "activity_id",
+            "time_offset",
+            "lat",
+            "lng",
+            "alt",
+            "pace",
+            "hr",
+            "distance",
+            "cadence",
+            "watts",
+        ]
+        assert df["activity_id"].dtype == "int64"
+        assert df["time_offset"].dtype == "int32"
+        assert df["lat"].tolist()[0] == 39.904212
+        assert df["alt"].tolist() == [10, -1, pd.NA, 12]
+        assert df["pace"].tolist() == [0.0, 0.0, 0.0, 5.0]
+        assert df["hr"].tolist() == [140, pd.NA, pd.NA, pd.NA]
+        assert df["distance"].tolist() == [0, 2, 5, 8]
+        assert df["cadence"].tolist() == [80, pd.NA, pd.NA, pd.NA]
+        assert df["watts"].isna().all()
+
+    def test_truncates_to_shorter_latlng_stream(self):
+        """Mismatched time/latlng lengths are truncated to the shorter one."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+        streams = self._streams(time=[0, 1, 2], latlng=[[1.0, 2.0], [1.1, 2.1]], heartrate=[100, 101, 102])
+
+        df = convert_streams_to_flyby_dataframe(SimpleNamespace(id=1), streams)
+
+        assert df["time_offset"].tolist() == [0, 1]
+        assert df["hr"].tolist() == [100, 101]
+
+    def test_indoor_activity_has_no_coordinates(self):
+        """Activities without latlng keep empty coordinates."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+        df = convert_streams_to_flyby_dataframe(SimpleNamespace(id=1), self._streams(time=[0, 5]))
+
+        assert len(df) == 2
+        assert df["lat"].isna().all()
+        assert df["lng"].isna().all()
+
+    def test_does_not_mutate_streams(self):
+        """Short streams are padded in the frame only, not on the stream objects."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+        streams = self._streams(time=[0, 1, 2], heartrate=[120])
+
+        convert_streams_to_flyby_dataframe(SimpleNamespace(id=1), streams)
+
+        assert streams["heartrate"].data == [120]
+
+    def test_pace_rounding_matches_python_round(self):
+        """Pace is rounded exactly like round(pace, 2), including ties."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe
+
+        velocities = [(1000.0 / 60.0) / p for p in (5.125, 4.005, 6.675, 2.345, 3.3333333, 29.999)]
+        time_offsets = list(range(1, len(velocities) + 1))
+
+        df = convert_streams_to_flyby_dataframe(
+            SimpleNamespace(id=1), self._streams(time=time_offsets, velocity_smooth=velocities)
+        )
+
+        expected = [round((1000.0 / 60.0) / v, 2) for v in velocities]
+        assert df["pace"].tolist() == expected
+
+    def test_converted_frame_round_trips_through_store(self, temp_dir):
+        """Converted rows are stored with NULLs for missing samples."""
+        from types import SimpleNamespace
+
+        from scripts.generator.db import convert_streams_to_flyby_dataframe, init_db, store_flyby_data
+
+        con = init_db(str(temp_dir / "test_flyby.duckdb"))
+        con.execute("INSERT INTO activities (run_id, name) VALUES (7, 'A')")
+        streams = self._streams(
+            time=[0, 1],
+            latlng=[[39.9, 116.4], [39.91, 116.41]],
+            altitude=[50.2],
+            velocity_smooth=[0.0, 4.0],
+            heartrate=[150, 151],
+        )
+
+        df = convert_streams_to_flyby_dataframe(SimpleNamespace(id=7), streams)
+        assert store_flyby_data(con, df) == 2
+
+        rows = con.execute(
+            "SELECT time_offset, lat, lng, alt, pace, hr, distance FROM activities_flyby ORDER BY time_offset"
+        ).fetchall()
+        assert [(r[0], float(r[1]), float(r[2]), r[3], float(r[4]), r[5], r[6]) for r in rows] == [
+            (0, 39.9, 116.4, 50, 0.0, 150, None),
+            (1, 39.91, 116.41, None, 4.17, 151, None),
+        ]
+
+        con.close()
+
+
+class TestFlybyBatchWriter:
+    """Test cases for the batched flyby writer."""
+
+    @staticmethod
+    def _flyby_df(activity_id, points):
+        return pd.DataFrame(
+            {
+                "activity_id": [activity_id] * points,
+                "time_offset": list(range(points)),
+                "lat": [39.9] * points,
+                "lng": [116.4] * points,
+                "alt": [50] * points,
+                "pace": [5.0] * points,
+                "hr": [150] * points,
+                "distance": list(range(points)),
+                "cadence": [None] * points,
+                "watts": [None] * points,
+            }
+        )
+
+    @staticmethod
+    def _init_with_queue(temp_dir, activity_ids):
+        from scripts.generator.db import enqueue_flyby_activities, init_db
+
+        con = init_db(str(temp_dir / "test_batch.duckdb"))
+        for activity_id in activity_ids:
+            con.execute("INSERT INTO activities (run_id, name) VALUES (?, 'A')", [activity_id])
+        enqueue_flyby_activities(con, activity_ids)
+        return con
+
+    def test_flushes_rows_and_queue_on_exit(self, temp_dir):
+        """Buffered rows and queue completions are written together when the context exits."""
+        from scripts.generator.db import FlybyBatchWriter
+
+        con = self._init_with_queue(temp_dir, [1, 2, 3])
+
+        with FlybyBatchWriter(con) as writer:
+            assert writer.add(1, self._flyby_df(1, 3)) == 3
+            writer.mark_done(1)
+            writer.add(2, self._flyby_df(2, 2))
+            writer.mark_done(2)
+            assert con.execute("SELECT COUNT(*) FROM activities_flyby").fetchone()[0] == 0
+
+        assert writer.flush_count == 1
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby").fetchone()[0] == 5
+        points = con.execute("SELECT run_id, flyby_points FROM activity_fingerprints ORDER BY run_id").fetchall()
+        assert points == [(1, 3), (2, 2)]
+        queue_ids = [row[0] for row in con.execute("SELECT activity_id FROM activities_flyby_queue").fetchall()]
+        assert queue_ids == [3]
+
+        con.close()
+
+    def test_flushes_when_row_limit_reached(self, temp_dir):
+        """A flush happens at the activity boundary once the row limit is reached."""
+        from scripts.generator.db import FlybyBatchWriter
+
+        con = self._init_with_queue(temp_dir, [1, 2])
+
+        writer = FlybyBatchWriter(con, max_rows=3)
+        writer.add(1, self._flyby_df(1, 4))
+        writer.mark_done(1)
+        assert writer.flush_count == 1
+        assert writer.pending_rows == 0
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby").fetchone()[0] == 4
+
+        writer.mark_done(2)
+        assert writer.flush_count == 1
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby_queue").fetchone()[0] == 1
+
+        con.close()
+
+    def test_unflushed_batch_stays_queued_on_error(self, temp_dir):
+        """An exception inside the context discards the batch and keeps activities queued."""
+        from scripts.generator.db import FlybyBatchWriter
+
+        con = self._init_with_queue(temp_dir, [1])
+
+        with pytest.raises(RuntimeError):
+            with FlybyBatchWriter(con) as writer:
+                writer.add(1, self._flyby_df(1, 2))
+                writer.mark_done(1)
+                raise RuntimeError("crash")
+
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby").fetchone()[0] == 0
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby_queue").fetchone()[0] == 1
+
+        con.close()
+
+    def test_failed_flush_rolls_back_queue_changes(self, temp_dir):
+        """If the upsert fails nothing is committed and the queue is untouched."""
+        from scripts.exceptions import StorageError
+        from scripts.generator.db import FlybyBatchWriter
+
+        con = self._init_with_queue(temp_dir, [1])
+        writer = FlybyBatchWriter(con)
+        writer.add(1, self._flyby_df(1, 2))
+        writer.mark_done(1)
+        # Activity 99 does not exist, so the foreign key makes the upsert fail.
+        writer.add(99, self._flyby_df(99, 2))
+        with pytest.raises(StorageError):
+            writer.flush()
+
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby").fetchone()[0] == 0
+        assert con.execute("SELECT COUNT(*) FROM activities_flyby_queue").fetchone()[0] == 1
+
+        con.close()
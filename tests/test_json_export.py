@@ -0,0 +1,116 @@
+"""Tests for the incremental activities.json export."""
+
+import json
+
+import pytest
+
+from scripts.generator import Generator, init_db
+from scripts.generator.json_export import manifest_path
+from scripts.utils import ActivityJSONEncoder
+
+
+@pytest.fixture
+def generator(temp_dir):
+    gen = Generator(temp_dir / "data.duckdb")
+    gen.db_connection = init_db(gen.db_path)
+    yield gen
+    gen.db_connection.close()
+
+
+def _add(gen, run_id, start_date_local, name="Run", polyline="_p~iF~ps|U_ulLnnqC"):
+    gen.db_connection.execute(
+        """
+        INSERT INTO activities (run_id, name, type, distance, start_date_local, summary_polyline)
+        VALUES (?, ?, 'Run', 5000.0, ?, ?)
+        """,
+        [run_id, name, start_date_local, polyline],
+    )
+
+
+def _full_rebuild(gen):
+    return json.dumps(gen.load(), cls=ActivityJSONEncoder)
+
+
+def test_streaks_follow_consecutive_days(generator):
+    days = ["01 07:00", "02 07:00", "03 07:00", "03 18:00", "04 07:00", "06 07:00", None, None]
+    for run_id, day in enumerate(days, start=1):
+        _add(generator, run_id, f"2024-01-{day}:00" if day else None)
+
+    assert [a["streak"] for a in generator.load()] == [1, 2, 3, 1, 2, 1, 1, 1]
+
+
+def test_unchanged_export_reuses_everything(generator, temp_dir):
+    json_file = temp_dir / "activities.json"
+    for run_id, day in [(1, "2024-01-01"), (2, "2024-01-02"), (3, "2024-01-04")]:
+        _add(generator, run_id, f"{day} 07:00:00")
+
+    first = generator.export_activities_json(json_file)
+    content = json_file.read_text()
+    second = generator.export_activities_json(json_file)
+
+    assert first == {"mode": "full", "activities": 3, "reencoded": 3, "verified": None}
+    assert second == {"mode": "incremental", "activities": 3, "reencoded": 0, "verified": None}
+    assert json_file.read_text() == content == _full_rebuild(generator)
+    assert manifest_path(json_file).exists()
+
+
+def test_new_and_backfilled_activities_update_streak_tail(generator, temp_dir):
+    json_file = temp_dir / "activities.json"
+    for run_id, day in [(1, "2024-01-01"), (2, "2024-01-02"), (4, "2024-01-04"), (5, "2024-01-05")]:
+        _add(generator, run_id, f"{day} 07:00:00")
+    generator.export_activities_json(json_file)
+
+    # A backfilled activity joins the two streaks, a new one extends the last.
+    _add(generator, 3, "2024-01-03 07:00:00")
+    _add(generator, 6, "2024-01-06 07:00:00")
+    stats = generator.export_activities_json(json_file, verify=True)
+
+    assert stats["verified"] is True
+    assert stats["reencoded"] == 4
+    assert [a["streak"] for a in json.loads(json_file.read_text())] == [1, 2, 3, 4, 5, 6]
+
+
+def test_changed_and_deleted_rows_are_picked_up(generator, temp_dir):
+    json_file = temp_dir / "activities.json"
+    for run_id, day in [(1, "2024-01-01"), (2, "2024-01-02"), (3, "2024-01-03")]:
+        _add(generator, run_id, f"{day} 07:00:00")
+    generator.export_activities_json(json_file)
+
+    generator.db_connection.execute("UPDATE activities SET name = 'Renamed' WHERE run_id = 1")
+    generator.db_connection.execute("DELETE FROM activities WHERE run_id = 2")
+    stats = generator.export_activities_json(json_file, verify=True)
+
+    activities = json.loads(json_file.read_text())
+    assert stats["verified"] is True
+    assert [(a["run_id"], a["name"], a["streak"]) for a in activities] == [(1, "Renamed", 1), (3, "Run", 1)]
+
+
+def test_modified_json_triggers_full_rebuild(generator, temp_dir):
+    json_file = temp_dir / "activities.json"
+    _add(generator, 1, "2024-01-01 07:00:00")
+    generator.export_activities_json(json_file)
+    json_file.write_text("[]")
+
+    stats = generator.export_activities_json(json_file)
+
+    assert stats["mode"] == "full"
+    assert json_file.read_text() == _full_rebuild(generator)
+
+
+def test_only_run_change_triggers_full_rebuild(generator, temp_dir):
+    json_file = temp_dir / "activities.json"
+    _add(generator, 1, "2024-01-01 07:00:00")
+    generator.db_connection.execute(
+        """
+        INSERT INTO activities (run_id, name, type, start_date_local, summary_polyline)
+        VALUES (2, 'Ride', 'Ride', '2024-01-02', '')
+        """
+    )
+    generator.export_activities_json(json_file)
+
+    generator.only_run = True
+    stats = generator.export_activities_json(json_file, verify=True)
+
+    assert stats["mode"] == "full"
+    assert stats["verified"] is True
+    assert [a["run_id"] for a in json.loads(json_file.read_text())] == [1]
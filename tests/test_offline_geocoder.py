@@ -0,0 +1,50 @@
+"""Tests for the bundled offline country index."""
+
+import numpy as np
+import s2sphere
+
+from scripts.offline_geocoder import CountryIndex, get_country_index
+
+
+def _cell(lat, lon, level):
+    return s2sphere.CellId.from_lat_lng(s2sphere.LatLng.from_degrees(lat, lon)).parent(level)
+
+
+def test_bundled_index_resolves_common_locations():
+    index = get_country_index()
+
+    assert index is not None
+    assert index.lookup_many([39.9042, 31.2304, 35.6762, 48.8566], [116.4074, 121.4737, 139.6503, 2.3522]) == [
+        "中国",
+        "中国",
+        "日本",
+        "法国",
+    ]
+
+
+def test_open_sea_and_invalid_points_are_unresolved():
+    index = get_country_index()
+
+    assert index.lookup(0.0, -140.0) is None
+    assert index.lookup(None, None) is None
+    assert index.lookup(float("nan"), 10.0) is None
+    assert index.lookup(95.0, 10.0) is None
+
+
+def test_lookup_uses_cell_ranges(temp_dir):
+    beijing = _cell(39.9042, 116.4074, 9)
+    paris = _cell(48.8566, 2.3522, 9)
+    cells = sorted([(beijing, 0), (paris, 1)], key=lambda item: item[0].id())
+    index = CountryIndex(
+        9,
+        [cell.range_min().id() for cell, _ in cells],
+        [cell.range_max().id() for cell, _ in cells],
+        [country for _, country in cells],
+        ["中国", "法国"],
+    )
+    index.save(temp_dir / "index.npz")
+    restored = CountryIndex.load(temp_dir / "index.npz")
+
+    assert restored.level == 9
+    assert restored.range_min.dtype == np.uint64
+    assert restored.lookup_many([39.9042, 48.8566, 35.6762], [116.4074, 2.3522, 139.6503]) == ["中国", "法国", None]
@@ -238,3 +238,40 @@ class TestFilterOut:
 
             # Result should be a string (either original or filtered)
             assert result is None or isinstance(result, str)
+
+    def test_filter_out_non_string_input(self):
+        """Test that NaN (a NULL polyline read by pandas) returns None."""
+        from scripts.polyline_processor import filter_out
+
+        assert filter_out(float("nan")) is None
+
+
+class TestFilterPolyline:
+    """Test cases for the vectorized filter_polyline function."""
+
+    def test_matches_point_by_point_filtering(self):
+        """Test that the vectorized filter matches start_end_hiding followed by point-wise range checks."""
+        import polyline
+
+        from scripts.polyline_processor import filter_polyline, point_in_list_points_range
+
+        coords = [(39.9000 + i * 0.0005, 116.4000 + i * 0.0003) for i in range(200)]
+        hide_points = [(39.9300, 116.4180), (39.9500, 116.4300)]
+
+        result = polyline.decode(filter_polyline(polyline.encode(coords), hide_points, 0.3, 0.5))
+
+        # Points are re-encoded at the polyline precision of 5 decimals.
+        inner = [p for p in coords[9:-9] if not point_in_list_points_range(p, hide_points, 0.3)]
+        assert result == [(round(lat, 5), round(lng, 5)) for lat, lng in inner]
+
+    def test_bbox_prefilter_keeps_points_near_the_range_edge(self):
+        """Test that points just inside the range are hidden even far from the ignore points' centre."""
+        import numpy as np
+
+        from scripts.polyline_processor import range_hiding_mask
+
+        hide_points = np.array([[60.0, 10.0], [60.0, 10.5]])
+        # ~0.99 km east of the eastern hide point and ~1.01 km north of the western one.
+        points = np.array([[60.0, 10.5 + 0.99 / 55.6], [60.0 + 1.01 / 111.2, 10.0], [61.0, 10.0]])
+
+        assert range_hiding_mask(points, hide_points, 1.0).tolist() == [False, True, True]
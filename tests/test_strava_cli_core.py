@@ -1,7 +1,9 @@
 import asyncio
+import logging
 from datetime import datetime, timezone
 from unittest.mock import patch
 
+import pandas as pd
 import pytest
 
 from scripts.strava_cli_core.cli import _parse_range, build_parser
@@ -91,6 +93,12 @@ def test_strava_cli_parser_sync_db_prune():
     assert args.prune is True
 
 
+def test_strava_cli_parser_sync_db_verify_json():
+    parser = build_parser()
+    args = parser.parse_args(["sync", "db", "--verify-json"])
+    assert args.verify_json is True
+
+
 def test_strava_cli_parser_export():
     parser = build_parser()
     args = parser.parse_args(["export", "--format", "fit", "--id", "123", "--id-range", "100:200"])
@@ -98,6 +106,8 @@ def test_strava_cli_parser_export():
     assert args.format == "fit"
     assert args.ids == [123]
     assert args.id_range == "100:200"
+    assert args.lap_split == "1km"
+    assert parser.parse_args(["export", "--format", "fit", "--all", "--lap-split", "1mi"]).lap_split == "1mi"
 
 
 def test_strava_cli_parser_garmin_files():
@@ -118,6 +128,7 @@ def test_strava_cli_parser_sync_garmin_does_not_require_strava_credentials():
     assert args.is_cn is True
     assert args.duration_tolerance_sec == 120
     assert args.force is False
+    assert args.delta is False
     assert not hasattr(args, "client_id")
     assert not hasattr(args, "client_secret")
     assert not hasattr(args, "refresh_token")
@@ -131,6 +142,13 @@ def test_strava_cli_parser_sync_garmin_force():
     assert args.force is True
 
 
+def test_strava_cli_parser_sync_garmin_delta():
+    parser = build_parser()
+    args = parser.parse_args(["vendor", "garmin", "--secret-string", "secret", "--delta"])
+    assert args.delta is True
+    assert args.upload_concurrency == 2
+
+
 def test_strava_cli_parser_garmin_reconcile():
     parser = build_parser()
     args = parser.parse_args(["vendor", "garmin-reconcile", "--is-cn", "--secret-string", "secret"])
@@ -210,6 +228,89 @@ def test_sync_store_roundtrip(temp_dir):
         con.close()
 
 
+def test_is_sync_due_backs_off_failed_uploads():
+    from dataclasses import replace
+
+    from scripts.strava_cli_core.store import SYNC_MAX_ATTEMPTS, VendorSyncRow, is_sync_due, sync_retry_at
+
+    now = datetime(2024, 1, 1, 12)
+    row = VendorSyncRow(1, "garmin", "garmin_com", "failed", None, None, "error", 1, None, None, None)
+    assert is_sync_due(None)
+    assert is_sync_due(row, now)
+    assert not is_sync_due(replace(row, status="synced"), now)
+    assert not is_sync_due(replace(row, status="conflict"), now)
+    assert not is_sync_due(row, now, source="strava_to_garmin")
+    assert is_sync_due(replace(row, source="strava_to_garmin"), now, source="strava_to_garmin")
+    assert not is_sync_due(replace(row, next_retry_at=sync_retry_at(1, now)), now)
+    assert is_sync_due(replace(row, next_retry_at=sync_retry_at(1, now)), sync_retry_at(1, now))
+    assert not is_sync_due(replace(row, attempt_count=SYNC_MAX_ATTEMPTS), now)
+    assert sync_retry_at(3, now) - now == 4 * (sync_retry_at(1, now) - now)
+
+
+def test_load_pending_sync_activity_ids_skips_conflicts_and_backed_off_failures(temp_dir):
+    from datetime import timedelta
+
+    from scripts.generator.db import get_activity_fingerprints, init_db
+    from scripts.strava_cli_core.store import SYNC_MAX_ATTEMPTS, load_pending_sync_activity_ids
+
+    db_path = str(temp_dir / "pending.duckdb")
+    init_db(db_path).close()
+    con = ensure_vendor_sync_table(db_path)
+    con.execute("INSERT INTO activities (run_id, name) SELECT i, 'Run' FROM range(1, 9) t(i)")
+    fingerprints = get_activity_fingerprints(con)
+    now = datetime.now()
+    rows = {
+        2: {"status": "synced", "content_hash": fingerprints[2][1]},
+        3: {"status": "synced", "content_hash": "changed"},
+        4: {"status": "conflict", "content_hash": fingerprints[4][1]},
+        5: {"status": "failed", "attempt_count": 1, "next_retry_at": now + timedelta(hours=1)},
+        6: {"status": "failed", "attempt_count": 1, "next_retry_at": now - timedelta(minutes=1)},
+        7: {"status": "failed", "attempt_count": SYNC_MAX_ATTEMPTS},
+        8: {"status": "uploading"},
+    }
+    try:
+        for activity_id, fields in rows.items():
+            upsert_vendor_sync_status(con, activity_id=activity_id, vendor="garmin", account="garmin_com", **fields)
+
+        assert load_pending_sync_activity_ids(con, vendor="garmin", account="garmin_com") == [1, 3, 6, 8]
+    finally:
+        con.close()
+
+
+def test_vendor_sync_state_flushes_in_batches_and_on_error(temp_dir):
+    from scripts.strava_cli_core.store import VendorSyncState
+
+    con = ensure_vendor_sync_table(str(temp_dir / "sync.duckdb"))
+    try:
+        upsert_vendor_sync_status(
+            con, activity_id=1, vendor="garmin", account="garmin_com", status="synced", remote_activity_id=9001
+        )
+        verified_at = datetime(2026, 2, 15, 8, 0, 0, tzinfo=timezone.utc)
+
+        with pytest.raises(RuntimeError):
+            with VendorSyncState(con, vendor="garmin", account="garmin_com", flush_rows=2) as state:
+                state.update(activity_id=1, status="missing_remote", last_error="gone", attempt_count=2)
+                state.update(activity_id=2, status="pending")
+                # Two dirty rows: written back already.
+                assert load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")[2].status == "pending"
+                row = state.update(activity_id=3, status="synced", last_verified_at=verified_at)
+                assert 3 not in load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+                raise RuntimeError("interrupted")
+
+        rows = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+        assert rows == state.rows
+        assert rows[1].remote_activity_id == 9001
+        assert (rows[1].status, rows[1].attempt_count) == ("missing_remote", 2)
+        assert rows[3] == row
+        assert rows[3].last_verified_at == verified_at.astimezone().replace(tzinfo=None)
+
+        with VendorSyncState(con, vendor="garmin", account="garmin_com") as state:
+            state.clear()
+        assert load_vendor_sync_rows(con, vendor="garmin", account="garmin_com") == {}
+    finally:
+        con.close()
+
+
 def test_is_existing_in_garmin_matches_by_time_and_distance():
     activity_row = {
         "start_date": datetime(2026, 2, 15, 8, 0, 0, tzinfo=timezone.utc),
@@ -424,6 +525,36 @@ def test_is_existing_in_garmin_prefers_duration_for_boxing_type():
     assert matched == 61
 
 
+def test_garmin_matcher_assigns_one_to_one():
+    from scripts.strava_cli_core.sync_garmin import GarminMatcher
+
+    garmin_activities = [
+        {"activityId": 41, "startTimeGMT": "2026-02-15 08:01:00", "distance": 5000.0},
+        {"activityId": 40, "startTimeGMT": "2026-02-15 08:00:10", "distance": 5005.0},
+        {"activityId": 42, "startTimeGMT": "2026-02-16 08:00:00", "distance": 5000.0},
+        {"activityId": 43, "startTimeGMT": None, "distance": 5000.0},
+    ]
+    matcher = GarminMatcher(
+        garmin_activities,
+        match_window_seconds=120,
+        distance_tolerance_meters=50.0,
+        duration_tolerance_seconds=120,
+        reserved_activity_ids={42},
+    )
+    activity_row = {"start_date": datetime(2026, 2, 15, 8, 0, 0, tzinfo=timezone.utc), "distance": 5000.0}
+
+    matches = []
+    for _ in range(3):
+        matched = matcher.match(activity_row)
+        if matched is not None:
+            matcher.reserve(matched)
+        matches.append(matched)
+
+    assert matches == [40, 41, None]
+    assert matcher.match(activity_row, include_reserved=True) == 40
+    assert matcher.match({**activity_row, "start_date": "2026-02-16 08:00:00"}, include_reserved=True) == 42
+
+
 def test_extract_remote_activity_id_from_upload_result():
     payload = {
         "uploadId": "x1",
@@ -456,3 +587,352 @@ def test_fetch_garmin_activities_without_max_pages_fetches_until_empty():
     rows, calls = asyncio.run(run())
     assert [row["activityId"] for row in rows] == [1, 2]
     assert calls == [(0, 1), (1, 1), (2, 1)]
+
+
+def test_fetch_garmin_activities_since_stops_at_older_page():
+    class DummyGarmin:
+        def __init__(self):
+            self.calls = []
+
+        async def get_activities(self, start, limit):
+            self.calls.append((start, limit))
+            return [{"activityId": start, "startTimeGMT": f"2024-01-{20 - start:02d} 07:00:00"}]
+
+    client = DummyGarmin()
+    since = datetime(2024, 1, 18, 12, tzinfo=timezone.utc)
+    rows = asyncio.run(_fetch_garmin_activities(client, page_size=1, since=since))
+    assert [row["activityId"] for row in rows] == [0, 1, 2]
+    assert client.calls == [(0, 1), (1, 1), (2, 1)]
+
+
+class FakeGarmin:
+    """In-memory Garmin account for run_sync_garmin."""
+
+    activities: list[dict] = []
+    instances = 0
+    is_closed = False
+
+    def __init__(self, secret_string, auth_domain):
+        FakeGarmin.instances += 1
+        self.req = self
+
+    async def aclose(self):
+        self.is_closed = True
+
+    async def get_activities(self, start, limit):
+        newest_first = sorted(FakeGarmin.activities, key=lambda activity: activity["startTimeGMT"], reverse=True)
+        return newest_first[start : start + limit]
+
+    async def upload_fit(self, filename, file_content):
+        activity_id = int(filename.split(".")[0])
+        FakeGarmin.activities.append(
+            {
+                "activityId": 100 + activity_id,
+                "startTimeGMT": f"2024-01-0{activity_id} 07:00:00",
+                "distance": 1000.0,
+                "activityType": {"typeKey": "running"},
+            }
+        )
+        return {"activityId": 100 + activity_id}
+
+
+def test_run_sync_garmin_delta_only_touches_pending_activities(temp_dir, caplog):
+    from scripts.generator.db import get_activity_fingerprints, init_db, store_flyby_data
+    from scripts.strava_cli_core.store import load_pending_sync_activity_ids
+    from scripts.strava_cli_core.sync_garmin import run_sync_garmin_sync
+    from scripts.strava_cli_core.types import GarminCredentials, RuntimeConfig
+
+    db_path = temp_dir / "garmin.duckdb"
+    con = init_db(str(db_path))
+    for run_id in (1, 2, 3):
+        con.execute(
+            """
+            INSERT INTO activities (run_id, name, type, distance, elapsed_time, moving_time, start_date)
+            VALUES (?, 'Run', 'Run', 1000.0, 600, 600, ?)
+            """,
+            [run_id, f"2024-01-0{run_id} 07:00:00"],
+        )
+    runtime_config = RuntimeConfig(
+        sql_file=db_path, fit_dir=temp_dir / "fit", tcx_dir=temp_dir / "tcx", gpx_dir=temp_dir / "gpx"
+    )
+
+    fingerprinted = []
+
+    def spy_fingerprints(con, activity_ids=None):
+        fingerprinted.append(activity_ids)
+        return get_activity_fingerprints(con, activity_ids)
+
+    def sync(delta):
+        with (
+            patch("scripts.strava_cli_core.sync_garmin.Garmin", FakeGarmin),
+            patch("scripts.strava_cli_core.sync_garmin.Generator") as generator,
+            patch("scripts.strava_cli_core.sync_garmin.get_activity_fingerprints", spy_fingerprints),
+        ):
+            generator.return_value.build_fit_file.return_value = b""
+            run_sync_garmin_sync(
+                garmin_credentials=GarminCredentials(secret_string="secret", is_cn=False),
+                runtime_config=runtime_config,
+                use_fake_garmin_device=False,
+                fix_hr=False,
+                force=False,
+                delta=delta,
+                match_window_seconds=300,
+                distance_tolerance_meters=50.0,
+                duration_tolerance_seconds=120,
+            )
+        return init_db(str(db_path))
+
+    FakeGarmin.activities = []
+    FakeGarmin.instances = 0
+    con = sync(delta=True)
+    assert sorted(activity["activityId"] for activity in FakeGarmin.activities) == [101, 102, 103]
+
+    instances = FakeGarmin.instances
+    con = sync(delta=True)
+    assert FakeGarmin.instances == instances
+
+    # A hash from before activity_fingerprints is replaced without re-uploading.
+    con.execute("UPDATE vendor_activity_sync SET content_hash = repeat('a', 64) WHERE activity_id = 1")
+    con.close()
+    fingerprinted.clear()
+    con = sync(delta=True)
+    assert fingerprinted == [[1]]
+    assert len(FakeGarmin.activities) == 3
+    rows = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+    assert rows[1].content_hash == get_activity_fingerprints(con)[1][1]
+
+    flyby = {"activity_id": 2, "time_offset": 0, "lat": 39.9, "lng": 116.4, "alt": 50, "pace": 5.0, "hr": 150}
+    store_flyby_data(con, pd.DataFrame([{**flyby, "distance": 0.0, "cadence": None, "watts": None}]))
+    con.close()
+    fingerprinted.clear()
+    with caplog.at_level(logging.WARNING, logger="scripts.strava_cli_core.sync_garmin"):
+        con = sync(delta=True)
+    assert fingerprinted == [[2]]
+    assert len(FakeGarmin.activities) == 3
+    assert "1 activities changed locally after they were synced to garmin_com" in caplog.text
+    rows = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+    assert {row.status for row in rows.values()} == {"synced"}
+    assert rows[2].remote_activity_id == 102
+    # The change is not recorded as synced, so the next run still reports it.
+    assert rows[2].content_hash != get_activity_fingerprints(con)[2][1]
+    assert load_pending_sync_activity_ids(con, vendor="garmin", account="garmin_com") == [2]
+
+    instances = FakeGarmin.instances
+    con = sync(delta=False)
+    assert FakeGarmin.instances > instances
+    full_rows = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+    assert len(FakeGarmin.activities) == 3
+    for activity_id, row in rows.items():
+        assert full_rows[activity_id].status == row.status
+        assert full_rows[activity_id].remote_activity_id == row.remote_activity_id
+        assert full_rows[activity_id].content_hash == row.content_hash
+
+
+def _export_db(temp_dir):
+    from scripts.generator.db import init_db
+    from scripts.strava_cli_core.types import RuntimeConfig
+
+    con = init_db(str(temp_dir / "export.duckdb"))
+    for run_id in (1, 2, 3):
+        con.execute(
+            """
+            INSERT INTO activities (run_id, name, type, distance, elapsed_time, moving_time, start_date)
+            VALUES (?, ?, 'Run', 1000.0, 600, 600, '2024-01-01 07:00:00')
+            """,
+            [run_id, f"Run {run_id}"],
+        )
+        con.execute(
+            """
+            INSERT INTO activities_flyby (activity_id, time_offset, lat, lng, alt, pace, hr, distance)
+            SELECT ?, i * 10, 39.9 + i / 10000, 116.4, 50, 5.0, 150, i * 30 FROM range(20) t(i)
+            """,
+            [run_id],
+        )
+    runtime_config = RuntimeConfig(
+        sql_file=temp_dir / "export.duckdb",
+        fit_dir=temp_dir / "fit",
+        tcx_dir=temp_dir / "tcx",
+        gpx_dir=temp_dir / "gpx",
+    )
+    return con, runtime_config
+
+
+def test_run_export_skips_up_to_date_files(temp_dir):
+    from scripts.generator.db import refresh_activity_fingerprints
+    from scripts.strava_cli_core.export import run_export
+
+    con, runtime_config = _export_db(temp_dir)
+    export = dict(runtime_config=runtime_config, export_format="gpx", export_all=False, id_range=None, output_dir=None)
+
+    written = run_export(include_ids=[1, 2, 3, 4], **export)
+    assert sorted(path.name for path in written) == ["1.gpx", "2.gpx", "3.gpx"]
+    assert "<trkpt" in (temp_dir / "gpx" / "1.gpx").read_text()
+    assert run_export(include_ids=[1, 2, 3], **export) == []
+
+    con.execute("UPDATE activities_flyby SET hr = 160 WHERE activity_id = 2 AND time_offset = 50")
+    refresh_activity_fingerprints(con, [2])
+    (temp_dir / "gpx" / "3.gpx").unlink()
+    assert sorted(path.name for path in run_export(include_ids=[1, 2, 3], **export)) == ["2.gpx", "3.gpx"]
+    assert len(run_export(include_ids=[1, 2, 3], force=True, **export)) == 3
+
+
+def test_run_export_in_worker_processes_matches_serial(temp_dir):
+    from scripts.strava_cli_core.export import run_export
+
+    _, runtime_config = _export_db(temp_dir)
+    export = dict(runtime_config=runtime_config, export_format="tcx", export_all=True, include_ids=[], id_range=None)
+
+    serial = run_export(output_dir=temp_dir / "serial", **export)
+    parallel = run_export(output_dir=temp_dir / "parallel", jobs=2, batch_size=2, **export)
+    parallel, serial = sorted(parallel), sorted(serial)
+    assert [path.name for path in parallel] == [path.name for path in serial]
+    assert [path.read_bytes() for path in parallel] == [path.read_bytes() for path in serial]
+
+
+def test_run_export_gzip_compact(temp_dir):
+    import gzip
+
+    from scripts.strava_cli_core.export import run_export
+
+    _, runtime_config = _export_db(temp_dir)
+    export = dict(runtime_config=runtime_config, export_format="gpx", export_all=True, include_ids=[], id_range=None)
+
+    indented = run_export(output_dir=temp_dir / "plain", **export)
+    compressed = run_export(output_dir=temp_dir / "gz", compress=True, indent=False, **export)
+    assert sorted(path.name for path in compressed) == ["1.gpx.gz", "2.gpx.gz", "3.gpx.gz"]
+    compact = gzip.decompress((temp_dir / "gz" / "1.gpx.gz").read_bytes()).decode()
+    assert "\n" not in compact
+    assert compact.replace("><", ">\n<") == "\n".join(
+        line.strip() for line in sorted(indented)[0].read_text().splitlines()
+    )
+    assert run_export(output_dir=temp_dir / "gz", compress=True, indent=False, **export) == []
+    with pytest.raises(ValueError, match="Compressed export"):
+        run_export(output_dir=temp_dir / "fit", compress=True, **{**export, "export_format": "fit"})
+
+
+def test_upload_activities_bounds_concurrency_and_shares_backoff(temp_dir):
+    from unittest.mock import MagicMock
+
+    from scripts.garmin_sync import GarminConnectTooManyRequestsError
+    from scripts.generator.db import init_db
+    from scripts.strava_cli_core.store import VendorSyncState
+    from scripts.strava_cli_core.sync_garmin import GarminMatcher, PendingUpload, _upload_activities
+
+    init_db(str(temp_dir / "upload.duckdb"))
+    con = ensure_vendor_sync_table(str(temp_dir / "upload.duckdb"))
+    generator = MagicMock()
+    generator.build_fit_file.return_value = b"fit"
+
+    class SlowGarmin:
+        def __init__(self):
+            self.activities = []
+            self.in_flight = self.max_in_flight = self.fetches = 0
+            self.rate_limited = False
+
+        async def upload_fit(self, filename, file_content):
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            activity_id = int(filename.split(".")[0])
+            if activity_id == 3 and not self.rate_limited:
+                self.rate_limited = True
+                raise GarminConnectTooManyRequestsError("Too many requests", retry_after=0.05)
+            self.activities.append(
+                {
+                    "activityId": 100 + activity_id,
+                    "startTimeGMT": f"2024-01-{activity_id:02d} 07:00:00",
+                    "distance": 1000.0,
+                }
+            )
+            # Even activities come back without an id, like a 204 response.
+            return None if activity_id % 2 == 0 else {"activityId": 100 + activity_id}
+
+        async def get_activities(self, start, limit):
+            self.fetches += 1
+            return self.activities[::-1][start : start + limit]
+
+    for run_id in range(1, 9):
+        con.execute(
+            """
+            INSERT INTO activities (run_id, name, type, distance, elapsed_time, moving_time, start_date)
+            VALUES (?, 'Run', 'Run', 1000.0, 600, 600, ?)
+            """,
+            [run_id, f"2024-01-{run_id:02d} 07:00:00"],
+        )
+    activities_df = con.execute("SELECT * FROM activities ORDER BY run_id").fetchdf()
+    uploads = [PendingUpload(row, f"hash-{row['run_id']}", 0) for _, row in activities_df.iterrows()]
+    garmin = SlowGarmin()
+    matcher = GarminMatcher(
+        [], match_window_seconds=300, distance_tolerance_meters=50.0, duration_tolerance_seconds=120
+    )
+    with VendorSyncState(con, vendor="garmin", account="garmin_com") as sync_state:
+        asyncio.run(
+            _upload_activities(
+                uploads,
+                db_con=con,
+                generator=generator,
+                garmin_client=garmin,
+                sync_state=sync_state,
+                matcher=matcher,
+                account="garmin_com",
+                transforms=[],
+                concurrency=3,
+                wave_size=4,
+            )
+        )
+
+    rows = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+    assert {run_id: row.remote_activity_id for run_id, row in rows.items()} == {i: 100 + i for i in range(1, 9)}
+    assert {row.status for row in rows.values()} == {"synced"}
+    assert rows[1].content_hash == "hash-1"
+    assert garmin.max_in_flight == 3
+    assert garmin.fetches == 2
+    assert matcher.reserved == {100 + i for i in range(1, 9)}
+
+
+def test_upload_activities_schedules_retry_of_failed_uploads(temp_dir):
+    from unittest.mock import MagicMock
+
+    from scripts.generator.db import init_db
+    from scripts.strava_cli_core.store import VendorSyncState, is_sync_due
+    from scripts.strava_cli_core.sync_garmin import GarminMatcher, PendingUpload, _upload_activities
+
+    init_db(str(temp_dir / "upload.duckdb"))
+    con = ensure_vendor_sync_table(str(temp_dir / "upload.duckdb"))
+    con.execute(
+        """
+        INSERT INTO activities (run_id, name, type, distance, elapsed_time, moving_time, start_date)
+        VALUES (1, 'Run', 'Run', 1000.0, 600, 600, '2024-01-01 07:00:00')
+        """
+    )
+    generator = MagicMock()
+    generator.build_fit_file.return_value = b"fit"
+
+    class RejectingGarmin:
+        async def upload_fit(self, filename, file_content):
+            raise RuntimeError("upload rejected")
+
+    activity_row = con.execute("SELECT * FROM activities").fetchdf().iloc[0]
+    matcher = GarminMatcher(
+        [], match_window_seconds=300, distance_tolerance_meters=50.0, duration_tolerance_seconds=120
+    )
+    with VendorSyncState(con, vendor="garmin", account="garmin_com") as sync_state:
+        asyncio.run(
+            _upload_activities(
+                [PendingUpload(activity_row, "hash-1", 1)],
+                db_con=con,
+                generator=generator,
+                garmin_client=RejectingGarmin(),
+                sync_state=sync_state,
+                matcher=matcher,
+                account="garmin_com",
+                transforms=[],
+            )
+        )
+
+    row = load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")[1]
+    assert (row.status, row.attempt_count, row.last_error) == ("failed", 2, "upload rejected")
+    assert row.next_retry_at > datetime.now()
+    assert not is_sync_due(row)
+    con.close()
@@ -0,0 +1,140 @@
+"""Tests for the Strava flyby fetch pipeline against a local fake Strava API."""
+
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts.generator import service, strava_client
+from scripts.generator.db import enqueue_flyby_activities, init_db
+from scripts.generator.service import Generator
+from scripts.strava_rate_limit import StravaRateGovernor
+
+
+class FakeStravaHandler(BaseHTTPRequestHandler):
+    """Serves /activities/{id} and /activities/{id}/streams like the Strava API."""
+
+    failing_ids = set()
+    rate_limited_ids = set()
+    requests = []
+
+    def do_GET(self):
+        match = re.match(r"^/api/v3/activities/(\d+)(/streams)?", self.path)
+        if not match:
+            self._send(404, {"message": "Not Found"})
+            return
+        activity_id = int(match.group(1))
+        self.requests.append(self.path)
+
+        if activity_id in self.rate_limited_ids:
+            self._send(429, {"message": "Rate Limit Exceeded", "errors": []})
+        elif activity_id in self.failing_ids:
+            self._send(500, {"message": "Server Error", "errors": []})
+        elif match.group(2):
+            self._send(
+                200,
+                {
+                    "time": {"data": [0, 1, 2], "series_type": "time", "original_size": 3, "resolution": "high"},
+                    "latlng": {
+                        "data": [[39.9, 116.4], [39.9001, 116.4001], [39.9002, 116.4002]],
+                        "series_type": "time",
+                        "original_size": 3,
+                        "resolution": "high",
+                    },
+                    "heartrate": {"data": [140, 141, 142], "series_type": "time", "original_size": 3},
+                },
+            )
+        else:
+            self._send(200, {"id": activity_id, "name": f"Run {activity_id}", "type": "Run"})
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("X-RateLimit-Limit", "200,2000")
+        self.send_header("X-RateLimit-Usage", "10,100")
+        self.send_header("X-ReadRateLimit-Limit", "100,1000")
+        self.send_header("X-ReadRateLimit-Usage", "5,50")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_strava():
+    FakeStravaHandler.failing_ids = set()
+    FakeStravaHandler.rate_limited_ids = set()
+    FakeStravaHandler.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeStravaHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/api/v3"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def generator(temp_dir, fake_strava, monkeypatch):
+    monkeypatch.setattr(strava_client, "FLYBY_WORKERS", 2)
+    monkeypatch.setattr(strava_client, "FLYBY_MAX_RETRIES", 1)
+    monkeypatch.setattr(service, "get_strava_governor", StravaRateGovernor)
+
+    gen = Generator(temp_dir / "test.duckdb")
+    gen.client.access_token = "token"
+    gen.client.protocol.resolve_url = lambda url: f"{fake_strava}/{url.lstrip('/')}"
+    gen.db_connection = init_db(gen.db_path)
+    yield gen
+    gen.db_connection.close()
+
+
+def _queue(con, activity_ids):
+    for activity_id in activity_ids:
+        con.execute("INSERT INTO activities (run_id, name) VALUES (?, 'A')", [activity_id])
+    enqueue_flyby_activities(con, activity_ids)
+
+
+def test_sync_flyby_queue_stores_streams_and_keeps_failures_queued(generator):
+    FakeStravaHandler.failing_ids = {3}
+    _queue(generator.db_connection, [1, 2, 3, 4])
+
+    total = generator._sync_flyby_queue([1, 2, 3, 4], activity_map={})
+
+    assert total == 9
+    stored = generator.db_connection.execute(
+        "SELECT activity_id, COUNT(*) FROM activities_flyby GROUP BY activity_id ORDER BY activity_id"
+    ).fetchall()
+    assert stored == [(1, 3), (2, 3), (4, 3)]
+    queue = generator.db_connection.execute("SELECT activity_id, status FROM activities_flyby_queue").fetchall()
+    assert queue == [(3, "error")]
+    # Usage from the response headers reaches the shared governor.
+    assert generator.rate_governor.budget_left("read") == (95, 950)
+    assert generator.rate_governor.budget_left("overall") == (190, 1900)
+    assert generator.rate_governor.metrics()["calls"] == 7
+
+
+def test_sync_flyby_queue_marks_rate_limited_and_stops(generator):
+    FakeStravaHandler.rate_limited_ids = {7}
+    _queue(generator.db_connection, [7])
+
+    total = generator._sync_flyby_queue([7], activity_map={})
+
+    assert total == 0
+    queue = generator.db_connection.execute("SELECT activity_id, status FROM activities_flyby_queue").fetchall()
+    assert queue == [(7, "rate_limited")]
+    assert generator.rate_governor.metrics()["rate_limit_hits"] == 1
+
+
+def test_sync_flyby_queue_skips_activities_with_existing_flyby(generator):
+    _queue(generator.db_connection, [5])
+    generator.db_connection.execute("INSERT INTO activities_flyby (activity_id, time_offset, pace) VALUES (5, 0, 5.0)")
+
+    total = generator._sync_flyby_queue([5], activity_map={})
+
+    assert total == 1
+    assert FakeStravaHandler.requests == []
+    assert generator.db_connection.execute("SELECT COUNT(*) FROM activities_flyby_queue").fetchone()[0] == 0
@@ -0,0 +1,115 @@
+"""Tests for the shared Strava rate-limit governor."""
+
+from unittest.mock import MagicMock
+
+import duckdb
+import pytest
+from stravalib.exc import Fault, RateLimitExceeded
+from stravalib.util.limiter import get_seconds_until_next_day
+
+from scripts.strava_rate_limit import StravaRateGovernor, is_rate_limit_fault
+
+
+def test_reads_usage_from_response_headers():
+    governor = StravaRateGovernor()
+    governor(
+        {
+            "X-ReadRateLimit-Limit": "100,1000",
+            "X-ReadRateLimit-Usage": "12,340",
+            "X-RateLimit-Limit": "200,2000",
+            "X-RateLimit-Usage": "30,400",
+        },
+        "GET",
+    )
+
+    assert governor.budget_left("read") == (88, 660)
+    assert governor.budget_left("overall") == (170, 1600)
+    assert governor.seconds_until_available() == 0
+
+
+def test_blocks_when_short_limit_is_exhausted():
+    governor = StravaRateGovernor()
+    governor.update(short_usage=100, long_usage=200, short_limit=100, long_limit=1000)
+
+    assert 0 < governor.seconds_until_available() <= 900
+
+
+def test_acquire_uses_burst_without_waiting():
+    governor = StravaRateGovernor(burst=3)
+
+    assert [governor.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert governor.metrics()["calls"] == 3
+    assert governor.metrics()["seconds_slept"] == 0
+
+
+def test_rate_respects_daily_budget_once_half_used():
+    governor = StravaRateGovernor(burst=0)
+    governor.update(short_usage=0, long_usage=999, short_limit=100, long_limit=1000)
+
+    # A single call is left, spread over the rest of the UTC day.
+    assert governor.rate() <= 1 / max(get_seconds_until_next_day() - 1, 1)
+
+
+def test_call_translates_429_to_rate_limit_exceeded():
+    governor = StravaRateGovernor()
+
+    def too_many_requests():
+        raise Fault("429 Client Error", response=MagicMock(status_code=429))
+
+    with pytest.raises(RateLimitExceeded):
+        governor.call(too_many_requests)
+    assert governor.metrics()["rate_limit_hits"] == 1
+
+
+def test_call_pages_takes_a_token_per_page():
+    from stravalib.client import BatchedResultsIterator
+
+    governor = StravaRateGovernor(burst=10)
+    pages = [[{"id": 1}, {"id": 2}], [{"id": 3}, {"id": 4}], [{"id": 5}]]
+    fetcher = MagicMock(side_effect=lambda page, per_page: pages[page - 1])
+
+    def get_activities(**filters):
+        return BatchedResultsIterator(entity=MagicMock(), result_fetcher=fetcher, per_page=2)
+
+    assert len(governor.call_pages(get_activities, after="2024-01-01")) == 5
+    assert fetcher.call_count == 3
+    assert governor.metrics()["calls"] == 3
+
+
+def test_call_with_retries_retries_after_pause():
+    governor = StravaRateGovernor()
+    func = MagicMock(side_effect=[RateLimitExceeded("limited", timeout=0.01), "ok"])
+
+    assert governor.call_with_retries(2, func, 1, key="value") == "ok"
+    func.assert_called_with(1, key="value")
+    assert func.call_count == 2
+
+
+def test_state_round_trips_through_duckdb(temp_dir):
+    con = duckdb.connect(str(temp_dir / "state.duckdb"))
+    governor = StravaRateGovernor()
+    governor.update(short_usage=40, long_usage=600, short_limit=100, long_limit=1000)
+    governor.save_state(con)
+
+    restored = StravaRateGovernor()
+    restored.load_state(con)
+
+    assert restored.budget_left("read") == (60, 400)
+    assert restored.budget_left("overall") == (200, 2000)
+    con.close()
+
+
+def test_load_state_without_table_is_a_no_op(temp_dir):
+    con = duckdb.connect(str(temp_dir / "empty.duckdb"))
+    governor = StravaRateGovernor()
+    governor.load_state(con)
+
+    assert governor.budget_left("read") == (100, 1000)
+    con.close()
+
+
+def test_is_rate_limit_fault():
+    response = MagicMock(status_code=429)
+    assert is_rate_limit_fault(Fault("429 Client Error", response=response))
+    assert not is_rate_limit_fault(Fault("500 Server Error", response=MagicMock(status_code=500)))
+    assert not is_rate_limit_fault(ValueError("boom"))
@@ -0,0 +1,184 @@
+"""Tests for strava_to_garmin_sync.py module."""
+
+import asyncio
+import datetime
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+
+class FakeGovernor:
+    def call(self, func):
+        return func()
+
+    def call_with_retries(self, retries, func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    def call_pages(self, func, *args, **kwargs):
+        return list(func(*args, **kwargs))
+
+
+class FakeStrava:
+    def __init__(self, activities, others=()):
+        self.activities = activities
+        self.others = {activity.id: activity for activity in others}
+        self.stream_requests = []
+
+    def get_activities(self, **filters):
+        return list(self.activities)
+
+    def get_activity(self, activity_id):
+        return self.others[activity_id]
+
+    def get_activity_streams(self, activity_id, types, resolution):
+        self.stream_requests.append(activity_id)
+        return {"time": SimpleNamespace(data=[0, 1])}
+
+
+class FakeGarmin:
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.uploads = []
+        self.active = self.max_active = 0
+
+    async def get_activities(self, start, limit):
+        return []
+
+    async def upload_fit(self, filename, file_content):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        if filename in self.failing:
+            raise RuntimeError("upload rejected")
+        self.uploads.append((filename, file_content))
+        return {"successes": [{"activityId": 9000 + int(filename.split(".")[0])}]}
+
+
+def _activity(activity_id):
+    return SimpleNamespace(
+        id=activity_id,
+        name=f"Run {activity_id}",
+        type="Run",
+        start_date=datetime.datetime(2024, 1, activity_id, 7, tzinfo=datetime.timezone.utc),
+        elapsed_time=datetime.timedelta(seconds=600),
+        moving_time=datetime.timedelta(seconds=600),
+        distance=1000.0,
+        average_speed=1.7,
+        average_heartrate=None,
+        average_cadence=None,
+    )
+
+
+def _build_upload(activity_data, transforms):
+    return f"fit {activity_data.activity_id}".encode()
+
+
+def _sync(temp_dir, garmin, strava):
+    from scripts.strava_to_garmin_sync import upload_to_activities
+
+    with (
+        patch("scripts.strava_to_garmin_sync.SQL_FILE", temp_dir / "data.duckdb"),
+        patch("scripts.strava_to_garmin_sync.get_strava_governor", return_value=FakeGovernor()),
+        patch("scripts.strava_to_garmin_sync._build_upload", _build_upload),
+    ):
+        return asyncio.run(upload_to_activities(garmin, strava, False, False, upload_concurrency=2))
+
+
+def _states(temp_dir):
+    from scripts.strava_cli_core.store import ensure_vendor_sync_table, load_vendor_sync_rows
+
+    con = ensure_vendor_sync_table(str(temp_dir / "data.duckdb"))
+    try:
+        return load_vendor_sync_rows(con, vendor="garmin", account="garmin_com")
+    finally:
+        con.close()
+
+
+class TestUploadToActivities:
+    """Test cases for the pipelined upload_to_activities."""
+
+    def test_uploads_concurrently_and_records_progress(self, temp_dir):
+        from scripts.exceptions import SyncError
+
+        garmin = FakeGarmin(failing={"3.fit"})
+        strava = FakeStrava([_activity(activity_id) for activity_id in (4, 1, 3, 2)])
+
+        with pytest.raises(SyncError, match="3.fit"):
+            _sync(temp_dir, garmin, strava)
+
+        assert strava.stream_requests == [1, 2, 3, 4]
+        assert sorted(garmin.uploads) == [(f"{i}.fit", f"fit {i}".encode()) for i in (1, 2, 4)]
+        assert garmin.max_active == 2
+        states = _states(temp_dir)
+        assert {activity_id: state.status for activity_id, state in states.items()} == {
+            1: "synced",
+            2: "synced",
+            3: "failed",
+            4: "synced",
+        }
+        assert states[1].remote_activity_id == 9001
+        assert states[3].attempt_count == 1
+
+    def test_resumes_pending_activities_without_reuploading(self, temp_dir):
+        from scripts.strava_cli_core.store import ensure_vendor_sync_table, upsert_vendor_sync_status
+        from scripts.strava_to_garmin_sync import SYNC_SOURCE
+
+        con = ensure_vendor_sync_table(str(temp_dir / "data.duckdb"))
+        for activity_id, status in ((1, "pending"), (2, "synced")):
+            upsert_vendor_sync_status(
+                con,
+                activity_id=activity_id,
+                vendor="garmin",
+                account="garmin_com",
+                status=status,
+                source=SYNC_SOURCE,
+            )
+        con.close()
+
+        garmin = FakeGarmin()
+        strava = FakeStrava([_activity(2), _activity(3)], others=[_activity(1)])
+
+        assert _sync(temp_dir, garmin, strava) == ["1.fit", "3.fit"]
+        assert strava.stream_requests == [1, 3]
+        assert all(state.status == "synced" for state in _states(temp_dir).values())
+
+    def test_retries_failed_activities_once_due(self, temp_dir):
+        from scripts.exceptions import SyncError
+        from scripts.strava_cli_core.store import ensure_vendor_sync_table
+
+        with pytest.raises(SyncError):
+            _sync(temp_dir, FakeGarmin(failing={"1.fit"}), FakeStrava([_activity(1), _activity(2)]))
+        failed = _states(temp_dir)[1]
+        assert failed.status == "failed"
+        assert failed.next_retry_at > datetime.datetime.now()
+
+        # Garmin's newest activity is now 2, so 1 is no longer listed after it.
+        strava = FakeStrava([_activity(2)], others=[_activity(1)])
+        assert _sync(temp_dir, FakeGarmin(), strava) == []
+
+        con = ensure_vendor_sync_table(str(temp_dir / "data.duckdb"))
+        con.execute("UPDATE vendor_activity_sync SET next_retry_at = NOW()::TIMESTAMP - INTERVAL 1 MINUTE")
+        con.close()
+        assert _sync(temp_dir, FakeGarmin(), strava) == ["1.fit"]
+        assert strava.stream_requests == [1]
+        assert _states(temp_dir)[1].status == "synced"
+
+    def test_leaves_rows_of_the_duckdb_sync_alone(self, temp_dir):
+        from scripts.strava_cli_core.store import ensure_vendor_sync_table, upsert_vendor_sync_status
+
+        con = ensure_vendor_sync_table(str(temp_dir / "data.duckdb"))
+        for activity_id, status in ((1, "missing_remote"), (2, "failed"), (3, "uploading")):
+            upsert_vendor_sync_status(
+                con, activity_id=activity_id, vendor="garmin", account="garmin_com", status=status, attempt_count=1
+            )
+        con.close()
+        before = _states(temp_dir)
+
+        strava = FakeStrava([_activity(3), _activity(4)], others=[_activity(1), _activity(2)])
+        assert _sync(temp_dir, FakeGarmin(), strava) == ["4.fit"]
+        assert strava.stream_requests == [4]
+        states = _states(temp_dir)
+        assert {activity_id: states[activity_id] for activity_id in (1, 2, 3)} == before
+        assert states[4].source == "strava_to_garmin"
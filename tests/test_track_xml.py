@@ -0,0 +1,92 @@
+"""Tests for generator/track_xml.py module."""
+
+import datetime
+import gzip
+import io
+
+import numpy as np
+
+START_MS = 1704092400000
+
+
+def _records():
+    return {
+        "timestamp": np.array([START_MS, START_MS + 1000, START_MS + 2500], dtype="int64"),
+        "position_lat": np.array([39.9, 39.91, 1e-7]),
+        "position_long": np.array([116.4, 116.41, 116.42]),
+        "altitude": np.array([50.5, np.nan, 51.0]),
+        "heart_rate": np.array([120.0, 131.0, np.nan]),
+    }
+
+
+class TestWriteGpx:
+    """Test cases for write_gpx function."""
+
+    def test_matches_gpxpy(self):
+        import gpxpy.gpx
+
+        from scripts.generator.track_xml import write_gpx
+
+        records = _records()
+        gpx = gpxpy.gpx.GPX()
+        track = gpxpy.gpx.GPXTrack(name='Run & <"Lap"> 1')
+        segment = gpxpy.gpx.GPXTrackSegment()
+        for ms, lat, lng, alt in zip(
+            records["timestamp"].tolist(),
+            records["position_lat"].tolist(),
+            records["position_long"].tolist(),
+            records["altitude"].tolist(),
+        ):
+            time = datetime.datetime.fromtimestamp(ms / 1000, tz=datetime.timezone.utc)
+            segment.points.append(
+                gpxpy.gpx.GPXTrackPoint(lat, lng, elevation=None if np.isnan(alt) else alt, time=time)
+            )
+        track.segments.append(segment)
+        gpx.tracks.append(track)
+
+        out = io.StringIO()
+        write_gpx(out, records, name='Run & <"Lap"> 1', time_suffix="Z")
+
+        assert out.getvalue() == gpx.to_xml().replace("+00:00", "Z")
+
+
+class TestWriteTcx:
+    """Test cases for write_tcx function."""
+
+    def test_track_points(self):
+        from scripts.generator.track_xml import write_tcx
+
+        out = io.StringIO()
+        write_tcx(out, _records(), sport="Run", start_time=START_MS, total_time_seconds=3, distance_meters=12.5)
+        tcx = out.getvalue()
+
+        assert tcx.startswith('<?xml version="1.0" ?>\n<TrainingCenterDatabase ')
+        assert "<Id>2024-01-01T07:00:00</Id>" in tcx
+        assert "<Time>2024-01-01T07:00:02.500000</Time>" in tcx
+        assert tcx.count("<AltitudeMeters>") == 2
+        assert tcx.count("<HeartRateBpm>") == 2
+        assert "<LatitudeDegrees>1e-07</LatitudeDegrees>" in tcx
+
+    def test_compact_and_empty_track(self):
+        from scripts.generator.track_xml import write_tcx
+
+        out = io.StringIO()
+        write_tcx(out, {}, sport="Ride", start_time=START_MS, total_time_seconds=0, distance_meters=0, indent=None)
+
+        assert "\n" not in out.getvalue()
+        assert "<TriggerMethod>Manual</TriggerMethod><Track/></Lap>" in out.getvalue()
+
+
+class TestOpenTrackFile:
+    """Test cases for open_track_file function."""
+
+    def test_gzip_is_reproducible(self, temp_dir):
+        from scripts.generator.track_xml import open_track_file, write_gpx
+
+        for name in ("a.gpx.gz", "b.gpx.gz"):
+            with open_track_file(temp_dir / name, compress=True) as out:
+                write_gpx(out, _records(), name="Zürich")
+
+        data = (temp_dir / "a.gpx.gz").read_bytes()
+        assert data == (temp_dir / "b.gpx.gz").read_bytes()
+        assert "<name>Zürich</name>" in gzip.decompress(data).decode("utf-8")